@@ -0,0 +1,270 @@
+"""Account x month activity bitmap for lifecycle, activity and churn metrics.
+
+Active / dormant / lost logic used to be recomputed from the transaction
+rows in several storylines (S0 active rate, S1 monthly active accounts,
+S9 dormancy, lifecycle classes and inactivity scoring), each with its own
+filter-and-groupby over ``combined_df``. ``build_activity`` makes one pass
+over the transactions at load time and keeps, per account:
+
+- one activity bit per month (``np.packbits`` along the month axis: one
+  byte per 8 months, so 36 months of 1M accounts take 5 MB);
+- the last transaction date (8 bytes);
+- optionally the summed spend and the transaction count of each month the
+  account was active, as sparse cells in compressed sparse row (CSR) form
+  like ``v4_incidence`` (14 bytes per active account-month, nothing for
+  inactive ones).
+
+The result is kept as ``ctx['activity']`` (a ``transactions`` data
+source, see ``v4_data_loader.DATA_SOURCES``). The helpers below derive the
+metrics with bit operations on the packed bytes, without unpacking the
+bitmap: windows are slices over the month axis (``last_months``), so
+"active in the last 3 months", retention curves, reactivation and streaks
+cost a few vectorised passes over an (accounts, months / 8) byte array
+instead of a groupby over every transaction.
+
+The month axis holds the ``year_month`` values present in the data, in
+order, which is how the storylines counted "the last 3 months" before.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+# Set bits per byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def build_activity(df: pd.DataFrame, values: bool = True) -> dict:
+    """Pack per-account monthly activity of *df* into account x month arrays.
+
+    Rows without an account number or a ``year_month`` are ignored, as in
+    a ``groupby`` on those columns. No dense (accounts, months) array is
+    allocated.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Transactions with ``primary_account_num``, ``year_month``,
+        ``amount`` and ``transaction_date``.
+    values : bool
+        Also keep the ``spend`` / ``count`` of each active account-month.
+
+    Keys in returned dict
+    ---------------------
+    accounts  : sorted Index of account numbers (axis 0)
+    months    : sorted Index of the ``year_month`` values in *df* (axis 1)
+    bits      : uint8 array (accounts, ceil(months / 8)); bit j of a row
+                (little-endian bit order) is set if the account transacted
+                in month j
+    last_date : datetime64 array (accounts,), latest transaction date
+    as_of     : latest transaction date in *df*
+
+    With *values* also (cells = active account-months, by account then month):
+
+    indptr    : int64 array (accounts + 1,), row offsets into the cells
+    indices   : int16 array (cells,), month of each cell
+    spend     : float64 array (cells,), summed amount
+    count     : int32 array (cells,), transactions
+    """
+    acct_codes, accounts = pd.factorize(df["primary_account_num"], sort=True)
+    month_codes, months = pd.factorize(df["year_month"], sort=True)
+    accounts = pd.Index(accounts, name="primary_account_num")
+    months = pd.Index(months, name="year_month")
+    n_accts, n_months = len(accounts), len(months)
+    width = (n_months + 7) // 8
+
+    valid = (acct_codes >= 0) & (month_codes >= 0)
+    rows, cols = acct_codes[valid].astype(np.int64), month_codes[valid]
+    bits = np.zeros((n_accts, width), dtype=np.uint8)
+    np.bitwise_or.at(bits.reshape(-1), rows * width + (cols >> 3),
+                     np.left_shift(1, cols & 7).astype(np.uint8))
+
+    cells = {}
+    if values:
+        keys, inverse = np.unique(rows * max(n_months, 1) + cols, return_inverse=True)
+        amount = np.nan_to_num(df["amount"].to_numpy(dtype=np.float64)[valid])
+        cells = {
+            "indptr": np.searchsorted(keys // max(n_months, 1),
+                                      np.arange(n_accts + 1)).astype(np.int64),
+            "indices": (keys % max(n_months, 1)).astype(np.int16),
+            "spend": np.bincount(inverse, weights=amount, minlength=len(keys)),
+            "count": np.bincount(inverse, minlength=len(keys)).astype(np.int32),
+        }
+
+    dates = df["transaction_date"]
+    last_date = np.full(n_accts, np.datetime64("NaT"), dtype=dates.dtype)
+    if n_accts:
+        last = dates[acct_codes >= 0].groupby(acct_codes[acct_codes >= 0]).max()
+        last_date[last.index.to_numpy()] = last.to_numpy()
+
+    return {
+        "accounts": accounts,
+        "months": months,
+        "bits": bits,
+        "last_date": last_date,
+        "as_of": dates.max(),
+        **cells,
+    }
+
+
+def activity_nbytes(act: dict) -> int:
+    """Memory held by the arrays of *act*."""
+    return sum(v.nbytes for v in act.values() if isinstance(v, np.ndarray))
+
+
+def take_accounts(act: dict, rows: np.ndarray) -> dict:
+    """*act* restricted to the account rows *rows* (ascending positions)."""
+    out = {**act, "accounts": act["accounts"][rows], "bits": act["bits"][rows],
+           "last_date": act["last_date"][rows]}
+    if act.get("indptr") is not None:
+        from v4_incidence import take_rows
+
+        out.update({k: v for k, v in take_rows(act, rows).items()
+                    if k in ("indptr", "indices", "spend", "count")})
+    return out
+
+
+# =========================================================================
+# Windows
+# =========================================================================
+
+def last_months(act: dict, n: int, skip: int = 0) -> slice:
+    """Month-axis slice of the *n* months ending *skip* months before the latest."""
+    end = max(len(act["months"]) - skip, 0)
+    return slice(max(end - n, 0), end)
+
+
+def _month_bit(act: dict, j: int) -> np.ndarray:
+    """Bool per account: transacted in month *j*."""
+    return (act["bits"][:, j >> 3] & np.uint8(1 << (j & 7))) != 0
+
+
+def _window_mask(act: dict, window: slice) -> np.ndarray:
+    """Byte mask (ceil(months / 8),) with the bits of the months in *window* set."""
+    in_window = np.zeros(len(act["months"]), dtype=bool)
+    in_window[window] = True
+    return np.packbits(in_window, bitorder="little")
+
+
+def active_matrix(act: dict, window: slice = slice(None)) -> np.ndarray:
+    """Bool array (accounts, months in *window*): account transacted that month.
+
+    Unpacks the bitmap (one byte per account-month); the helpers below
+    work on the packed bits instead.
+    """
+    full = np.unpackbits(act["bits"], axis=1, count=len(act["months"]), bitorder="little")
+    return full[:, window].view(bool)
+
+
+def active_in(act: dict, window: slice) -> np.ndarray:
+    """Bool per account: transacted in any month of *window*."""
+    return (act["bits"] & _window_mask(act, window)).any(axis=1)
+
+
+def active_months(act: dict, window: slice = slice(None)) -> np.ndarray:
+    """Per-account number of active months in *window* (popcount of the bits)."""
+    return _POPCOUNT[act["bits"] & _window_mask(act, window)].sum(axis=1, dtype=np.int64)
+
+
+def first_active(act: dict) -> np.ndarray:
+    """Per-account first active month (index on the month axis), -1 if none."""
+    first = np.full(len(act["accounts"]), -1, dtype=np.int32)
+    for j in range(len(act["months"]) - 1, -1, -1):
+        first[_month_bit(act, j)] = j
+    return first
+
+
+def last_active(act: dict) -> np.ndarray:
+    """Per-account last active month (index on the month axis), -1 if none."""
+    last = np.full(len(act["accounts"]), -1, dtype=np.int32)
+    for j in range(len(act["months"])):
+        last[_month_bit(act, j)] = j
+    return last
+
+
+def window_total(act: dict, window: slice, values: str = "spend") -> np.ndarray:
+    """Per-account sum of *values* (``spend`` or ``count``) over *window*."""
+    if act.get(values) is None:
+        raise ValueError(f"activity built without {values!r} (build_activity(values=True))")
+    start, stop, _ = window.indices(len(act["months"]))
+    month = act["indices"]
+    data = np.where((month >= start) & (month < stop), act[values], 0)
+    return np.add.reduceat(np.r_[data, 0], act["indptr"][:-1])[: len(act["accounts"])] \
+        * (np.diff(act["indptr"]) > 0)
+
+
+def monthly_active(act: dict) -> pd.Series:
+    """Active accounts per month, indexed by ``year_month``."""
+    counts = [np.count_nonzero(_month_bit(act, j)) for j in range(len(act["months"]))]
+    return pd.Series(np.array(counts, dtype=np.int64), index=act["months"], name="Accounts")
+
+
+# =========================================================================
+# Lifecycle metrics
+# =========================================================================
+
+def months_since_active(act: dict) -> np.ndarray:
+    """Months between each account's last active month and the latest month."""
+    n_months = len(act["months"])
+    last = last_active(act)
+    return np.where(last >= 0, n_months - 1 - last, n_months)
+
+
+def streaks(act: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Per account: (current streak, longest streak) of consecutive active months.
+
+    The current streak ends at the latest month (0 if inactive then).
+    """
+    run = np.zeros(len(act["accounts"]), dtype=np.int32)
+    longest = np.zeros_like(run)
+    for j in range(len(act["months"])):
+        run = np.where(_month_bit(act, j), run + 1, 0)
+        np.maximum(longest, run, out=longest)
+    return run, longest
+
+
+def reactivated(act: dict, gap: int = 3) -> np.ndarray:
+    """Bool per account: active in the latest month after *gap*+ inactive months.
+
+    Only accounts active at some point before the gap count, so new
+    accounts are not mistaken for returning ones.
+    """
+    n_months = len(act["months"])
+    if n_months < gap + 2:
+        return np.zeros(len(act["accounts"]), dtype=bool)
+    return (
+        _month_bit(act, n_months - 1)
+        & ~active_in(act, slice(n_months - 1 - gap, n_months - 1))
+        & active_in(act, slice(0, n_months - 1 - gap))
+    )
+
+
+def retention_curve(act: dict, max_lag: int = 12) -> pd.DataFrame:
+    """% of each first-active-month cohort still active *k* months later.
+
+    Rows are cohorts (month of first transaction in the data), columns
+    ``Month 0`` .. ``Month <max_lag>``; lags past the end of the data are
+    NaN. The first month of the data is a cohort of existing accounts,
+    not new ones.
+    """
+    n_months = len(act["months"])
+    first = first_active(act)
+    seen = np.flatnonzero(first >= 0)
+    first = first[seen]
+    cohort_size = np.bincount(first, minlength=n_months)
+
+    lags = range(min(max_lag, n_months - 1) + 1)
+    out = np.full((n_months, len(lags)), np.nan)
+    for k in lags:
+        col = first + k
+        ok = col < n_months
+        bit = (act["bits"][seen[ok], col[ok] >> 3] >> (col[ok] & 7).astype(np.uint8)) & 1
+        kept = np.bincount(first[ok], weights=bit, minlength=n_months)
+        has_lag = np.arange(n_months) + k < n_months
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[has_lag, k] = kept[has_lag] / cohort_size[has_lag] * 100
+
+    curve = pd.DataFrame(out, index=act["months"].astype(str),
+                         columns=[f"Month {k}" for k in lags])
+    curve.insert(0, "Accounts", cohort_size)
+    return curve[cohort_size > 0]
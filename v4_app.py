@@ -14,11 +14,19 @@ _HERE = Path(__file__).resolve().parent
 if str(_HERE) not in sys.path:
     sys.path.insert(0, str(_HERE))
 
+import numpy as np
 import streamlit as st
 
-from v4_client_config import list_clients, load_client_config
+from v4_client_config import (
+    client_rules, list_clients, load_base, load_client_config, merge_rules, save_client_rules,
+)
 from v4_data_loader import load_config
+from v4_figspec import to_figure
+from v4_rule_whatif import (
+    RULE_TIERS, compare_tags, merchant_table, new_matcher, pattern_hits, tag_merchants,
+)
 from v4_run import STORYLINE_LABELS, run_pipeline
+from v4_spill import as_frame
 
 # ---------------------------------------------------------------------------
 # Page config
@@ -65,6 +73,128 @@ def _strip_html(text: str) -> str:
     return re.sub(r"<[^>]+>", "", text)
 
 
+def _pattern_box(label: str, patterns: list[str], key: str) -> list[str]:
+    """Text area with one pattern per line; returns the edited list."""
+    text = st.text_area(label, value="\n".join(patterns), key=key, height=220)
+    return list(dict.fromkeys(line.strip() for line in text.splitlines() if line.strip()))
+
+
+def _edited_rules(rules: dict, loaded: dict, base: dict) -> dict:
+    """The sections of *rules* that differ from the client file's *loaded* rules.
+
+    Categories / tiers only browsed in the editor (left empty) do not count
+    as edits, and a ``financial_services`` list set back to the base one
+    becomes None (remove the override).
+    """
+    def competitors(rule_set):
+        return {cat: tiers for cat, tiers in (
+                    (c, {t: ps for t, ps in (r or {}).items() if ps})
+                    for c, r in (rule_set.get("competitors") or {}).items())
+                if tiers}
+
+    edited = {}
+    if competitors(rules) != competitors(loaded):
+        edited["competitors"] = competitors(rules)
+    if rules.get("false_positives", []) != loaded.get("false_positives", []):
+        edited["false_positives"] = rules.get("false_positives", [])
+    fs = rules.get("financial_services") or base.get("financial_services")
+    if fs != (loaded.get("financial_services") or base.get("financial_services")):
+        edited["financial_services"] = None if fs == base.get("financial_services") else fs
+    return edited
+
+
+def _rule_whatif(client: str, paths: dict) -> None:
+    """Edit a saved client's rule lists and see the effect on its merchants at once."""
+    base = load_base()
+    config = {**load_client_config(client, base=base), **{k: v for k, v in paths.items() if v}}
+    state = st.session_state.setdefault("whatif", {})
+    if state.get("client") != client:
+        state.clear()
+        state.update(client=client, rules=client_rules(client), loaded=client_rules(client))
+    if "table" not in state:
+        st.caption("Matches the rules against the client's distinct merchant names "
+                   "(spend, transactions, accounts per name), not the transactions.")
+        if not st.button("Load merchant names", key="wi_load"):
+            return
+        try:
+            with st.spinner("Building merchant table..."):
+                table = merchant_table(config)
+        except Exception as e:
+            st.error(f"Could not build the merchant table: {e}")
+            return
+        state["table"], state["matcher"] = table, new_matcher(table)
+        state["saved"] = tag_merchants(state["matcher"], config)
+    table, matcher, rules = state["table"], state["matcher"], state["rules"]
+
+    left, right = st.columns([1, 2])
+    with left:
+        rule_set = st.radio("Rules", ["Competitors", "False positives", "Financial services"],
+                            horizontal=True, key="wi_set")
+        if rule_set == "Competitors":
+            comp = rules.setdefault("competitors", {})
+            cat = st.selectbox("Category", sorted(set(base.get("competitors", {})) | set(comp)),
+                               key="wi_cat")
+            tier = st.selectbox("Match", RULE_TIERS, key="wi_tier")
+            n_base = len((base.get("competitors", {}).get(cat) or {}).get(tier, []))
+            edited = _pattern_box(f"Client patterns ({n_base} base patterns also apply)",
+                                  (comp.get(cat) or {}).get(tier, []), key=f"wi_{cat}_{tier}")
+            comp[cat] = {**(comp.get(cat) or {}), tier: edited}
+            shown = [(tier, p) for p in edited]
+        elif rule_set == "False positives":
+            edited = _pattern_box(
+                f"Client false positives ({len(base.get('false_positives', []))} base entries "
+                "also apply)", rules.get("false_positives", []), key="wi_fp")
+            rules["false_positives"] = edited
+            shown = [("contains", p) for p in edited]
+        else:
+            fs = rules.get("financial_services") or base.get("financial_services", {})
+            cat = st.selectbox("Category", list(fs), key="wi_fs_cat")
+            edited = _pattern_box("Patterns (contains; the client list replaces the base)",
+                                  fs.get(cat, []), key=f"wi_fs_{cat}")
+            rules["financial_services"] = {**fs, cat: edited}
+            shown = [("contains", p) for p in edited]
+
+    merged = {**config, **merge_rules(base, rules)}
+    t0 = time.time()
+    tags = tag_merchants(matcher, merged)
+    summary, changes = compare_tags(table, state["saved"], tags)
+    elapsed_ms = (time.time() - t0) * 1000
+
+    with right:
+        row = summary.set_index("Rule set").loc[
+            "Financial services" if rule_set == "Financial services" else "Competitors"]
+        k1, k2, k3 = st.columns(3)
+        k1.metric("Matched merchants", f"{row['Merchants (after)']:,}",
+                  f"{row['Merchants (after)'] - row['Merchants (before)']:+,}")
+        k2.metric("Newly matched spend", f"${row['Newly matched spend']:,.0f}")
+        k3.metric("Newly excluded spend", f"${row['Excluded spend']:,.0f}")
+        st.caption(f"{len(table):,} merchant names re-tagged in {elapsed_ms:,.0f} ms; "
+                   "changes are against the saved rules")
+        st.markdown("**Changed merchants**")
+        st.dataframe(changes, use_container_width=True, height=240)
+        hit = np.unique(np.concatenate(
+            [pattern_hits(matcher, t, p, names="fs_names" if rule_set == "Financial services"
+                          else "names") for t, p in shown] or [np.array([], dtype=int)]))
+        st.markdown(f"**Merchants matched by this list** ({len(hit):,})")
+        st.dataframe(table.iloc[hit].join(tags.iloc[hit]), use_container_width=True, height=240)
+
+    s1, s2 = st.columns(2)
+    if s1.button(f"Save to configs/clients/{client}.yaml", key="wi_save"):
+        to_save = _edited_rules(rules, state["loaded"], base)
+        if not to_save:
+            st.info("No edits to save.")
+        else:
+            path = save_client_rules(client, to_save)
+            state["saved"], state["loaded"] = tags, client_rules(client)
+            st.success(f"Saved {', '.join(to_save)} to {path.name}; "
+                       "the next run uses these rules.")
+    if s2.button("Discard edits", key="wi_discard"):
+        for key in [k for k in st.session_state if str(k).startswith("wi_")]:
+            del st.session_state[key]
+        state["rules"], state["loaded"] = client_rules(client), client_rules(client)
+        st.rerun()
+
+
 # ---------------------------------------------------------------------------
 # Sidebar
 # ---------------------------------------------------------------------------
@@ -123,6 +253,15 @@ with st.sidebar:
             if st.checkbox(label, value=all_on, key=f"cb_{key}"):
                 selected.append(key)
 
+        st.subheader("Mode")
+        preview_on = st.checkbox(
+            "Preview on a sample of accounts",
+            value=False,
+            help="Quick directional run on a stratified account sample; "
+                 "headline totals are scaled up with confidence intervals",
+        )
+        preview_pct = st.slider("Sample size (% of accounts)", 1, 50, 10)
+
         st.divider()
         submitted = st.form_submit_button("Run Analysis")
 
@@ -132,6 +271,11 @@ with st.sidebar:
 st.header("V4 Transaction Analysis")
 st.caption("Debit card portfolio analytics")
 
+if chosen != "(manual entry)":
+    with st.expander(f"Competitor rule what-if ({chosen})", expanded=False):
+        _rule_whatif(chosen, {"transaction_dir": txn_dir.strip(), "odd_file": odd_path.strip(),
+                              "file_extension": file_ext})
+
 if not submitted:
     st.info(
         "Configure data sources and client info in the sidebar, "
@@ -210,6 +354,7 @@ try:
     with status_box:
         results, excel_path, html_path = run_pipeline(
             config, storylines=selected, progress_cb=_progress,
+            preview=preview_pct / 100 if preview_on else None,
         )
     elapsed = time.time() - t0
     status_box.update(label=f"Complete in {elapsed:.1f}s", state="complete")
@@ -223,6 +368,12 @@ except Exception:
 # Summary metrics
 # ---------------------------------------------------------------------------
 st.subheader(f"{client_id.strip()} - {client_name.strip()}")
+if preview_on:
+    st.warning(
+        f"Preview on {preview_pct}% of accounts: shares and rankings are directional, "
+        "counts and totals cover the sample. See **Preview Estimates** for "
+        "headline totals scaled to the full portfolio."
+    )
 
 total_sections = sum(len(r.get("sections", [])) for r in results.values())
 total_figures = sum(
@@ -245,7 +396,7 @@ if results:
     tab_labels = []
     tab_keys = []
     for key in results:
-        label = STORYLINE_LABELS.get(key, key)
+        label = STORYLINE_LABELS.get(key, results[key].get("title", key))
         short = label.split(":")[0] if ":" in label else label
         tab_labels.append(short)
         tab_keys.append(key)
@@ -254,7 +405,7 @@ if results:
 
     for tab, key in zip(tabs, tab_keys):
         result = results[key]
-        label = STORYLINE_LABELS.get(key, key)
+        label = STORYLINE_LABELS.get(key, result.get("title", key))
         sections = result.get("sections", [])
         desc = result.get("description", "")
 
@@ -277,14 +428,14 @@ if results:
 
                 for fig in figures:
                     st.plotly_chart(
-                        fig,
+                        to_figure(fig),
                         use_container_width=True,
                         key=f"{key}_{heading}_{id(fig)}",
                     )
 
                 for tbl_title, tbl_df in tables:
                     with st.expander(f"Table: {tbl_title}"):
-                        st.dataframe(tbl_df, use_container_width=True)
+                        st.dataframe(as_frame(tbl_df), use_container_width=True)
 
 # ---------------------------------------------------------------------------
 # Download section
@@ -0,0 +1,474 @@
+"""Aggregation backend for storyline group-bys (pandas, DuckDB or Polars).
+
+Storylines call ``group_agg(ctx, source, by, name=(column, func), ...)``
+for their heavy roll-ups (per-account, per-merchant, per-merchant-month,
+per-category). With ``backend: pandas`` (default) that is a plain
+``groupby().agg()``; with ``backend: duckdb`` the loaded frames are
+registered as DuckDB relations (zero-copy) and the aggregation runs there,
+multi-threaded; with ``backend: polars`` (the default when ``engine:
+polars``) the frames are copied into Polars once and aggregated
+multi-threaded there. Only the small result frame comes back to pandas.
+
+Every backend works on the frames already loaded in memory: DuckDB reads
+the registered pandas frames and does not scan the transaction files, so
+the data must fit in RAM as with pandas. Past ``duckdb_memory_limit`` it
+only spills its own working state (hash tables) to ``duckdb_temp_dir``.
+
+``approx_nunique`` counts distinct values with HyperLogLog in every
+backend (``v4_sketches`` for pandas, DuckDB ``approx_count_distinct``,
+Polars ``approx_n_unique``); ``approx_distinct: true`` switches the
+``nunique`` roll-ups of ``group_agg`` to it, and the storylines' scalar
+account / merchant counts go through ``distinct_count`` for the same
+switch. Per-account averages of a ``groupby().nunique()`` and month counts
+stay exact.
+
+DuckDB and Polars are optional (``pip install duckdb`` / ``polars``).
+Without them the run falls back to pandas with a warning.
+
+Check a backend agrees with pandas on a dataset:
+    python v4_backend.py my_client.yaml [duckdb|polars]
+or, without client data, every installed backend on a synthetic dataset
+with null keys and values, empty groups and frames, string, categorical,
+nullable-integer and Period keys (values and dtypes must agree):
+    python v4_backend.py --self-test
+"""
+from __future__ import annotations
+
+import importlib.util
+import itertools
+import sys
+
+import numpy as np
+import pandas as pd
+
+BACKENDS = ("pandas", "duckdb", "polars")
+
+# check_parity tolerance for approx_nunique columns: DuckDB's and Polars'
+# HyperLogLog are off by up to ~20-30% per group (pandas: ``sketch_error``)
+APPROX_RTOL = 0.3
+
+# ctx frames registered with DuckDB / Polars
+_CTX_TABLES = ("combined_df", "business_df", "personal_df", "odd_df")
+
+# Aggregations both backends support, as (pandas func, SQL template)
+_AGG_SQL = {
+    "sum": "COALESCE(SUM({c}), 0)",
+    "count": "COUNT({c})",
+    "size": "COUNT(*)",
+    "mean": "AVG({c})",
+    "nunique": "COUNT(DISTINCT {c})",
+    "min": "MIN({c})",
+    "max": "MAX({c})",
+    "approx_nunique": "APPROX_COUNT_DISTINCT({c})",
+}
+
+_tmp_names = itertools.count()
+
+
+# =========================================================================
+# Setup
+# =========================================================================
+
+def resolve_backend(config: dict) -> str:
+    """Return the backend to use for *config*.
+
+    ``backend`` key; when unset, follows the loader ``engine`` (pandas/polars).
+    """
+    backend = str(config.get("backend") or config.get("engine") or "pandas").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    if backend != "pandas" and importlib.util.find_spec(backend) is None:
+        print(f"[backend] {backend} not installed -- falling back to pandas")
+        return "pandas"
+    return backend
+
+
+def _duckdb_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """View of *df* DuckDB can scan: Period columns become month-start timestamps."""
+    periods = {c: df[c].dt.to_timestamp() for c in df.columns
+               if isinstance(df[c].dtype, pd.PeriodDtype)}
+    return df.assign(**periods) if periods else df
+
+
+def _polars_frame(ctx: dict, source: str):
+    """Polars copy of a ctx frame, made on first use and kept in ``ctx['polars']``.
+
+    Business/personal are lazy filters over the combined copy.
+    """
+    import polars as pl
+    from v4_polars import to_polars
+
+    frames = ctx["polars"]
+    if source not in frames:
+        split = {"business_df": "Yes", "personal_df": "No"}
+        if source in split and "Business?" in ctx["combined_df"].columns:
+            frames[source] = (_polars_frame(ctx, "combined_df").lazy()
+                              .filter(pl.col("Business?") == split[source]))
+        else:
+            frames[source] = to_polars(ctx[source])
+            print(f"[backend] Polars: copied {source}")
+    return frames[source]
+
+
+def _duckdb_table(ctx: dict, source: str) -> str:
+    """Register a ctx frame with DuckDB on first use; returns the view name."""
+    registered = ctx.setdefault("duckdb_tables", set())
+    if source not in registered:
+        ctx["duckdb"].register(source, _duckdb_frame(ctx[source]))
+        registered.add(source)
+    return source
+
+
+def attach_backend(ctx: dict) -> str:
+    """Set ``ctx['backend']`` and prepare the DuckDB connection / Polars frames.
+
+    ctx frames are handed to the engine on first use, so sources a run never
+    reads are never loaded. DuckDB: opens ``ctx['duckdb']``; uses config keys
+    ``duckdb_threads``, ``duckdb_memory_limit`` (e.g. "8GB") and
+    ``duckdb_temp_dir`` (where DuckDB spills its hash tables; the registered
+    frames stay in memory). Polars: ``ctx['polars']`` holds
+    the copies.
+    """
+    config = ctx.get("config", {})
+    backend = resolve_backend(config)
+    ctx["backend"] = backend
+    if backend == "polars":
+        import polars as pl
+
+        ctx["polars"] = {}
+        print(f"[backend] Polars {pl.__version__}")
+    if backend != "duckdb":
+        return backend
+
+    import duckdb
+
+    con = duckdb.connect()
+    if config.get("duckdb_threads"):
+        con.execute(f"SET threads = {int(config['duckdb_threads'])}")
+    if config.get("duckdb_memory_limit"):
+        con.execute(f"SET memory_limit = '{config['duckdb_memory_limit']}'")
+    if config.get("duckdb_temp_dir"):
+        con.execute(f"SET temp_directory = '{config['duckdb_temp_dir']}'")
+    ctx["duckdb"] = con
+    ctx["duckdb_tables"] = set()
+    print(f"[backend] DuckDB {duckdb.__version__}")
+    return backend
+
+
+def close_backend(ctx: dict) -> None:
+    """Close the DuckDB connection and drop the Polars copies, if any."""
+    ctx.pop("polars", None)
+    ctx.pop("duckdb_tables", None)
+    con = ctx.pop("duckdb", None)
+    if con is not None:
+        con.close()
+
+
+# =========================================================================
+# Aggregation
+# =========================================================================
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _restore_dtypes(out: pd.DataFrame, df: pd.DataFrame, by: list[str], aggs: dict) -> pd.DataFrame:
+    """Give engine results the pandas key dtypes (Period, category, string, numeric) and int counts.
+
+    Categorical keys sort by category order in pandas, so the result is
+    re-sorted once they are restored.
+    """
+    categorical = False
+    for c in by:
+        if isinstance(df[c].dtype, pd.PeriodDtype):
+            out[c] = pd.to_datetime(out[c]).dt.to_period(df[c].dtype.freq)
+        elif isinstance(df[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype(object).astype(df[c].dtype)
+            categorical = True
+        elif ((df[c].dtype.kind in "iuf" or isinstance(df[c].dtype, pd.StringDtype))
+              and out[c].dtype != df[c].dtype):
+            out[c] = out[c].astype(df[c].dtype)
+    for name, (col, func) in aggs.items():
+        if func in ("count", "size", "nunique", "approx_nunique"):
+            out[name] = out[name].astype(np.int64)
+    if categorical:
+        out = out.sort_values(by, kind="stable", ignore_index=True)
+    return out
+
+
+def _pandas_agg(df: pd.DataFrame, by: list[str], aggs: dict, config: dict) -> pd.DataFrame:
+    exact = {name: agg for name, agg in aggs.items() if agg[1] != "approx_nunique"}
+    groups = df.groupby(by, observed=True, sort=True)
+    if exact:
+        out = groups.agg(**exact).reset_index()
+    else:
+        out = groups.size().reset_index()[by]
+    if len(exact) < len(aggs):
+        from v4_sketches import SKETCH_ERROR, group_nunique
+
+        error = float(config.get("sketch_error", SKETCH_ERROR))
+        for name, (col, func) in aggs.items():
+            if func == "approx_nunique":
+                out[name] = group_nunique(df, by, col, error).to_numpy()
+        out = out[[*by, *aggs]]
+        out.columns = pd.Index(list(out.columns))
+    return out
+
+
+def _polars_agg(ctx: dict, source, df: pd.DataFrame, by: list[str], aggs: dict) -> pd.DataFrame:
+    import polars as pl
+    from v4_polars import to_polars
+
+    if isinstance(source, str) and source in _CTX_TABLES:
+        frame = _polars_frame(ctx, source)
+    else:
+        frame = to_polars(df[list(dict.fromkeys([*by, *(col for col, _ in aggs.values())]))])
+    exprs = {
+        "sum": lambda c: pl.col(c).sum(),
+        "count": lambda c: pl.col(c).count(),
+        "size": lambda c: pl.len(),
+        "mean": lambda c: pl.col(c).mean(),
+        "nunique": lambda c: pl.col(c).drop_nulls().n_unique(),
+        "min": lambda c: pl.col(c).min(),
+        "max": lambda c: pl.col(c).max(),
+        "approx_nunique": lambda c: pl.col(c).drop_nulls().approx_n_unique(),
+    }
+    out = (
+        frame.lazy()
+        .filter(pl.all_horizontal(pl.col(c).is_not_null() for c in by))
+        .group_by(by)
+        .agg(exprs[func](col).alias(name) for name, (col, func) in aggs.items())
+        .sort(by)
+        .collect()
+        .to_pandas()
+    )
+    return _restore_dtypes(out, df, by, aggs)
+
+
+def group_agg(ctx: dict, source, by, **aggs) -> pd.DataFrame:
+    """Group *source* by *by* and compute named aggregations.
+
+    Parameters
+    ----------
+    ctx : dict
+        Pipeline context (``backend`` / ``duckdb`` set by ``attach_backend``).
+    source : str | pd.DataFrame
+        A ctx frame key (e.g. ``"combined_df"``) or an ad-hoc DataFrame.
+    by : str | list[str]
+        Grouping column(s). Rows with a null key are dropped (as pandas does).
+    **aggs : (column, func)
+        ``func`` in sum / count / size / mean / nunique / min / max, or
+        ``approx_nunique`` (HyperLogLog). With ``approx_distinct: true`` in
+        the config every ``nunique`` runs as ``approx_nunique``.
+
+    Returns
+    -------
+    pd.DataFrame -- *by* columns then one column per aggregation, sorted by
+    the keys, with a default RangeIndex. Identical between backends.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    for name, (_, func) in aggs.items():
+        if func not in _AGG_SQL:
+            raise ValueError(f"Unsupported aggregation '{func}' for '{name}'")
+    config = ctx.get("config", {})
+    if config.get("approx_distinct"):
+        aggs = {name: (col, "approx_nunique" if func == "nunique" else func)
+                for name, (col, func) in aggs.items()}
+    df = ctx[source] if isinstance(source, str) else source
+
+    if ctx.get("backend") == "polars":
+        return _polars_agg(ctx, source, df, by, aggs)
+    con = ctx.get("duckdb")
+    if ctx.get("backend") != "duckdb" or con is None:
+        return _pandas_agg(df, by, aggs, config)
+
+    adhoc = not (isinstance(source, str) and source in _CTX_TABLES)
+    table = f"_adhoc_{next(_tmp_names)}" if adhoc else _duckdb_table(ctx, source)
+    if adhoc:
+        con.register(table, _duckdb_frame(df))
+    try:
+        keys = ", ".join(_quote(c) for c in by)
+        selects = ", ".join(
+            f"{_AGG_SQL[func].format(c=_quote(col))} AS {_quote(name)}"
+            for name, (col, func) in aggs.items()
+        )
+        not_null = " AND ".join(f"{_quote(c)} IS NOT NULL" for c in by)
+        out = con.execute(
+            f"SELECT {keys}, {selects} FROM {_quote(table)} "
+            f"WHERE {not_null} GROUP BY {keys} ORDER BY {keys}"
+        ).df()
+    finally:
+        if adhoc:
+            con.unregister(table)
+
+    return _restore_dtypes(out, df, by, aggs)
+
+
+def distinct_count(ctx: dict, values: pd.Series) -> int:
+    """Number of distinct non-null *values*, like ``values.nunique()``.
+
+    With ``approx_distinct: true`` it is a HyperLogLog estimate
+    (``sketch_error``), as for the ``nunique`` roll-ups of ``group_agg``.
+    """
+    config = ctx.get("config", {})
+    if not config.get("approx_distinct"):
+        return int(values.nunique())
+    from v4_sketches import SKETCH_ERROR, HyperLogLog, hll_precision
+
+    p = hll_precision(float(config.get("sketch_error", SKETCH_ERROR)))
+    return int(round(HyperLogLog(p).add(values).count()))
+
+
+# =========================================================================
+# Parity check
+# =========================================================================
+
+def check_parity(ctx: dict, rollups: dict | None = None) -> pd.DataFrame:
+    """Run the storyline roll-ups on both backends and compare the results.
+
+    *rollups* maps a label to ``(source, by, aggs)``; *source* is a ctx key
+    or a DataFrame. Defaults to the storyline roll-ups on the loaded data.
+    Values and dtypes must agree. Returns one row per roll-up with
+    ``rows`` and ``match`` (bool).
+    """
+    if rollups is None:
+        merch_col = ("merchant_consolidated" if "merchant_consolidated" in ctx["combined_df"].columns
+                     else "merchant_name")
+        rollups = {
+            "per-account": ("combined_df", ["primary_account_num"],
+                            {"total_spend": ("amount", "sum"), "txn_count": ("amount", "count")}),
+            "per-merchant": ("combined_df", [merch_col],
+                             {"spend": ("amount", "sum"), "txns": ("amount", "count"),
+                              "avg": ("amount", "mean"),
+                              "accounts": ("primary_account_num", "nunique")}),
+            "per-merchant-month": ("combined_df", [merch_col, "year_month"],
+                                   {"amount": ("amount", "sum")}),
+            "per-mcc": ("combined_df", ["mcc_code"],
+                        {"spend": ("amount", "sum"), "merchants": ("merchant_name", "nunique")}),
+            "business per-merchant": ("business_df", [merch_col],
+                                      {"spend": ("amount", "sum"),
+                                       "accounts": ("primary_account_num", "nunique")}),
+            "per-branch": ("combined_df", ["Branch"],
+                           {"spend": ("amount", "sum"),
+                            "accounts": ("primary_account_num", "nunique")}),
+        }
+    pandas_ctx = {k: v for k, v in ctx.items()
+                  if k not in ("backend", "duckdb", "duckdb_tables", "polars")}
+    pandas_ctx["backend"] = "pandas"
+    rows = []
+    for label, (source, by, aggs) in rollups.items():
+        df = ctx.get(source) if isinstance(source, str) else source
+        if df is None or not set(by).issubset(df.columns):
+            continue
+        expected = group_agg(pandas_ctx, source, by, **aggs)
+        got = group_agg(ctx, source, by, **aggs)
+        # HyperLogLog implementations differ between backends: compare those loosely
+        approx = [name for name, (_, func) in aggs.items() if func == "approx_nunique"]
+        try:
+            pd.testing.assert_frame_equal(got.drop(columns=approx), expected.drop(columns=approx),
+                                          check_exact=False, rtol=1e-9)
+            pd.testing.assert_frame_equal(got[approx], expected[approx],
+                                          check_exact=False, rtol=APPROX_RTOL)
+            match = True
+        except AssertionError as e:
+            print(f"[parity] {label}: MISMATCH\n{e}")
+            match = False
+        rows.append({"rollup": label, "rows": len(expected), "match": match})
+    return pd.DataFrame(rows)
+
+
+def synthetic_context(rows: int = 20_000, seed: int = 0) -> dict:
+    """Small transaction ctx with the edge cases the backends must agree on.
+
+    Null account / merchant / branch keys, missing amounts, a merchant whose
+    amounts are all missing, a categorical ``Branch`` with an unused
+    category (in non-alphabetical order), a nullable-integer ``tier``,
+    Period ``year_month`` and int ``mcc_code`` keys.
+    """
+    rng = np.random.default_rng(seed)
+    merchants = np.array(["ACME", "BOB'S DINER", "CAFÉ ROMA", "ZED", None], dtype=object)
+    df = pd.DataFrame({
+        "primary_account_num": rng.choice(np.array([*map(str, range(500)), None], dtype=object),
+                                          rows),
+        "merchant_name": merchants[rng.integers(0, len(merchants), rows)],
+        "Branch": pd.Categorical(rng.choice(np.array(["West", "East", None], dtype=object), rows),
+                                 categories=["West", "North", "East"]),
+        "tier": pd.array(rng.choice(np.array([1, 2, None], dtype=object), rows), dtype="Int64"),
+        "mcc_code": rng.integers(5000, 5010, rows).astype(np.int64),
+        "year_month": pd.period_range("2024-01", periods=6, freq="M")[rng.integers(0, 6, rows)],
+        "amount": np.where(rng.random(rows) < 0.1, np.nan, rng.gamma(2.0, 30.0, rows)),
+        "Business?": rng.choice(["Yes", "No"], rows),
+    })
+    df["merchant_consolidated"] = df["merchant_name"]
+    df.loc[df["merchant_name"] == "ZED", "amount"] = np.nan
+    return {
+        "config": {},
+        "combined_df": df,
+        "business_df": df[df["Business?"] == "Yes"].copy(),
+        "personal_df": df[df["Business?"] == "No"].copy(),
+    }
+
+
+def self_test(backends: tuple[str, ...] | None = None) -> pd.DataFrame:
+    """``check_parity`` of each installed backend on ``synthetic_context``.
+
+    Adds roll-ups on the categorical, nullable-integer and Period keys, an
+    empty frame, every aggregation and ``approx_nunique`` (alone and with
+    exact aggregations, over null keys; within ``APPROX_RTOL``). Returns one row per backend and
+    roll-up with ``rows`` and ``match``.
+    """
+    every = {"sum": ("amount", "sum"), "count": ("amount", "count"),
+             "size": ("amount", "size"), "mean": ("amount", "mean"),
+             "nunique": ("primary_account_num", "nunique"),
+             "min": ("amount", "min"), "max": ("amount", "max")}
+    approx = {"accounts": ("primary_account_num", "approx_nunique")}
+    reports = []
+    for backend in backends or BACKENDS[1:]:
+        if importlib.util.find_spec(backend) is None:
+            print(f"[parity] {backend} not installed -- skipped")
+            continue
+        ctx = synthetic_context()
+        df = ctx["combined_df"]
+        ctx["config"]["backend"] = backend
+        attach_backend(ctx)
+        extra = {
+            "per-merchant (all aggs)": ("combined_df", ["merchant_name"], every),
+            "per-branch (categorical)": ("combined_df", ["Branch", "merchant_name"], every),
+            "per-tier (nullable int)": ("combined_df", ["tier"], every),
+            "per-month-mcc (period)": ("combined_df", ["year_month", "mcc_code"], every),
+            "ad-hoc frame": (df[df["amount"] > 50], ["Branch"], every),
+            "empty frame": (df.iloc[:0], ["Branch", "merchant_name"], every),
+            # null merchant / branch keys, approx_nunique alone and mixed
+            "approx only (null keys)": ("combined_df", ["merchant_name"], approx),
+            "approx + exact (categorical)": ("combined_df", ["Branch", "merchant_name"],
+                                             {**approx, "spend": ("amount", "sum")}),
+            "approx, empty frame": (df.iloc[:0], ["merchant_name"], approx),
+        }
+        try:
+            report = pd.concat([check_parity(ctx), check_parity(ctx, extra)], ignore_index=True)
+        finally:
+            close_backend(ctx)
+        reports.append(report.assign(backend=backend))
+    if not reports:
+        return pd.DataFrame(columns=["backend", "rollup", "rows", "match"])
+    return pd.concat(reports, ignore_index=True)[["backend", "rollup", "rows", "match"]]
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--self-test"]:
+        report = self_test(tuple(sys.argv[2:]) or None)
+        print(report.to_string(index=False))
+        sys.exit(0 if report["match"].all() else 1)
+
+    from v4_data_loader import load_all, load_config
+
+    config = load_config(sys.argv[1] if len(sys.argv) > 1 else "v4_config.yaml")
+    backend = sys.argv[2] if len(sys.argv) > 2 else "duckdb"
+    config["backend"] = backend
+    ctx = load_all(config)
+    if attach_backend(ctx) != backend:
+        sys.exit(f"{backend} is not installed")
+    report = check_parity(ctx)
+    print(report.to_string(index=False))
+    close_backend(ctx)
+    sys.exit(0 if report["match"].all() else 1)
@@ -0,0 +1,245 @@
+"""Multi-client batch runner.
+
+Runs ``run_pipeline`` for many clients in parallel worker processes. The
+base config is loaded once in the parent and handed to each worker at
+start-up; clients are scheduled largest-first under a memory budget based
+on each client's estimated data size.
+
+Usage:
+    python v4_run.py --all-clients
+    python v4_run.py --clients 1453,1776 --workers 4 --mem-gb 24
+"""
+from __future__ import annotations
+
+import contextlib
+import importlib.util
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from v4_client_config import list_clients, load_base, load_client_config
+
+# In-memory size of the loaded data relative to the files on disk
+# (parsed strings + derived columns for CSVs; XLSX is zip-compressed).
+TXN_MEMORY_FACTOR = 4.0
+ODD_MEMORY_FACTOR = 12.0
+# Fixed per-worker overhead: interpreter, pandas/plotly imports, reports
+WORKER_OVERHEAD_BYTES = 600 * 1024 ** 2
+
+_FALLBACK_MEMORY_BYTES = 8 * 1024 ** 3
+
+# Set in each worker by _init_worker
+_WORKER_BASE: dict | None = None
+
+
+# =========================================================================
+# Sizing
+# =========================================================================
+
+def estimate_client_bytes(config: dict) -> int:
+    """Estimate peak memory for one client's run from its input file sizes."""
+    txn_bytes = 0
+    txn_dir = config.get("transaction_dir") or ""
+    if txn_dir and Path(txn_dir).is_dir():
+        ext = config.get("file_extension", "csv")
+        txn_bytes = sum(p.stat().st_size for p in Path(txn_dir).rglob(f"*.{ext}"))
+
+    odd_bytes = 0
+    odd_file = config.get("odd_file") or ""
+    if odd_file and Path(odd_file).is_file():
+        odd_bytes = Path(odd_file).stat().st_size
+
+    return int(txn_bytes * TXN_MEMORY_FACTOR
+               + odd_bytes * ODD_MEMORY_FACTOR
+               + WORKER_OVERHEAD_BYTES)
+
+
+def available_memory_bytes() -> int:
+    """Physical memory currently available (psutil, then sysconf, then 8 GB)."""
+    if importlib.util.find_spec("psutil") is not None:
+        import psutil
+        return int(psutil.virtual_memory().available)
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return _FALLBACK_MEMORY_BYTES
+
+
+def _missing_inputs(config: dict) -> str | None:
+    """Return why a client can't run (no data paths), or None."""
+    txn_dir = config.get("transaction_dir") or ""
+    odd_file = config.get("odd_file") or ""
+    if not txn_dir or not Path(txn_dir).is_dir():
+        return f"transaction_dir not found: {txn_dir!r}"
+    if not odd_file or not Path(odd_file).is_file():
+        return f"odd_file not found: {odd_file!r}"
+    return None
+
+
+# =========================================================================
+# Worker
+# =========================================================================
+
+def _init_worker(base: dict) -> None:
+    """Process-pool initializer: keep the shared base config for every task."""
+    global _WORKER_BASE
+    _WORKER_BASE = base
+
+
+def run_client(
+    client_id: str,
+    storylines: list[str] | None = None,
+    log_dir: str = "output/batch/logs",
+    base: dict | None = None,
+    output_root: str | None = None,
+) -> dict:
+    """Run one client; stdout/stderr go to ``<log_dir>/<id>.log``.
+
+    *base* defaults to the worker's shared base config (or ``load_base()``).
+    With *output_root*, a relative ``output_dir`` in the client config is
+    resolved against it (the job queue writes reports back to its share).
+    Returns a status dict: client_id, status (ok/failed), error, excel,
+    html, log, elapsed_s.
+    """
+    from v4_run import run_pipeline
+
+    if base is None:
+        base = _WORKER_BASE if _WORKER_BASE is not None else load_base()
+    start = time.time()
+    Path(log_dir).mkdir(parents=True, exist_ok=True)
+    log_path = Path(log_dir) / f"{client_id}.log"
+    status = {"client_id": client_id, "status": "ok", "error": "",
+              "excel": "", "html": "", "log": str(log_path)}
+    with open(log_path, "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            config = load_client_config(client_id, base=base)
+            if output_root and not Path(config.get("output_dir", "output")).is_absolute():
+                config["output_dir"] = str(Path(output_root) / config.get("output_dir", "output"))
+            _, excel_path, html_path = run_pipeline(config, storylines)
+            status["excel"], status["html"] = str(excel_path), str(html_path)
+        except Exception as e:
+            traceback.print_exc()
+            status["status"], status["error"] = "failed", f"{type(e).__name__}: {e}"
+    status["elapsed_s"] = round(time.time() - start, 1)
+    return status
+
+
+# =========================================================================
+# Batch
+# =========================================================================
+
+def run_batch(
+    client_ids: list[str] | None = None,
+    storylines: list[str] | None = None,
+    max_workers: int | None = None,
+    memory_budget_gb: float | None = None,
+    output_dir: str = "output/batch",
+) -> pd.DataFrame:
+    """Run many clients in parallel and write a status/timing summary.
+
+    Parameters
+    ----------
+    client_ids : list[str] | None
+        Clients to run; None runs every ``configs/clients/*.yaml``.
+    storylines : list[str] | None
+        Storyline keys passed to ``run_pipeline`` (None = all).
+    max_workers : int | None
+        Upper bound on concurrent clients (default: CPU count).
+    memory_budget_gb : float | None
+        Total estimated memory the running clients may use at once
+        (default: 80% of currently available memory). A client larger than
+        the budget still runs, alone.
+    output_dir : str
+        Where per-client logs and ``batch_summary_<timestamp>.csv`` go.
+
+    Returns
+    -------
+    pd.DataFrame -- one row per client with status, timing and report paths.
+    """
+    batch_start = time.time()
+    base = load_base()
+    client_ids = client_ids or list_clients()
+    max_workers = max_workers or os.cpu_count() or 1
+    budget = (int(memory_budget_gb * 1024 ** 3) if memory_budget_gb
+              else int(available_memory_bytes() * 0.8))
+
+    out = Path(output_dir)
+    log_dir = out / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    # -- size and validate every client up front -----------------------------
+    rows: dict[str, dict] = {}
+    queue: list[tuple[str, int]] = []
+    for cid in client_ids:
+        try:
+            config = load_client_config(cid, base=base)
+        except Exception as e:
+            rows[cid] = {"client_id": cid, "status": "failed", "error": str(e)}
+            continue
+        est = estimate_client_bytes(config)
+        rows[cid] = {"client_id": cid, "client_name": config.get("client_name", ""),
+                     "est_memory_mb": round(est / 1024 ** 2)}
+        missing = _missing_inputs(config)
+        if missing:
+            rows[cid].update(status="skipped", error=missing)
+        else:
+            queue.append((cid, est))
+    queue.sort(key=lambda item: item[1], reverse=True)
+
+    print(f"[batch] {len(queue)} of {len(client_ids)} clients runnable | "
+          f"workers <= {max_workers} | memory budget {budget / 1024 ** 3:.1f} GB")
+
+    # -- memory-aware scheduling: largest first, fill the budget -------------
+    running: dict[Future, tuple[str, int]] = {}
+    in_use = 0
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(base,)) as pool:
+        while queue or running:
+            for item in list(queue):
+                cid, est = item
+                if len(running) >= max_workers:
+                    break
+                if running and in_use + est > budget:
+                    continue
+                queue.remove(item)
+                running[pool.submit(run_client, cid, storylines, str(log_dir))] = item
+                in_use += est
+                print(f"[batch] started {cid} (~{est / 1024 ** 2:,.0f} MB, "
+                      f"{len(running)} running)")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                cid, est = running.pop(fut)
+                in_use -= est
+                try:
+                    rows[cid].update(fut.result())
+                except Exception as e:  # worker died (e.g. killed for memory)
+                    rows[cid].update(status="failed", error=f"{type(e).__name__}: {e}")
+                print(f"[batch] {cid}: {rows[cid]['status']} "
+                      f"in {rows[cid].get('elapsed_s', 0):.1f}s")
+
+    # -- consolidated summary ------------------------------------------------
+    cols = ["client_id", "client_name", "status", "elapsed_s", "est_memory_mb",
+            "error", "excel", "html", "log"]
+    summary = pd.DataFrame([rows[c] for c in client_ids]).reindex(columns=cols)
+    summary_path = out / f"batch_summary_{datetime.now():%Y%m%d_%H%M%S}.csv"
+    summary.to_csv(summary_path, index=False)
+
+    elapsed = time.time() - batch_start
+    serial = summary["elapsed_s"].fillna(0).sum()
+    counts = summary["status"].value_counts()
+    print(f"\n{'=' * 80}")
+    print(f"  BATCH COMPLETE in {elapsed:.1f}s "
+          f"(sum of client run times {serial:.1f}s)")
+    print("  " + " | ".join(f"{k}: {v}" for k, v in counts.items()))
+    print(f"{'=' * 80}")
+    print(summary[["client_id", "status", "elapsed_s", "est_memory_mb", "error"]]
+          .to_string(index=False))
+    print(f"\n  Summary: {summary_path}")
+    return summary
@@ -0,0 +1,203 @@
+"""Batch PNG export for plotly figures.
+
+``render_pngs`` turns many figures into PNG bytes at once:
+
+- each PNG is cached on disk under a hash of the figure spec JSON, the
+  theme and the image size, so charts that did not change since the last
+  run are not rendered again (``chart_cache_dir``, default
+  ``.cache/charts``; "" disables). Only the figures that miss the cache
+  are built into validated Plotly figures (``v4_figspec.to_figure``);
+- the remaining figures are rendered by worker processes that each keep
+  one kaleido renderer (headless Chromium) alive for all their figures,
+  instead of paying the renderer round-trip per ``write_image`` call.
+
+A figure that fails to render is reported and returned as None; the
+export carries on with the rest.
+"""
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import plotly.io as pio
+
+from v4_figspec import FigureLike, spec_json, to_figure
+
+CHART_CACHE_DIR = ".cache/charts"
+DEFAULT_WIDTH = 900
+DEFAULT_HEIGHT = 500
+MAX_WORKERS = 4
+
+# Set per process by _init_renderer / _render
+_RENDERER = None
+
+# Set on first use by _theme_hash
+_THEME_HASH = None
+
+
+# =========================================================================
+# Renderer
+# =========================================================================
+
+def _new_renderer():
+    """A persistent kaleido 0.2.x scope, or None (plotly.io handles rendering)."""
+    if importlib.util.find_spec("kaleido") is None:
+        return None
+    try:
+        from kaleido.scopes.plotly import PlotlyScope
+    except ImportError:  # kaleido >= 1.0 has no scopes; plotly.io drives it
+        return None
+    return PlotlyScope(mathjax=False)
+
+
+def _init_renderer() -> None:
+    """Process-pool initializer: start this worker's own renderer."""
+    global _RENDERER
+    _RENDERER = _new_renderer()
+
+
+def _render(fig_json: str, width: int, height: int, scale: float) -> bytes:
+    """Render one figure (as JSON) to PNG bytes with this process's renderer."""
+    global _RENDERER
+    if _RENDERER is None:
+        _RENDERER = _new_renderer()
+    if _RENDERER is not None:
+        return _RENDERER.transform(json.loads(fig_json), format="png",
+                                   width=width, height=height, scale=scale)
+    return pio.to_image(pio.from_json(fig_json), format="png",
+                        width=width, height=height, scale=scale)
+
+
+def _render_job(job: tuple[str, str, int, int, float]) -> tuple[str, bytes | None, str]:
+    key, fig_json, width, height, scale = job
+    try:
+        return key, _render(fig_json, width, height, scale), ""
+    except Exception as e:
+        return key, None, f"{type(e).__name__}: {e}"
+
+
+# =========================================================================
+# Cache
+# =========================================================================
+
+def _theme_hash() -> str:
+    """SHA-1 of the v4_consultant template, so theme edits re-render charts."""
+    global _THEME_HASH
+    if _THEME_HASH is None:
+        from v4_themes import ensure_theme
+
+        ensure_theme()
+        template = pio.templates["v4_consultant"].to_plotly_json()
+        _THEME_HASH = hashlib.sha1(
+            json.dumps(template, sort_keys=True, default=str).encode()
+        ).hexdigest()
+    return _THEME_HASH
+
+
+def chart_key(fig_json: str, width: int, height: int, scale: float) -> str:
+    """Cache key: SHA-1 of the figure (spec) JSON, the theme and the output size."""
+    h = hashlib.sha1(f"{width}x{height}@{scale}\n{_theme_hash()}\n".encode())
+    h.update(fig_json.encode())
+    return h.hexdigest()
+
+
+def _cache_path(cache_dir: str, key: str) -> Path:
+    return Path(cache_dir) / f"{key}.png"
+
+
+def _cache_put(cache_dir: str, key: str, png: bytes) -> None:
+    """Write a cached PNG atomically so a concurrent run never reads half a file."""
+    path = _cache_path(cache_dir, key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(png)
+    os.replace(tmp, path)
+
+
+# =========================================================================
+# Batch export
+# =========================================================================
+
+def render_pngs(
+    figs: list[FigureLike],
+    width: int = DEFAULT_WIDTH,
+    height: int = DEFAULT_HEIGHT,
+    scale: float = 1,
+    cache_dir: str = CHART_CACHE_DIR,
+    workers: int | None = None,
+) -> list[bytes | None]:
+    """Render *figs* to PNG bytes, using the cache and parallel renderers.
+
+    Parameters
+    ----------
+    figs : list[FigureSpec | go.Figure]
+    width, height, scale :
+        Image size; scale=1 suits Excel, scale=3 presentation decks.
+    cache_dir : str
+        PNG cache folder; "" disables the cache.
+    workers : int | None
+        Renderer processes for the uncached figures (default: up to
+        ``MAX_WORKERS``, one per figure). 1 renders in this process.
+
+    Returns
+    -------
+    list -- PNG bytes per figure, in order; None where rendering failed.
+    """
+    start = time.time()
+    keys = [chart_key(spec_json(fig), width, height, scale) for fig in figs]
+
+    pngs: dict[str, bytes | None] = {}
+    if cache_dir:
+        for key in set(keys):
+            path = _cache_path(cache_dir, key)
+            if path.is_file():
+                pngs[key] = path.read_bytes()
+    cached = len(pngs)
+
+    jobs = {}
+    for key, fig in zip(keys, figs):
+        if key not in pngs and key not in jobs:
+            jobs[key] = (key, to_figure(fig).to_json(), width, height, scale)
+
+    workers = min(workers or min(MAX_WORKERS, os.cpu_count() or 1), len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_renderer) as pool:
+            results = list(pool.map(_render_job, jobs.values()))
+    else:
+        results = [_render_job(job) for job in jobs.values()]
+
+    for key, png, error in results:
+        pngs[key] = png
+        if png is None:
+            print(f"[charts] WARNING: chart not rendered ({error})")
+        elif cache_dir:
+            _cache_put(cache_dir, key, png)
+
+    if figs:
+        renderers = f" by {workers} renderer(s)" if workers > 1 else ""
+        print(f"[charts] {len(figs)} chart(s): {cached} cached, {len(jobs)} rendered"
+              f"{renderers} in {time.time() - start:.1f}s")
+    return [pngs[key] for key in keys]
+
+
+def render_png(
+    fig: FigureLike,
+    width: int = DEFAULT_WIDTH,
+    height: int = DEFAULT_HEIGHT,
+    scale: float = 1,
+    cache_dir: str = CHART_CACHE_DIR,
+) -> bytes:
+    """Render one figure to PNG bytes (cached); raises if rendering fails."""
+    key = chart_key(spec_json(fig), width, height, scale)
+    path = _cache_path(cache_dir, key) if cache_dir else None
+    if path is not None and path.is_file():
+        return path.read_bytes()
+    png = _render(to_figure(fig).to_json(), width, height, scale)
+    if cache_dir:
+        _cache_put(cache_dir, key, png)
+    return png
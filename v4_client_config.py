@@ -8,6 +8,8 @@ Usage:
 """
 from __future__ import annotations
 
+import importlib.util
+import shutil
 from pathlib import Path
 
 import yaml
@@ -17,6 +19,9 @@ _CONFIGS = _ROOT / "configs"
 _BASE_PATH = _CONFIGS / "base_competitors.yaml"
 _CLIENTS_DIR = _CONFIGS / "clients"
 
+# Sections of a client file the app's rule editor can change
+_RULE_KEYS = ("competitors", "false_positives", "financial_services")
+
 
 def load_base() -> dict:
     """Load the shared base config (competitors, financial_services, payroll, etc.)."""
@@ -26,9 +31,12 @@ def load_base() -> dict:
         return yaml.safe_load(f) or {}
 
 
-def load_client_config(client_id: str) -> dict:
+def load_client_config(client_id: str, base: dict | None = None) -> dict:
     """Load a client config merged with the base.
 
+    *base* is the already-loaded ``load_base()`` dict; pass it when loading
+    many clients (e.g. a batch run) to read the base file only once.
+
     Merge rules:
     - competitors: client patterns are APPENDED to base (per category, per tier)
     - false_positives: client list appended to base list
@@ -37,7 +45,8 @@ def load_client_config(client_id: str) -> dict:
 
     Returns a dict ready to pass to run_pipeline().
     """
-    base = load_base()
+    if base is None:
+        base = load_base()
 
     client_path = _CLIENTS_DIR / f"{client_id}.yaml"
     if not client_path.exists():
@@ -48,27 +57,30 @@ def load_client_config(client_id: str) -> dict:
     with open(client_path, encoding="utf-8") as f:
         client = yaml.safe_load(f) or {}
 
+    # Start with client fields, then layer in merged/base values
+    return {**client, **merge_rules(base, client)}
+
+
+def merge_rules(base: dict, client: dict) -> dict:
+    """The merged rule sections of a client: competitors, false_positives, ...
+
+    Also used by the app's rule editor to preview unsaved client rules.
+    """
     # Merge competitors: client patterns extend base patterns
-    base_comp = base.get("competitors", {})
-    client_comp = client.pop("competitors", {})
-    merged_comp = _merge_competitors(base_comp, client_comp)
+    merged = {"competitors": _merge_competitors(base.get("competitors", {}),
+                                                client.get("competitors") or {})}
 
     # Merge false positives (deduplicated, order preserved)
-    base_fp = base.get("false_positives", [])
-    client_fp = client.pop("false_positives", [])
-    merged_fp = list(dict.fromkeys(base_fp + client_fp))
-
-    # Start with client fields, then layer in merged/base values
-    config = dict(client)
-    config["competitors"] = merged_comp
-    config["false_positives"] = merged_fp
+    merged["false_positives"] = list(dict.fromkeys(
+        base.get("false_positives", []) + (client.get("false_positives") or [])))
 
     # Carry over base sections the client doesn't override
     for key in ("financial_services", "payroll"):
-        if key not in config and key in base:
-            config[key] = base[key]
-
-    return config
+        if key in client:
+            merged[key] = client[key]
+        elif key in base:
+            merged[key] = base[key]
+    return merged
 
 
 def _merge_competitors(base: dict, client: dict) -> dict:
@@ -96,6 +108,55 @@ def _merge_competitors(base: dict, client: dict) -> dict:
     return merged
 
 
+def client_rules(client_id: str) -> dict:
+    """The client file's own (unmerged) competitors / false_positives / financial_services."""
+    with open(_CLIENTS_DIR / f"{client_id}.yaml", encoding="utf-8") as f:
+        client = yaml.safe_load(f) or {}
+    return {key: client[key] for key in _RULE_KEYS if key in client}
+
+
+def save_client_rules(client_id: str, rules: dict) -> Path:
+    """Write edited rule sections back to ``configs/clients/<client_id>.yaml``.
+
+    Keys of *rules* (``_RULE_KEYS``) replace the file's sections; a
+    ``financial_services`` of None removes the override so the base
+    applies again. With ``ruamel.yaml`` installed the file's comments and
+    layout are kept; otherwise it is rewritten with PyYAML (comments are
+    lost) and the previous version is kept as ``<client_id>.yaml.bak``.
+    """
+    path = _CLIENTS_DIR / f"{client_id}.yaml"
+    if importlib.util.find_spec("ruamel") is not None:
+        from ruamel.yaml import YAML
+
+        rt = YAML()
+        rt.preserve_quotes = True
+        with open(path, encoding="utf-8") as f:
+            doc = rt.load(f)
+        _apply_rules(doc, rules)
+        with open(path, "w", encoding="utf-8") as f:
+            rt.dump(doc, f)
+    else:
+        print(f"[config] ruamel.yaml not installed; rewriting {path.name} without its "
+              f"comments (previous version: {path.name}.bak)")
+        with open(path, encoding="utf-8") as f:
+            doc = yaml.safe_load(f) or {}
+        shutil.copy2(path, path.with_name(path.name + ".bak"))
+        _apply_rules(doc, rules)
+        with open(path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(dict(doc), f, sort_keys=False, allow_unicode=True)
+    return path
+
+
+def _apply_rules(doc: dict, rules: dict) -> None:
+    for key in _RULE_KEYS:
+        if key not in rules:
+            continue
+        if rules[key] is None:
+            doc.pop(key, None)
+        else:
+            doc[key] = rules[key]
+
+
 def list_clients() -> list[str]:
     """Return sorted list of configured client IDs."""
     if not _CLIENTS_DIR.exists():
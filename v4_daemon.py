@@ -0,0 +1,378 @@
+"""Analysis daemon: keep clients' data loaded between runs.
+
+Every ``v4_run.py`` or app run loads the transaction files and the ODD again.
+The daemon loads a client once and keeps its context resident, so an analyst
+iterating on one client (competitor patterns, thresholds, a single
+storyline) gets results in seconds. Requests run against a shallow copy of
+the resident context (see ``run_pipeline(ctx=...)``), so several requests
+can use the same client's data at once; the result cache still applies, so
+only storylines whose inputs changed are recomputed.
+
+- A client is (re)loaded when its data fingerprint changes: new transaction
+  files, an edited ODD, or overrides of loader keys such as
+  ``recent_months``.
+- Resident clients are evicted least-recently-used first when loading
+  another one would exceed the memory cap, and after ``--idle-min``
+  minutes without requests.
+- Code changes are not picked up by a running daemon; after editing a
+  ``v4_*.py`` module, requests are refused until it is restarted.
+
+It listens on HTTP on 127.0.0.1 only (works on Windows too; no auth).
+
+Usage:
+    python v4_daemon.py [--port 8765] [--mem-gb 16] [--idle-min 60]
+
+Requests (JSON; ``client_id`` from configs/clients, or ``config_file``):
+    GET  /status
+    POST /load   {"client_id": "1453"}
+    POST /run    {"client_id": "1453", "storylines": ["s3_competition"],
+                  "overrides": {"competitors": {...}}, "reports": ["html"]}
+    POST /evict  {"client_id": "1453"}
+
+``/run`` without ``storylines`` and with ``"reports": ["html"]`` rebuilds
+the HTML dashboard from cached results. From Python:
+``daemon_request("/run", {"client_id": "1453", ...})``.
+"""
+from __future__ import annotations
+
+import gc
+import json
+import sys
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from v4_batch import WORKER_OVERHEAD_BYTES, available_memory_bytes, estimate_client_bytes
+from v4_client_config import load_base, load_client_config
+from v4_data_loader import DATA_SOURCES, load_config, load_context
+from v4_result_cache import data_fingerprint
+from v4_run import ALL_STORYLINES, REPORTS, run_pipeline, write_reports
+from v4_segments import segment_payload
+
+DAEMON_PORT = 8765
+IDLE_MINUTES = 60
+# Share of the available memory resident clients may use by default
+MEMORY_SHARE = 0.5
+SWEEP_S = 60
+
+_HERE = Path(__file__).resolve().parent
+
+
+def _code_stamp() -> dict[str, int]:
+    return {p.name: p.stat().st_mtime_ns for p in sorted(_HERE.glob("v4_*.py"))}
+
+
+def context_bytes(ctx: dict) -> int:
+    """In-memory size of the frames / arrays of a loaded context."""
+    seen: set[int] = set()
+    total = 0
+    for value in dict.values(ctx):
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, pd.DataFrame):
+            total += int(value.memory_usage(deep=True).sum())
+        elif isinstance(value, np.ndarray):
+            total += value.nbytes
+        elif isinstance(value, dict):  # odd_ts, activity
+            total += sum(v.nbytes for v in value.values() if isinstance(v, np.ndarray))
+    return total
+
+
+# =========================================================================
+# Resident clients
+# =========================================================================
+
+class ClientPool:
+    """Loaded client contexts, shared by concurrent requests.
+
+    Parameters
+    ----------
+    mem_bytes : int
+        Cap on the summed size of resident contexts.
+    idle_s : float
+        Contexts unused for this long are evicted by ``sweep_idle``.
+    """
+
+    def __init__(self, mem_bytes: int, idle_s: float):
+        self.mem_bytes = mem_bytes
+        self.idle_s = idle_s
+        self._lock = threading.Lock()
+        self._clients: dict[str, dict] = {}
+        self._report_locks: dict[str, threading.Lock] = {}
+
+    def acquire(self, client_id: str, config: dict) -> dict:
+        """Resident entry for *client_id* (loading it if needed); pair with ``release``."""
+        fingerprint = data_fingerprint(config)
+        with self._lock:
+            entry = self._clients.get(client_id)
+            load = entry is None or entry["fingerprint"] != fingerprint
+            if load:
+                # A stale entry is replaced; runs still using it keep their reference
+                entry = {"client_id": client_id, "fingerprint": fingerprint, "ctx": None,
+                         "bytes": 0, "error": None, "ready": threading.Event(),
+                         "in_flight": 0, "loaded_at": None, "last_used": time.time()}
+                self._clients[client_id] = entry
+            entry["in_flight"] += 1
+
+        if load:
+            try:
+                self._make_room(client_id, estimate_client_bytes(config) - WORKER_OVERHEAD_BYTES)
+                start = time.time()
+                print(f"[daemon] Loading {client_id}")
+                ctx = load_context(config, sources=DATA_SOURCES)
+                entry["ctx"], entry["bytes"] = ctx, context_bytes(ctx)
+                entry["loaded_at"] = time.time()
+                print(f"[daemon] {client_id} resident: {entry['bytes'] / 1024 ** 2:,.0f} MB "
+                      f"in {time.time() - start:.1f}s")
+            except Exception as e:
+                entry["error"] = e
+                with self._lock:
+                    if self._clients.get(client_id) is entry:
+                        del self._clients[client_id]
+            finally:
+                entry["ready"].set()
+        else:
+            entry["ready"].wait()
+
+        if entry["error"] is not None:
+            self.release(entry)
+            raise entry["error"]
+        return entry
+
+    def release(self, entry: dict) -> None:
+        with self._lock:
+            entry["in_flight"] -= 1
+            entry["last_used"] = time.time()
+
+    def report_lock(self, client_id: str) -> threading.Lock:
+        """Lock serialising report writes of one client (same output files)."""
+        with self._lock:
+            return self._report_locks.setdefault(client_id, threading.Lock())
+
+    def _make_room(self, client_id: str, needed: int) -> None:
+        """Evict idle clients, least recently used first, until *needed* bytes fit."""
+        with self._lock:
+            used = sum(e["bytes"] for e in self._clients.values())
+            idle = sorted((e for e in self._clients.values()
+                           if e["client_id"] != client_id and e["in_flight"] == 0
+                           and e["ctx"] is not None),
+                          key=lambda e: e["last_used"])
+            evicted = []
+            while used + needed > self.mem_bytes and idle:
+                entry = idle.pop(0)
+                del self._clients[entry["client_id"]]
+                used -= entry["bytes"]
+                evicted.append(entry["client_id"])
+        if evicted:
+            gc.collect()
+            print(f"[daemon] Evicted for memory: {', '.join(evicted)}")
+        if used + needed > self.mem_bytes:
+            print(f"[daemon] WARNING: loading {client_id} (~{needed / 1024 ** 3:.1f} GB) goes over "
+                  f"the {self.mem_bytes / 1024 ** 3:.1f} GB cap; no idle client left to evict")
+
+    def evict(self, client_id: str) -> bool:
+        with self._lock:
+            entry = self._clients.pop(client_id, None)
+        gc.collect()
+        return entry is not None
+
+    def sweep_idle(self) -> list[str]:
+        """Evict clients with no request for ``idle_s`` seconds."""
+        now = time.time()
+        with self._lock:
+            stale = [cid for cid, e in self._clients.items()
+                     if e["in_flight"] == 0 and e["ctx"] is not None
+                     and now - e["last_used"] > self.idle_s]
+            for cid in stale:
+                del self._clients[cid]
+        if stale:
+            gc.collect()
+            print(f"[daemon] Evicted idle: {', '.join(stale)}")
+        return stale
+
+    def status(self) -> dict:
+        with self._lock:
+            clients = [{
+                "client_id": e["client_id"],
+                "state": "resident" if e["ctx"] is not None else "loading",
+                "mb": round(e["bytes"] / 1024 ** 2, 1),
+                "in_flight": e["in_flight"],
+                "idle_s": round(time.time() - e["last_used"], 1),
+            } for e in self._clients.values()]
+        return {"mem_cap_mb": round(self.mem_bytes / 1024 ** 2),
+                "resident_mb": round(sum(c["mb"] for c in clients), 1),
+                "clients": clients}
+
+
+# =========================================================================
+# Requests
+# =========================================================================
+
+class RequestError(ValueError):
+    """A request the daemon refuses (reported as HTTP 400 / 409)."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _request_config(body: dict, base: dict) -> dict:
+    if body.get("config_file"):
+        config = load_config(body["config_file"])
+    elif body.get("client_id"):
+        config = load_client_config(str(body["client_id"]), base=base)
+    else:
+        raise RequestError("client_id or config_file is required")
+    return {**config, **(body.get("overrides") or {})}
+
+
+def handle_load(pool: ClientPool, base: dict, body: dict) -> dict:
+    config = _request_config(body, base)
+    client_id = str(config.get("client_id", ""))
+    entry = pool.acquire(client_id, config)
+    pool.release(entry)
+    return {"client_id": client_id, "mb": round(entry["bytes"] / 1024 ** 2, 1)}
+
+
+def handle_run(pool: ClientPool, base: dict, body: dict) -> dict:
+    """Run storylines against the resident data and write the requested reports."""
+    start = time.time()
+    config = _request_config(body, base)
+    client_id = str(config.get("client_id", ""))
+    storylines = body.get("storylines")
+    known = {k for k, _ in ALL_STORYLINES}
+    unknown = sorted(set(storylines or ()) - known)
+    if unknown:
+        raise RequestError(f"unknown storylines: {', '.join(unknown)}")
+    reports = tuple(body.get("reports", REPORTS))
+
+    entry = pool.acquire(client_id, config)
+    try:
+        results, _, _ = run_pipeline(config, storylines, ctx=entry["ctx"], reports=())
+        segments = segment_payload(entry["ctx"], config) if "html" in reports else None
+        with pool.report_lock(client_id):
+            excel_path, html_path = write_reports(results, config, reports, segments=segments)
+    finally:
+        pool.release(entry)
+    return {
+        "client_id": client_id,
+        "elapsed_s": round(time.time() - start, 1),
+        "excel": str(excel_path) if "excel" in reports else "",
+        "html": str(html_path) if "html" in reports else "",
+        "storylines": {
+            key: {"title": r.get("title", ""), "description": r.get("description", ""),
+                  "sheets": [s["name"] for s in r.get("sheets", [])]}
+            for key, r in results.items()
+        },
+    }
+
+
+def _make_handler(pool: ClientPool, base: dict, code_stamp: dict):
+    routes = {"/load": handle_load, "/run": handle_run}
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, payload: dict) -> None:
+            data = json.dumps(payload, indent=2, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._reply(200, pool.status())
+            else:
+                self._reply(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/evict":
+                    self._reply(200, {"evicted": pool.evict(str(body.get("client_id", "")))})
+                    return
+                if self.path not in routes:
+                    raise RequestError(f"unknown path {self.path}", 404)
+                if _code_stamp() != code_stamp:
+                    raise RequestError("v4_*.py code changed since the daemon started; "
+                                       "restart it to pick up the change", 409)
+                self._reply(200, routes[self.path](pool, base, body))
+            except RequestError as e:
+                self._reply(e.status, {"error": str(e)})
+            except (json.JSONDecodeError, FileNotFoundError, KeyError) as e:
+                self._reply(400, {"error": f"{type(e).__name__}: {e}"})
+            except Exception as e:
+                traceback.print_exc()
+                self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, fmt, *args):
+            print(f"[daemon] {self.address_string()} {fmt % args}")
+
+    return Handler
+
+
+# =========================================================================
+# Server / client
+# =========================================================================
+
+def serve(
+    port: int = DAEMON_PORT,
+    mem_gb: float | None = None,
+    idle_minutes: float = IDLE_MINUTES,
+) -> None:
+    """Run the daemon until interrupted (Ctrl+C)."""
+    mem_bytes = int(mem_gb * 1024 ** 3) if mem_gb else int(available_memory_bytes() * MEMORY_SHARE)
+    pool = ClientPool(mem_bytes, idle_minutes * 60)
+    base = load_base()
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(pool, base, _code_stamp()))
+    server.daemon_threads = True
+
+    stop = threading.Event()
+
+    def sweep():
+        while not stop.wait(SWEEP_S):
+            pool.sweep_idle()
+
+    threading.Thread(target=sweep, daemon=True).start()
+    print(f"[daemon] Listening on http://127.0.0.1:{port} "
+          f"(memory cap {mem_bytes / 1024 ** 3:.1f} GB, idle eviction {idle_minutes:g} min)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+def daemon_request(path: str, body: dict | None = None, port: int = DAEMON_PORT,
+                   timeout: float = 3600) -> dict:
+    """Send a request to a running daemon (GET without *body*, POST with it)."""
+    url = f"http://127.0.0.1:{port}{path}"
+    data = None if body is None else json.dumps(body).encode()
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        payload = json.loads(e.read() or b"{}")
+        raise RuntimeError(f"daemon {e.code}: {payload.get('error', e.reason)}") from None
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    opts = dict(zip(args[::2], args[1::2]))
+    serve(
+        port=int(opts.get("--port", DAEMON_PORT)),
+        mem_gb=float(opts["--mem-gb"]) if "--mem-gb" in opts else None,
+        idle_minutes=float(opts.get("--idle-min", IDLE_MINUTES)),
+    )
@@ -6,15 +6,23 @@ a context dict ready for downstream storyline analyses.
 
 from __future__ import annotations
 
+import hashlib
+import importlib.util
+import json
+import os
 import re
 from datetime import datetime
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import yaml
 from dateutil.relativedelta import relativedelta
 
-from v4_merchant_rules import standardize_merchant_name
+from v4_activity import activity_nbytes, build_activity
+from v4_incidence import build_incidence, incidence_nbytes
+from v4_merchant_rules import consolidate_merchants
+from v4_preview import SAMPLE_CHUNK_ROWS, plan_sample, sample_mask
 
 # ---------------------------------------------------------------------------
 # Column names assigned to raw transaction files (tab-delimited, no header)
@@ -35,6 +43,17 @@ TRANSACTION_COLUMNS = [
     "transaction_code",
 ]
 
+# Columns every run reads (dates, accounts, amounts, merchant names); storylines
+# list any other transaction columns they read in their ``TXN_COLUMNS``
+CORE_TRANSACTION_COLUMNS = ("transaction_date", "primary_account_num", "amount", "merchant_name")
+
+# Text columns are parsed as strings; ids, codes and amounts are inferred
+TRANSACTION_DTYPES = {
+    c: "str" for c in ("transaction_date", "transaction_type", "merchant_name",
+                       "terminal_location_1", "terminal_location_2", "institution",
+                       "card_present")
+}
+
 # ---------------------------------------------------------------------------
 # ODD time-series regex patterns (MmmYY prefix, e.g. "Jan25 Spend")
 # ---------------------------------------------------------------------------
@@ -55,22 +74,60 @@ ODD_TIMESERIES_PATTERNS: dict[str, re.Pattern[str]] = {
     "segmentation": re.compile(rf"^{_MONTH_PREFIX} Segmentation$"),
 }
 
-# Generation boundaries based on Account Holder Age
-GENERATION_BINS = [
-    (12, 27, "Gen Z"),
-    (28, 43, "Millennial"),
-    (44, 59, "Gen X"),
-    (60, 78, "Boomer"),
-    (79, 200, "Silent"),
-]
+# ODD column groups for projection (``load_odd(config, groups=...)``).
+#   core       -- account attributes (Acct Number, Branch, Avg Bal, ...);
+#                 always loaded, derived columns depend on it
+#   timeseries -- MmmYY Spend/Swipes/PIN/Sig/OD Limit/Reg E/MTD columns
+#   campaigns  -- MmmYY Mail/Resp/Segmentation plus offer/response counters
+ODD_COLUMN_GROUPS = ("core", "timeseries", "campaigns")
+_CAMPAIGN_SERIES = {"mail", "resp", "segmentation"}
+_CAMPAIGN_COLUMNS = {"# of Offers", "# of Responses", "Response Grouping"}
+
+# Bucketed ODD features derived once at load (``derive_odd_features``).
+# Each spec bins ``source`` -- an ODD column, or with ``series`` the latest
+# month of an ``ODD_TIMESERIES_PATTERNS`` series -- at ``edges`` into
+# ``labels``. ``closed`` is the side of each interval that is inclusive:
+# "left" = [a, b), "right" = (a, b]. ``fillna`` fills the source first.
+# Override or add specs per client with ``odd_feature_bins`` in the config.
+INF = float("inf")
+ODD_FEATURE_BINS: dict[str, dict] = {
+    "generation": {
+        "source": "Account Holder Age",
+        "edges": [12, 28, 44, 60, 79, 201],
+        "labels": ["Gen Z", "Millennial", "Gen X", "Boomer", "Silent"],
+        "closed": "left",
+    },
+    "balance_tier": {
+        "source": "Avg Bal",
+        "edges": [-INF, 500, 2_000, 10_000, INF],
+        "labels": ["Low", "Medium", "High", "Very High"],
+        "closed": "left",
+    },
+    "age_band": {
+        "source": "Account Holder Age",
+        "edges": [0, 25, 35, 45, 55, 65, 200],
+        "labels": ["18-25", "26-35", "36-45", "46-55", "56-65", "65+"],
+        "closed": "right",
+    },
+    "tenure_band": {
+        "source": "tenure_years",
+        "edges": [0, 1, 3, 5, 10, INF],
+        "labels": ["0-1 yr", "1-3 yrs", "3-5 yrs", "5-10 yrs", "10+ yrs"],
+        "closed": "left",
+    },
+    "od_limit_band": {
+        "series": "od_limit",
+        "fillna": 0,
+        "edges": [-1, 0, 250, 500, 1000, INF],
+        "labels": ["$0", "$1-250", "$251-500", "$501-1000", "$1000+"],
+        "closed": "right",
+    },
+}
 
-# Balance tier thresholds
-BALANCE_TIERS = [
-    (float("-inf"), 500, "Low"),
-    (500, 2_000, "Medium"),
-    (2_000, 10_000, "High"),
-    (10_000, float("inf"), "Very High"),
-]
+# Features kept as plain labels rather than categoricals: they are merged
+# onto the transactions and grouped/counted by most storylines, which expect
+# only observed labels.
+_LABEL_FEATURES = ("generation", "balance_tier")
 
 
 # =========================================================================
@@ -106,26 +163,74 @@ def _parse_file_date(filepath: Path) -> datetime | None:
     return None
 
 
-def _load_single_transaction_file(filepath: Path) -> pd.DataFrame:
-    """Read one tab-delimited transaction file, skip metadata row."""
-    df = pd.read_csv(filepath, sep="\t", skiprows=1, header=None, low_memory=False)
-    df.columns = TRANSACTION_COLUMNS[: len(df.columns)]
+def transaction_columns(extra=None) -> list[str]:
+    """Transaction columns to parse: the core ones plus *extra* (None = all)."""
+    if extra is None:
+        return list(TRANSACTION_COLUMNS)
+    keep = set(CORE_TRANSACTION_COLUMNS) | set(extra)
+    return [c for c in TRANSACTION_COLUMNS if c in keep]
+
+
+def _file_width(filepath: Path) -> int:
+    """Number of tab-separated fields in the first data row."""
+    with open(filepath, encoding="utf-8", errors="replace") as f:
+        f.readline()  # metadata row
+        return f.readline().rstrip("\r\n").count("\t") + 1
+
+
+def _load_single_transaction_file(
+    filepath: Path, columns: list[str] | None = None, sample: dict | None = None
+) -> pd.DataFrame:
+    """Read one tab-delimited transaction file, skip metadata row.
+
+    Only *columns* (default: all) are parsed; the others are skipped by the
+    CSV reader and never materialised. With a preview *sample*
+    (``v4_preview.plan_sample``) the file is read in chunks and only rows of
+    sampled accounts are kept.
+    """
+    names = TRANSACTION_COLUMNS[: _file_width(filepath)]
+    positions = [i for i, c in enumerate(names) if columns is None or c in columns]
+    reader = pd.read_csv(
+        filepath, sep="\t", skiprows=1, header=None, usecols=positions,
+        dtype={i: TRANSACTION_DTYPES[names[i]] for i in positions
+               if names[i] in TRANSACTION_DTYPES},
+        low_memory=False, chunksize=SAMPLE_CHUNK_ROWS if sample else None,
+    )
+    if sample:
+        acct = TRANSACTION_COLUMNS.index("primary_account_num")
+        df = pd.concat([chunk[sample_mask(chunk[acct], sample)] for chunk in reader],
+                       ignore_index=True)
+    else:
+        df = reader
+    df.columns = [names[i] for i in positions]
     df["source_file"] = filepath.name
     return df
 
 
-def load_transactions(config: dict) -> pd.DataFrame:
-    """Load all transaction files, keep only the most recent N months.
+ENGINES = ("pandas", "polars")
 
-    Steps
-    -----
-    1. Walk year-folders under ``config['transaction_dir']`` and collect files
-       matching ``config['file_extension']``.
-    2. Parse embedded dates from filenames; keep the most recent
-       ``config['recent_months']`` files.
-    3. Concatenate into a single DataFrame.
-    4. Convert *amount* to float, flip sign if median is negative.
-    5. Parse *transaction_date* as datetime, derive *year_month* Period.
+
+def resolve_engine(config: dict) -> str:
+    """Loader engine from ``config['engine']``; ``polars`` falls back to pandas if missing."""
+    engine = str(config.get("engine") or "pandas").lower()
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}' (choose from {', '.join(ENGINES)})")
+    if engine == "polars" and importlib.util.find_spec("polars") is None:
+        print("[transactions] WARNING: polars not installed, using pandas")
+        return "pandas"
+    return engine
+
+
+def select_transaction_files(config: dict) -> list[tuple[Path, datetime]]:
+    """Discover the transaction files and pick the most recent N months.
+
+    Walks year-folders under ``config['transaction_dir']`` (and the folder
+    itself) for ``config['file_extension']`` files, parses the date embedded
+    in each filename and keeps the ``config['recent_months']`` most recent.
+
+    Returns
+    -------
+    list of (path, file date), newest first.
     """
     txn_dir = Path(config["transaction_dir"])
     ext = config.get("file_extension", "csv")
@@ -182,31 +287,49 @@ def load_transactions(config: dict) -> pd.DataFrame:
     latest = selected[0][1]
     print(f"[transactions] Selected {len(selected)} most recent files "
           f"({earliest:%Y-%m-%d} to {latest:%Y-%m-%d})")
+    return selected
 
-    # -- load and combine -----------------------------------------------------
-    frames: list[pd.DataFrame] = []
-    for filepath, file_date in selected:
-        df = _load_single_transaction_file(filepath)
-        frames.append(df)
-        print(f"  Loaded: {filepath.name} ({len(df):,} rows)")
 
-    combined = pd.concat(frames, ignore_index=True)
+def load_transactions(
+    config: dict, columns: list[str] | None = None, sample: dict | None = None
+) -> pd.DataFrame:
+    """Load all transaction files, keep only the most recent N months.
 
-    # -- type conversions -----------------------------------------------------
-    combined["amount"] = pd.to_numeric(combined["amount"], errors="coerce").fillna(0.0)
-    if combined["amount"].median() < 0:
-        combined["amount"] = combined["amount"].abs()
+    *columns* limits parsing to those ``TRANSACTION_COLUMNS`` (see
+    ``transaction_columns``); None parses all of them. *sample* (a preview
+    plan from ``v4_preview.plan_sample``) keeps only sampled accounts' rows.
 
-    combined["transaction_date"] = pd.to_datetime(
-        combined["transaction_date"], errors="coerce"
-    )
-    combined["year_month"] = combined["transaction_date"].dt.to_period("M")
+    Steps
+    -----
+    1. Walk year-folders under ``config['transaction_dir']`` and collect files
+       matching ``config['file_extension']``.
+    2. Parse embedded dates from filenames; keep the most recent
+       ``config['recent_months']`` files (steps 1-2: ``select_transaction_files``).
+    3. Concatenate into a single DataFrame.
+    4. Convert *amount* to float, flip sign if median is negative.
+    5. Parse *transaction_date* as datetime, derive *year_month* Period.
+
+    With ``engine: polars`` steps 3-5 and merchant consolidation run in
+    Polars (``v4_polars.read_transactions``); the result is the same frame.
+    ``merchant_clusters`` (a reviewed ``v4_merchant_clusters`` mapping CSV)
+    maps the consolidated names once more.
+    """
+    selected = select_transaction_files(config)
+
+    if resolve_engine(config) == "polars":
+        from v4_polars import read_transactions
+
+        print("[transactions] Engine: polars")
+        combined = read_transactions([f for f, _ in selected], TRANSACTION_COLUMNS, columns, sample)
+    else:
+        combined = _read_transactions_pandas([f for f, _ in selected], columns, sample)
+
+    if config.get("merchant_clusters"):
+        from v4_merchant_clusters import apply_clusters
+
+        combined["merchant_consolidated"] = apply_clusters(
+            combined["merchant_consolidated"], config["merchant_clusters"])
 
-    # -- merchant consolidation -----------------------------------------------
-    print("[transactions] Applying merchant name consolidation...")
-    combined["merchant_consolidated"] = combined["merchant_name"].apply(
-        standardize_merchant_name
-    )
     original_unique = combined["merchant_name"].nunique()
     consolidated_unique = combined["merchant_consolidated"].nunique()
     reduction = original_unique - consolidated_unique
@@ -228,35 +351,101 @@ def load_transactions(config: dict) -> pd.DataFrame:
     return combined
 
 
+def _read_transactions_pandas(
+    files: list[Path], columns: list[str] | None = None, sample: dict | None = None
+) -> pd.DataFrame:
+    """Read, convert and consolidate the selected files with pandas."""
+    # -- load and combine -----------------------------------------------------
+    frames: list[pd.DataFrame] = []
+    for filepath in files:
+        df = _load_single_transaction_file(filepath, columns, sample)
+        frames.append(df)
+        print(f"  Loaded: {filepath.name} ({len(df):,} rows)")
+
+    combined = pd.concat(frames, ignore_index=True)
+
+    # -- type conversions -----------------------------------------------------
+    combined["amount"] = pd.to_numeric(combined["amount"], errors="coerce").fillna(0.0)
+    if combined["amount"].median() < 0:
+        combined["amount"] = combined["amount"].abs()
+
+    combined["transaction_date"] = pd.to_datetime(
+        combined["transaction_date"], errors="coerce"
+    )
+    combined["year_month"] = combined["transaction_date"].dt.to_period("M")
+
+    # -- merchant consolidation -----------------------------------------------
+    print("[transactions] Applying merchant name consolidation...")
+    combined["merchant_consolidated"] = consolidate_merchants(combined["merchant_name"])
+    return combined
+
+
 # =========================================================================
 # ODD loading
 # =========================================================================
 
-def _assign_generation(age) -> str | None:
-    """Map numeric age to a generational cohort label."""
-    try:
-        age_val = float(age)
-    except (TypeError, ValueError):
-        return None
-    for lo, hi, label in GENERATION_BINS:
-        if lo <= age_val <= hi:
-            return label
-    return None
+def feature_bins(config: dict | None = None) -> dict[str, dict]:
+    """Return ``ODD_FEATURE_BINS`` merged with ``config['odd_feature_bins']``.
 
+    Raises ValueError for a spec whose edges are not increasing or whose
+    labels don't match the number of intervals.
+    """
+    specs = {**ODD_FEATURE_BINS, **((config or {}).get("odd_feature_bins") or {})}
+    for name, spec in specs.items():
+        edges = [float(e) for e in spec["edges"]]
+        if any(b <= a for a, b in zip(edges, edges[1:])):
+            raise ValueError(f"odd_feature_bins.{name}: edges must be increasing")
+        if len(spec["labels"]) != len(edges) - 1:
+            raise ValueError(
+                f"odd_feature_bins.{name}: {len(edges) - 1} intervals but "
+                f"{len(spec['labels'])} labels"
+            )
+        if spec.get("closed", "right") not in ("left", "right"):
+            raise ValueError(f"odd_feature_bins.{name}: closed must be 'left' or 'right'")
+    return specs
+
+
+def bin_values(values, edges, labels, closed: str = "right") -> pd.Categorical:
+    """Bucket *values* into an ordered Categorical with ``np.searchsorted``.
+
+    Equivalent to ``pd.cut(values, edges, labels=labels, right=closed == "right")``.
+    Non-numeric values and values outside the edges are NaN.
+    """
+    vals = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+    edges = np.asarray(edges, dtype=float)
+    side = "left" if closed == "right" else "right"
+    codes = np.searchsorted(edges, vals, side=side) - 1
+    codes[np.isnan(vals) | (codes < 0) | (codes >= len(labels))] = -1
+    return pd.Categorical.from_codes(codes, categories=list(labels), ordered=True)
 
-def _assign_balance_tier(avg_bal) -> str | None:
-    """Map average balance to a tier label."""
-    try:
-        bal = float(avg_bal)
-    except (TypeError, ValueError):
-        return None
-    for lo, hi, label in BALANCE_TIERS:
-        if lo <= bal < hi:
-            return label
-    # catch exactly the upper boundary of the last tier
-    if bal >= BALANCE_TIERS[-1][1]:
-        return BALANCE_TIERS[-1][2]
-    return None
+
+def derive_odd_features(odd_df: pd.DataFrame, specs: dict[str, dict]) -> pd.DataFrame:
+    """Add one column per bin spec (see ``ODD_FEATURE_BINS``) to *odd_df*.
+
+    A feature whose source is missing is set to None so downstream
+    ``notna()`` checks behave as before.
+    """
+    ts_cols = _detect_timeseries_columns(odd_df.columns)
+    for name, spec in specs.items():
+        if "series" in spec:
+            cols = ts_cols.get(spec["series"])
+            source = cols[-1] if cols else None
+        else:
+            source = spec["source"] if spec["source"] in odd_df.columns else None
+        if source is None:
+            odd_df[name] = None
+            continue
+
+        values = odd_df[source]
+        if "fillna" in spec:
+            values = pd.to_numeric(values, errors="coerce").fillna(spec["fillna"])
+        binned = bin_values(values, spec["edges"], spec["labels"], spec.get("closed", "right"))
+        odd_df[name] = (
+            pd.Series(binned, index=odd_df.index).astype(object)
+            .where(binned.codes >= 0, None)
+            if name in _LABEL_FEATURES else binned
+        )
+    return odd_df
 
 
 def _detect_timeseries_columns(columns: pd.Index) -> dict[str, list[str]]:
@@ -267,52 +456,200 @@ def _detect_timeseries_columns(columns: pd.Index) -> dict[str, list[str]]:
     """
     result: dict[str, list[str]] = {}
     for series_name, pattern in ODD_TIMESERIES_PATTERNS.items():
-        matches = [c for c in columns if pattern.match(c)]
+        matches = [c for c in columns if pattern.match(c) and _column_period(c) is not None]
         if matches:
-            result[series_name] = sorted(matches)
+            result[series_name] = sorted(matches, key=_column_period)
     return result
 
 
-def load_odd(config: dict) -> pd.DataFrame:
+def _odd_column_group(col: str) -> str:
+    """Return the ``ODD_COLUMN_GROUPS`` entry that *col* belongs to."""
+    if col in _CAMPAIGN_COLUMNS:
+        return "campaigns"
+    for series_name, pattern in ODD_TIMESERIES_PATTERNS.items():
+        if pattern.match(col):
+            return "campaigns" if series_name in _CAMPAIGN_SERIES else "timeseries"
+    return "core"
+
+
+def _resolve_excel_engine(engine: str) -> str:
+    """Pick the xlsx reader: ``calamine`` when available, else ``openpyxl``.
+
+    ``auto`` prefers calamine (Rust reader, several times faster than
+    openpyxl's cell-by-cell parse); an explicit ``calamine`` falls back to
+    openpyxl with a warning when python-calamine is not installed.
+    """
+    if engine in ("auto", "calamine"):
+        if importlib.util.find_spec("python_calamine") is not None:
+            return "calamine"
+        if engine == "calamine":
+            print("[odd] WARNING: python-calamine not installed, using openpyxl")
+        return "openpyxl"
+    return engine
+
+
+def _read_odd_workbook(odd_path: Path, engine: str) -> pd.DataFrame:
+    """Parse the ODD workbook and normalise headers and date columns."""
+    engine = _resolve_excel_engine(engine)
+    print(f"[odd] Parsing workbook with {engine}...")
+    odd_df = pd.read_excel(odd_path, engine=engine)
+
+    # strip whitespace from column names
+    odd_df.columns = odd_df.columns.astype(str).str.strip()
+
+    # -- parse date columns ---------------------------------------------------
+    for col in ("DOB", "Date Opened", "Date Closed"):
+        if col in odd_df.columns:
+            odd_df[col] = pd.to_datetime(odd_df[col], errors="coerce")
+
+    # -- settle mixed-type columns on one type so the frame round-trips Parquet
+    for col in odd_df.columns[odd_df.dtypes == object]:
+        values = odd_df[col]
+        present = values.notna()
+        if values[present].map(type).eq(str).all():
+            continue
+        numeric = pd.to_numeric(values, errors="coerce")
+        if numeric[present].notna().all():
+            odd_df[col] = numeric
+        else:
+            odd_df[col] = values.where(~present, values.astype(str))
+    return odd_df
+
+
+def _file_sha1(path: Path) -> str:
+    """Content hash of *path*, read in 1 MB chunks."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path: Path, data: dict) -> None:
+    """Write *data* as JSON to *path* via a temporary file and ``os.replace``."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _read_odd_cached(odd_path: Path, config: dict, keep) -> pd.DataFrame:
+    """Return the ODD frame restricted to columns where ``keep(col)`` is true.
+
+    The parsed workbook is cached as Parquet under ``config['odd_cache_dir']``
+    (default ``.cache/odd``) with a JSON manifest holding the workbook's
+    mtime, size and SHA-1. An unchanged mtime is a cache hit; a changed mtime
+    with identical content (e.g. a re-synced copy) is revalidated by hash.
+    Projection is pushed into the Parquet read, so callers that skip the
+    time-series or campaign groups never materialise those columns.
+
+    Cache files are keyed by the workbook's resolved path (two clients'
+    ``ODD.xlsx`` never share an entry) and the manifest's ``source`` is
+    checked on read. Parquet and manifest are written to a temporary file
+    and moved into place, so an interrupted write leaves no partial cache.
+    """
+    engine = config.get("odd_engine", "auto")
+    cache_setting = config.get("odd_cache_dir", ".cache/odd")
+    if not cache_setting or importlib.util.find_spec("pyarrow") is None:
+        odd_df = _read_odd_workbook(odd_path, engine)
+        return odd_df[[c for c in odd_df.columns if keep(c)]]
+
+    cache_dir = Path(cache_setting)
+    source = str(odd_path.resolve())
+    key = f"{odd_path.stem}-{hashlib.sha1(source.encode()).hexdigest()[:8]}"
+    manifest_path = cache_dir / f"{key}.json"
+    stat = odd_path.stat()
+    manifest: dict = {}
+    if manifest_path.exists():
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        except ValueError:
+            manifest = {}
+        if manifest.get("source") != source:
+            manifest = {}
+    parquet_path = cache_dir / manifest.get("parquet", "-")
+
+    digest = None
+    hit = parquet_path.exists() and manifest.get("size") == stat.st_size
+    if hit and manifest.get("mtime_ns") != stat.st_mtime_ns:
+        digest = _file_sha1(odd_path)
+        hit = digest == manifest.get("sha1")
+        if hit:
+            manifest["mtime_ns"] = stat.st_mtime_ns
+            _write_json_atomic(manifest_path, manifest)
+
+    if hit:
+        columns = [c for c in manifest["columns"] if keep(c)]
+        print(f"[odd] Cache hit: {parquet_path.name} "
+              f"({len(columns)} of {len(manifest['columns'])} columns)")
+        return pd.read_parquet(parquet_path, columns=columns)
+
+    odd_df = _read_odd_workbook(odd_path, engine)
+    digest = digest or _file_sha1(odd_path)
+    new_parquet = cache_dir / f"{key}-{digest[:12]}.parquet"
+    tmp = new_parquet.with_name(f"{new_parquet.name}.{os.getpid()}.tmp")
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        odd_df.to_parquet(tmp, index=False)
+        os.replace(tmp, new_parquet)
+        manifest = {
+            "source": source,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha1": digest,
+            "parquet": new_parquet.name,
+            "columns": list(odd_df.columns),
+        }
+        _write_json_atomic(manifest_path, manifest)
+        if parquet_path.exists() and parquet_path != new_parquet:
+            parquet_path.unlink()
+        print(f"[odd] Cached parsed workbook to {new_parquet}")
+    except Exception as exc:  # cache is best-effort; never fail the load
+        tmp.unlink(missing_ok=True)
+        print(f"[odd] WARNING: could not write ODD cache ({exc})")
+        return odd_df[[c for c in odd_df.columns if keep(c)]]
+    # read back so first and cached runs see identical dtypes
+    return pd.read_parquet(new_parquet, columns=[c for c in odd_df.columns if keep(c)])
+
+
+def load_odd(config: dict, groups: tuple[str, ...] | None = None) -> pd.DataFrame:
     """Load the ODD (account-level) Excel file and derive analytical columns.
 
+    Parameters
+    ----------
+    config : dict
+        Uses ``odd_file``, plus optional ``odd_engine`` (``auto`` /
+        ``calamine`` / ``openpyxl``), ``odd_cache_dir`` (empty disables the
+        Parquet cache), ``odd_column_groups`` and ``odd_feature_bins``.
+    groups : tuple[str, ...] | None
+        Column groups to load (see ``ODD_COLUMN_GROUPS``). ``core`` is always
+        included. None falls back to ``config['odd_column_groups']``, then to
+        every group.
+
     Derived columns
     ---------------
-    * ``generation`` -- generational cohort from Account Holder Age
     * ``tenure_years`` -- account tenure from Account Age or Date Opened
-    * ``balance_tier`` -- tier based on Avg Bal
+    * one column per ``feature_bins(config)`` spec: ``generation`` and
+      ``balance_tier`` (plain labels), ``age_band``, ``tenure_band`` and
+      ``od_limit_band`` (ordered categoricals)
     """
     odd_path = Path(config["odd_file"])
     if not odd_path.exists():
         raise FileNotFoundError(f"ODD file not found: {odd_path}")
 
-    print(f"\n[odd] Loading ODD file: {odd_path.name}")
-    odd_df = pd.read_excel(odd_path, engine="openpyxl")
+    if groups is None:
+        groups = tuple(config.get("odd_column_groups") or ODD_COLUMN_GROUPS)
+    unknown = set(groups) - set(ODD_COLUMN_GROUPS)
+    if unknown:
+        raise ValueError(f"Unknown ODD column group(s): {sorted(unknown)}")
+    wanted = set(groups) | {"core"}
+
+    print(f"\n[odd] Loading ODD file: {odd_path.name} "
+          f"(groups: {', '.join(g for g in ODD_COLUMN_GROUPS if g in wanted)})")
+    odd_df = _read_odd_cached(
+        odd_path, config, lambda c: _odd_column_group(c) in wanted
+    )
     print(f"[odd] Loaded: {len(odd_df):,} rows, {len(odd_df.columns)} columns")
 
-    # strip whitespace from column names
-    odd_df.columns = odd_df.columns.str.strip()
-
-    # -- parse date columns ---------------------------------------------------
-    if "DOB" in odd_df.columns:
-        odd_df["DOB"] = pd.to_datetime(odd_df["DOB"], errors="coerce")
-
-    if "Date Opened" in odd_df.columns:
-        odd_df["Date Opened"] = pd.to_datetime(odd_df["Date Opened"], errors="coerce")
-
-    if "Date Closed" in odd_df.columns:
-        odd_df["Date Closed"] = pd.to_datetime(odd_df["Date Closed"], errors="coerce")
-
-    # -- derived: generation --------------------------------------------------
-    if "Account Holder Age" in odd_df.columns:
-        odd_df["generation"] = odd_df["Account Holder Age"].apply(_assign_generation)
-        gen_dist = odd_df["generation"].value_counts()
-        print(f"[odd] Generation distribution:")
-        for gen, count in gen_dist.items():
-            print(f"       {gen}: {count:,}")
-    else:
-        odd_df["generation"] = None
-
     # -- derived: tenure_years ------------------------------------------------
     if "Account Age" in odd_df.columns:
         numeric_age = pd.to_numeric(odd_df["Account Age"], errors="coerce")
@@ -333,15 +670,15 @@ def load_odd(config: dict) -> pd.DataFrame:
     else:
         odd_df["tenure_years"] = None
 
-    # -- derived: balance_tier ------------------------------------------------
-    if "Avg Bal" in odd_df.columns:
-        odd_df["balance_tier"] = odd_df["Avg Bal"].apply(_assign_balance_tier)
-        tier_dist = odd_df["balance_tier"].value_counts()
-        print(f"[odd] Balance tier distribution:")
-        for tier, count in tier_dist.items():
-            print(f"       {tier}: {count:,}")
-    else:
-        odd_df["balance_tier"] = None
+    # -- derived: bucketed features (generation, balance_tier, bands) --------
+    specs = feature_bins(config)
+    derive_odd_features(odd_df, specs)
+    for name in specs:
+        dist = odd_df[name].value_counts(sort=False)
+        if dist.sum():
+            print(f"[odd] {name} distribution:")
+            for label, count in dist.items():
+                print(f"       {label}: {count:,}")
 
     # -- auto-detect time series columns --------------------------------------
     ts_cols = _detect_timeseries_columns(odd_df.columns)
@@ -365,6 +702,142 @@ def load_odd(config: dict) -> pd.DataFrame:
     return odd_df
 
 
+# =========================================================================
+# ODD time-series tensor
+# =========================================================================
+
+# Series whose monthly values are codes/labels rather than amounts; these are
+# dictionary-encoded instead of being stored as float32.
+ODD_CODED_SERIES = ("reg_e_code", "reg_e_desc", "mail", "resp", "segmentation")
+
+
+def _column_period(col: str) -> pd.Period | None:
+    """'Apr25 Spend' -> Period('2025-04', 'M'); None if the prefix isn't a month."""
+    try:
+        return pd.Period(datetime.strptime(col[:5], "%b%y"), freq="M")
+    except ValueError:
+        return None
+
+
+def ts_month_label(period: pd.Period) -> str:
+    """Period('2025-04', 'M') -> 'Apr25' (the ODD column prefix)."""
+    return period.strftime("%b%y")
+
+
+def build_odd_timeseries(odd_df: pd.DataFrame) -> dict:
+    """Pack the ``MmmYY <metric>`` columns into dense account x month arrays.
+
+    Rows align positionally with *odd_df*; the month axis is a contiguous
+    monthly ``PeriodIndex`` so windows ("3 months before the campaign") are
+    plain slices. Months a metric has no column for are NaN / code -1.
+
+    Keys in returned dict
+    ---------------------
+    months     : contiguous monthly PeriodIndex (axis 1)
+    metrics    : numeric series names, in axis-2 order of ``values``
+    values     : float32 array (accounts, months, metrics)
+    codes      : {series: int16/int32 array (accounts, months)}, -1 = missing,
+                 for the ``ODD_CODED_SERIES``
+    categories : {series: object array} -- labels the codes index into
+    columns    : {series: {Period: source column name}} -- months present
+    """
+    detected = _detect_timeseries_columns(odd_df.columns)
+    columns = {
+        name: dict(sorted((_column_period(c), c) for c in cols))
+        for name, cols in detected.items()
+    }
+    periods = [p for by_month in columns.values() for p in by_month]
+    months = (
+        pd.period_range(min(periods), max(periods), freq="M")
+        if periods else pd.PeriodIndex([], freq="M")
+    )
+    n_accts, n_months = len(odd_df), len(months)
+    pos = {p: i for i, p in enumerate(months)}
+
+    metrics = tuple(n for n in columns if n not in ODD_CODED_SERIES)
+    values = np.full((n_accts, n_months, len(metrics)), np.nan, dtype=np.float32)
+    for k, name in enumerate(metrics):
+        for period, col in columns[name].items():
+            values[:, pos[period], k] = pd.to_numeric(odd_df[col], errors="coerce")
+
+    codes: dict[str, np.ndarray] = {}
+    categories: dict[str, np.ndarray] = {}
+    for name in (n for n in columns if n in ODD_CODED_SERIES):
+        src = list(columns[name].items())
+        stacked = pd.concat([odd_df[col] for _, col in src], ignore_index=True)
+        flat, cats = pd.factorize(stacked.astype(object), use_na_sentinel=True)
+        dtype = np.int16 if len(cats) < np.iinfo(np.int16).max else np.int32
+        grid = np.full((n_accts, n_months), -1, dtype=dtype)
+        for j, (period, _) in enumerate(src):
+            grid[:, pos[period]] = flat[j * n_accts:(j + 1) * n_accts]
+        codes[name] = grid
+        categories[name] = np.asarray(cats, dtype=object)
+
+    return {
+        "months": months,
+        "metrics": metrics,
+        "values": values,
+        "codes": codes,
+        "categories": categories,
+        "columns": columns,
+    }
+
+
+def get_odd_timeseries(ctx: dict) -> dict:
+    """Return ``ctx['odd_ts']``, building it from ``ctx['odd_df']`` if absent."""
+    if ctx.get("odd_ts") is None:
+        odd = ctx.get("odd_df")
+        ctx["odd_ts"] = build_odd_timeseries(odd if odd is not None else pd.DataFrame())
+    return ctx["odd_ts"]
+
+
+def ts_months(ts: dict, series: str) -> list[pd.Period]:
+    """Months (chronological) for which the ODD had a *series* column."""
+    return list(ts["columns"].get(series, {}))
+
+
+def ts_latest(ts: dict, series: str) -> pd.Period | None:
+    """Most recent month with a *series* column, or None."""
+    months = ts_months(ts, series)
+    return months[-1] if months else None
+
+
+def ts_window(ts: dict, series: str, anchor: pd.Period,
+              before: int = 0, after: int = 0) -> np.ndarray:
+    """Numeric *series* for ``anchor - before .. anchor + after`` (inclusive).
+
+    Returns a float32 array (accounts, before + 1 + after); months outside
+    the ODD's range are NaN.
+    """
+    k = ts["metrics"].index(series)
+    width = before + 1 + after
+    out = np.full((ts["values"].shape[0], width), np.nan, dtype=np.float32)
+    if len(ts["months"]) == 0:
+        return out
+    start = (anchor - ts["months"][0]).n - before
+    lo, hi = max(start, 0), min(start + width, len(ts["months"]))
+    if lo < hi:
+        out[:, lo - start:hi - start] = ts["values"][:, lo:hi, k]
+    return out
+
+
+def ts_column(ts: dict, series: str, period: pd.Period,
+              index: pd.Index | None = None) -> pd.Series:
+    """One month of *series* as a Series aligned to the ODD rows.
+
+    Numeric series come back as float32; coded series as a Categorical over
+    the original labels (missing = NaN).
+    """
+    i = (period - ts["months"][0]).n
+    if series in ts["codes"]:
+        data = pd.Categorical.from_codes(
+            ts["codes"][series][:, i], categories=ts["categories"][series]
+        )
+    else:
+        data = ts["values"][:, i, ts["metrics"].index(series)]
+    return pd.Series(data, index=index, name=ts["columns"][series].get(period))
+
+
 # =========================================================================
 # Merge
 # =========================================================================
@@ -376,6 +849,7 @@ _MERGE_COLS = [
     "generation",
     "balance_tier",
     "tenure_years",
+    "tenure_band",
     "Branch",
     "Business?",
     "Debit?",
@@ -387,12 +861,14 @@ _MERGE_COLS = [
 
 
 def merge_data(
-    txn_df: pd.DataFrame, odd_df: pd.DataFrame
+    txn_df: pd.DataFrame, odd_df: pd.DataFrame, engine: str = "pandas"
 ) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """Left-join transaction data with a slim subset of ODD columns.
 
     Only essential ODD columns are merged to keep memory manageable.
     Storylines needing full ODD data should read ``ctx["odd_df"]`` directly.
+    With ``engine="polars"`` the join runs as a Polars hash join
+    (``v4_polars.join_odd``); the merged frame is the same.
 
     Returns
     -------
@@ -408,12 +884,17 @@ def merge_data(
     print(f"[merge] Merging {len(merge_cols)} ODD columns "
           f"(of {len(odd_df.columns)} total) to keep memory low")
 
-    combined_df = txn_df.merge(
-        odd_slim,
-        left_on="primary_account_num",
-        right_on="Acct Number",
-        how="left",
-    )
+    if engine == "polars":
+        from v4_polars import join_odd
+
+        combined_df = join_odd(txn_df, odd_slim)
+    else:
+        combined_df = txn_df.merge(
+            odd_slim,
+            left_on="primary_account_num",
+            right_on="Acct Number",
+            how="left",
+        )
 
     matched = combined_df["Acct Number"].notna().sum()
     unmatched = combined_df["Acct Number"].isna().sum()
@@ -444,6 +925,110 @@ def merge_data(
 # Main entry point
 # =========================================================================
 
+# Data sources storylines declare in ``SOURCES`` and the ctx keys they fill
+DATA_SOURCES: dict[str, tuple[str, ...]] = {
+    "odd": ("odd_df", "odd_ts"),
+    "transactions": ("txn_df", "combined_df", "business_df", "personal_df", "activity",
+                     "incidence"),
+}
+
+
+def _load_odd_source(ctx: dict) -> None:
+    """Load the ODD and pack its time series (fills odd_df, odd_ts)."""
+    odd_df = load_odd(ctx["config"])
+
+    fraction = ctx.get("preview_fraction")
+    if fraction:
+        plan, keep = plan_sample(odd_df, fraction)
+        print(f"[preview] Sampled {keep.sum():,} of {len(odd_df):,} accounts "
+              f"({fraction:.0%}, stratified by {', '.join(plan['by']) or 'nothing'})")
+        odd_df = odd_df[keep].reset_index(drop=True)
+        dict.__setitem__(ctx, "preview", plan)
+
+    before_mb = odd_df.memory_usage(deep=True).sum() / 1024 ** 2
+    odd_ts = build_odd_timeseries(odd_df)
+    ts_source_cols = [c for by_month in odd_ts["columns"].values() for c in by_month.values()]
+    odd_df = odd_df.drop(columns=ts_source_cols)
+    ts_mb = (odd_ts["values"].nbytes
+             + sum(a.nbytes for a in odd_ts["codes"].values())) / 1024 ** 2
+    print(f"[odd] Time series packed: {len(ts_source_cols)} columns -> "
+          f"{odd_ts['values'].shape[0]:,} accounts x {len(odd_ts['months'])} months "
+          f"x {len(odd_ts['metrics']) + len(odd_ts['codes'])} series "
+          f"({before_mb:.1f} MB -> "
+          f"{odd_df.memory_usage(deep=True).sum() / 1024 ** 2 + ts_mb:.1f} MB)")
+    dict.update(ctx, odd_df=odd_df, odd_ts=odd_ts)
+
+
+def _load_transaction_source(ctx: dict) -> None:
+    """Load transactions and merge with ODD (fills txn_df, combined/business/personal_df,
+    activity, incidence)."""
+    config = ctx["config"]
+    odd_df = ctx["odd_df"]  # first: a preview samples accounts from the ODD
+    txn_df = load_transactions(config, columns=ctx.get("txn_columns"), sample=ctx.get("preview"))
+    combined_df, business_df, personal_df = merge_data(
+        txn_df, odd_df, engine=resolve_engine(config))
+    activity = build_activity(combined_df)
+    print(f"[activity] Bitmap: {len(activity['accounts']):,} accounts x "
+          f"{len(activity['months'])} months ({activity_nbytes(activity) / 1024 ** 2:.1f} MB)")
+    incidence = build_incidence(combined_df)
+    print(f"[incidence] Account x merchant: {len(incidence['accounts']):,} x "
+          f"{len(incidence['merchants']):,}, {len(incidence['indices']):,} cells "
+          f"({incidence_nbytes(incidence) / 1024 ** 2:.1f} MB)")
+    dict.update(ctx, txn_df=txn_df, combined_df=combined_df, business_df=business_df,
+                personal_df=personal_df, activity=activity, incidence=incidence)
+
+
+_SOURCE_LOADERS = {"odd": _load_odd_source, "transactions": _load_transaction_source}
+
+
+class LazyContext(dict):
+    """Context dict whose data sources load on first access.
+
+    ``ctx["combined_df"]`` (or ``ctx.get``) loads the transactions the first
+    time it is read; ``ctx["odd_df"]`` loads only the ODD. Everything else
+    behaves like the plain ctx dict storylines already use.
+    """
+
+    def __missing__(self, key):
+        for source, keys in DATA_SOURCES.items():
+            if key in keys:
+                _SOURCE_LOADERS[source](self)
+                return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return dict.__contains__(self, key) or any(key in k for k in DATA_SOURCES.values())
+
+    def get(self, key, default=None):
+        # Membership first: an error inside a source loader must propagate,
+        # not read as a missing key
+        if key not in self:
+            return default
+        return self[key]
+
+
+def source_loaded(ctx: dict, source: str) -> bool:
+    """True once every ctx key of *source* ("odd" / "transactions") is in memory."""
+    return all(dict.__contains__(ctx, key) for key in DATA_SOURCES[source])
+
+
+def load_context(
+    config: dict, sources=(), columns: list[str] | None = None, preview: float | None = None
+) -> dict:
+    """Context dict with *sources* loaded now and the rest loaded on first access.
+
+    *columns* (kept as ``ctx['txn_columns']``) limits which transaction
+    columns are parsed; None parses all of them. *preview* (a fraction,
+    ``ctx['preview_fraction']``) loads a stratified account sample; the
+    plan is kept as ``ctx['preview']`` (see ``v4_preview``).
+    """
+    ctx = LazyContext(config=config, txn_columns=columns, preview_fraction=preview)
+    for source in ("odd", "transactions"):
+        if source in sources and not source_loaded(ctx, source):
+            _SOURCE_LOADERS[source](ctx)
+    return ctx
+
+
 def load_all(config: dict) -> dict:
     """Load all data sources and return a context dict for downstream analyses.
 
@@ -451,18 +1036,25 @@ def load_all(config: dict) -> dict:
     ---------------------
     config       : the raw config dict
     txn_df       : raw transaction DataFrame (before merge)
-    odd_df       : raw ODD DataFrame (account-level, for standalone analyses)
+    odd_df       : ODD DataFrame (account-level, for standalone analyses);
+                   the wide MmmYY time-series columns are moved into odd_ts
+    odd_ts       : account x month tensor of the ODD time series, rows
+                   aligned with odd_df (see ``build_odd_timeseries``)
     combined_df  : merged transaction + ODD data
     business_df  : business-account transactions only
     personal_df  : personal-account transactions only
+    activity     : account x month activity bitmap with sparse monthly spend
+                   and transaction counts (see ``v4_activity.build_activity``)
+    incidence    : sparse account x merchant spend / transaction counts
+                   (CSR arrays, see ``v4_incidence.build_incidence``)
     """
     print("=" * 80)
     print("  V4 TRANSACTION ANALYSIS - DATA LOADING")
     print("=" * 80)
 
-    txn_df = load_transactions(config)
-    odd_df = load_odd(config)
-    combined_df, business_df, personal_df = merge_data(txn_df, odd_df)
+    ctx = load_context(config, sources=DATA_SOURCES)
+    txn_df, odd_df, combined_df = ctx["txn_df"], ctx["odd_df"], ctx["combined_df"]
+    business_df, personal_df = ctx["business_df"], ctx["personal_df"]
 
     print("\n" + "=" * 80)
     print("  DATA LOADING COMPLETE")
@@ -478,11 +1070,4 @@ def load_all(config: dict) -> dict:
     print(f"  Unique merchants  : {combined_df['merchant_consolidated'].nunique():,}")
     print("=" * 80)
 
-    return {
-        "config": config,
-        "txn_df": txn_df,
-        "odd_df": odd_df,
-        "combined_df": combined_df,
-        "business_df": business_df,
-        "personal_df": personal_df,
-    }
+    return ctx
@@ -2,18 +2,25 @@
 # Excel workbook writer - multi-tab formatted output
 # =============================================================================
 
+import importlib.util
+from io import BytesIO
+
 import pandas as pd
 from pathlib import Path
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, numbers
 from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.utils import get_column_letter
 
+from v4_spill import iter_frames
+
 
 # Styling constants
 HEADER_FILL = PatternFill(start_color="2E4057", end_color="2E4057", fill_type="solid")
 HEADER_FONT = Font(name="Calibri", size=11, bold=True, color="FFFFFF")
 HEADER_ALIGN = Alignment(horizontal="center", vertical="center", wrap_text=True)
+HEADER_BORDER = Border(bottom=Side(style="medium", color="2E4057"))
 DATA_FONT = Font(name="Calibri", size=10)
 DATA_ALIGN = Alignment(vertical="center")
 CURRENCY_FORMAT = '#,##0'
@@ -33,6 +40,11 @@ THIN_BORDER = Border(
 )
 ALT_ROW_FILL = PatternFill(start_color="F7F9FC", end_color="F7F9FC", fill_type="solid")
 
+# Embedded chart size (pixels) and the rows each chart block takes
+CHART_WIDTH = 900
+CHART_HEIGHT = 500
+CHART_ROWS = 28
+
 
 def generate_excel_report(storyline_results: dict, config: dict, output_path: str):
     """
@@ -50,11 +62,14 @@ def generate_excel_report(storyline_results: dict, config: dict, output_path: st
                 'pct_cols': list of str (columns to format as percentage)
                 'number_cols': list of str (columns to format with comma separators)
     config : dict
+        ``chart_images: true`` adds a "<S#> Charts" sheet per storyline with
+        its section figures as PNGs (rendered in one cached batch, see
+        ``v4_chart_export``; needs kaleido and Pillow).
     output_path : str
     """
-    wb = Workbook()
-    # Remove default sheet
-    wb.remove(wb.active)
+    # Write-only: rows are streamed to disk as they are appended, so a
+    # spilled sheet (see ``v4_spill``) never has all of its cells in memory
+    wb = Workbook(write_only=True)
 
     # Order keys: s0_executive first, then the rest in original order
     ordered_keys = []
@@ -62,6 +77,8 @@ def generate_excel_report(storyline_results: dict, config: dict, output_path: st
         ordered_keys.append("s0_executive")
     ordered_keys.extend(k for k in storyline_results if k != "s0_executive")
 
+    charts = _render_charts(storyline_results, ordered_keys, config) if config.get("chart_images") else {}
+
     sheet_count = 0
     for key in ordered_keys:
         result = storyline_results[key]
@@ -73,90 +90,67 @@ def generate_excel_report(storyline_results: dict, config: dict, output_path: st
 
             ws = wb.create_sheet(title=sheet_name)
             sheet_count += 1
+            n_cols = max(len(df.columns), 1)
 
-            # Write title row
-            ws.merge_cells(
-                start_row=1,
-                start_column=1,
-                end_row=1,
-                end_column=max(len(df.columns), 1),
-            )
-            title_cell = ws.cell(row=1, column=1, value=result["title"])
+            # Auto-fit column widths (set before the first row is written)
+            for col_idx, width in enumerate(_column_widths(df), 1):
+                ws.column_dimensions[get_column_letter(col_idx)].width = min(width + 4, 40)
+
+            # Freeze panes (headers visible when scrolling)
+            start_row = 4
+            ws.freeze_panes = f"A{start_row + 1}"
+
+            # Title and subtitle rows
+            ws.merged_cells.add(f"A1:{get_column_letter(n_cols)}1")
+            ws.merged_cells.add(f"A2:{get_column_letter(n_cols)}2")
+            title_cell = WriteOnlyCell(ws, value=result["title"])
             title_cell.font = Font(name="Calibri", size=14, bold=True, color="2E4057")
             title_cell.alignment = Alignment(horizontal="left")
-
-            # Write subtitle
-            ws.merge_cells(
-                start_row=2,
-                start_column=1,
-                end_row=2,
-                end_column=max(len(df.columns), 1),
-            )
-            subtitle = ws.cell(
-                row=2,
-                column=1,
-                value=f"{sheet_info.get('subtitle', sheet_name)} | {config.get('client_name', '')}",
+            ws.append([title_cell])
+            subtitle = WriteOnlyCell(
+                ws, value=f"{sheet_info.get('subtitle', sheet_name)} | {config.get('client_name', '')}",
             )
             subtitle.font = Font(name="Calibri", size=10, italic=True, color="8B95A2")
+            ws.append([subtitle])
 
             # Blank row
-            start_row = 4
+            ws.append([])
 
             # Write headers
-            for col_idx, col_name in enumerate(df.columns, 1):
-                cell = ws.cell(row=start_row, column=col_idx, value=col_name)
+            headers = []
+            for col_name in df.columns:
+                cell = WriteOnlyCell(ws, value=col_name)
                 cell.fill = HEADER_FILL
                 cell.font = HEADER_FONT
                 cell.alignment = HEADER_ALIGN
-                cell.border = Border(
-                    bottom=Side(style="medium", color="2E4057")
-                )
-
-            # Write data rows
-            currency_cols = set(sheet_info.get("currency_cols", []))
-            pct_cols = set(sheet_info.get("pct_cols", []))
-            number_cols = set(sheet_info.get("number_cols", []))
-
-            for row_idx, (_, row) in enumerate(df.iterrows(), start_row + 1):
-                for col_idx, (col_name, value) in enumerate(row.items(), 1):
-                    cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                    cell.font = DATA_FONT
-                    cell.alignment = DATA_ALIGN
-                    cell.border = THIN_BORDER
-
-                    # Apply number formats
-                    if col_name in currency_cols:
-                        col_lower = col_name.lower()
-                        if any(kw in col_lower for kw in _CENTS_KEYWORDS):
-                            cell.number_format = CURRENCY_CENTS_FORMAT
-                        else:
-                            cell.number_format = CURRENCY_FORMAT
-                    elif col_name in pct_cols:
-                        cell.number_format = PERCENT_FORMAT
-                    elif col_name in number_cols:
-                        cell.number_format = NUMBER_FORMAT
-
-                    # Alternating row fill
-                    if (row_idx - start_row) % 2 == 0:
-                        cell.fill = ALT_ROW_FILL
-
-            # Auto-fit column widths
-            for col_idx in range(1, len(df.columns) + 1):
-                col_letter = get_column_letter(col_idx)
-                max_len = len(str(df.columns[col_idx - 1]))
-                for row in ws.iter_rows(
-                    min_row=start_row + 1,
-                    max_row=ws.max_row,
-                    min_col=col_idx,
-                    max_col=col_idx,
-                ):
-                    for cell in row:
-                        if cell.value:
-                            max_len = max(max_len, len(str(cell.value)))
-                ws.column_dimensions[col_letter].width = min(max_len + 4, 40)
-
-            # Freeze panes (headers visible when scrolling)
-            ws.freeze_panes = ws.cell(row=start_row + 1, column=1)
+                cell.border = HEADER_BORDER
+                headers.append(cell)
+            ws.append(headers)
+
+            # Write data rows (a chunk at a time for spilled sheets)
+            formats = _column_formats(df.columns, sheet_info)
+            row_idx = start_row
+            for chunk in iter_frames(df):
+                for _, row in chunk.iterrows():
+                    row_idx += 1
+                    alt = (row_idx - start_row) % 2 == 0
+                    cells = []
+                    for value, number_format in zip(row, formats):
+                        cell = WriteOnlyCell(ws, value=value)
+                        cell.font = DATA_FONT
+                        cell.alignment = DATA_ALIGN
+                        cell.border = THIN_BORDER
+                        if number_format:
+                            cell.number_format = number_format
+                        # Alternating row fill
+                        if alt:
+                            cell.fill = ALT_ROW_FILL
+                        cells.append(cell)
+                    ws.append(cells)
+
+        if charts.get(key):
+            _add_charts_sheet(wb, key, result["title"], charts[key])
+            sheet_count += 1
 
     # Add overview sheet at the beginning
     _add_overview_sheet(wb, storyline_results, config, sheet_count)
@@ -168,39 +162,121 @@ def generate_excel_report(storyline_results: dict, config: dict, output_path: st
     print(f"  Excel report: {output} ({sheet_count} sheets)")
 
 
+def _column_formats(columns, sheet_info) -> list:
+    """Number format per column from the sheet's currency / pct / number lists."""
+    currency_cols = set(sheet_info.get("currency_cols", []))
+    pct_cols = set(sheet_info.get("pct_cols", []))
+    number_cols = set(sheet_info.get("number_cols", []))
+    formats = []
+    for col_name in columns:
+        if col_name in currency_cols:
+            col_lower = col_name.lower()
+            if any(kw in col_lower for kw in _CENTS_KEYWORDS):
+                formats.append(CURRENCY_CENTS_FORMAT)
+            else:
+                formats.append(CURRENCY_FORMAT)
+        elif col_name in pct_cols:
+            formats.append(PERCENT_FORMAT)
+        elif col_name in number_cols:
+            formats.append(NUMBER_FORMAT)
+        else:
+            formats.append(None)
+    return formats
+
+
+def _column_widths(df) -> list[int]:
+    """Longest header / non-empty value per column (one pass over the chunks)."""
+    widths = [len(str(c)) for c in df.columns]
+    for chunk in iter_frames(df):
+        for _, row in chunk.iterrows():
+            for i, value in enumerate(row):
+                if value:
+                    widths[i] = max(widths[i], len(str(value)))
+    return widths
+
+
+def _render_charts(storyline_results, ordered_keys, config):
+    """Render every section figure in one batch -> {key: [(heading, png), ...]}."""
+    if importlib.util.find_spec("PIL") is None:
+        print("  WARNING: Pillow not installed, charts not embedded in Excel")
+        return {}
+    from v4_chart_export import CHART_CACHE_DIR, render_pngs
+
+    items = [
+        (key, section.get("heading", ""), fig)
+        for key in ordered_keys
+        for section in storyline_results[key].get("sections", [])
+        for fig in section.get("figures", [])
+    ]
+    pngs = render_pngs(
+        [fig for _, _, fig in items], width=CHART_WIDTH, height=CHART_HEIGHT, scale=1,
+        cache_dir=config.get("chart_cache_dir", CHART_CACHE_DIR),
+        workers=config.get("chart_workers"),
+    )
+    charts: dict[str, list] = {}
+    for (key, heading, _), png in zip(items, pngs):
+        if png is not None:
+            charts.setdefault(key, []).append((heading, png))
+    return charts
+
+
+def _styled(ws, value, font, fill=None, alignment=None):
+    """Write-only cell with the given style."""
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = font
+    if fill is not None:
+        cell.fill = fill
+    if alignment is not None:
+        cell.alignment = alignment
+    return cell
+
+
+def _add_charts_sheet(wb, key, title, charts):
+    """One sheet per storyline with its charts stacked under their section headings."""
+    from openpyxl.drawing.image import Image as XlImage
+
+    ws = wb.create_sheet(title=f"{key.split('_')[0].upper()} Charts"[:31])
+    ws.append([_styled(ws, title, Font(name="Calibri", size=14, bold=True, color="2E4057"))])
+    ws.append([])
+    row = 3
+    for heading, png in charts:
+        ws.append([_styled(ws, heading, Font(name="Calibri", size=11, bold=True, color="2E4057"))])
+        img = XlImage(BytesIO(png))
+        img.width, img.height = CHART_WIDTH, CHART_HEIGHT
+        ws.add_image(img, f"A{row + 1}")
+        for _ in range(CHART_ROWS - 1):
+            ws.append([])
+        row += CHART_ROWS
+
+
 def _add_overview_sheet(wb, storyline_results, config, sheet_count):
     """Add a summary overview as the first sheet."""
+    from datetime import datetime
+
     ws = wb.create_sheet(title="Overview", index=0)
 
-    # Title
-    ws.merge_cells("A1:D1")
-    title = ws.cell(row=1, column=1, value=f"{config.get('client_name', '')} - Transaction Analysis")
-    title.font = Font(name="Calibri", size=18, bold=True, color="2E4057")
+    # Column widths
+    ws.column_dimensions["A"].width = 30
+    ws.column_dimensions["B"].width = 50
+    ws.column_dimensions["C"].width = 60
 
-    ws.merge_cells("A2:D2")
-    from datetime import datetime
-    subtitle = ws.cell(
-        row=2,
-        column=1,
-        value=f"Client ID: {config.get('client_id', '')} | Generated: {datetime.now().strftime('%B %d, %Y')}",
-    )
-    subtitle.font = Font(name="Calibri", size=11, italic=True, color="8B95A2")
+    # Title
+    ws.merged_cells.add("A1:D1")
+    ws.merged_cells.add("A2:D2")
+    ws.append([_styled(ws, f"{config.get('client_name', '')} - Transaction Analysis",
+                       Font(name="Calibri", size=18, bold=True, color="2E4057"))])
+    ws.append([_styled(
+        ws,
+        f"Client ID: {config.get('client_id', '')} | Generated: {datetime.now().strftime('%B %d, %Y')}",
+        Font(name="Calibri", size=11, italic=True, color="8B95A2"),
+    )])
+    ws.append([])
 
     # Table of contents
-    row = 4
-    ws.cell(row=row, column=1, value="Table of Contents").font = Font(
-        name="Calibri", size=14, bold=True, color="2E4057"
-    )
-    row += 1
-
+    ws.append([_styled(ws, "Table of Contents", Font(name="Calibri", size=14, bold=True, color="2E4057"))])
     headers = ["Storyline", "Sheets", "Description"]
-    for col_idx, header in enumerate(headers, 1):
-        cell = ws.cell(row=row, column=col_idx, value=header)
-        cell.fill = HEADER_FILL
-        cell.font = HEADER_FONT
-        cell.alignment = HEADER_ALIGN
+    ws.append([_styled(ws, header, HEADER_FONT, HEADER_FILL, HEADER_ALIGN) for header in headers])
 
-    row += 1
     overview_keys = []
     if "s0_executive" in storyline_results:
         overview_keys.append("s0_executive")
@@ -208,17 +284,11 @@ def _add_overview_sheet(wb, storyline_results, config, sheet_count):
     for key in overview_keys:
         result = storyline_results[key]
         sheet_names = [s["name"] for s in result.get("sheets", [])]
-        ws.cell(row=row, column=1, value=result["title"]).font = Font(
-            name="Calibri", size=10, bold=True
-        )
-        ws.cell(row=row, column=2, value=", ".join(sheet_names)).font = DATA_FONT
-        ws.cell(row=row, column=3, value=result.get("description", "")).font = DATA_FONT
-        row += 1
-
-    # Column widths
-    ws.column_dimensions["A"].width = 30
-    ws.column_dimensions["B"].width = 50
-    ws.column_dimensions["C"].width = 60
+        ws.append([
+            _styled(ws, result["title"], Font(name="Calibri", size=10, bold=True)),
+            _styled(ws, ", ".join(sheet_names), DATA_FONT),
+            _styled(ws, result.get("description", ""), DATA_FONT),
+        ])
 
 
 def format_df_for_excel(df: pd.DataFrame, currency_cols=None, pct_cols=None) -> pd.DataFrame:
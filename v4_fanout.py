@@ -0,0 +1,344 @@
+"""Per-branch report fan-out.
+
+One report per branch used to mean one ``run_pipeline`` per branch on
+filtered data, reading and merging every transaction file N times. The
+fan-out loads the client once and splits the loaded context by an ODD
+account attribute (``Branch`` by default, already merged into
+``combined_df``) in a single pass:
+
+- every row goes to exactly one partition (one stable sort by branch
+  code); transactions of accounts without a branch (or not in the ODD)
+  go to ``UNASSIGNED``;
+- each partition gets its slice of ``odd_df`` / ``odd_ts`` and of the
+  activity bitmap and account x merchant incidence matrix, so no
+  storyline rescans the full data;
+- lookups that only depend on the merchant name are built once before the
+  split: the competitor tags (``competitor_categories``) are added to
+  ``combined_df`` and carried by every partition; merchant consolidation
+  already ran at load time.
+
+The partitions then run ``run_pipeline(ctx=...)`` in parallel worker
+processes (a partition is sent to one worker only) and write their
+Excel / HTML to ``<output_dir>/branches/``. A roll-up report with one row
+per branch (spend, accounts, competitor share, run status) is written
+next to the client's other reports as ``..._V4_Branch_Rollup``.
+
+Each branch keeps its own result cache (``<result_cache_dir>/branches/``)
+and is not added to the run store.
+
+Usage:
+    python v4_fanout.py my_client.yaml [--by Branch] [--workers 4]
+"""
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import multiprocessing
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from v4_activity import take_accounts
+from v4_data_loader import DATA_SOURCES, LazyContext, load_context
+from v4_incidence import take_rows
+from v4_result_cache import RESULT_CACHE_DIR
+from v4_themes import apply_theme, format_currency, horizontal_bar
+
+FANOUT_BY = "Branch"
+
+# Partition of transactions whose account has no value for the fan-out column
+UNASSIGNED = "Unassigned"
+
+
+def _slug(label: str) -> str:
+    return re.sub(r"[^\w-]+", "_", label).strip("_") or "blank"
+
+
+def branch_slugs(labels) -> dict[str, str]:
+    """Label -> file-name-safe slug, unique across *labels*.
+
+    Labels whose slugs collide ("North/Side", "North Side") get a short
+    hash of the label appended, so no branch overwrites another's reports.
+    """
+    slugs = {label: _slug(str(label)) for label in labels}
+    taken = pd.Series(list(slugs.values())).value_counts()
+    return {label: f"{slug}-{hashlib.sha1(str(label).encode()).hexdigest()[:6]}"
+            if taken[slug] > 1 else slug
+            for label, slug in slugs.items()}
+
+
+def _blocks(codes: np.ndarray, n: int) -> list[np.ndarray]:
+    """Row positions of each code 0..n-1, in original row order (one stable sort)."""
+    order = np.argsort(codes, kind="stable")
+    bounds = np.cumsum(np.bincount(codes, minlength=n))
+    return np.split(order, bounds[:-1])
+
+
+def branch_config(config: dict, by: str, slug: str) -> dict:
+    """Config of one partition: own report names, result cache, no run store.
+
+    *slug* is the partition's ``branch_slugs`` entry; the raw label is not
+    used, since it may hold path separators.
+    """
+    cache_dir = config.get("result_cache_dir", RESULT_CACHE_DIR)
+    return {
+        **config,
+        "client_name": f"{config.get('client_name', 'Client')} {_slug(by)} {slug}",
+        "output_dir": str(Path(config.get("output_dir", "output")) / "branches"),
+        "result_cache_dir": str(Path(cache_dir) / "branches" / slug) if cache_dir else "",
+        "run_store_dir": "",
+    }
+
+
+def partition_context(ctx: dict, by: str = FANOUT_BY) -> dict[str, LazyContext]:
+    """Split a loaded context by the ODD column *by*, one context per value.
+
+    Transactions and ODD rows keep their original order, so a partition
+    holds what a run on data filtered to that value would load. The
+    activity bitmap keeps the full month axis, the incidence matrix the
+    full merchant axis.
+    """
+    df, odd, act, ts = ctx["combined_df"], ctx["odd_df"], ctx["activity"], ctx["odd_ts"]
+    if by not in df.columns or by not in odd.columns:
+        raise KeyError(f"fan-out column {by!r} is not in the ODD")
+    values = sorted(set(odd[by].dropna()) | set(df[by].dropna()), key=str)
+    labels = [str(v) for v in values] + [UNASSIGNED]
+
+    def codes(col: pd.Series) -> np.ndarray:
+        c = pd.Categorical(col, categories=values).codes.astype(np.int64)
+        return np.where(c < 0, len(values), c)
+
+    txn_rows = _blocks(codes(df[by]), len(labels))
+    odd_rows = _blocks(codes(odd[by]), len(labels))
+    acct_pos = pd.Series(np.arange(len(act["accounts"])), index=act["accounts"])
+
+    parts = {}
+    for label, rows, o_rows in zip(labels, txn_rows, odd_rows):
+        if not len(rows) and not len(o_rows):
+            continue
+        part = df.take(rows).reset_index(drop=True)
+        if "Business?" in part.columns:
+            business_df = part[part["Business?"] == "Yes"].copy()
+            personal_df = part[part["Business?"] == "No"].copy()
+        else:
+            business_df, personal_df = pd.DataFrame(columns=part.columns), part.copy()
+        a_rows = np.sort(acct_pos.reindex(part["primary_account_num"].unique()).dropna()
+                         .to_numpy(dtype=np.int64))
+        activity = take_accounts(act, a_rows)
+        odd_ts = {**ts, "values": ts["values"][o_rows],
+                  "codes": {k: v[o_rows] for k, v in ts["codes"].items()}}
+        parts[label] = LazyContext(
+            config=ctx["config"], txn_columns=ctx.get("txn_columns"), preview_fraction=None,
+            # txn_df: nothing reads it after the merge; the partition has its columns
+            txn_df=part, combined_df=part, business_df=business_df, personal_df=personal_df,
+            activity=activity, incidence=take_rows(ctx["incidence"], a_rows),
+            odd_df=odd.take(o_rows).reset_index(drop=True), odd_ts=odd_ts,
+        )
+    return parts
+
+
+# =========================================================================
+# Worker
+# =========================================================================
+
+def run_branch(
+    label: str,
+    config: dict,
+    ctx: dict,
+    storylines: list[str] | None = None,
+    log_dir: str = "output/branches/logs",
+    slug: str | None = None,
+) -> dict:
+    """Run the storylines on one partition; output goes to ``<log_dir>/<slug>.log``.
+
+    Returns a status dict like ``v4_batch.run_client``: branch, status,
+    error, excel, html, log, elapsed_s.
+    """
+    from v4_run import run_pipeline
+
+    start = time.time()
+    Path(log_dir).mkdir(parents=True, exist_ok=True)
+    log_path = Path(log_dir) / f"{slug or _slug(label)}.log"
+    status = {"branch": label, "status": "ok", "error": "",
+              "excel": "", "html": "", "log": str(log_path)}
+    with open(log_path, "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            _, excel_path, html_path = run_pipeline(config, storylines, ctx=ctx)
+            status["excel"], status["html"] = str(excel_path), str(html_path)
+        except Exception as e:
+            traceback.print_exc()
+            status["status"], status["error"] = "failed", f"{type(e).__name__}: {e}"
+    status["elapsed_s"] = round(time.time() - start, 1)
+    return status
+
+
+# =========================================================================
+# Fan-out
+# =========================================================================
+
+def _branch_row(label: str, ctx: dict) -> dict:
+    df = ctx["combined_df"]
+    spend = float(df["amount"].sum())
+    active = int(df["primary_account_num"].nunique())
+    comp = float(df.loc[df["competitor_category"].notna(), "amount"].sum())
+    return {
+        "Branch": label,
+        "ODD Accounts": len(ctx["odd_df"]),
+        "Active Accounts": active,
+        "Transactions": len(df),
+        "Spend": round(spend, 2),
+        "Avg Ticket": round(spend / len(df), 2) if len(df) else 0.0,
+        "Spend per Active Account": round(spend / active, 2) if active else 0.0,
+        "Competitor Share (%)": round(comp / spend * 100, 1) if spend else 0.0,
+    }
+
+
+def rollup_result(rollup: pd.DataFrame, by: str) -> dict:
+    """Roll-up report across partitions (one row per branch)."""
+    total = rollup["Spend"].sum()
+    rollup = rollup.assign(**{"Share of Spend (%)": (rollup["Spend"] / total * 100).round(1)
+                              if total else 0.0})
+    ranked = rollup.sort_values("Spend", ascending=False)
+    top = ranked.iloc[0]
+    failed = rollup[rollup["Status"] == "failed"]
+    fig = horizontal_bar(ranked, "Spend", "Branch", f"Spend by {by}", top_n=len(ranked))
+    narrative = (
+        f"<b>{len(rollup):,}</b> {by.lower()} reports from one load of the data. "
+        f"<b>{top['Branch']}</b> has the most spend ({format_currency(top['Spend'])}, "
+        f"{top['Share of Spend (%)']:.1f}% of the total)."
+    )
+    if len(failed):
+        narrative += f" Failed: <b>{', '.join(failed['Branch'])}</b> (see the logs)."
+    return {
+        "title": f"{by} Roll-up",
+        "description": f"Headline KPIs of every {by.lower()} report side by side",
+        "sections": [{
+            "heading": f"{by} Overview",
+            "narrative": narrative,
+            "figures": [apply_theme(fig)],
+            "tables": [(f"{by} Roll-up", ranked.drop(columns=["Excel", "HTML"]))],
+        }],
+        "sheets": [{
+            "name": f"{by} Roll-up"[:31], "df": ranked,
+            "currency_cols": ["Spend", "Avg Ticket", "Spend per Active Account"],
+            "number_cols": ["ODD Accounts", "Active Accounts", "Transactions"],
+            "pct_cols": ["Competitor Share (%)", "Share of Spend (%)"],
+        }],
+    }
+
+
+def run_fanout(
+    config: dict,
+    by: str = FANOUT_BY,
+    storylines: list[str] | None = None,
+    max_workers: int | None = None,
+) -> pd.DataFrame:
+    """Load *config*'s data once and write one report per value of *by*, plus a roll-up.
+
+    Parameters
+    ----------
+    config : dict
+        Client config (``load_config`` / ``load_client_config``).
+    by : str
+        ODD column merged into ``combined_df`` to split on.
+    storylines : list[str] | None
+        Storyline keys passed to ``run_pipeline`` (None = all).
+    max_workers : int | None
+        Concurrent partitions (default: CPU count). Partitions are pickled
+        to the workers; with one worker they run in this process.
+
+    Returns
+    -------
+    pd.DataFrame -- one row per partition with KPIs, status and report paths.
+    """
+    from v4_excel_report import generate_excel_report
+    from v4_html_report import generate_html_report
+    from v4_s3_competition import competitor_categories
+
+    start = time.time()
+    ctx = load_context(config, sources=DATA_SOURCES)
+    df = ctx["combined_df"]
+    merch_col = "merchant_consolidated" if "merchant_consolidated" in df.columns else "merchant_name"
+    df["competitor_category"] = competitor_categories(df[merch_col], config)
+    parts = partition_context(ctx, by)
+    del ctx, df
+    print(f"[fanout] {len(parts)} partitions by {by} in {time.time() - start:.1f}s: "
+          + ", ".join(f"{k} ({len(p['combined_df']):,} rows)" for k, p in parts.items()))
+
+    out = Path(config.get("output_dir", "output"))
+    log_dir = str(out / "branches" / "logs")
+    rows = {label: _branch_row(label, p) for label, p in parts.items()}
+    slugs = branch_slugs(parts)
+    todo = [label for label in parts if len(parts[label]["combined_df"])]
+    for label in parts:
+        if label not in todo:
+            rows[label].update(Status="skipped", Error="no transactions")
+
+    workers = min(max_workers or os.cpu_count() or 1, len(todo)) or 1
+    print(f"[fanout] Running {len(todo)} partitions, {workers} worker(s); logs in {log_dir}")
+    statuses = []
+    if workers == 1:
+        for label in todo:
+            statuses.append(run_branch(label, branch_config(config, by, slugs[label]),
+                                       parts.pop(label), storylines, log_dir, slugs[label]))
+            print(f"[fanout] {label}: {statuses[-1]['status']} in {statuses[-1]['elapsed_s']:.1f}s")
+    else:
+        # spawn: workers must not inherit Polars / DuckDB thread pools via fork
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {
+                pool.submit(run_branch, label, branch_config(config, by, slugs[label]),
+                            parts.pop(label), storylines, log_dir, slugs[label]): label
+                for label in todo
+            }
+            for fut in as_completed(futures):
+                try:
+                    statuses.append(fut.result())
+                except Exception as e:  # worker died (e.g. killed for memory)
+                    statuses.append({"branch": futures[fut], "status": "failed",
+                                     "error": f"{type(e).__name__}: {e}"})
+                print(f"[fanout] {futures[fut]}: {statuses[-1]['status']} "
+                      f"in {statuses[-1].get('elapsed_s', 0):.1f}s")
+    for s in statuses:
+        rows[s["branch"]].update(Status=s["status"], Error=s["error"],
+                                 Excel=s.get("excel", ""), HTML=s.get("html", ""))
+
+    rollup = pd.DataFrame(list(rows.values())).reindex(columns=[
+        "Branch", "ODD Accounts", "Active Accounts", "Transactions", "Spend", "Avg Ticket",
+        "Spend per Active Account", "Competitor Share (%)", "Status", "Error", "Excel", "HTML",
+    ]).fillna({"Error": "", "Excel": "", "HTML": ""})
+    result = rollup_result(rollup, by)
+    out.mkdir(parents=True, exist_ok=True)
+    stem = (f"{config.get('client_id', '')}_{config.get('client_name', 'Client').replace(' ', '_')}"
+            f"_V4_{_slug(by)}_Rollup")
+    generate_excel_report({"rollup": result}, config, str(out / f"{stem}.xlsx"))
+    generate_html_report({"rollup": result}, config, str(out / f"{stem}.html"))
+
+    counts = rollup["Status"].value_counts()
+    print(f"\n  FAN-OUT COMPLETE in {time.time() - start:.1f}s "
+          f"(sum of partition run times {sum(s.get('elapsed_s', 0) for s in statuses):.1f}s)")
+    print("  " + " | ".join(f"{k}: {v}" for k, v in counts.items()))
+    print(f"  Roll-up: {out / stem}.xlsx / .html")
+    return rollup
+
+
+if __name__ == "__main__":
+    from v4_data_loader import load_config
+
+    if len(sys.argv) < 2:
+        print("Usage: python v4_fanout.py my_client.yaml [--by Branch] [--workers N]")
+        sys.exit(2)
+    opts = dict(zip(sys.argv[2::2], sys.argv[3::2]))
+    run_fanout(
+        load_config(sys.argv[1]),
+        by=opts.get("--by", FANOUT_BY),
+        max_workers=int(opts["--workers"]) if "--workers" in opts else None,
+    )
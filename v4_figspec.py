@@ -0,0 +1,147 @@
+"""Lightweight figure specs, turned into Plotly figures only at render time.
+
+Building ``go.Figure`` / ``go.Bar`` objects runs Plotly's property
+validation on every trace and every ``update_layout``; across the 100+
+charts of a run that is a noticeable share of storyline time, and the
+validated objects stay alive until the reports are written. Storylines
+and the ``v4_themes`` builders therefore build a ``FigureSpec`` instead:
+
+- traces are plain dicts (``dict(type="bar", x=..., y=...)``), with
+  pandas columns copied to numpy arrays so no DataFrame is kept alive;
+- ``update_layout`` / ``add_annotation`` / ``add_hline`` and the other
+  figure methods the storylines use are recorded as ``(method, kwargs)``
+  and replayed in order on the real figure;
+- ``to_figure`` builds, validates and themes the ``go.Figure`` once, for
+  the HTML dashboard, the Streamlit app or the PNG export. It also accepts
+  a ``go.Figure`` (e.g. from an older result cache).
+
+Specs are plain data: they pickle small and ``spec_json`` gives a stable
+JSON for cache keys (``v4_chart_export``).
+"""
+from __future__ import annotations
+
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+
+def _plain(value):
+    """Copy pandas / numpy values out of their frames; recurse into containers."""
+    if isinstance(value, (pd.Series, pd.Index)):
+        return value.to_numpy(copy=True)
+    if isinstance(value, pd.DataFrame):
+        return value.to_numpy(copy=True)
+    if isinstance(value, np.ndarray):
+        return value.copy() if value.base is not None else value
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    return value
+
+
+def _trace_dict(trace) -> dict:
+    if isinstance(trace, go.Figure):
+        raise TypeError("add_trace expects a trace, not a figure")
+    if hasattr(trace, "to_plotly_json"):
+        return trace.to_plotly_json()
+    return _plain(dict(trace))
+
+
+class FigureSpec:
+    """Unvalidated figure: trace dicts, a layout dict and recorded updates.
+
+    Mirrors the part of the ``go.Figure`` API the storylines use; every
+    method returns the spec, like Plotly's, so calls can be chained.
+
+    Parameters
+    ----------
+    data : dict | list[dict] | None
+        One trace or a list of traces (``dict(type=..., ...)``).
+    layout : dict | None
+    """
+
+    __slots__ = ("data", "layout", "ops")
+
+    def __init__(self, data=None, layout=None):
+        if data is None:
+            data = []
+        elif isinstance(data, dict) or hasattr(data, "to_plotly_json"):
+            data = [data]
+        self.data: list[dict] = [_trace_dict(t) for t in data]
+        self.layout: dict = _plain(dict(layout or {}))
+        self.ops: list[tuple[str, dict]] = []
+
+    def add_trace(self, trace) -> "FigureSpec":
+        self.data.append(_trace_dict(trace))
+        return self
+
+    def add_traces(self, traces) -> "FigureSpec":
+        for trace in traces:
+            self.add_trace(trace)
+        return self
+
+    def _record(self, method: str, dict1: dict | None, kwargs: dict) -> "FigureSpec":
+        if dict1:
+            kwargs = {**dict1, **kwargs}
+        self.ops.append((method, _plain(kwargs)))
+        return self
+
+    def update_layout(self, dict1=None, **kwargs) -> "FigureSpec":
+        return self._record("update_layout", dict1, kwargs)
+
+    def add_annotation(self, arg=None, **kwargs) -> "FigureSpec":
+        return self._record("add_annotation", arg, kwargs)
+
+    def add_shape(self, arg=None, **kwargs) -> "FigureSpec":
+        return self._record("add_shape", arg, kwargs)
+
+    def add_hline(self, y, **kwargs) -> "FigureSpec":
+        return self._record("add_hline", None, {"y": y, **kwargs})
+
+    def add_vline(self, x, **kwargs) -> "FigureSpec":
+        return self._record("add_vline", None, {"x": x, **kwargs})
+
+    def update_xaxes(self, patch=None, **kwargs) -> "FigureSpec":
+        return self._record("update_xaxes", patch, kwargs)
+
+    def update_yaxes(self, patch=None, **kwargs) -> "FigureSpec":
+        return self._record("update_yaxes", patch, kwargs)
+
+    def update_traces(self, patch=None, **kwargs) -> "FigureSpec":
+        return self._record("update_traces", patch, kwargs)
+
+    def to_dict(self) -> dict:
+        """Plain ``{"data", "layout", "ops"}`` form of the spec."""
+        return {"data": self.data, "layout": self.layout,
+                "ops": [[method, kwargs] for method, kwargs in self.ops]}
+
+    def __repr__(self) -> str:
+        types = ", ".join(t.get("type", "scatter") for t in self.data)
+        return f"FigureSpec([{types}], {len(self.ops)} update(s))"
+
+
+FigureLike = Union[FigureSpec, go.Figure]
+
+
+def to_figure(fig: FigureLike) -> go.Figure:
+    """Validated, themed ``go.Figure`` for a spec (a ``go.Figure`` is returned as-is)."""
+    if not isinstance(fig, FigureSpec):
+        return fig
+    from v4_themes import ensure_theme
+
+    ensure_theme()
+    figure = go.Figure(data=fig.data, layout={"template": "v4_consultant", **fig.layout})
+    for method, kwargs in fig.ops:
+        getattr(figure, method)(**kwargs)
+    return figure
+
+
+def spec_json(fig: FigureLike) -> str:
+    """Stable JSON of a spec (or figure), e.g. for cache keys."""
+    if isinstance(fig, FigureSpec):
+        return pio.to_json(fig.to_dict(), validate=False, engine="json")
+    return fig.to_json()
@@ -2,10 +2,20 @@
 # HTML dashboard generator - self-contained interactive Plotly dashboards
 # =============================================================================
 
+import json
+from html import escape
+
 import pandas as pd
 import plotly.graph_objects as go
+import plotly.io as pio
 from pathlib import Path
 from datetime import datetime
+from typing import Iterator
+
+from plotly.utils import PlotlyJSONEncoder
+
+from v4_figspec import to_figure
+from v4_spill import SpilledTable
 
 # Keywords that identify currency columns in HTML tables
 _CURRENCY_KEYWORDS = {
@@ -14,6 +24,89 @@ _CURRENCY_KEYWORDS = {
 }
 _PCT_KEYWORDS = {"%", "pct", "rate", "penetration", "recapture"}
 
+# Placeholder for the storyline sections in the page template
+_CONTENT_MARKER = "<!--V4_CONTENT-->"
+
+# Segment Explorer section (see ``v4_segments``): filters, KPIs, two charts
+# and a monthly table, re-aggregated in the browser from the embedded cubes.
+# __FILTERS__ / __THEME__ / __SEGMENTS__ are filled in by
+# ``_segment_explorer_html``.
+_SEGMENT_EXPLORER = """<div id="segment_explorer" class="storyline-section">
+<h2 class="storyline-title">Segment Explorer</h2>
+<div class="narrative">Filter the headline numbers below by account segment. Figures are
+re-aggregated in the browser from pre-computed segment totals; the storyline sections
+cover the whole portfolio.</div>
+<div class="segment-filters">__FILTERS__</div>
+<div class="kpi-row" id="seg-kpis"></div>
+<div class="chart-container"><div id="seg-monthly" style="height:420px"></div></div>
+<div class="chart-container"><div id="seg-merchants" style="height:520px"></div></div>
+<h4>Monthly Summary (selected segments)</h4>
+<div class="table-container" id="seg-table"></div>
+</div>
+<script type="application/json" id="seg-data">__SEGMENTS__</script>
+<script>
+(function () {
+    const seg = JSON.parse(document.getElementById('seg-data').textContent);
+    const theme = __THEME__;
+    const money = v => '$' + v.toLocaleString(undefined, {maximumFractionDigits: 0});
+    const count = v => v.toLocaleString();
+    const filters = seg.dims.map((_, i) => document.getElementById('seg-f' + i));
+
+    function render() {
+        const picked = filters.map(f => f.value);
+        const keep = seg.cells.map(c => c.every((v, i) => picked[i] === '' || String(v) === picked[i]));
+        const n = seg.months.length;
+        const spend = new Array(n).fill(0), txns = new Array(n).fill(0), accts = new Array(n).fill(0);
+        for (const [c, m, s, t, a] of seg.monthly) {
+            if (keep[c]) { spend[m] += s; txns[m] += t; accts[m] += a; }
+        }
+        const mSpend = new Array(seg.merchants.length).fill(0);
+        for (const [c, k, s] of seg.merchant_rows) { if (keep[c]) mSpend[k] += s; }
+        const accounts = seg.cell_accounts.reduce((sum, a, c) => sum + (keep[c] ? a : 0), 0);
+        const totSpend = spend.reduce((a, b) => a + b, 0), totTxns = txns.reduce((a, b) => a + b, 0);
+
+        const kpis = [['Total Spend', money(totSpend)], ['Transactions', count(totTxns)],
+                      ['Active Accounts', count(accounts)],
+                      ['Avg Ticket', totTxns ? '$' + (totSpend / totTxns).toFixed(2) : '-']];
+        document.getElementById('seg-kpis').innerHTML = kpis.map(([l, v]) =>
+            '<div class="kpi-card"><div class="kpi-value">' + v + '</div><div class="kpi-label">' + l + '</div></div>'
+        ).join('');
+
+        Plotly.react('seg-monthly', [
+            {type: 'bar', x: seg.months, y: spend, name: 'Spend',
+             hovertemplate: '%{x}<br>Spend: $%{y:,.0f}<extra></extra>'},
+            {type: 'scatter', mode: 'lines+markers', x: seg.months, y: accts, name: 'Active Accounts',
+             yaxis: 'y2', hovertemplate: '%{x}<br>Accounts: %{y:,}<extra></extra>'}
+        ], Object.assign({}, theme, {
+            title: {text: '<b>Monthly Spend and Active Accounts</b>'},
+            yaxis: {title: {text: 'Spend'}, tickprefix: '$'},
+            yaxis2: {title: {text: 'Accounts'}, overlaying: 'y', side: 'right', showgrid: false},
+            legend: {orientation: 'h', y: -0.15}
+        }), {displayModeBar: true, responsive: true});
+
+        const order = mSpend.map((v, i) => i).sort((a, b) => mSpend[a] - mSpend[b]);
+        Plotly.react('seg-merchants', [{
+            type: 'bar', orientation: 'h', x: order.map(i => mSpend[i]),
+            y: order.map(i => seg.merchants[i]), hovertemplate: '%{y}: $%{x:,.0f}<extra></extra>'
+        }], Object.assign({}, theme, {
+            title: {text: '<b>Top Merchants by Spend</b>'}, xaxis: {tickprefix: '$'},
+            margin: {l: 220}
+        }), {displayModeBar: true, responsive: true});
+
+        const rows = seg.months.map((m, i) => '<tr><td>' + m + '</td><td>' + money(spend[i]) +
+            '</td><td>' + count(txns[i]) + '</td><td>' + count(accts[i]) + '</td><td>' +
+            (txns[i] ? '$' + (spend[i] / txns[i]).toFixed(2) : '') + '</td></tr>').join('');
+        document.getElementById('seg-table').innerHTML = '<table class="data-table"><thead><tr>' +
+            '<th>Month</th><th>Spend</th><th>Transactions</th><th>Accounts</th><th>Avg Ticket</th>' +
+            '</tr></thead><tbody>' + rows + '</tbody></table>';
+    }
+
+    filters.forEach(f => f.addEventListener('change', render));
+    render();
+})();
+</script>
+"""
+
 
 def _format_table_for_html(table_df: pd.DataFrame) -> pd.DataFrame:
     """Format numeric columns for display in HTML tables."""
@@ -35,7 +128,90 @@ def _format_table_for_html(table_df: pd.DataFrame) -> pd.DataFrame:
     return display
 
 
-def generate_html_report(storyline_results: dict, config: dict, output_path: str):
+def _table_html(table) -> Iterator[str]:
+    """HTML for one section table; spilled tables are rendered chunk by chunk."""
+    if not isinstance(table, SpilledTable):
+        yield _format_table_for_html(table).to_html(
+            classes="data-table",
+            index=False,
+            border=0,
+            escape=False,
+        )
+        return
+    tail = ""
+    for i, chunk in enumerate(table.iter_chunks()):
+        html = _format_table_for_html(chunk).to_html(
+            classes="data-table",
+            index=False,
+            border=0,
+            escape=False,
+        )
+        head, body = html.split("<tbody>\n", 1)
+        body, tail = body.rsplit("</tbody>", 1)
+        if i == 0:
+            yield head + "<tbody>\n"
+        yield body.rstrip(" ")
+    yield "  </tbody>" + tail
+
+
+def _segment_explorer_html(segments: str) -> str:
+    """Segment Explorer section for the ``v4_segments`` payload (a JSON string)."""
+    from v4_themes import ensure_theme
+
+    cubes = json.loads(segments)
+    filters = []
+    for i, (dim, values) in enumerate(zip(cubes["dims"], cubes["values"])):
+        options = "".join(f'<option value="{j}">{escape(v)}</option>'
+                          for j, v in enumerate(values))
+        filters.append(
+            f'<label>{escape(dim)} <select id="seg-f{i}">'
+            f'<option value="">All</option>{options}</select></label>'
+        )
+    ensure_theme()
+    theme = {"template": pio.templates["v4_consultant"].to_plotly_json()}
+    return (
+        _SEGMENT_EXPLORER
+        .replace("__FILTERS__", "\n".join(filters))
+        .replace("__THEME__", json.dumps(theme, cls=PlotlyJSONEncoder))
+        .replace("__SEGMENTS__", segments.replace("</", "<\\/"))
+    )
+
+
+def _storyline_html(key: str, result: dict) -> Iterator[str]:
+    """HTML of one storyline section, piece by piece."""
+    yield f'<div id="{key}" class="storyline-section">\n'
+    yield f'<h2 class="storyline-title">{result["title"]}</h2>\n'
+
+    for section in result.get("sections", []):
+        yield f'<h3>{section["heading"]}</h3>\n'
+
+        if section.get("narrative"):
+            yield f'<div class="narrative">{section["narrative"]}</div>\n'
+
+        for fig in section.get("figures", []):
+            if fig is None:
+                continue
+            fig = to_figure(fig)
+            if not fig.data and not fig.layout.annotations:
+                continue
+            chart_html = fig.to_html(
+                full_html=False,
+                include_plotlyjs=False,
+                config={"displayModeBar": True, "responsive": True},
+            )
+            yield f'<div class="chart-container">{chart_html}</div>\n'
+
+        for table_title, table_df in section.get("tables", []):
+            yield f'<h4>{table_title}</h4>\n'
+            yield '<div class="table-container">\n'
+            yield from _table_html(table_df)
+            yield "\n</div>\n"
+
+    yield "</div>\n"
+
+
+def generate_html_report(storyline_results: dict, config: dict, output_path: str,
+                         segments: str | None = None):
     """
     Generate a self-contained HTML dashboard with interactive Plotly charts.
 
@@ -48,12 +224,16 @@ def generate_html_report(storyline_results: dict, config: dict, output_path: str
             'sections': list of dicts, each with:
                 'heading': str
                 'narrative': str (insight text)
-                'figures': list of go.Figure
+                'figures': list of FigureSpec / go.Figure
                 'tables': list of (title, pd.DataFrame)  [optional]
     config : dict
         Client config for header info.
     output_path : str
         Where to write the HTML file.
+    segments : str | None
+        Segment cubes (``v4_segments.segment_payload``); adds a Segment
+        Explorer after the executive summary whose filters re-aggregate in
+        the browser.
     """
     client_name = config.get("client_name", "Client")
     client_id = config.get("client_id", "")
@@ -72,51 +252,14 @@ def generate_html_report(storyline_results: dict, config: dict, output_path: str
         nav_items.append(
             f'<a href="#{key}" class="nav-link">{result["title"]}</a>'
         )
+    explorer_after = ordered_keys[0] if ordered_keys[:1] == ["s0_executive"] else None
+    if segments:
+        nav_items.insert(1 if explorer_after else 0,
+                         '<a href="#segment_explorer" class="nav-link">Segment Explorer</a>')
     nav_html = "\n".join(nav_items)
 
-    # Build content sections
-    content_sections = []
-    for key in ordered_keys:
-        result = storyline_results[key]
-        section_html = f'<div id="{key}" class="storyline-section">\n'
-        section_html += f'<h2 class="storyline-title">{result["title"]}</h2>\n'
-
-        for section in result.get("sections", []):
-            section_html += f'<h3>{section["heading"]}</h3>\n'
-
-            if section.get("narrative"):
-                section_html += (
-                    f'<div class="narrative">{section["narrative"]}</div>\n'
-                )
-
-            for fig in section.get("figures", []):
-                if fig is None:
-                    continue
-                if not fig.data and not fig.layout.annotations:
-                    continue
-                chart_html = fig.to_html(
-                    full_html=False,
-                    include_plotlyjs=False,
-                    config={"displayModeBar": True, "responsive": True},
-                )
-                section_html += f'<div class="chart-container">{chart_html}</div>\n'
-
-            for table_title, table_df in section.get("tables", []):
-                section_html += f'<h4>{table_title}</h4>\n'
-                section_html += '<div class="table-container">\n'
-                display_df = _format_table_for_html(table_df)
-                section_html += display_df.to_html(
-                    classes="data-table",
-                    index=False,
-                    border=0,
-                    escape=False,
-                )
-                section_html += "\n</div>\n"
-
-        section_html += "</div>\n"
-        content_sections.append(section_html)
-
-    content_html = "\n".join(content_sections)
+    # Storyline sections are streamed into the file between these halves
+    content_html = _CONTENT_MARKER
 
     html = f"""<!DOCTYPE html>
 <html lang="en">
@@ -351,6 +494,24 @@ h4 {{
     letter-spacing: 0.5px;
 }}
 
+/* Segment Explorer filters */
+.segment-filters {{
+    display: flex;
+    flex-wrap: wrap;
+    gap: 12px 24px;
+    margin: 12px 0;
+    font-size: 13px;
+    font-weight: 600;
+}}
+
+.segment-filters select {{
+    margin-left: 6px;
+    padding: 4px 8px;
+    border: 1px solid var(--border);
+    border-radius: 4px;
+    font-size: 13px;
+}}
+
 /* Executive summary styling */
 #s0_executive .storyline-title {{
     font-size: 24px;
@@ -433,9 +594,21 @@ sections.forEach(section => observer.observe(section));
 </body>
 </html>"""
 
+    head, tail = html.split(_CONTENT_MARKER)
     output = Path(output_path)
     output.parent.mkdir(parents=True, exist_ok=True)
-    output.write_text(html, encoding="utf-8")
+    with open(output, "w", encoding="utf-8") as fh:
+        fh.write(head)
+        if segments and explorer_after is None:
+            fh.write(_segment_explorer_html(segments))
+        for i, key in enumerate(ordered_keys):
+            if i:
+                fh.write("\n")
+            for part in _storyline_html(key, storyline_results[key]):
+                fh.write(part)
+            if segments and key == explorer_after:
+                fh.write(_segment_explorer_html(segments))
+        fh.write(tail)
     print(f"  HTML dashboard: {output}")
 
 
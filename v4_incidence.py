@@ -0,0 +1,163 @@
+"""Sparse account x merchant incidence matrix for account-level merchant metrics.
+
+Wallet share, accounts per merchant and per-account category sets used to
+be rebuilt in several storylines (S3C competitor share and segment pivots,
+S4 cross-category use and affinity, S8 payroll recapture), each with its
+own multi-key groupby over every transaction. ``build_incidence`` makes
+one pass over the transactions at load time and keeps the non-empty
+(account, merchant) cells in compressed sparse row (CSR) form on integer
+codes:
+
+- ``indptr`` / ``indices``: the cells of account row ``i`` are
+  ``indptr[i]:indptr[i + 1]``, ``indices`` holds their merchant codes
+  (ascending within a row);
+- ``spend`` / ``count``: summed amount and number of transactions per cell.
+
+Rows are the sorted account numbers (the same axis as
+``v4_activity.build_activity``), columns the sorted distinct merchant
+names; a missing merchant name is a column of its own (the last), so a
+row sums to the account's whole spend. The result is kept as
+``ctx['incidence']`` (a ``transactions`` data source, see
+``v4_data_loader.DATA_SOURCES``).
+
+The helpers below are sparse algebra on those arrays: row sums over a set
+of merchant columns (wallet share), accounts per column, collapsing
+merchant columns into groups (account x category) and the co-occurrence
+of groups across accounts. The arrays are the ``(data, indices, indptr)``
+triple of ``scipy.sparse.csr_matrix`` if a matrix object is wanted.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def build_incidence(df: pd.DataFrame, merch_col: str | None = None) -> dict:
+    """Account x merchant spend / transaction counts of *df* in CSR form.
+
+    Rows without an account number are ignored, as in a ``groupby`` on it.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Transactions with ``primary_account_num``, ``amount`` and the
+        merchant column.
+    merch_col : str | None
+        Merchant column (default: ``merchant_consolidated`` if present,
+        else ``merchant_name``).
+
+    Keys in returned dict
+    ---------------------
+    accounts  : sorted Index of account numbers (rows)
+    merchants : sorted Index of merchant names, missing last (columns)
+    indptr    : int64 array (accounts + 1,), row offsets into the cells
+    indices   : int32 array (cells,), merchant code of each cell
+    spend     : float64 array (cells,), summed amount
+    count     : int32 array (cells,), transactions
+    merch_col : the merchant column used
+    """
+    if merch_col is None:
+        merch_col = "merchant_consolidated" if "merchant_consolidated" in df.columns else "merchant_name"
+    acct_codes, accounts = pd.factorize(df["primary_account_num"], sort=True)
+    merch_codes, merchants = pd.factorize(df[merch_col], sort=True, use_na_sentinel=False)
+    n_accts, n_merch = len(accounts), max(len(merchants), 1)
+
+    valid = acct_codes >= 0
+    cells, inverse = np.unique(acct_codes[valid].astype(np.int64) * n_merch + merch_codes[valid],
+                               return_inverse=True)
+    amount = np.nan_to_num(df["amount"].to_numpy(dtype=np.float64)[valid])
+    rows = cells // n_merch
+    return {
+        "accounts": pd.Index(accounts, name="primary_account_num"),
+        "merchants": pd.Index(merchants, name=merch_col),
+        "indptr": np.searchsorted(rows, np.arange(n_accts + 1)).astype(np.int64),
+        "indices": (cells % n_merch).astype(np.int32),
+        "spend": np.bincount(inverse, weights=amount, minlength=len(cells)),
+        "count": np.bincount(inverse, minlength=len(cells)).astype(np.int32),
+        "merch_col": merch_col,
+    }
+
+
+def incidence_nbytes(inc: dict) -> int:
+    """Memory held by the arrays of *inc*."""
+    return sum(v.nbytes for v in inc.values() if isinstance(v, np.ndarray))
+
+
+def take_rows(inc: dict, rows: np.ndarray) -> dict:
+    """*inc* restricted to the account rows *rows* (ascending positions)."""
+    start, stop = inc["indptr"][rows], inc["indptr"][rows + 1]
+    lengths = stop - start
+    cells = np.repeat(start - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return {
+        **inc,
+        "accounts": inc["accounts"][rows],
+        "indptr": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        **{k: inc[k][cells] for k in ("indices", "spend", "count")},
+    }
+
+
+# =========================================================================
+# Sparse algebra
+# =========================================================================
+
+def cell_rows(inc: dict) -> np.ndarray:
+    """Account row of every cell (the COO row array)."""
+    return np.repeat(np.arange(len(inc["accounts"])), np.diff(inc["indptr"]))
+
+
+def column_mask(inc: dict, names) -> np.ndarray:
+    """Bool per merchant column: its name is in *names*."""
+    return inc["merchants"].isin(names)
+
+
+def row_sums(inc: dict, values: str = "spend", columns: np.ndarray | None = None) -> np.ndarray:
+    """Per-account sum of *values* (``spend`` or ``count``), optionally over a column mask."""
+    data = inc[values]
+    if columns is not None:
+        data = np.where(columns[inc["indices"]], data, 0)
+    return np.add.reduceat(np.r_[data, 0], inc["indptr"][:-1])[: len(inc["accounts"])] \
+        * (np.diff(inc["indptr"]) > 0)
+
+
+def column_accounts(inc: dict) -> np.ndarray:
+    """Number of accounts with at least one transaction per merchant column."""
+    return np.bincount(inc["indices"], minlength=len(inc["merchants"]))
+
+
+def collapse_columns(inc: dict, codes: np.ndarray, groups) -> dict:
+    """Account x group incidence: merchant columns summed into *groups*.
+
+    *codes* gives each merchant column's position in *groups* (-1 = drop
+    the column). The result has the same keys as ``build_incidence`` with
+    ``groups`` as the column axis in place of ``merchants``.
+    """
+    group_of = np.asarray(codes)[inc["indices"]]
+    keep = group_of >= 0
+    n_groups = max(len(groups), 1)
+    rows = cell_rows(inc)[keep]
+    cells, inverse = np.unique(rows.astype(np.int64) * n_groups + group_of[keep],
+                               return_inverse=True)
+    return {
+        **{k: v for k, v in inc.items() if k != "merchants"},
+        "groups": pd.Index(groups),
+        "indptr": np.searchsorted(cells // n_groups,
+                                  np.arange(len(inc["accounts"]) + 1)).astype(np.int64),
+        "indices": (cells % n_groups).astype(np.int32),
+        "spend": np.bincount(inverse, weights=inc["spend"][keep], minlength=len(cells)),
+        "count": np.bincount(inverse, weights=inc["count"][keep],
+                             minlength=len(cells)).astype(np.int32),
+    }
+
+
+def cooccurrence(inc: dict, axis: str = "groups") -> pd.DataFrame:
+    """Accounts using both of each pair of columns (``B.T @ B`` of the 0/1 matrix).
+
+    The diagonal holds the accounts using each column. Meant for a few
+    columns (e.g. ``collapse_columns`` categories): the 0/1 matrix is dense
+    over the accounts with any cell.
+    """
+    labels = inc[axis]
+    used = np.flatnonzero(np.diff(inc["indptr"]) > 0)
+    dense = np.zeros((len(used), len(labels)), dtype=np.float64)
+    dense[np.repeat(np.arange(len(used)), np.diff(inc["indptr"])[used]), inc["indices"]] = 1.0
+    return pd.DataFrame((dense.T @ dense).astype(np.int64), index=labels, columns=labels)
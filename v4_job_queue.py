@@ -0,0 +1,358 @@
+"""Shared-directory job queue for running clients across several machines.
+
+Coordination is plain files on a directory every worker can reach (a local
+folder, or an SMB/NFS share mounted on several hosts); no server is needed.
+A job moves between state folders with ``os.replace``, which is atomic on
+one filesystem, so exactly one worker wins each claim::
+
+    <queue_dir>/
+        pending/<client_id>.json    waiting to be claimed
+        claimed/<client_id>.json    being run; its mtime is the heartbeat
+        done/<client_id>.json       finished -- timing / output manifest
+        failed/<client_id>.json     failed ``max_attempts`` times
+        logs/<client_id>.log        pipeline output of the last attempt
+
+A claimed job whose heartbeat is older than ``stale_after_s`` (worker
+killed, host lost) is moved back to pending by whichever worker notices
+first, and retried until ``max_attempts``. Every claim carries a fresh
+``claim`` token: a job is staged under a private name before it appears
+in ``claimed/`` (so it never shows there with a stale mtime), and a
+requeue that finds the heartbeat or token changed after its move backs
+off. A worker whose claim was taken away writes its manifest to
+``done/<client_id>.<worker>.late.json`` (not listed by ``status``).
+
+Reports go to each client's ``output_dir``; a relative one is resolved
+against the queue directory, so every worker writes back to the share.
+
+Usage:
+    python v4_job_queue.py submit  <queue_dir> [--clients 1453,1776]
+    python v4_job_queue.py work    <queue_dir> [--workers 4]
+    python v4_job_queue.py status  <queue_dir>
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from v4_batch import run_client
+from v4_client_config import list_clients, load_base
+
+JOB_STATES = ("pending", "claimed", "done", "failed")
+
+HEARTBEAT_S = 30
+STALE_AFTER_S = 300
+MAX_ATTEMPTS = 3
+POLL_S = 5
+
+
+# =========================================================================
+# Job files
+# =========================================================================
+
+def _job_path(queue_dir: Path, state: str, job_id: str) -> Path:
+    return queue_dir / state / f"{job_id}.json"
+
+
+def _read_job(path: Path) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_job(path: Path, job: dict) -> None:
+    """Write *job* atomically (temp file + replace) so readers never see half a file."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job, f, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+def _move(queue_dir: Path, job_id: str, src: str, dst: str) -> Path | None:
+    """Atomically move a job between states; None if another worker got there first."""
+    target = _job_path(queue_dir, dst, job_id)
+    try:
+        os.replace(_job_path(queue_dir, src, job_id), target)
+    except FileNotFoundError:
+        return None
+    return target
+
+
+def _stage_path(queue_dir: Path, job_id: str, why: str) -> Path:
+    """Private name for a job being moved (not matched by ``*.json`` globs)."""
+    return queue_dir / "claimed" / f".{job_id}.{why}.{socket.gethostname()}.{os.getpid()}.stage"
+
+
+def _claim_token(path: Path) -> str | None:
+    """``claim`` token of the job at *path*; None if it is gone or unreadable."""
+    try:
+        return _read_job(path).get("claim")
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _mtime(path: Path) -> float:
+    """File mtime, or +inf if it vanished (moved by another worker)."""
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return float("inf")
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def init_queue(queue_dir: str | Path) -> Path:
+    """Create the queue folders (idempotent) and return the queue path."""
+    queue_dir = Path(queue_dir)
+    for state in (*JOB_STATES, "logs"):
+        (queue_dir / state).mkdir(parents=True, exist_ok=True)
+    return queue_dir
+
+
+# =========================================================================
+# Producer side
+# =========================================================================
+
+def submit_jobs(
+    queue_dir: str | Path,
+    client_ids: list[str] | None = None,
+    storylines: list[str] | None = None,
+    resubmit: bool = False,
+) -> list[str]:
+    """Queue one job per client (default: every ``configs/clients/*.yaml``).
+
+    Clients already pending or claimed are skipped; done/failed ones are only
+    queued again with ``resubmit=True``. Returns the job ids queued.
+    """
+    queue_dir = init_queue(queue_dir)
+    queued = []
+    for cid in client_ids or list_clients():
+        if any(_job_path(queue_dir, s, cid).exists() for s in ("pending", "claimed")):
+            continue
+        finished = [s for s in ("done", "failed") if _job_path(queue_dir, s, cid).exists()]
+        if finished and not resubmit:
+            continue
+        for state in finished:
+            _job_path(queue_dir, state, cid).unlink(missing_ok=True)
+        _write_job(_job_path(queue_dir, "pending", cid), {
+            "job_id": cid, "client_id": cid, "storylines": storylines,
+            "attempts": 0, "submitted_at": _now(), "history": [],
+        })
+        queued.append(cid)
+    print(f"[queue] Submitted {len(queued)} job(s) to {queue_dir}")
+    return queued
+
+
+def requeue_stale(
+    queue_dir: str | Path,
+    stale_after_s: float = STALE_AFTER_S,
+    max_attempts: int = MAX_ATTEMPTS,
+) -> list[str]:
+    """Return stale claimed jobs to pending (or to failed once out of attempts)."""
+    queue_dir = Path(queue_dir)
+    requeued = []
+    for path in (queue_dir / "claimed").glob("*.json"):
+        seen = _mtime(path)
+        age = time.time() - seen
+        if age < stale_after_s:
+            continue
+        job_id = path.stem
+        try:
+            job = _read_job(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+        # Take the claim out of claimed/ first, then check it is still the
+        # one judged stale: a heartbeat or a new claim in between wins.
+        staged = _stage_path(queue_dir, job_id, "requeue")
+        try:
+            os.replace(path, staged)
+        except FileNotFoundError:
+            continue
+        if _mtime(staged) != seen or _claim_token(staged) != job.get("claim"):
+            os.replace(staged, path)
+            continue
+        dst = "failed" if job.get("attempts", 0) >= max_attempts else "pending"
+        job["history"].append({"event": "stale", "worker": job.get("worker"),
+                               "at": _now(), "heartbeat_age_s": round(age)})
+        if dst == "failed":
+            job.update(status="failed", error=f"stale after {job['attempts']} attempt(s)")
+        _write_job(staged, job)
+        os.replace(staged, _job_path(queue_dir, dst, job_id))
+        requeued.append(job_id)
+        print(f"[queue] {job_id}: heartbeat {age:.0f}s old -> {dst}")
+    return requeued
+
+
+def queue_status(queue_dir: str | Path) -> pd.DataFrame:
+    """One row per job: state, attempts, worker and timing."""
+    queue_dir = Path(queue_dir)
+    rows = []
+    for state in JOB_STATES:
+        for path in sorted((queue_dir / state).glob("*.json")):
+            if path.name.endswith(".late.json"):
+                continue
+            try:
+                job = _read_job(path)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            rows.append({
+                "job_id": job["job_id"], "state": state,
+                "attempts": job.get("attempts", 0), "worker": job.get("worker", ""),
+                "started_at": job.get("started_at", ""),
+                "elapsed_s": job.get("elapsed_s"), "error": job.get("error", ""),
+            })
+    return pd.DataFrame(rows, columns=["job_id", "state", "attempts", "worker",
+                                       "started_at", "elapsed_s", "error"])
+
+
+# =========================================================================
+# Worker side
+# =========================================================================
+
+def _claim_next(queue_dir: Path, worker_id: str) -> dict | None:
+    """Claim the oldest pending job; None when nothing is left to claim.
+
+    The job is moved to a private name, updated there (attempt, worker,
+    new ``claim`` token) and only then moved into ``claimed/``, so it
+    appears there with a fresh heartbeat.
+    """
+    for path in sorted((queue_dir / "pending").glob("*.json"), key=_mtime):
+        staged = _stage_path(queue_dir, path.stem, "claim")
+        try:
+            os.replace(path, staged)
+        except FileNotFoundError:
+            continue  # another worker won this one
+        job = _read_job(staged)
+        job["attempts"] = job.get("attempts", 0) + 1
+        job.update(worker=worker_id, started_at=_now(), claim=uuid.uuid4().hex)
+        job["history"].append({"event": "claimed", "worker": worker_id, "at": job["started_at"]})
+        _write_job(staged, job)
+        os.replace(staged, _job_path(queue_dir, "claimed", path.stem))
+        return job
+    return None
+
+
+def _heartbeat(path: Path, token: str, stop: threading.Event, every_s: float) -> None:
+    """Touch the claim file until *stop* is set; stops if the claim was taken away.
+
+    A missing file is retried on the next beat (a requeue check may have it
+    staged for a moment); a different ``claim`` token means the job was
+    requeued and claimed again.
+    """
+    while not stop.wait(every_s):
+        current = _claim_token(path)
+        if current is None:
+            continue
+        if current != token:
+            return
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            continue
+
+
+def run_worker(
+    queue_dir: str | Path,
+    worker_id: str | None = None,
+    heartbeat_s: float = HEARTBEAT_S,
+    stale_after_s: float = STALE_AFTER_S,
+    max_attempts: int = MAX_ATTEMPTS,
+    poll_s: float = POLL_S,
+    exit_when_idle: bool = True,
+) -> int:
+    """Claim and run jobs until the queue is drained; returns jobs processed.
+
+    With ``exit_when_idle=False`` the worker keeps polling for new jobs.
+    """
+    queue_dir = init_queue(queue_dir)
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    base = load_base()
+    processed = 0
+    print(f"[worker {worker_id}] watching {queue_dir}")
+
+    while True:
+        requeue_stale(queue_dir, stale_after_s, max_attempts)
+        job = _claim_next(queue_dir, worker_id)
+        if job is None:
+            if exit_when_idle and not any((queue_dir / "claimed").glob("*.json")):
+                break
+            time.sleep(poll_s)
+            continue
+
+        job_id = job["job_id"]
+        claim_path = _job_path(queue_dir, "claimed", job_id)
+        print(f"[worker {worker_id}] {job_id}: attempt {job['attempts']}")
+        stop = threading.Event()
+        beat = threading.Thread(target=_heartbeat,
+                                args=(claim_path, job["claim"], stop, heartbeat_s), daemon=True)
+        beat.start()
+        try:
+            result = run_client(job["client_id"], job.get("storylines"),
+                                str(queue_dir / "logs"), base=base, output_root=str(queue_dir))
+        finally:
+            stop.set()
+            beat.join()
+
+        job.update(result, finished_at=_now(), host=socket.gethostname())
+        if result["status"] == "ok":
+            dst = "done"
+        else:
+            dst = "failed" if job["attempts"] >= max_attempts else "pending"
+        job["history"].append({"event": result["status"], "worker": worker_id,
+                               "at": job["finished_at"], "elapsed_s": result["elapsed_s"]})
+        moved = None
+        if _claim_token(claim_path) == job["claim"]:
+            moved = _move(queue_dir, job_id, "claimed", dst)
+        if moved is None:
+            # Our claim was declared stale and re-queued meanwhile; keep the
+            # manifest of this run next to whatever state the job is in now.
+            moved = queue_dir / "done" / f"{job_id}.{worker_id.replace(':', '_')}.late.json"
+        _write_job(moved, job)
+        processed += 1
+        print(f"[worker {worker_id}] {job_id}: {result['status']} "
+              f"in {result['elapsed_s']:.1f}s -> {dst}")
+
+    print(f"[worker {worker_id}] idle, exiting after {processed} job(s)")
+    return processed
+
+
+def run_workers(queue_dir: str | Path, n_workers: int, **kwargs) -> None:
+    """Start *n_workers* local worker processes on the queue and wait for them."""
+    procs = [
+        multiprocessing.Process(target=run_worker, args=(queue_dir,),
+                                kwargs={"worker_id": f"{socket.gethostname()}:w{i}", **kwargs})
+        for i in range(n_workers)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+# =========================================================================
+# CLI
+# =========================================================================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("submit", "work", "status"):
+        print(__doc__)
+        sys.exit(1)
+    command, qdir = sys.argv[1], sys.argv[2]
+    args = [a for a in sys.argv[3:] if a != "--resubmit"]
+    opts = dict(zip(args[::2], args[1::2]))
+    if command == "submit":
+        ids = [c.strip() for c in opts.get("--clients", "").split(",") if c.strip()]
+        submit_jobs(qdir, ids or None, resubmit="--resubmit" in sys.argv)
+    elif command == "work":
+        run_workers(qdir, int(opts.get("--workers", 1)))
+    print(queue_status(qdir).to_string(index=False))
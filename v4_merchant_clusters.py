@@ -0,0 +1,313 @@
+"""Fuzzy clustering of the consolidated merchant long tail.
+
+``v4_merchant_rules`` folds ~200 brands; most of the remaining distinct
+names are store-number and location variants of the same local business
+("JOE'S PIZZA #12", "JOES PIZZA 0457"). This module groups such near
+duplicates into a reviewable mapping table without comparing every pair:
+
+1. Each consolidated name is reduced to a key: the part before its first
+   number (store numbers and the location after them drop out), letters
+   and spaces only ("JOE'S PIZZA #12 CHICAGO IL" -> "JOES PIZZA"). Names
+   with the same key are one cluster from the start.
+2. Each distinct key gets a MinHash signature of its character 3-grams
+   (``MINHASH_PERMS`` hash functions, computed with numpy over all keys at
+   once).
+3. Locality-sensitive hashing: the signature is cut into ``LSH_BANDS``
+   bands; keys sharing any band land in the same bucket. Within a bucket
+   each key is compared with the bucket's first key and its neighbour
+   only, so the candidate pairs grow linearly with the number of keys.
+4. Candidates whose estimated similarity is close to the threshold get
+   their exact 3-gram Jaccard similarity; those reaching it are linked.
+   Keys are then taken by spend, highest first: an unassigned key becomes
+   a cluster centre and takes its unassigned linked keys. Every member is
+   similar to its centre itself, so chains of pairwise-similar names
+   (A ~ B ~ C, A not ~ C) do not snowball into one cluster.
+
+``build_clusters`` returns one row per name in a multi-name cluster: its
+canonical name (the name of the cluster's highest-spend member without its
+store number, ``display_name``), the exact key similarity to the centre and
+an ``Apply`` flag (True as built; a reviewer sets it to False to reject a
+row, or edits ``canonical``). ``cluster_table`` caches it per client in the
+result cache; the CLI writes it as a CSV to review (rerunning it keeps the
+decisions already in that CSV, ``carry_review``). Pointing
+``merchant_clusters`` in the config at the reviewed CSV makes the loader map
+``merchant_consolidated`` through the rows still marked ``Apply``
+(``apply_clusters``).
+
+Usage:
+    python v4_merchant_clusters.py my_client.yaml [--threshold 0.7] [--out clusters.csv]
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from v4_result_cache import data_fingerprint, load_result, save_result
+
+CLUSTER_THRESHOLD = 0.7   # 3-gram Jaccard similarity to link two names
+MINHASH_PERMS = 64
+LSH_BANDS = 16            # 16 bands x 4 rows: pairs at ~0.5 similarity collide half the time
+
+_CACHE_KEY = "merchant_clusters"
+_APOSTROPHE = re.compile(r"['\u2019`]")
+_NON_LETTER = re.compile(r"[^A-Z ]+")
+_FROM_NUMBER = re.compile(r"\d.*$")
+_MULTI_SPACE = re.compile(r"\s+")
+_STORE_NUMBER = re.compile(r"[\s#]+\d.*$")
+_PRIME = (1 << 31) - 1
+_YES = ("true", "1", "yes", "y", "x")
+_COLUMNS = ["Apply", "merchant", "canonical", "cluster", "similarity", "cluster_size",
+            "transactions", "spend", "accounts"]
+
+
+def cluster_key(name) -> str:
+    """Key of *name* for matching: letters and spaces before its first digit.
+
+    Falls back to the letters of the whole name if it starts with a digit
+    ("7-ELEVEN 123" -> "ELEVEN"); "" if it has none.
+    """
+    upper = _APOSTROPHE.sub("", str(name).upper())
+    key = _MULTI_SPACE.sub(" ", _NON_LETTER.sub(" ", _FROM_NUMBER.sub("", upper))).strip()
+    return key or _MULTI_SPACE.sub(" ", _NON_LETTER.sub(" ", upper)).strip()
+
+
+def display_name(name) -> str:
+    """*name* as written, cut before its first store number.
+
+    Only a number after a space or ``#`` is cut, so a leading one stays
+    ("JOE'S PIZZA #12 CHICAGO IL" -> "JOE'S PIZZA", "7-ELEVEN 123" ->
+    "7-ELEVEN"); the whole name if nothing is left.
+    """
+    name = _MULTI_SPACE.sub(" ", str(name)).strip()
+    return _STORE_NUMBER.sub("", name).rstrip(" -#,") or name
+
+
+# =========================================================================
+# MinHash / LSH
+# =========================================================================
+
+def _grams(keys: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Distinct 3-gram codes of every key: (key index, code), sorted by key.
+
+    Keys are padded with a space at each end; over 27 symbols a 3-gram is
+    an integer below 27**3.
+    """
+    text = "".join(f" {k} " for k in keys)
+    sym = np.frombuffer(text.encode("ascii"), dtype=np.uint8).astype(np.int64)
+    sym = np.where(sym == 32, 0, sym - 64)  # space -> 0, A..Z -> 1..26
+    lengths = np.fromiter((len(k) for k in keys), dtype=np.int64, count=len(keys))
+    owner = np.repeat(np.arange(len(keys)), lengths)
+    # a padded key of length L + 2 has L 3-grams; the k-th starts k symbols in
+    offset = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    pos = np.repeat(np.cumsum(lengths + 2) - (lengths + 2), lengths) + offset
+    code = sym[pos] * 729 + sym[pos + 1] * 27 + sym[pos + 2]
+    uniq = np.unique(owner * 19683 + code)
+    return uniq // 19683, uniq % 19683
+
+
+def minhash(keys: list[str], perms: int = MINHASH_PERMS, seed: int = 0) -> np.ndarray:
+    """MinHash signatures (len(keys) x *perms*) of the keys' 3-gram sets."""
+    owner, code = _grams(keys)
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, perms)
+    b = rng.integers(0, _PRIME, perms)
+    starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+    sig = np.empty((len(keys), perms), dtype=np.int64)
+    for k in range(perms):
+        sig[:, k] = np.minimum.reduceat((a[k] * code + b[k]) % _PRIME, starts)
+    return sig
+
+
+def candidate_pairs(sig: np.ndarray, bands: int = LSH_BANDS) -> tuple[np.ndarray, np.ndarray]:
+    """Distinct (i, j) pairs, i < j, of rows sharing an LSH band bucket."""
+    rows = sig.shape[1] // bands
+    mix = np.random.default_rng(1).integers(1, 1 << 62, rows, dtype=np.uint64) | np.uint64(1)
+    left, right = [], []
+    for band in range(bands):
+        cols = sig[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        bucket = (cols * mix).sum(axis=1) + np.uint64(band)  # wraps around: a hash
+        order = np.argsort(bucket, kind="stable")
+        b = bucket[order]
+        same = np.flatnonzero(b[1:] == b[:-1]) + 1
+        if not len(same):
+            continue
+        first = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+        leader = order[first[np.searchsorted(first, same, "right") - 1]]
+        left += [order[same - 1], leader]
+        right += [order[same], order[same]]
+    if not left:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    i, j = np.concatenate(left), np.concatenate(right)
+    lo, hi = np.minimum(i, j), np.maximum(i, j)
+    pair = np.unique(lo[lo != hi] * len(sig) + hi[lo != hi])
+    return pair // len(sig), pair % len(sig)
+
+
+def _centres(weight: np.ndarray, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """Cluster centre of each node: greedy by *weight* over the links (i, j)."""
+    n = len(weight)
+    a, b = np.r_[i, j], np.r_[j, i]
+    srt = np.argsort(a, kind="stable")
+    a, b = a[srt], b[srt]
+    ptr = np.searchsorted(a, np.arange(n + 1))
+    centre = np.arange(n)
+    assigned = np.zeros(n, dtype=bool)
+    for k in np.argsort(-weight, kind="stable"):
+        if assigned[k] or ptr[k] == ptr[k + 1]:
+            continue
+        assigned[k] = True
+        nb = b[ptr[k]:ptr[k + 1]]
+        nb = nb[~assigned[nb]]
+        centre[nb] = k
+        assigned[nb] = True
+    return centre
+
+
+def _jaccard(a: str, b: str) -> float:
+    """Exact 3-gram Jaccard similarity of two keys (same grams as ``_grams``)."""
+    ga = {f" {a} "[k:k + 3] for k in range(len(a))}
+    gb = {f" {b} "[k:k + 3] for k in range(len(b))}
+    return len(ga & gb) / len(ga | gb)
+
+
+# =========================================================================
+# Clusters
+# =========================================================================
+
+def build_clusters(table: pd.DataFrame, threshold: float = CLUSTER_THRESHOLD) -> pd.DataFrame:
+    """Mapping table of near-duplicate names in *table* (``merchant_table``).
+
+    Returns one row per name in a cluster of two or more names: ``Apply``,
+    ``merchant``, ``canonical``, ``cluster`` (id, by cluster spend),
+    ``similarity`` (exact 3-gram Jaccard of the keys, name vs canonical),
+    ``cluster_size``, ``transactions``, ``spend`` and ``accounts``.
+    """
+    names = table.dropna(subset=["merchant"]).reset_index(drop=True)
+    keys = names["merchant"].map(cluster_key)
+    names = names[keys != ""].reset_index(drop=True)
+    keys = keys[keys != ""].reset_index(drop=True)
+    key_codes, distinct = pd.factorize(keys)
+    distinct = list(distinct)
+    if not distinct:
+        return pd.DataFrame(columns=_COLUMNS)
+
+    start = time.time()
+    sig = minhash(distinct)
+    i, j = candidate_pairs(sig)
+    near = (sig[i] == sig[j]).mean(axis=1) >= threshold - 0.2
+    i, j = i[near], j[near]
+    similar = np.fromiter((_jaccard(distinct[a], distinct[b]) >= threshold for a, b in zip(i, j)),
+                          dtype=bool, count=len(i))
+    weight = np.bincount(key_codes, weights=names["spend"].to_numpy(dtype=float),
+                         minlength=len(distinct))
+    label = _centres(weight, i[similar], j[similar])
+    print(f"[clusters] {len(names):,} names, {len(distinct):,} keys, {len(i):,} candidate "
+          f"pairs checked, {int(similar.sum()):,} linked in {time.time() - start:.1f}s")
+
+    names = names.assign(cluster=label[key_codes], key=keys)
+    size = names.groupby("cluster")["merchant"].transform("size")
+    members = names[size > 1].copy()
+    if members.empty:
+        return pd.DataFrame(columns=_COLUMNS)
+    members["cluster_size"] = size[size > 1]
+    top = members.sort_values("spend", ascending=False, kind="stable").drop_duplicates("cluster")
+    members["canonical"] = members["cluster"].map(
+        pd.Series(top["merchant"].map(display_name).to_numpy(), index=top["cluster"]))
+    members["similarity"] = [round(_jaccard(a, distinct[c]), 3)
+                             for a, c in zip(members["key"], members["cluster"])]
+    members["Apply"] = True
+    rank = (members.groupby("cluster")["spend"].sum()
+            .rank(ascending=False, method="first").astype(int))
+    members["cluster"] = members["cluster"].map(rank)
+    return (members.sort_values(["cluster", "spend"], ascending=[True, False])[_COLUMNS]
+            .reset_index(drop=True))
+
+
+def cluster_table(config: dict, ctx: dict | None = None,
+                  threshold: float | None = None) -> pd.DataFrame:
+    """``build_clusters`` of the client's merchant names, cached per data.
+
+    Clustering runs on the names before any ``merchant_clusters`` mapping,
+    so *ctx* is only used when the config applies none.
+    """
+    from v4_rule_whatif import merchant_table
+
+    threshold = float(threshold or config.get("merchant_cluster_threshold") or CLUSTER_THRESHOLD)
+    raw = {**config, "merchant_clusters": ""}
+    h = hashlib.sha1(data_fingerprint(raw).encode())
+    h.update(Path(__file__).read_bytes())
+    h.update(repr(threshold).encode())
+    fingerprint = h.hexdigest()
+    cached = load_result(config, _CACHE_KEY, fingerprint)
+    if cached is not None:
+        return cached
+
+    table = merchant_table(raw, None if config.get("merchant_clusters") else ctx)
+    clusters = build_clusters(table, threshold)
+    save_result(config, _CACHE_KEY, fingerprint, clusters)
+    return clusters
+
+
+def carry_review(clusters: pd.DataFrame, path: str | Path) -> pd.DataFrame:
+    """*clusters* with the ``Apply`` / ``canonical`` of names already in the CSV at *path*."""
+    path = Path(path)
+    if not path.is_file():
+        return clusters
+    old = pd.read_csv(path, usecols=["Apply", "merchant", "canonical"], dtype=str) \
+        .drop_duplicates("merchant").set_index("merchant")
+    seen = clusters["merchant"].isin(old.index)
+    out = clusters.copy()
+    out.loc[seen, "canonical"] = out.loc[seen, "merchant"].map(old["canonical"]).to_numpy()
+    out.loc[seen, "Apply"] = (out.loc[seen, "merchant"].map(old["Apply"]).str.strip().str.lower()
+                              .isin(_YES).to_numpy())
+    print(f"[clusters] Kept {int(seen.sum()):,} earlier review decisions from {path.name}")
+    return out
+
+
+def load_cluster_map(path: str | Path) -> dict[str, str]:
+    """merchant -> canonical for the rows of a reviewed mapping CSV marked Apply."""
+    df = pd.read_csv(path, usecols=["Apply", "merchant", "canonical"], dtype=str)
+    apply = df["Apply"].str.strip().str.lower().isin(_YES)
+    df = df[apply & df["merchant"].notna() & df["canonical"].notna()
+            & (df["merchant"] != df["canonical"])]
+    return dict(zip(df["merchant"], df["canonical"]))
+
+
+def apply_clusters(names: pd.Series, path: str | Path) -> pd.Series:
+    """*names* with the reviewed mapping at *path* applied (unchanged if missing)."""
+    path = Path(path)
+    if not path.is_file():
+        print(f"[clusters] WARNING: mapping {path} not found, names left as they are")
+        return names
+    mapping = load_cluster_map(path)
+    codes, distinct = pd.factorize(names, use_na_sentinel=False)
+    mapped = pd.Series(distinct, dtype=object).map(lambda n: mapping.get(n, n))
+    out = pd.Series(mapped.to_numpy()[codes], index=names.index, name=names.name)
+    print(f"[clusters] {path.name}: {len(mapping):,} names mapped, "
+          f"{int(((out != names) & names.notna()).sum()):,} transactions renamed")
+    return out
+
+
+if __name__ == "__main__":
+    from v4_data_loader import load_config
+
+    if len(sys.argv) < 2:
+        print("Usage: python v4_merchant_clusters.py my_client.yaml [--threshold 0.7] [--out path.csv]")
+        sys.exit(2)
+    opts = dict(zip(sys.argv[2::2], sys.argv[3::2]))
+    cfg = load_config(sys.argv[1])
+    result = cluster_table(cfg, threshold=float(opts["--threshold"]) if "--threshold" in opts else None)
+    out = Path(opts.get("--out") or Path(cfg.get("output_dir", "output"))
+               / f"{cfg.get('client_id', 'client')}_merchant_clusters.csv")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    result = carry_review(result, out)
+    result.to_csv(out, index=False)
+    print(f"[clusters] {result['cluster'].nunique() if len(result) else 0:,} clusters, "
+          f"{int(result['Apply'].sum()) if len(result) else 0:,} names to map; review {out} "
+          f"and set merchant_clusters: {out.as_posix()} in the config")
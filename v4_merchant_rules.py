@@ -6,9 +6,11 @@ sequential if/elif pattern matching. First match wins.
 Usage:
     from v4_merchant_rules import standardize_merchant_name
     from v4_merchant_rules import apply_merchant_consolidation
+    from v4_merchant_rules import consolidate_merchants
 
     canonical = standardize_merchant_name("WALMART #3893 CHICAGO IL")
     df = apply_merchant_consolidation(df, column="merchant_name")
+    df["merchant_consolidated"] = consolidate_merchants(df["merchant_name"])
 """
 
 from __future__ import annotations
@@ -894,5 +896,19 @@ def apply_merchant_consolidation(
             f"Available columns: {list(df.columns)}"
         )
     result = df.copy()
-    result["merchant_consolidated"] = result[column].apply(standardize_merchant_name)
+    result["merchant_consolidated"] = consolidate_merchants(result[column])
     return result
+
+
+def consolidate_merchants(names: pd.Series) -> pd.Series:
+    """:func:`standardize_merchant_name` of every value in *names*.
+
+    Same result as ``names.apply(standardize_merchant_name)``, but the
+    rules run once per distinct name (missing values included) instead of
+    once per row; a year of transactions repeats each name many times.
+    """
+    import pandas as pd
+
+    codes, distinct = pd.factorize(names, use_na_sentinel=False)
+    consolidated = pd.Series(distinct, dtype=object).map(standardize_merchant_name)
+    return pd.Series(consolidated.to_numpy()[codes], index=names.index, name=names.name)
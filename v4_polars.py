@@ -0,0 +1,214 @@
+"""Polars engine for transaction loading and the ODD join.
+
+Selected with ``engine: polars`` in the config (``pip install polars``).
+Compared with the pandas path in ``v4_data_loader``:
+
+- all selected monthly files are scanned as one lazy query and parsed by
+  Polars' multi-threaded CSV reader;
+- amount/date conversion and the sign fix are Polars expressions;
+- merchant consolidation runs ``standardize_merchant_name`` once per
+  *distinct* merchant name and maps the result back with an expression;
+- the join to ODD is a Polars hash join on the account number.
+
+The result is handed to the storylines as the same pandas frames the
+pandas engine produces (same columns, row order and values). Aggregations
+on the Polars side of the run go through ``v4_backend.group_agg``.
+"""
+from __future__ import annotations
+
+import itertools
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import polars as pl
+from pandas.tseries.api import guess_datetime_format
+
+from v4_merchant_rules import standardize_merchant_name
+from v4_preview import sample_mask
+
+# Strings pandas.read_csv reads as missing by default
+_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null",
+]
+
+
+def _consolidate_expr(names: pl.Series) -> pl.Expr:
+    """Expression mapping merchant_name to its consolidated name.
+
+    ``standardize_merchant_name`` runs once per distinct name; missing names
+    stay missing, as in the pandas path.
+    """
+    distinct = names.drop_nulls().unique().to_list()
+    consolidated = [standardize_merchant_name(n) for n in distinct]
+    return (
+        pl.col("merchant_name").cast(pl.String)
+        .replace_strict([str(n) for n in distinct], consolidated, default=None)
+        .alias("merchant_consolidated")
+    )
+
+
+def read_transactions(
+    files: list[Path], columns: list[str], keep: list[str] | None = None,
+    sample: dict | None = None,
+) -> pd.DataFrame:
+    """Scan, convert and consolidate the selected transaction files.
+
+    Parameters
+    ----------
+    files : list[Path]
+        Tab-delimited files (metadata first row, no header), in the order
+        their rows should appear.
+    columns : list[str]
+        Names for the file columns (``TRANSACTION_COLUMNS``). A file with
+        fewer fields (the 12-column monthly layout) takes the leading names;
+        its rows get nulls in the columns it lacks, as with pandas.
+    keep : list[str] | None
+        Columns to parse (default: all). The projection is pushed into the
+        scan, so the other columns are never parsed; columns a file does
+        not have are skipped.
+    sample : dict | None
+        Preview plan (``v4_preview.plan_sample``): the account filter is a
+        predicate on the scan, so rows of unsampled accounts are dropped
+        while the files are read.
+
+    Returns
+    -------
+    pd.DataFrame -- same layout as the pandas loader, including
+    ``source_file``, ``year_month`` and ``merchant_consolidated``.
+    """
+    from v4_data_loader import _file_width
+
+    paths = [str(f) for f in files]
+    # One scan per run of files with the same width; rows keep file order
+    scans, order = [], {}
+    for width, group in itertools.groupby(files, key=_file_width):
+        names = columns[:width]
+        selected = [c for c in names if keep is None or c in keep]
+        scans.append(pl.scan_csv(
+            [str(f) for f in group], separator="\t", has_header=False, skip_rows=1,
+            new_columns=names, infer_schema_length=None, null_values=_NA_VALUES,
+            include_file_paths="source_file",
+        ).select(*selected, "source_file"))
+        # pandas.concat order: columns by first appearance, file by file
+        order.update(dict.fromkeys([*selected, "source_file"]))
+    lf = scans[0] if len(scans) == 1 else pl.concat(scans, how="diagonal_relaxed")
+    if sample:
+        acct = pl.col("primary_account_num")
+        lf = lf.filter(acct.is_in(pl.Series(sample["accounts"]))
+                       | ~acct.is_in(pl.Series(sample["odd_accounts"])))
+    lf = lf.with_columns(
+        pl.col("source_file").replace_strict(paths, [f.name for f in files]),
+        pl.col("amount").cast(pl.Float64, strict=False).fill_null(0.0),
+        pl.col("transaction_date").cast(pl.String),
+    )
+    txn = lf.collect()
+    if sample:  # accounts missing from the ODD: same hash rule as the pandas reader
+        txn = txn.filter(sample_mask(txn["primary_account_num"].to_pandas(), sample))
+
+    # Same date format pandas.to_datetime would infer (month-first)
+    dates = txn["transaction_date"].drop_nulls()
+    fmt = guess_datetime_format(dates[0]) if len(dates) else None
+    txn = txn.with_columns(
+        pl.col("transaction_date").str.to_datetime(format=fmt, strict=False)
+    )
+
+    if txn["amount"].median() < 0:
+        txn = txn.with_columns(pl.col("amount").abs())
+
+    for name, n in txn.group_by("source_file", maintain_order=True).len().iter_rows():
+        print(f"  Loaded: {name} ({n:,} rows)")
+
+    print("[transactions] Applying merchant name consolidation...")
+    txn = txn.with_columns(_consolidate_expr(txn["merchant_name"]))
+
+    # pandas from here on: reorder to the pandas layout, then derive Periods
+    df = txn.select(*order, "merchant_consolidated").to_pandas()
+    df.insert(len(order), "year_month", df["transaction_date"].dt.to_period("M"))
+    return df
+
+
+def join_odd(txn_df: pd.DataFrame, odd_slim: pd.DataFrame) -> pd.DataFrame:
+    """Left-join *odd_slim* onto *txn_df* by account with a Polars hash join.
+
+    Only the key columns go through Polars: the join yields, per transaction,
+    the matching ODD row position, and the ODD columns are then taken in
+    pandas, so their dtypes (ordered categoricals, datetimes) are exactly
+    what ``DataFrame.merge`` would give.
+    """
+    keys = pl.DataFrame({"_acct": pl.Series(txn_df["primary_account_num"].to_numpy())})
+    odd_keys = pl.DataFrame({
+        "_acct": pl.Series(odd_slim["Acct Number"].to_numpy()),
+        "_odd_row": np.arange(len(odd_slim)),
+    })
+    rows = (keys.with_row_index("_txn_row")
+            .join(odd_keys, on="_acct", how="left", maintain_order="left"))
+
+    if len(rows) == len(txn_df):  # unique ODD keys: rows are in txn order
+        txn_part = txn_df.reset_index(drop=True)
+    else:
+        txn_part = txn_df.take(rows["_txn_row"].to_numpy()).reset_index(drop=True)
+    odd_rows = rows["_odd_row"].fill_null(-1).to_numpy()
+    odd_part = odd_slim.reset_index(drop=True).reindex(odd_rows).reset_index(drop=True)
+    return pd.concat([txn_part, odd_part], axis=1)
+
+
+def to_polars(df: pd.DataFrame) -> pl.DataFrame:
+    """Polars copy of a pandas frame; Period columns become month-start datetimes."""
+    periods = {c: df[c].dt.to_timestamp() for c in df.columns
+               if isinstance(df[c].dtype, pd.PeriodDtype)}
+    return pl.from_pandas(df.assign(**periods) if periods else df)
+
+
+# Synthetic monthly files for ``self_test``: (file date, field count, rows).
+# Empty and "NULL" merchant names are missing in both engines.
+_SELF_TEST_FILES = [
+    ("01012025", 12, [
+        ("01/03/2025", "1001", "SIG", "12.50", "5411", "Amazon.com*AB12", "CITY", "CT", "1", "11", "INST", "N"),
+        ("01/09/2025", "1002", "PIN", "40.00", "5812", "", "CITY", "CT", "2", "12", "INST", "Y"),
+        ("01/17/2025", "1003", "SIG", "7.25", "5999", "JOE'S COFFEE #12", "CITY", "CT", "3", "13", "INST", "N"),
+    ]),
+    ("02012025", 13, [
+        ("02/02/2025", "1001", "SIG", "19.99", "5411", "AMAZON MKTPL", "CITY", "CT", "1", "11", "INST", "N", "21"),
+        ("02/14/2025", "1004", "SIG", "55.10", "6011", "NULL", "CITY", "CT", "4", "14", "INST", "Y", "22"),
+        ("02/20/2025", "1002", "PIN", "3.00", "5812", "Joe's Coffee", "", "", "2", "12", "INST", "N", "23"),
+    ]),
+]
+
+
+def self_test() -> bool:
+    """Load synthetic files with both engines and compare the frames.
+
+    The files mix the 12- and 13-column layouts and include missing merchant
+    names. Returns True when ``load_transactions`` gives the same frame with
+    ``engine: pandas`` and ``engine: polars``.
+    """
+    from v4_data_loader import load_transactions
+
+    with tempfile.TemporaryDirectory() as tmp:
+        year = Path(tmp) / "2025"
+        year.mkdir()
+        for date, width, rows in _SELF_TEST_FILES:
+            lines = ["meta"] + ["\t".join(r[:width]) for r in rows]
+            (year / f"9999-trans-{date}.csv").write_text("\n".join(lines) + "\n")
+        config = {"transaction_dir": tmp, "file_extension": "csv", "recent_months": 12}
+        frames = {e: load_transactions({**config, "engine": e}) for e in ("pandas", "polars")}
+
+    try:
+        pd.testing.assert_frame_equal(frames["polars"], frames["pandas"], check_dtype=False)
+    except AssertionError as exc:
+        print(f"[polars] self-test MISMATCH: {exc}")
+        return False
+    print(f"[polars] self-test ok: {len(frames['pandas'])} rows, "
+          f"{frames['pandas']['merchant_consolidated'].isna().sum()} missing merchants")
+    return True
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--self-test"]:
+        sys.exit(0 if self_test() else 1)
+    sys.exit("usage: python v4_polars.py --self-test")
@@ -0,0 +1,293 @@
+"""Preview mode: run the storylines on a stratified sample of accounts.
+
+``run_pipeline(config, preview=0.1)`` (or *Preview* in the app) keeps 10%
+of the accounts:
+
+- accounts are drawn per stratum (``PREVIEW_STRATA``, e.g. business vs
+  personal) by ranking a hash of the account number, so each stratum keeps
+  the same share and reruns pick the same accounts;
+- a sampled account keeps its ODD row and all of its transactions;
+  transactions of accounts missing from the ODD are kept by the same hash;
+- the filter runs inside the transaction reader (chunked pandas reads, a
+  predicate on the Polars scan), so rows of unsampled accounts are never
+  collected into a frame.
+
+Storyline results are computed on the sample. ``scale_result`` multiplies
+their spend totals and transaction / account counts by ``1 / fraction`` and
+labels every tab as a preview; shares, rates, averages, rankings, charts and
+narratives stay as computed on the sample and are directional.
+``preview_result`` scales the headline totals back up to the portfolio,
+with 95% confidence intervals from the stratified estimator.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from v4_html_report import build_kpi_html
+from v4_themes import format_currency
+
+# ODD columns the account sample is stratified by (those present are used)
+PREVIEW_STRATA = ("Business?",)
+
+# Rows per chunk when the pandas reader filters a file by account
+SAMPLE_CHUNK_ROWS = 500_000
+
+_Z95 = 1.96
+
+
+# =========================================================================
+# Sampling
+# =========================================================================
+
+def account_hash(accts: pd.Series) -> np.ndarray:
+    """Deterministic pseudo-random value in [0, 1) per account number."""
+    return pd.util.hash_pandas_object(accts, index=False).to_numpy() / 2.0 ** 64
+
+
+def plan_sample(odd_df: pd.DataFrame, fraction: float) -> tuple[dict, np.ndarray]:
+    """Choose the sampled accounts of *odd_df*.
+
+    Returns
+    -------
+    plan : dict
+        ``fraction``; ``by`` (strata columns used); ``accounts`` (sampled
+        ODD account numbers); ``odd_accounts`` (all of them); ``strata``
+        (one row per stratum with ``Accounts`` / ``Sampled``); ``stratum``
+        (Series: sampled account -> stratum label).
+    keep : np.ndarray[bool] -- rows of *odd_df* in the sample.
+    """
+    accts = odd_df["Acct Number"]
+    strata_cols = [c for c in PREVIEW_STRATA if c in odd_df.columns]
+    if strata_cols:
+        stratum = odd_df[strata_cols].astype(str).agg(" / ".join, axis=1)
+    else:
+        stratum = pd.Series("All", index=odd_df.index)
+
+    rank = pd.Series(account_hash(accts), index=odd_df.index).groupby(stratum).rank(method="first")
+    sizes = stratum.value_counts().sort_index()
+    sampled = np.maximum(1, np.round(sizes * fraction)).astype(int)
+    keep = (rank <= stratum.map(sampled)).to_numpy()
+
+    plan = {
+        "fraction": fraction,
+        "by": strata_cols,
+        "accounts": accts[keep].to_numpy(),
+        "odd_accounts": accts.to_numpy(),
+        "strata": pd.DataFrame({"Stratum": sizes.index, "Accounts": sizes.to_numpy(),
+                                "Sampled": sampled.to_numpy()}),
+        "stratum": pd.Series(stratum[keep].to_numpy(), index=accts[keep].to_numpy()),
+    }
+    return plan, keep
+
+
+def sample_mask(accts: pd.Series, plan: dict) -> np.ndarray:
+    """Rows whose account is in the sample (*accts*: transaction account numbers)."""
+    in_sample = accts.isin(plan["accounts"]).to_numpy()
+    outside_odd = ~accts.isin(plan["odd_accounts"]).to_numpy()
+    return in_sample | (outside_odd & (account_hash(accts) < plan["fraction"]))
+
+
+# =========================================================================
+# Estimates
+# =========================================================================
+
+def _stratified_total(y: pd.Series, stratum: pd.Series, sizes: pd.Series) -> tuple[float, float]:
+    """Total of *y* over all accounts and its variance (stratified SRS)."""
+    total, var = 0.0, 0.0
+    for label, values in y.groupby(stratum):
+        big_n, n = sizes[label], len(values)
+        total += big_n * values.mean()
+        if n > 1:
+            var += big_n ** 2 * (1 - n / big_n) * values.var(ddof=1) / n
+    return total, var
+
+
+def _bernoulli_total(y: pd.Series, fraction: float) -> tuple[float, float]:
+    """Horvitz-Thompson total of *y* for accounts kept with probability *fraction*."""
+    return y.sum() / fraction, (1 - fraction) / fraction ** 2 * (y ** 2).sum()
+
+
+def preview_estimates(ctx: dict) -> pd.DataFrame:
+    """Headline KPIs of the sample scaled to the portfolio, with 95% CIs.
+
+    Spend and transaction totals include accounts missing from the ODD;
+    the counts and ratios cover ODD accounts. Ratios use the linearised
+    (Taylor) variance.
+    """
+    plan = ctx["preview"]
+    sizes = plan["strata"].set_index("Stratum")["Accounts"]
+    stratum = plan["stratum"]
+
+    per_acct = (ctx["combined_df"].groupby("primary_account_num")["amount"]
+                .agg(spend="sum", txns="size"))
+    odd = per_acct.reindex(stratum.index, fill_value=0).astype(float)
+    odd["active"] = (odd["txns"] > 0).astype(float)
+    other = per_acct.drop(index=stratum.index, errors="ignore")
+
+    def total(col: str) -> tuple[float, float]:
+        t, v = _stratified_total(odd[col], stratum, sizes)
+        if col in other.columns and len(other):
+            t_o, v_o = _bernoulli_total(other[col], plan["fraction"])
+            t, v = t + t_o, v + v_o
+        return t, v
+
+    def ratio(num: str, den: str) -> tuple[float, float]:
+        t_den = _stratified_total(odd[den], stratum, sizes)[0]
+        if not t_den:
+            return 0.0, 0.0
+        r = _stratified_total(odd[num], stratum, sizes)[0] / t_den
+        return r, _stratified_total(odd[num] - r * odd[den], stratum, sizes)[1] / t_den ** 2
+
+    n_odd = float(sizes.sum())
+    sample_txns = per_acct["txns"].sum()
+    active = total("active")
+    rows = [
+        ("Total Spend", per_acct["spend"].sum(), *total("spend")),
+        ("Transactions", sample_txns, *total("txns")),
+        ("Active Accounts", odd["active"].sum(), *active),
+        ("Active Rate (%)", odd["active"].mean() * 100,
+         active[0] / n_odd * 100, active[1] / n_odd ** 2 * 100 ** 2),
+        ("Spend per Active Account",
+         odd["spend"].sum() / odd["active"].sum() if odd["active"].sum() else 0.0,
+         *ratio("spend", "active")),
+        ("Avg Ticket", odd["spend"].sum() / odd["txns"].sum() if odd["txns"].sum() else 0.0,
+         *ratio("spend", "txns")),
+    ]
+    est = pd.DataFrame(rows, columns=["Metric", "Sample", "Estimate", "Variance"])
+    half = _Z95 * np.sqrt(est.pop("Variance"))
+    est["95% CI Low"] = est["Estimate"] - half
+    est["95% CI High"] = est["Estimate"] + half
+    est["Margin (%)"] = np.where(est["Estimate"] != 0,
+                                 half / est["Estimate"].abs().where(est["Estimate"] != 0, 1) * 100,
+                                 0.0)
+    return est.round(2)
+
+
+def preview_result(ctx: dict) -> dict:
+    """Storyline-shaped result describing the sample and the scaled KPIs."""
+    plan = ctx["preview"]
+    strata = plan["strata"]
+    est = preview_estimates(ctx)
+    by_metric = est.set_index("Metric")
+
+    def card(metric, fmt):
+        row = by_metric.loc[metric]
+        return {"label": f"{metric} (est.)",
+                "value": f"{fmt(row['Estimate'])} &plusmn;{row['Margin (%)']:.1f}%"}
+
+    kpis = [
+        card("Total Spend", format_currency),
+        card("Transactions", lambda v: f"{v:,.0f}"),
+        card("Active Accounts", lambda v: f"{v:,.0f}"),
+        card("Active Rate (%)", lambda v: f"{v:.1f}%"),
+    ]
+    narr = build_kpi_html(kpis) + (
+        f"<p>Preview run on a <b>{plan['fraction']:.0%}</b> stratified sample of "
+        f"accounts (<b>{strata['Sampled'].sum():,}</b> of <b>{strata['Accounts'].sum():,}</b>, "
+        f"each with all of its transactions). The totals above are scaled to the "
+        f"full portfolio with 95% confidence intervals. In the other storylines' "
+        f"tables, spend totals and transaction / account counts are scaled by "
+        f"{1 / plan['fraction']:.1f}x (no confidence interval); shares, rates, "
+        f"rankings, charts and narratives describe the sample and are "
+        f"directional.</p>"
+    )
+    return {
+        "title": "Preview Estimates",
+        "description": f"Preview on a {plan['fraction']:.0%} account sample: "
+                       f"scaled headline KPIs with 95% confidence intervals",
+        "sections": [{
+            "heading": "Sample-Based Estimates",
+            "narrative": narr,
+            "figures": [],
+            "tables": [("Scaled KPIs", est), ("Sample Strata", strata)],
+        }],
+        "sheets": [
+            {"name": "Preview Estimates", "df": est, "pct_cols": ["Margin (%)"]},
+            {"name": "Preview Strata", "df": strata, "number_cols": ["Accounts", "Sampled"]},
+        ],
+    }
+
+
+# =========================================================================
+# Storyline results
+# =========================================================================
+
+# Sheet / table columns that add up over accounts: scaled by 1 / fraction
+SCALED_COLUMNS = frozenset({
+    # spend
+    "Total Spend", "Spend", "Total Value", "Total Balance", "Competitor Spend",
+    "Total Competitor Spend", "Business Spend", "Personal Spend", "Total Payroll",
+    "Payroll Spend", "Consumer Spend", "First Half Spend", "Second Half Spend",
+    "Change", "Prev Spend", "Curr Spend", "Change ($)", "Prev $", "Curr $",
+    "Spend Change", "New Merchant $", "Est. Annual Revenue",
+    # transaction / account counts
+    "Transactions", "Accounts", "Unique Accounts", "Business Accounts",
+    "Personal Accounts", "PIN Count", "Sig Count", "Inactive", "Total", "Mailed",
+    "Responders", "Responded", "Non-Responders", "Total Sent", "Total Responded",
+    "Unique Employees", "Consumer Accounts", "Target Accounts",
+})
+
+# Cross-tab sheets whose numeric cells are all spend or account counts
+SCALED_SHEETS = frozenset({
+    "S3 Monthly Trend", "S3C Segmentation Heatmap", "S4 Affinity Matrix", "S5 Balance Gen",
+})
+
+
+def _scale_frame(df: pd.DataFrame, factor: float, all_numeric: bool) -> tuple[pd.DataFrame, list]:
+    """Copy of *df* with its additive numeric columns multiplied by *factor*."""
+    if not isinstance(df, pd.DataFrame) or df.empty or "Account" in df.columns \
+            or "primary_account_num" in df.columns:
+        return df, []
+    cols = [c for c in df.columns
+            if (all_numeric or c in SCALED_COLUMNS) and pd.api.types.is_numeric_dtype(df[c])
+            and not pd.api.types.is_bool_dtype(df[c])]
+    if not cols:
+        return df, []
+    out = df.copy()
+    for c in cols:
+        scaled = out[c] * factor
+        # counts stay whole numbers
+        out[c] = scaled.round().astype(df[c].dtype) if pd.api.types.is_integer_dtype(df[c]) else scaled
+    return out, cols
+
+
+def scale_result(result: dict, fraction: float) -> dict:
+    """Storyline *result* of a preview run, scaled to the portfolio and labelled.
+
+    Spend totals and transaction / account counts (``SCALED_COLUMNS``, and
+    every numeric cell of the ``SCALED_SHEETS`` cross-tabs) of sheets and
+    section tables are multiplied by ``1 / fraction``. Averages, rates,
+    shares, ranks, per-account lists, charts and narratives are left as
+    computed on the sample. The title and each sheet's subtitle row say
+    which columns were scaled. *result* itself is not modified.
+    """
+    factor = 1 / fraction
+    done: dict[int, tuple[pd.DataFrame, list]] = {}
+
+    def scale(df, all_numeric=False):
+        if id(df) not in done:
+            done[id(df)] = _scale_frame(df, factor, all_numeric)
+        return done[id(df)]
+
+    sheets = []
+    for sheet in result.get("sheets", []):
+        df, cols = scale(sheet.get("df"), sheet.get("name") in SCALED_SHEETS)
+        if cols:
+            note = f"{', '.join(map(str, cols))} scaled x{factor:.1f} to the portfolio; rest is sample"
+        else:
+            note = "sample values"
+        sheets.append({**sheet, "df": df,
+                       "subtitle": f"{sheet.get('subtitle', sheet.get('name', ''))} "
+                                   f"| PREVIEW ({fraction:.0%} sample): {note}"})
+    sections = []
+    for section in result.get("sections", []):
+        if section.get("tables"):
+            section = {**section, "tables": [(title, scale(df)[0]) for title, df in section["tables"]]}
+        sections.append(section)
+    return {
+        **result,
+        "title": f"{result.get('title', '')} (Preview, {fraction:.0%} sample)",
+        "sections": sections,
+        "sheets": sheets,
+    }
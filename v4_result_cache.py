@@ -0,0 +1,174 @@
+"""Storyline result cache keyed by input fingerprints.
+
+Each storyline result (sections, sheets, figures) is pickled to
+``<result_cache_dir>/<client_id>/<storyline>.pkl`` together with the
+fingerprint it was computed from. The fingerprint is a SHA-1 over:
+
+- the input data: every transaction file (name, size, mtime), the ODD
+  file and the merchant cluster mapping, plus the loader config keys;
+- the config keys the storyline reads (``STORYLINE_CONFIG_KEYS``);
+- the source of the storyline module and of the shared modules;
+- the fingerprints of the storylines whose ctx outputs it reads
+  (``STORYLINE_UPSTREAM``; S0 depends on every storyline in the run).
+
+On a rerun, a storyline whose fingerprint is unchanged is loaded from the
+cache; e.g. editing only ``competitors`` recomputes S3, S3B, S3C, S9 and S0.
+``result_cache_dir: ""`` disables the cache.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from types import ModuleType
+
+RESULT_CACHE_DIR = ".cache/results"
+
+# Config keys that shape the loaded data (and so every storyline)
+LOADER_CONFIG_KEYS = (
+    "transaction_dir", "file_extension", "recent_months", "odd_file",
+    "odd_column_groups", "odd_feature_bins", "merchant_clusters",
+)
+
+# Config keys that appear in every report or change every group-by
+COMMON_CONFIG_KEYS = ("client_id", "client_name", "client_state",
+                      "approx_distinct", "sketch_error")
+
+# Config keys each storyline reads, beyond the common ones
+STORYLINE_CONFIG_KEYS: dict[str, tuple[str, ...]] = {
+    "s0_executive": ("interchange_rate", "recent_months"),
+    "s2_merchant": ("top_n", "growth_min_threshold"),
+    "s3_competition": ("competitors", "false_positives"),
+    "s4_finserv": ("financial_services",),
+    "s8_payroll": ("payroll",),
+    "s9_lifecycle": ("interchange_rate",),
+}
+
+# Storylines that read ctx keys another storyline writes (s3_tagged_df, ...)
+STORYLINE_UPSTREAM: dict[str, tuple[str, ...]] = {
+    "s3b_threats": ("s3_competition",),
+    "s3c_segmentation": ("s3_competition",),
+    "s9_lifecycle": ("s3_competition",),
+}
+
+# Modules whose code every storyline result depends on
+_SHARED_MODULES = (
+    "v4_data_loader.py", "v4_merchant_rules.py", "v4_themes.py",
+    "v4_backend.py", "v4_polars.py", "v4_benchmarks.py", "v4_figspec.py",
+    "v4_activity.py", "v4_merchant_clusters.py", "v4_incidence.py",
+)
+
+_HERE = Path(__file__).resolve().parent
+
+
+# =========================================================================
+# Fingerprints
+# =========================================================================
+
+def _sha1(*parts) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def _file_stamp(path: Path) -> tuple[str, int, int]:
+    st = path.stat()
+    return path.name, st.st_size, st.st_mtime_ns
+
+
+def data_fingerprint(config: dict) -> str:
+    """Fingerprint of the input files and loader settings (no file is read)."""
+    stamps = []
+    txn_dir = Path(config.get("transaction_dir") or "")
+    if str(txn_dir) and txn_dir.is_dir():
+        ext = config.get("file_extension", "csv")
+        stamps += sorted(_file_stamp(p) for p in txn_dir.rglob(f"*.{ext}"))
+    odd_file = Path(config.get("odd_file") or "")
+    if str(odd_file) and odd_file.is_file():
+        stamps.append(_file_stamp(odd_file))
+    clusters = Path(config.get("merchant_clusters") or "")
+    if config.get("merchant_clusters") and clusters.is_file():
+        stamps.append(_file_stamp(clusters))
+    return _sha1(stamps, {k: config.get(k) for k in LOADER_CONFIG_KEYS})
+
+
+def _source_hash(path: Path) -> str:
+    return hashlib.sha1(path.read_bytes()).hexdigest() if path.is_file() else ""
+
+
+def storyline_fingerprints(config: dict, modules: dict[str, ModuleType]) -> dict[str, str]:
+    """Fingerprint per storyline key in *modules* (in run order, S0 last)."""
+    data = data_fingerprint(config)
+    shared = _sha1([_source_hash(_HERE / name) for name in _SHARED_MODULES])
+    common = {k: config.get(k) for k in COMMON_CONFIG_KEYS}
+
+    fps: dict[str, str] = {}
+    for key, module in modules.items():
+        if key == "s0_executive":
+            upstream = [fps[k] for k in fps]
+        else:
+            upstream = [fps.get(k, "") for k in STORYLINE_UPSTREAM.get(key, ())]
+        fps[key] = _sha1(
+            key, data, shared, common, upstream,
+            _source_hash(Path(module.__file__)),
+            {k: config.get(k) for k in STORYLINE_CONFIG_KEYS.get(key, ())},
+        )
+    return fps
+
+
+def with_upstream(keys: set[str], active: list[str]) -> set[str]:
+    """*keys* plus, transitively, the active storylines they need ctx outputs from."""
+    needed = set(keys)
+    stack = list(keys)
+    while stack:
+        for up in STORYLINE_UPSTREAM.get(stack.pop(), ()):
+            if up in active and up not in needed:
+                needed.add(up)
+                stack.append(up)
+    return needed
+
+
+# =========================================================================
+# Cache files
+# =========================================================================
+
+def _cache_path(config: dict, key: str) -> Path | None:
+    cache_dir = config.get("result_cache_dir", RESULT_CACHE_DIR)
+    if not cache_dir:
+        return None
+    client = str(config.get("client_id") or "default")
+    return Path(cache_dir) / client / f"{key}.pkl"
+
+
+def load_result(config: dict, key: str, fingerprint: str) -> dict | None:
+    """Cached result for *key* if it was computed from *fingerprint*, else None."""
+    path = _cache_path(config, key)
+    if path is None or not path.is_file():
+        return None
+    try:
+        with open(path, "rb") as f:
+            entry = pickle.load(f)
+    except Exception as e:  # unreadable / written by an incompatible version
+        print(f"[cache] WARNING: ignoring {path.name} ({type(e).__name__})")
+        return None
+    return entry["result"] if entry.get("fingerprint") == fingerprint else None
+
+
+def save_result(config: dict, key: str, fingerprint: str, result: dict) -> None:
+    """Persist *result* for *key* (atomic replace)."""
+    path = _cache_path(config, key)
+    if path is None:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump({"fingerprint": fingerprint, "result": result}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception as e:  # e.g. a figure that does not pickle
+        tmp.unlink(missing_ok=True)
+        print(f"[cache] WARNING: {key} not cached ({type(e).__name__}: {e})")
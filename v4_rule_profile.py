@@ -0,0 +1,416 @@
+"""Profiling and safe reordering of the merchant consolidation rules.
+
+``standardize_merchant_name`` walks ~200 ``if`` rules in source order and
+the first match wins, so a name matched by a rule near the bottom (or by
+none) pays for every test above it. This module measures that on a real
+dataset and looks for a cheaper order that cannot change any output:
+
+- ``extract_rules`` reads the function's source: the normalisation prelude,
+  one rule per top-level ``if`` (its body must end in ``return``) and the
+  final fallback ``return``.
+- ``profile_rules`` evaluates every distinct merchant name once through an
+  instrumented copy of the rules and weights by row count: how often each
+  rule fires, and how many condition tests (``in`` / ``==`` /
+  ``startswith`` calls) each input costs.
+- ``rules_overlap`` is a conservative prover: two rules are disjoint only
+  if no string can satisfy both conditions (e.g. two different ``==``
+  names, or incompatible prefixes). Anything it cannot reason about
+  (negations, other calls) counts as overlapping. Plain ``"X" in name``
+  tests never exclude one another ("NETFLIX SPOTIFY" matches both), so
+  substring rules keep their relative order.
+- ``optimize_order`` moves frequent rules up, but never past an earlier
+  rule they may overlap with, so first-match-wins picks the same rule for
+  every input.
+- ``verify_order`` compiles the reordered function and checks that its
+  outputs are identical (same type, same value) to the original's on every
+  profiled name.
+
+Usage:
+    python v4_rule_profile.py my_client.yaml [--out output/rule_profile.xlsx]
+"""
+from __future__ import annotations
+
+import ast
+import heapq
+import inspect
+import sys
+import textwrap
+import time
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import v4_merchant_rules
+from v4_merchant_rules import standardize_merchant_name
+
+_MISS = object()
+
+# Largest condition (in DNF conjunctions) the overlap prover expands
+_MAX_DNF = 256
+
+
+# =========================================================================
+# Rule extraction and compilation
+# =========================================================================
+
+def extract_rules(func=standardize_merchant_name) -> dict:
+    """Split *func*'s body into prelude, rules and fallback.
+
+    Returns a dict with ``original`` (*func*), ``func`` (its
+    ``ast.FunctionDef``), ``prelude``
+    (statements before the first rule), ``rules`` (top-level ``ast.If``
+    nodes, in source order), ``fallback`` (the final ``return``) and
+    ``first_line`` (line of ``def`` in the source file).
+
+    Raises ValueError if a rule can fall through (body not ending in
+    ``return``, or an ``else`` branch): reordering such rules is not safe.
+    """
+    lines, first_line = inspect.getsourcelines(func)
+    fn = ast.parse(textwrap.dedent("".join(lines))).body[0]
+    body = list(fn.body)
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant):
+        body = body[1:]  # docstring
+    start = next((i for i, s in enumerate(body) if isinstance(s, ast.If)), len(body))
+    prelude, rest = body[:start], body[start:]
+    if not rest or not isinstance(rest[-1], ast.Return):
+        raise ValueError(f"{func.__name__}: expected a final return after the rules")
+    rules, fallback = rest[:-1], rest[-1]
+    for node in rules:
+        if not isinstance(node, ast.If) or node.orelse or not isinstance(node.body[-1], ast.Return):
+            raise ValueError(f"{func.__name__}, line {first_line + node.lineno - 1}: "
+                             f"every rule must be an if whose body ends in return")
+    return {"original": func, "func": fn, "prelude": prelude, "rules": rules, "fallback": fallback,
+            "first_line": first_line}
+
+
+class _CountChecks(ast.NodeTransformer):
+    """Wrap every comparison / call in a condition with ``_chk(...)``."""
+
+    def visit_Compare(self, node):
+        return self._wrap(self.generic_visit(node))
+
+    def visit_Call(self, node):
+        return self._wrap(self.generic_visit(node))
+
+    @staticmethod
+    def _wrap(node):
+        return ast.Call(func=ast.Name("_chk", ast.Load()), args=[node], keywords=[])
+
+
+def _namespace() -> dict:
+    return dict(vars(v4_merchant_rules))
+
+
+def compile_profiler(spec: dict) -> dict:
+    """Instrumented rules: one callable per rule plus a check counter.
+
+    Returns a dict with ``normalize(name) -> args``, ``rules`` (callables
+    ``rule(*args)`` returning the rule's output or ``_MISS``) and
+    ``counter`` (a one-element list incremented by every test).
+    """
+    fn = spec["func"]
+    params = [a.arg for a in fn.args.args]
+    local_names = params + sorted({
+        t.id for s in spec["prelude"] for t in ast.walk(s)
+        if isinstance(t, ast.Name) and isinstance(t.ctx, ast.Store)
+    } - set(params))
+    args = ast.arguments(posonlyargs=[], args=[ast.arg(a) for a in local_names],
+                         kwonlyargs=[], kw_defaults=[], defaults=[])
+    ret_locals = ast.Return(ast.Tuple([ast.Name(n, ast.Load()) for n in local_names], ast.Load()))
+    defs = [ast.FunctionDef("_normalize", fn.args, spec["prelude"] + [ret_locals], [],
+                            type_params=[])]
+    for i, node in enumerate(spec["rules"]):
+        test = _CountChecks().visit(ast.parse(ast.unparse(node.test), mode="eval").body)
+        rule = ast.If(test, node.body, [])
+        defs.append(ast.FunctionDef(f"_rule_{i}", args,
+                                    [rule, ast.Return(ast.Name("_MISS", ast.Load()))], [],
+                                    type_params=[]))
+    module = ast.fix_missing_locations(ast.Module(defs, type_ignores=[]))
+
+    counter = [0]
+
+    def _chk(value):
+        counter[0] += 1
+        return value
+
+    ns = {**_namespace(), "_MISS": _MISS, "_chk": _chk}
+    exec(compile(module, "<merchant rules profile>", "exec"), ns)
+    return {"normalize": ns["_normalize"], "counter": counter,
+            "rules": [ns[f"_rule_{i}"] for i in range(len(spec["rules"]))]}
+
+
+def compile_order(spec: dict, order: list[int]):
+    """``standardize_merchant_name`` with its rules in *order* (rule indices)."""
+    fn = spec["func"]
+    body = spec["prelude"] + [spec["rules"][i] for i in order] + [spec["fallback"]]
+    new = ast.FunctionDef(fn.name, fn.args, body, [], returns=None, type_params=[])
+    module = ast.fix_missing_locations(ast.Module([new], type_ignores=[]))
+    ns = _namespace()
+    exec(compile(module, "<merchant rules reordered>", "exec"), ns)
+    return ns[fn.name]
+
+
+def _returns(node: ast.If) -> str:
+    """The constant values a rule's body can return, for the report."""
+    values = [r.value.value for r in ast.walk(node)
+              if isinstance(r, ast.Return) and isinstance(r.value, ast.Constant)]
+    return ", ".join(dict.fromkeys(str(v) for v in values)) or ast.unparse(node.body[-1])
+
+
+# =========================================================================
+# Profiling
+# =========================================================================
+
+def profile_rules(names: pd.Series, spec: dict | None = None,
+                  order: list[int] | None = None) -> dict:
+    """Rule hit counts and per-input test counts for the merchant *names*.
+
+    Each distinct name (missing values included) is evaluated once and
+    weighted by its number of rows.
+
+    Returns
+    -------
+    dict with ``rules`` (one row per rule, source order: line, output,
+    rows / distinct names it fires for, mean tests to reach it), ``names``
+    (one row per distinct name: rows, tests, rule index or -1) and
+    ``summary`` (rows, distinct names, matched share, tests per row).
+    """
+    spec = spec or extract_rules()
+    prof = compile_profiler(spec)
+    rules, counter = prof["rules"], prof["counter"]
+    order = list(range(len(rules))) if order is None else order
+    counts = names.value_counts(dropna=False)
+    fired = np.full(len(counts), -1)
+    checks = np.zeros(len(counts), dtype=np.int64)
+
+    for k, name in enumerate(counts.index):
+        args = prof["normalize"](name)
+        counter[0] = 0
+        for i in order:
+            if rules[i](*args) is not _MISS:
+                fired[k] = i
+                break
+        checks[k] = counter[0]
+
+    rows = counts.to_numpy()
+    hit = fired >= 0
+    fires = np.bincount(fired[hit], weights=rows[hit], minlength=len(rules))
+    table = pd.DataFrame({
+        "Rule": np.arange(1, len(rules) + 1),
+        "Line": [spec["first_line"] + n.lineno - 1 for n in spec["rules"]],
+        "Returns": [_returns(n) for n in spec["rules"]],
+        "Rows": fires.astype(np.int64),
+        "Row %": (fires / max(rows.sum(), 1) * 100).round(2),
+        "Names": np.bincount(fired[hit], minlength=len(rules)),
+        "Tests to Fire": np.divide(
+            np.bincount(fired[hit], weights=(checks * rows)[hit], minlength=len(rules)), fires,
+            out=np.zeros(len(rules)), where=fires > 0).round(1),
+    })
+    per_name = pd.DataFrame({"merchant_name": counts.index.astype(str), "Rows": rows,
+                             "Tests": checks, "Rule": np.where(hit, fired + 1, 0)})
+    cost = np.repeat(checks, rows)
+    summary = {
+        "rows": int(rows.sum()),
+        "distinct_names": len(counts),
+        "matched_pct": round(float(rows[hit].sum() / max(rows.sum(), 1) * 100), 2),
+        "tests_per_row": round(float(cost.mean()), 1) if len(cost) else 0.0,
+        "tests_p50": float(np.percentile(cost, 50)) if len(cost) else 0.0,
+        "tests_p95": float(np.percentile(cost, 95)) if len(cost) else 0.0,
+        "tests_max": int(cost.max()) if len(cost) else 0,
+        "tests_distinct": int(checks.sum()),
+    }
+    return {"rules": table, "names": per_name, "summary": summary}
+
+
+# =========================================================================
+# Overlap prover and optimizer
+# =========================================================================
+
+def _dnf(test: ast.expr) -> list[list[tuple]] | None:
+    """*test* as OR-of-AND of (kind, variable, literal) atoms; None if unknown.
+
+    Atoms: ``"L" in v`` -> ("in", v, L), ``v == "E"`` -> ("eq", v, E) and
+    ``v.startswith("P" | (...))`` -> ("sw", v, P).
+    """
+    if isinstance(test, ast.BoolOp):
+        parts = [_dnf(v) for v in test.values]
+        if any(p is None for p in parts):
+            return None
+        if isinstance(test.op, ast.Or):
+            out = [c for p in parts for c in p]
+        elif np.prod([len(p) for p in parts]) <= _MAX_DNF:
+            out = [sum(combo, []) for combo in product(*parts)]
+        else:
+            return None
+        return out if len(out) <= _MAX_DNF else None
+    if isinstance(test, ast.Compare) and len(test.ops) == 1:
+        left, right, op = test.left, test.comparators[0], test.ops[0]
+        if (isinstance(op, ast.In) and isinstance(left, ast.Constant)
+                and isinstance(left.value, str) and isinstance(right, ast.Name)):
+            return [[("in", right.id, left.value)]]
+        if isinstance(op, ast.Eq):
+            if isinstance(right, ast.Name):
+                left, right = right, left
+            if (isinstance(left, ast.Name) and isinstance(right, ast.Constant)
+                    and isinstance(right.value, str)):
+                return [[("eq", left.id, right.value)]]
+        return None
+    if (isinstance(test, ast.Call) and isinstance(test.func, ast.Attribute)
+            and test.func.attr == "startswith" and isinstance(test.func.value, ast.Name)
+            and len(test.args) == 1 and not test.keywords):
+        arg = test.args[0]
+        prefixes = arg.elts if isinstance(arg, ast.Tuple) else [arg]
+        if all(isinstance(p, ast.Constant) and isinstance(p.value, str) for p in prefixes):
+            return [[("sw", test.func.value.id, p.value)] for p in prefixes]
+    return None
+
+
+def _satisfiable(atoms: list[tuple]) -> bool:
+    """Can one string per variable satisfy all *atoms* (no negations)?"""
+    for var in {a[1] for a in atoms}:
+        eqs = {lit for kind, v, lit in atoms if v == var and kind == "eq"}
+        prefixes = sorted((lit for kind, v, lit in atoms if v == var and kind == "sw"), key=len)
+        subs = [lit for kind, v, lit in atoms if v == var and kind == "in"]
+        if len(eqs) > 1:
+            return False
+        if prefixes and not all(prefixes[-1].startswith(p) for p in prefixes):
+            return False
+        if eqs:
+            (value,) = eqs
+            if not all(value.startswith(p) for p in prefixes) or not all(s in value for s in subs):
+                return False
+        # otherwise: longest prefix followed by every substring satisfies all
+    return True
+
+
+def rules_overlap(a: list[list[tuple]] | None, b: list[list[tuple]] | None) -> bool:
+    """False only if no input can satisfy both conditions (DNFs from ``_dnf``)."""
+    if a is None or b is None:
+        return True
+    return any(_satisfiable(ca + cb) for ca in a for cb in b)
+
+
+def optimize_order(spec: dict, rule_rows: np.ndarray) -> tuple[list[int], int]:
+    """Order the rules by rows fired without changing any first match.
+
+    A rule may only move above earlier rules it provably cannot overlap
+    with; among the rules whose overlapping predecessors are placed, the
+    one firing for the most rows goes next (ties: source order).
+
+    Returns (order as rule indices, number of rules placed above a rule
+    that precedes them in the source).
+    """
+    dnfs = [_dnf(r.test) for r in spec["rules"]]
+    n = len(dnfs)
+    waiting = [0] * n
+    successors: list[list[int]] = [[] for _ in range(n)]
+    for j in range(n):
+        for i in range(j):
+            if rules_overlap(dnfs[i], dnfs[j]):
+                successors[i].append(j)
+                waiting[j] += 1
+    ready = [(-rule_rows[i], i) for i in range(n) if waiting[i] == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        _, i = heapq.heappop(ready)
+        order.append(i)
+        for j in successors[i]:
+            waiting[j] -= 1
+            if waiting[j] == 0:
+                heapq.heappush(ready, (-rule_rows[j], j))
+    moved = sum(1 for pos, i in enumerate(order) if any(k > i for k in order[:pos]))
+    return order, moved
+
+
+def verify_order(spec: dict, order: list[int], names) -> int:
+    """Number of *names* whose output differs under *order* (0 = identical)."""
+    original, reordered = spec["original"], compile_order(spec, order)
+    bad = 0
+    for name in names:
+        a, b = original(name), reordered(name)
+        if type(a) is not type(b) or not (a == b or (a != a and b != b)):
+            bad += 1
+    return bad
+
+
+# =========================================================================
+# Report
+# =========================================================================
+
+def run_profile(config: dict, out: str | None = None) -> dict:
+    """Profile *config*'s merchant names, optimise and verify, write Excel.
+
+    Only the ``merchant_name`` column of the selected transaction files is
+    read. Returns the profile dict plus ``order``, ``moved``,
+    ``tests_per_row_after`` and ``mismatches``.
+    """
+    from v4_data_loader import _load_single_transaction_file, select_transaction_files
+    from v4_excel_report import generate_excel_report
+
+    start = time.time()
+    names = pd.concat([_load_single_transaction_file(f, ["merchant_name"])["merchant_name"]
+                       for f, _ in select_transaction_files(config)], ignore_index=True)
+    spec = extract_rules()
+    profile = profile_rules(names, spec)
+    s = profile["summary"]
+    print(f"[rules] {len(spec['rules'])} rules, {s['rows']:,} rows, "
+          f"{s['distinct_names']:,} distinct names, {s['matched_pct']:.1f}% of rows matched")
+    print(f"[rules] Tests per row: mean {s['tests_per_row']:.1f}, p50 {s['tests_p50']:.0f}, "
+          f"p95 {s['tests_p95']:.0f}, max {s['tests_max']}; "
+          f"{s['tests_distinct']:,} tests once per distinct name")
+
+    order, moved = optimize_order(spec, profile["rules"]["Rows"].to_numpy())
+    after = profile_rules(names, spec, order)["summary"] if moved else s
+    mismatches = verify_order(spec, order, names.drop_duplicates())
+    print(f"[rules] Optimizer moved {moved} of {len(order)} rules; tests per row "
+          f"{s['tests_per_row']:.1f} -> {after['tests_per_row']:.1f}; "
+          f"verification: {'identical' if mismatches == 0 else f'{mismatches} names differ'}")
+
+    table = profile["rules"]
+    proposed = table.iloc[order].reset_index(drop=True)
+    proposed.insert(0, "Position", np.arange(1, len(order) + 1))
+    costliest = (profile["names"].assign(**{"Total Tests": lambda d: d["Rows"] * d["Tests"]})
+                 .sort_values("Total Tests", ascending=False).head(500))
+    summary = pd.DataFrame([
+        ("Rules", len(order)), ("Rows", s["rows"]), ("Distinct names", s["distinct_names"]),
+        ("Rows matched (%)", s["matched_pct"]), ("Tests per row (mean)", s["tests_per_row"]),
+        ("Tests per row (p50)", s["tests_p50"]), ("Tests per row (p95)", s["tests_p95"]),
+        ("Tests per row (max)", s["tests_max"]),
+        ("Tests, once per distinct name", s["tests_distinct"]),
+        ("Rules moved by optimizer", moved),
+        ("Tests per row after reorder", after["tests_per_row"]),
+        ("Names with different output", mismatches),
+    ], columns=["Metric", "Value"])
+    result = {
+        "title": "Merchant Rule Profile",
+        "description": "How often each consolidation rule fires and what each input costs",
+        "sections": [],
+        "sheets": [
+            {"name": "Summary", "df": summary},
+            {"name": "Rule Profile", "df": table, "number_cols": ["Rows", "Names"],
+             "pct_cols": ["Row %"]},
+            {"name": "Proposed Order", "df": proposed, "number_cols": ["Rows", "Names"],
+             "pct_cols": ["Row %"]},
+            {"name": "Costliest Names", "df": costliest,
+             "number_cols": ["Rows", "Tests", "Total Tests"]},
+        ],
+    }
+    path = Path(out or Path(config.get("output_dir", "output")) / "merchant_rule_profile.xlsx")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    generate_excel_report({"rule_profile": result}, config, str(path))
+    print(f"[rules] Profile written to {path} in {time.time() - start:.1f}s")
+    return {**profile, "order": order, "moved": moved,
+            "tests_per_row_after": after["tests_per_row"], "mismatches": mismatches}
+
+
+if __name__ == "__main__":
+    from v4_data_loader import load_config
+
+    if len(sys.argv) < 2:
+        print("Usage: python v4_rule_profile.py my_client.yaml [--out path.xlsx]")
+        sys.exit(2)
+    opts = dict(zip(sys.argv[2::2], sys.argv[3::2]))
+    run_profile(load_config(sys.argv[1]), out=opts.get("--out"))
@@ -0,0 +1,168 @@
+"""What-if matching of competitor / financial-services rules on merchant names.
+
+Tuning the ``competitors``, ``false_positives`` and ``financial_services``
+lists with a client meant editing the YAML and rerunning S3/S3B/S3C/S4 to
+see what a pattern caught. The rules only look at the merchant name, so the
+app's rule editor works on ``merchant_table``: one row per distinct
+consolidated merchant name with its spend, transactions and accounts (built
+once from the transactions and kept in the result cache).
+
+``new_matcher`` keeps the names upper-cased and sorted, and a memo of every
+pattern's hits: ``exact`` and ``starts_with`` patterns are binary searches
+over the sorted names, ``contains`` patterns one vectorised scan each, the
+first time they are seen. After an edit only the new patterns are matched;
+``tag_merchants`` then replays the rules in the storylines' priority order
+(exact -> starts_with -> contains, first match wins, false positives
+excluded; financial services: first category wins) from the memo, and
+``compare_tags`` lists what the edit newly matched or excluded.
+"""
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from v4_backend import group_agg
+from v4_result_cache import data_fingerprint, load_result, save_result
+from v4_s4_finserv import _category_label
+
+RULE_TIERS = ("exact", "starts_with", "contains")
+
+_CACHE_KEY = "merchant_table"
+
+
+def merchant_table(config: dict, ctx: dict | None = None) -> pd.DataFrame:
+    """Distinct merchant names with spend, transactions and accounts, by spend.
+
+    Loads the transactions only when no cached table matches the data.
+    """
+    h = hashlib.sha1(data_fingerprint(config).encode())
+    h.update(Path(__file__).read_bytes())
+    fingerprint = h.hexdigest()
+    cached = load_result(config, _CACHE_KEY, fingerprint)
+    if cached is not None:
+        return cached
+
+    if ctx is None:
+        from v4_data_loader import load_context, transaction_columns
+
+        ctx = load_context(config, sources=("transactions",), columns=transaction_columns())
+    df = ctx["combined_df"]
+    merch_col = "merchant_consolidated" if "merchant_consolidated" in df.columns else "merchant_name"
+    table = (
+        group_agg(ctx, "combined_df", merch_col, spend=("amount", "sum"),
+                  transactions=("amount", "size"), accounts=("primary_account_num", "nunique"))
+        .rename(columns={merch_col: "merchant"})
+        .sort_values("spend", ascending=False, ignore_index=True)
+    )
+    print(f"[rules] Merchant table: {len(table):,} names from {len(df):,} transactions")
+    save_result(config, _CACHE_KEY, fingerprint, table)
+    return table
+
+
+# =========================================================================
+# Matching
+# =========================================================================
+
+def new_matcher(table: pd.DataFrame) -> dict:
+    """Matching state for *table*'s names; reuse it across edits.
+
+    Keys: ``names`` (upper-cased, stripped, as S3 matches), ``fs_names``
+    (upper-cased, as S4 matches), ``order`` / ``sorted`` (the names sorted,
+    for prefix searches) and ``hits`` (memo: (names, tier, pattern) ->
+    sorted row positions).
+    """
+    raw = table["merchant"].astype(str)
+    names = raw.str.upper().str.strip()
+    arr = names.to_numpy(dtype=str)
+    order = np.argsort(arr, kind="stable")
+    return {"names": names, "fs_names": raw.str.upper(),
+            "order": order, "sorted": arr[order], "hits": {}}
+
+
+def pattern_hits(matcher: dict, tier: str, pattern: str, names: str = "names") -> np.ndarray:
+    """Row positions of the names *pattern* matches under *tier* (memoised)."""
+    key = (names, tier, pattern.upper())
+    hits = matcher["hits"].get(key)
+    if hits is not None:
+        return hits
+    p = key[2]
+    if names == "names" and tier in ("exact", "starts_with") and p and p[-1] < "\U0010ffff":
+        # Range of the sorted names: [p, p] or [p, successor of p)
+        srt = matcher["sorted"]
+        lo = np.searchsorted(srt, p, "left")
+        hi = (np.searchsorted(srt, p, "right") if tier == "exact"
+              else np.searchsorted(srt, p[:-1] + chr(ord(p[-1]) + 1), "left"))
+        hits = np.sort(matcher["order"][lo:hi])
+    else:
+        s = matcher[names]
+        mask = (s == p if tier == "exact" else s.str.startswith(p) if tier == "starts_with"
+                else s.str.contains(p, regex=False))
+        hits = np.flatnonzero(mask.to_numpy())
+    matcher["hits"][key] = hits
+    return hits
+
+
+def tag_merchants(matcher: dict, rules: dict) -> pd.DataFrame:
+    """Competitor and financial-services category of every name under *rules*.
+
+    *rules* holds merged ``competitors`` / ``false_positives`` /
+    ``financial_services`` (``v4_client_config.merge_rules``). Same result
+    as ``v4_s3_competition._detect_competitors`` and
+    ``v4_s4_finserv._detect_finserv`` on the transactions, per name.
+    """
+    n = len(matcher["names"])
+    false_pos = np.zeros(n, dtype=bool)
+    for pattern in rules.get("false_positives") or []:
+        false_pos[pattern_hits(matcher, "contains", pattern)] = True
+
+    competitor = np.full(n, None, dtype=object)
+    for tier in RULE_TIERS:
+        for cat, cat_rules in (rules.get("competitors") or {}).items():
+            for pattern in (cat_rules or {}).get(tier, []):
+                idx = pattern_hits(matcher, tier, pattern)
+                competitor[idx[pd.isna(competitor[idx]) & ~false_pos[idx]]] = cat
+
+    finserv = np.full(n, None, dtype=object)
+    for key, patterns in (rules.get("financial_services") or {}).items():
+        label = _category_label(key)  # S4 reports display labels, not config keys
+        for pattern in patterns or []:
+            idx = pattern_hits(matcher, "contains", pattern, names="fs_names")
+            finserv[idx[pd.isna(finserv[idx])]] = label
+
+    return pd.DataFrame({"competitor_category": competitor, "false_positive": false_pos,
+                         "finserv_category": finserv})
+
+
+def compare_tags(table: pd.DataFrame, before: pd.DataFrame,
+                 after: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Effect of a rule edit: (summary per rule set, one row per changed merchant)."""
+    summary, changes = [], []
+    for label, col in (("Competitors", "competitor_category"),
+                       ("Financial services", "finserv_category")):
+        was, now = before[col].notna().to_numpy(), after[col].notna().to_numpy()
+        moved = was & now & (before[col].to_numpy() != after[col].to_numpy())
+        groups = {"Newly matched": ~was & now, "Excluded": was & ~now, "Recategorized": moved}
+        spend = table["spend"].to_numpy()
+        summary.append({
+            "Rule set": label,
+            "Merchants (before)": int(was.sum()), "Merchants (after)": int(now.sum()),
+            "Spend (before)": round(float(spend[was].sum()), 2),
+            "Spend (after)": round(float(spend[now].sum()), 2),
+            **{f"{k} spend": round(float(spend[m].sum()), 2) for k, m in groups.items()},
+        })
+        for change, mask in groups.items():
+            if mask.any():
+                changes.append(table[mask].assign(**{
+                    "Rule set": label, "Change": change,
+                    "Before": before.loc[mask, col].to_numpy(),
+                    "After": after.loc[mask, col].to_numpy(),
+                }))
+    cols = ["merchant", "Rule set", "Change", "Before", "After",
+            "spend", "transactions", "accounts"]
+    changed = (pd.concat(changes, ignore_index=True)[cols]
+               .sort_values("spend", ascending=False, ignore_index=True)
+               if changes else pd.DataFrame(columns=cols))
+    return pd.DataFrame(summary), changed
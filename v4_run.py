@@ -4,6 +4,8 @@ Usage:
     python v4_run.py                    # uses v4_config.yaml in current dir
     python v4_run.py my_client.yaml     # uses specified config file
     python v4_run.py --client 1453      # loads from configs/clients/1453.yaml
+    python v4_run.py --all-clients      # every configs/clients/*.yaml, in parallel
+    python v4_run.py --clients 1453,1776 [--workers 4] [--mem-gb 24]
 
 Loads data, runs selected storylines, generates Excel + HTML reports.
 """
@@ -14,9 +16,17 @@ import time
 from pathlib import Path
 from typing import Callable, Optional
 
-from v4_data_loader import load_config, load_all
+from v4_backend import attach_backend, close_backend
+from v4_data_loader import (
+    DATA_SOURCES, LazyContext, load_config, load_context, source_loaded, transaction_columns,
+)
 from v4_excel_report import generate_excel_report
 from v4_html_report import generate_html_report
+from v4_preview import preview_result, scale_result
+from v4_result_cache import load_result, save_result, storyline_fingerprints, with_upstream
+from v4_run_store import store_run
+from v4_segments import segment_payload
+from v4_spill import new_spill_store, spill_result
 
 # Storyline modules
 import v4_s1_portfolio_health as s1
@@ -46,6 +56,9 @@ ALL_STORYLINES = [
     ("s9_lifecycle", s9),
 ]
 
+# Report files run_pipeline writes by default
+REPORTS = ("excel", "html")
+
 # Public mapping for the Streamlit app to look up labels
 STORYLINE_LABELS: dict[str, str] = {
     "s0_executive": "S0: Executive Summary",
@@ -67,6 +80,9 @@ def run_pipeline(
     config: dict,
     storylines: Optional[list[str]] = None,
     progress_cb: Optional[Callable[[int, int, str], None]] = None,
+    preview: Optional[float] = None,
+    ctx: Optional[dict] = None,
+    reports: tuple[str, ...] = REPORTS,
 ) -> tuple[dict, Path, Path]:
     """Execute the V4 analysis pipeline.
 
@@ -80,6 +96,32 @@ def run_pipeline(
     progress_cb : callable | None
         Optional callback ``(step, total, label)`` called after each storyline
         finishes, so a GUI can update a progress bar.
+    preview : float | None
+        Fraction of accounts (e.g. 0.1) for a quick preview run on a
+        stratified account sample (see ``v4_preview``). Preview runs bypass
+        the result cache, add a "Preview Estimates" result with the scaled
+        headline KPIs, scale the storylines' spend totals and counts to the
+        portfolio and label their tabs as a preview
+        (``v4_preview.scale_result``), and write ``..._V4_Preview_*`` report
+        files.
+    ctx : dict | None
+        An already loaded context (e.g. a resident client in ``v4_daemon``)
+        to run against instead of loading the data. Storyline outputs are
+        written to a shallow copy, so *ctx* itself is not modified.
+    reports : tuple[str, ...]
+        Which of "excel" / "html" to write; () writes none (see
+        ``write_reports``).
+
+    Storylines whose inputs are unchanged since the last run are loaded from
+    the result cache (see ``v4_result_cache``); data is only loaded when at
+    least one storyline has to be recomputed, and then only the sources
+    those storylines declare (module ``SOURCES``) -- an ODD-only selection
+    such as S7 never reads the transaction files. Likewise only the
+    transaction columns they declare (``TXN_COLUMNS``) are parsed.
+
+    Sheets and tables with at least ``spill_rows`` rows are moved to a
+    temporary Parquet store as soon as their storyline finishes and are
+    streamed into the report writers chunk by chunk (see ``v4_spill``).
 
     Returns
     -------
@@ -87,10 +129,12 @@ def run_pipeline(
     """
     start = time.time()
 
-    output_dir = Path(config.get("output_dir", "output"))
-    output_dir.mkdir(parents=True, exist_ok=True)
-    client_name = config.get("client_name", "Client")
-    client_id = config.get("client_id", "")
+    if preview is not None:
+        if ctx is not None:
+            raise ValueError("preview runs load their own account sample; pass ctx=None")
+        if not 0 < preview < 1:
+            raise ValueError(f"preview must be a fraction between 0 and 1, got {preview}")
+        config = {**config, "result_cache_dir": ""}
 
     # Determine which storylines to run
     if storylines is None:
@@ -99,20 +143,57 @@ def run_pipeline(
         key_set = set(storylines)
         active = [(k, m) for k, m in ALL_STORYLINES if k in key_set]
 
-    # Load data
-    if progress_cb:
-        progress_cb(0, len(active) + 2, "Loading data...")
-    ctx = load_all(config)
+    # Cached results whose fingerprint still matches
+    fingerprints = storyline_fingerprints(config, {**dict(active), "s0_executive": s0})
+    cached = {}
+    for key, fp in fingerprints.items():
+        result = load_result(config, key, fp)
+        if result is not None:
+            cached[key] = result
+    active_keys = [k for k, _ in active]
+    recompute = with_upstream({k for k in active_keys if k not in cached}, active_keys)
+
+    # Load the data sources the recomputed storylines read (S0 reads what the run has)
+    sources = {s for k, m in active if k in recompute
+               for s in getattr(m, "SOURCES", DATA_SOURCES)}
+    if "s0_executive" not in cached:
+        sources |= {s for _, m in active for s in getattr(m, "SOURCES", DATA_SOURCES)}
+        sources |= set(s0.SOURCES)
+    # ... and only the transaction columns they read (module ``TXN_COLUMNS``)
+    readers = [m for k, m in active if k in recompute] + [s0]
+    if any(not hasattr(m, "TXN_COLUMNS") for m in readers):
+        columns = None
+    else:
+        columns = transaction_columns({c for m in readers for c in m.TXN_COLUMNS})
+    base_ctx, ctx = ctx, None
+    if recompute or "s0_executive" not in cached:
+        if base_ctx is not None:
+            # Already loaded: storyline outputs go to a shallow copy
+            ctx = LazyContext(base_ctx, config=config)
+        else:
+            if progress_cb:
+                progress_cb(0, len(active) + 2, "Loading data...")
+            print(f"[data] Loading: {', '.join(sorted(sources))}"
+                  + (f" (preview: {preview:.0%} of accounts)" if preview else ""))
+            ctx = load_context(config, sources=sources, columns=columns, preview=preview)
+        attach_backend(ctx)
 
     # Run storylines
     results: dict = {}
+    spill_store = new_spill_store(config)
     for i, (key, module) in enumerate(active, start=1):
         label = module.__name__
+        if key not in recompute:
+            results[key] = spill_result(cached[key], key, config, spill_store)
+            continue
         if progress_cb:
             progress_cb(i, len(active) + 2, f"Running {STORYLINE_LABELS.get(key, label)}...")
         try:
             result = module.run(ctx)
-            results[key] = result
+            save_result(config, key, fingerprints[key], result)
+            if preview:
+                result = scale_result(result, preview)
+            results[key] = spill_result(result, key, config, spill_store)
         except Exception as e:
             results[key] = {
                 "title": STORYLINE_LABELS.get(key, label),
@@ -122,25 +203,41 @@ def run_pipeline(
             }
 
     # Executive summary runs last, receives all results for cross-storyline synthesis
-    try:
-        s0_result = s0.run(ctx, results)
-        results["s0_executive"] = s0_result
-    except Exception as e:
-        results["s0_executive"] = {
-            "title": "Executive Summary",
-            "description": f"Error: {e}",
-            "sections": [], "sheets": [],
-        }
+    if "s0_executive" in cached:
+        results["s0_executive"] = spill_result(cached["s0_executive"], "s0_executive",
+                                               config, spill_store)
+    else:
+        try:
+            s0_result = s0.run(ctx, results)
+            save_result(config, "s0_executive", fingerprints["s0_executive"], s0_result)
+            if preview:
+                s0_result = scale_result(s0_result, preview)
+            results["s0_executive"] = spill_result(s0_result, "s0_executive", config, spill_store)
+        except Exception as e:
+            results["s0_executive"] = {
+                "title": "Executive Summary",
+                "description": f"Error: {e}",
+                "sections": [], "sheets": [],
+            }
+    if preview and ctx is not None and source_loaded(ctx, "transactions"):
+        results = {"preview": preview_result(ctx), **results}
+    elif not preview and ctx is not None and source_loaded(ctx, "transactions"):
+        # Aggregates for run-over-run comparison (python v4_run_store.py compare);
+        # skipped when the selected storylines did not load the transactions
+        try:
+            store_run(ctx, config)
+        except Exception as e:
+            print(f"[runs] WARNING: run aggregates not stored ({type(e).__name__}: {e})")
+    segments = segment_payload(ctx, config) if "html" in reports else None
+    if ctx is not None:
+        close_backend(ctx)
 
     # Generate reports
     if progress_cb:
         progress_cb(len(active) + 1, len(active) + 2, "Generating reports...")
 
-    excel_path = output_dir / f"{client_id}_{client_name.replace(' ', '_')}_V4_Analysis.xlsx"
-    html_path = output_dir / f"{client_id}_{client_name.replace(' ', '_')}_V4_Dashboard.html"
-
-    generate_excel_report(results, config, str(excel_path))
-    generate_html_report(results, config, str(html_path))
+    excel_path, html_path = write_reports(results, config, reports, preview=preview,
+                                          segments=segments)
 
     if progress_cb:
         progress_cb(len(active) + 2, len(active) + 2, "Complete")
@@ -156,12 +253,45 @@ def run_pipeline(
     print(f"\n  V4 Analysis complete in {elapsed:.1f}s")
     print(f"  {len(results)} storylines | {total_sections} sections | "
           f"{total_figures} charts | {total_sheets} sheets")
+    hits = [k for k in results if k not in recompute and k in cached]
+    print(f"  Cache hits : {', '.join(hits) if hits else 'none'}")
+    print(f"  Recomputed : {', '.join(k for k in results if k not in hits) or 'none'}")
     print(f"  Excel: {excel_path}")
     print(f"  HTML:  {html_path}")
 
     return results, excel_path, html_path
 
 
+def report_paths(config: dict, preview: Optional[float] = None) -> tuple[Path, Path]:
+    """Excel and HTML report paths of a client (``..._V4[_Preview]_*``)."""
+    output_dir = Path(config.get("output_dir", "output"))
+    client_name = config.get("client_name", "Client")
+    client_id = config.get("client_id", "")
+    stem = f"{client_id}_{client_name.replace(' ', '_')}_V4" + ("_Preview" if preview else "")
+    return output_dir / f"{stem}_Analysis.xlsx", output_dir / f"{stem}_Dashboard.html"
+
+
+def write_reports(
+    results: dict,
+    config: dict,
+    reports: tuple[str, ...] = REPORTS,
+    preview: Optional[float] = None,
+    segments: Optional[str] = None,
+) -> tuple[Path, Path]:
+    """Write the selected reports ("excel", "html") of *results*; returns both paths.
+
+    *segments* (``v4_segments.segment_payload``) adds the Segment Explorer
+    to the HTML dashboard.
+    """
+    excel_path, html_path = report_paths(config, preview)
+    excel_path.parent.mkdir(parents=True, exist_ok=True)
+    if "excel" in reports:
+        generate_excel_report(results, config, str(excel_path))
+    if "html" in reports:
+        generate_html_report(results, config, str(html_path), segments=segments)
+    return excel_path, html_path
+
+
 def run_all(config_path: str = "v4_config.yaml") -> None:
     """CLI entry point -- loads config from file and runs all storylines."""
     config = load_config(config_path)
@@ -176,8 +306,24 @@ def run_all(config_path: str = "v4_config.yaml") -> None:
     run_pipeline(config)
 
 
+def _batch_cli(argv: list[str]) -> None:
+    """Parse ``--all-clients`` / ``--clients a,b`` [--workers N] [--mem-gb X]."""
+    from v4_batch import run_batch
+
+    args = argv[1:] if argv[0] == "--all-clients" else argv
+    opts = dict(zip(args[::2], args[1::2]))
+    client_ids = [c.strip() for c in opts.get("--clients", "").split(",") if c.strip()]
+    run_batch(
+        client_ids=client_ids or None,
+        max_workers=int(opts["--workers"]) if "--workers" in opts else None,
+        memory_budget_gb=float(opts["--mem-gb"]) if "--mem-gb" in opts else None,
+    )
+
+
 if __name__ == "__main__":
-    if len(sys.argv) >= 3 and sys.argv[1] == "--client":
+    if len(sys.argv) >= 2 and sys.argv[1] in ("--all-clients", "--clients"):
+        _batch_cli(sys.argv[1:])
+    elif len(sys.argv) >= 3 and sys.argv[1] == "--client":
         from v4_client_config import load_client_config
         client_id = sys.argv[2]
         config = load_client_config(client_id)
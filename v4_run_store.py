@@ -0,0 +1,473 @@
+"""Persisted run aggregates and run-over-run comparison.
+
+"What changed since last quarter's review?" used to mean rerunning the old
+configuration on the old raw files. Every full (non-preview) run now keeps
+a compact aggregate store, tagged with the client and data window, in
+``<run_store_dir>/<client_id>/<run_id>/`` (default ``RUN_STORE_DIR``):
+
+- ``months.parquet``      -- per month: spend, transactions, accounts;
+- ``accounts.parquet``    -- per account: spend, transactions, active
+  months, first / last active month, and spend / transactions over the
+  last ``compare_months`` months (from ``ctx['activity']``);
+- ``merchants.parquet``   -- per merchant and month: spend, transactions,
+  accounts;
+- ``competitors.parquet`` -- per competitor category and month: spend,
+  transactions, accounts (the ``competitors`` rules applied to the
+  merchant list);
+- ``manifest.json``       -- client, data window, fingerprint, headline KPIs.
+
+A run whose input data and competitor rules match the latest stored run
+is not stored again. ``compare_runs`` builds a delta report between two
+stored runs from these files alone (no transaction file is read), over
+the last ``compare_months`` months of each run's data:
+
+    python v4_run_store.py list my_client.yaml
+    python v4_run_store.py compare my_client.yaml [RUN_A [RUN_B]]
+
+Without run ids the two latest runs are compared. The report is written
+next to the client's other reports as ``..._V4_Compare_<A>_vs_<B>``.
+``run_store_dir: ""`` turns storing off.
+"""
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import json
+import shutil
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from v4_activity import (
+    active_in, active_months, first_active, last_active, last_months, window_total,
+)
+from v4_backend import group_agg
+from v4_result_cache import data_fingerprint
+from v4_themes import (
+    apply_theme, format_currency, horizontal_bar, insight_title, line_trend, waterfall_chart,
+)
+
+RUN_STORE_DIR = ".cache/runs"
+
+# Trailing months of each run a comparison covers
+COMPARE_MONTHS = 3
+
+# Config keys (besides the input data) the stored aggregates depend on
+_STORE_CONFIG_KEYS = ("competitors", "false_positives", "compare_months", "approx_distinct")
+
+_CUBES = ("months", "accounts", "merchants", "competitors")
+
+# Spend change (%) beyond which a retained account counts as growing / declining
+_MOVE_PCT = 10
+
+
+# =========================================================================
+# Store
+# =========================================================================
+
+def _client_dir(config: dict) -> Path | None:
+    store_dir = config.get("run_store_dir", RUN_STORE_DIR)
+    if not store_dir:
+        return None
+    return Path(store_dir) / str(config.get("client_id") or "default")
+
+
+def _store_fingerprint(config: dict) -> str:
+    h = hashlib.sha1(data_fingerprint(config).encode())
+    h.update(json.dumps({k: config.get(k) for k in _STORE_CONFIG_KEYS},
+                        sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def list_runs(config: dict) -> list[dict]:
+    """Manifests of the client's stored runs, oldest first."""
+    client_dir = _client_dir(config)
+    if client_dir is None or not client_dir.is_dir():
+        return []
+    return [json.loads(p.read_text()) for p in sorted(client_dir.glob("*/manifest.json"))]
+
+
+def build_aggregates(ctx: dict) -> tuple[dict[str, pd.DataFrame], dict[str, float]]:
+    """Aggregate cubes and headline KPIs of a loaded context.
+
+    Returns
+    -------
+    cubes : {"months", "accounts", "merchants", "competitors": DataFrame},
+            months as "YYYY-MM" strings
+    kpis  : {label: value} over the whole data window
+    """
+    from v4_s3_competition import competitor_categories
+
+    df = ctx["combined_df"]
+    act = ctx["activity"]
+    odd = ctx["odd_df"]
+    config = ctx.get("config", {})
+    merch_col = "merchant_consolidated" if "merchant_consolidated" in df.columns else "merchant_name"
+    aggs = dict(spend=("amount", "sum"), transactions=("amount", "size"),
+                accounts=("primary_account_num", "nunique"))
+
+    months = group_agg(ctx, "combined_df", "year_month", **aggs)
+    merchants = group_agg(ctx, "combined_df", [merch_col, "year_month"], **aggs)
+    merchants = merchants.rename(columns={merch_col: "merchant"})
+
+    category = competitor_categories(df[merch_col], config)
+    is_comp = category.notna().to_numpy()
+    comp_rows = df.loc[is_comp, ["primary_account_num", "year_month", "amount"]]
+    comp_rows["competitor"] = category[is_comp]
+    competitors = group_agg(ctx, comp_rows, ["competitor", "year_month"], **aggs)
+
+    n_months = len(act["months"])
+    labels = act["months"].astype(str).to_numpy()
+    recent = last_months(act, int(config.get("compare_months", COMPARE_MONTHS)))
+    accounts = pd.DataFrame({
+        "primary_account_num": act["accounts"],
+        "spend": window_total(act, slice(None)),
+        "transactions": window_total(act, slice(None), "count"),
+        "active_months": active_months(act),
+        "first_month": labels[np.maximum(first_active(act), 0)] if n_months else "",
+        "last_month": labels[np.maximum(last_active(act), 0)] if n_months else "",
+        "recent_spend": window_total(act, recent),
+        "recent_transactions": window_total(act, recent, "count"),
+    })
+
+    for cube in (months, merchants, competitors):
+        cube["year_month"] = cube["year_month"].astype(str)
+
+    total_spend = round(float(df["amount"].sum()), 2)
+    comp_spend = round(float(competitors["spend"].sum()), 2)
+    odd_accounts = odd["Acct Number"].nunique() if "Acct Number" in odd.columns else 0
+    active_latest = int(active_in(act, last_months(act, 1)).sum()) if n_months else 0
+    kpis = {
+        "Total Spend": total_spend,
+        "Transactions": len(df),
+        "Transacting Accounts": len(act["accounts"]),
+        "ODD Accounts": odd_accounts,
+        "Active in Latest Month": active_latest,
+        "Active Rate (%)": round(active_latest / odd_accounts * 100, 1) if odd_accounts else 0.0,
+        "Avg Ticket": round(total_spend / len(df), 2) if len(df) else 0.0,
+        "Competitor Spend": comp_spend,
+        "Competitor Share (%)": round(comp_spend / total_spend * 100, 1) if total_spend else 0.0,
+        "Months of Data": n_months,
+    }
+    cubes = {"months": months, "accounts": accounts,
+             "merchants": merchants, "competitors": competitors}
+    return cubes, kpis
+
+
+def store_run(ctx: dict, config: dict) -> Path | None:
+    """Persist the aggregates of this run; returns the run directory (or None).
+
+    *ctx* must have the transactions loaded: ``run_pipeline`` only stores
+    runs whose storylines read them, so an ODD-only run (e.g. just S7)
+    never loads the transaction files for this.
+    """
+    client_dir = _client_dir(config)
+    if client_dir is None:
+        return None
+    if importlib.util.find_spec("pyarrow") is None:
+        print("[runs] WARNING: pyarrow not installed, run aggregates not stored")
+        return None
+    fingerprint = _store_fingerprint(config)
+    runs = list_runs(config)
+    if runs and runs[-1]["fingerprint"] == fingerprint:
+        print(f"[runs] Data unchanged since stored run {runs[-1]['run_id']}")
+        return client_dir / runs[-1]["run_id"]
+
+    cubes, kpis = build_aggregates(ctx)
+
+    run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+    while (client_dir / run_id).exists():
+        run_id += "b"
+    tmp = client_dir / f".{run_id}.tmp"
+    tmp.mkdir(parents=True, exist_ok=True)
+    try:
+        for name, cube in cubes.items():
+            cube.to_parquet(tmp / f"{name}.parquet", index=False)
+        months = cubes["months"]["year_month"]
+        manifest = {
+            "run_id": run_id,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "client_id": str(config.get("client_id", "")),
+            "client_name": config.get("client_name", ""),
+            "fingerprint": fingerprint,
+            "first_month": months.min() if len(months) else "",
+            "last_month": months.max() if len(months) else "",
+            "compare_months": int(config.get("compare_months", COMPARE_MONTHS)),
+            "rows": {name: len(cube) for name, cube in cubes.items()},
+            "kpis": kpis,
+        }
+        (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2, default=str))
+        tmp.rename(client_dir / run_id)
+    except Exception as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        print(f"[runs] WARNING: run aggregates not stored ({type(e).__name__}: {e})")
+        return None
+    size_mb = sum(p.stat().st_size for p in (client_dir / run_id).iterdir()) / 1024 ** 2
+    print(f"[runs] Stored run {run_id} ({manifest['first_month']} .. "
+          f"{manifest['last_month']}, {size_mb:.1f} MB)")
+    return client_dir / run_id
+
+
+def load_run(config: dict, run_id: str) -> dict:
+    """Manifest and cubes of a stored run: ``{"manifest": ..., <cube>: DataFrame}``."""
+    client_dir = _client_dir(config)
+    run_dir = client_dir / run_id if client_dir is not None else None
+    if run_dir is None or not (run_dir / "manifest.json").is_file():
+        raise FileNotFoundError(f"No stored run {run_id!r} for client {config.get('client_id')}")
+    run = {"manifest": json.loads((run_dir / "manifest.json").read_text())}
+    for name in _CUBES:
+        run[name] = pd.read_parquet(run_dir / f"{name}.parquet")
+    return run
+
+
+# =========================================================================
+# Comparison
+# =========================================================================
+
+def _window(run: dict) -> list[str]:
+    """The run's last ``compare_months`` months of data."""
+    return sorted(run["months"]["year_month"])[-run["manifest"]["compare_months"]:]
+
+
+def _recent(run: dict, cube: str) -> pd.DataFrame:
+    """Rows of a month-keyed cube in the run's compared months."""
+    return run[cube][run[cube]["year_month"].isin(_window(run))]
+
+
+def _window_label(run: dict) -> str:
+    months = _window(run)
+    return f"{months[0]} .. {months[-1]}" if months else "no data"
+
+
+def _change(a, b) -> tuple[float, float | None]:
+    delta = b - a
+    return delta, (round(delta / a * 100, 1) if a else None)
+
+
+def _by_key(cube: pd.DataFrame, key: str) -> pd.DataFrame:
+    return cube.groupby(key)[["spend", "transactions"]].sum()
+
+
+def _resolve_runs(config: dict, run_a: str | None, run_b: str | None) -> tuple[str, str]:
+    if run_a is None or run_b is None:
+        ids = [m["run_id"] for m in list_runs(config)]
+        if len(ids) < 2:
+            raise ValueError(f"Need two stored runs to compare, found {len(ids)}")
+        run_a, run_b = run_a or ids[-2], run_b or ids[-1]
+    return run_a, run_b
+
+
+def compare_runs(config: dict, run_a: str | None = None, run_b: str | None = None) -> dict:
+    """Storyline-shaped delta report between two stored runs (default: the latest two)."""
+    run_a, run_b = _resolve_runs(config, run_a, run_b)
+    a, b = load_run(config, run_a), load_run(config, run_b)
+    ma, mb = a["manifest"], b["manifest"]
+    top_n = int(config.get("top_n", 20))
+    sections: list[dict] = []
+    sheets: list[dict] = []
+
+    # --- Runs compared ---
+    runs_df = pd.DataFrame([
+        {"Run": label, "Run ID": m["run_id"], "Created": m["created"],
+         "Data Window": f"{m['first_month']} .. {m['last_month']}",
+         "Compared Months": _window_label(run)}
+        for label, m, run in (("A", ma, a), ("B", mb, b))
+    ])
+    sections.append({
+        "heading": "Runs Compared",
+        "narrative": (
+            f"Run <b>A</b> ({ma['run_id']}) against run <b>B</b> ({mb['run_id']}), each over "
+            f"its last {ma['compare_months']} / {mb['compare_months']} months of data "
+            f"(A: {_window_label(a)}, B: {_window_label(b)}). Built from the stored "
+            f"aggregates of both runs."
+        ),
+        "figures": [], "tables": [("Runs", runs_df)],
+    })
+    sheets.append({"name": "Compare Runs", "df": runs_df})
+
+    # --- Headline KPIs: compared window, then whole-run KPIs ---
+    acct_a, acct_b = a["accounts"], b["accounts"]
+    rows = []
+    for label, va, vb in [
+        ("Spend", _recent(a, "months")["spend"].sum(), _recent(b, "months")["spend"].sum()),
+        ("Transactions", _recent(a, "months")["transactions"].sum(),
+         _recent(b, "months")["transactions"].sum()),
+        ("Active Accounts", int((acct_a["recent_transactions"] > 0).sum()),
+         int((acct_b["recent_transactions"] > 0).sum())),
+        ("Competitor Spend", _recent(a, "competitors")["spend"].sum(),
+         _recent(b, "competitors")["spend"].sum()),
+    ] + [(f"{k} (whole run)", ma["kpis"].get(k, 0), mb["kpis"].get(k, 0))
+         for k in ("ODD Accounts", "Active Rate (%)", "Avg Ticket", "Competitor Share (%)")]:
+        delta, pct = _change(float(va), float(vb))
+        rows.append({"Metric": label, "Run A": round(float(va), 2), "Run B": round(float(vb), 2),
+                     "Change": round(delta, 2), "Change %": pct})
+    kpi_df = pd.DataFrame(rows)
+    spend_row = kpi_df.iloc[0]
+    sections.append({
+        "heading": "Headline KPIs",
+        "narrative": (
+            f"Spend over the compared months moved from <b>{format_currency(spend_row['Run A'])}</b> "
+            f"to <b>{format_currency(spend_row['Run B'])}</b>"
+            + (f" ({spend_row['Change %']:+.1f}%)." if pd.notna(spend_row["Change %"]) else ".")
+        ),
+        "figures": [], "tables": [("KPI Changes", kpi_df)],
+    })
+    sheets.append({"name": "Compare KPIs", "df": kpi_df, "pct_cols": ["Change %"]})
+
+    # --- Monthly trend, both runs (overlapping months show restatements) ---
+    monthly = (
+        a["months"].set_index("year_month")[["spend", "accounts"]]
+        .join(b["months"].set_index("year_month")[["spend", "accounts"]],
+              how="outer", lsuffix=" A", rsuffix=" B")
+        .sort_index().reset_index()
+    )
+    monthly.columns = ["Month", "Spend (A)", "Accounts (A)", "Spend (B)", "Accounts (B)"]
+    trend_fig = line_trend(monthly, "Month", ["Spend (A)", "Spend (B)"], "Monthly Spend by Run",
+                           y_format="$,.0f")
+    trend_fig.update_layout(title=insight_title(
+        "Monthly spend, run A vs run B", "Months in both runs show any restated data"))
+    sections.append({
+        "heading": "Monthly Trend",
+        "narrative": (f"Run A covers <b>{ma['first_month']} .. {ma['last_month']}</b>, "
+                      f"run B <b>{mb['first_month']} .. {mb['last_month']}</b>."),
+        "figures": [apply_theme(trend_fig)], "tables": [("Monthly by Run", monthly)],
+    })
+    sheets.append({"name": "Compare Months", "df": monthly,
+                   "currency_cols": ["Spend (A)", "Spend (B)"],
+                   "number_cols": ["Accounts (A)", "Accounts (B)"]})
+
+    # --- Merchant and competitor movers over the compared months ---
+    for key, heading, sheet_name, cube in (
+        ("merchant", "Merchant Movers", "Compare Merchants", "merchants"),
+        ("competitor", "Competitor Movers", "Compare Competitors", "competitors"),
+    ):
+        moves = _by_key(_recent(a, cube), key).join(
+            _by_key(_recent(b, cube), key), how="outer", lsuffix="_a", rsuffix="_b",
+        ).fillna(0)
+        moves["change"] = moves["spend_b"] - moves["spend_a"]
+        moves["change_pct"] = (
+            moves["change"] / moves["spend_a"].where(moves["spend_a"] != 0) * 100
+        ).round(1)
+        moves = moves.reindex(moves["change"].abs().sort_values(ascending=False).index)
+        new = int(((moves["spend_a"] == 0) & (moves["spend_b"] > 0)).sum())
+        gone = int(((moves["spend_a"] > 0) & (moves["spend_b"] == 0)).sum())
+        table = moves.reset_index().rename(columns={
+            key: key.title(), "spend_a": "Spend (A)", "spend_b": "Spend (B)",
+            "transactions_a": "Transactions (A)", "transactions_b": "Transactions (B)",
+            "change": "Spend Change", "change_pct": "Change %",
+        })
+        if table.empty:
+            continue
+        fig = horizontal_bar(table.head(top_n), "Spend Change", key.title(),
+                             f"Largest {key} spend changes", top_n=top_n)
+        biggest = table.iloc[0]
+        sections.append({
+            "heading": heading,
+            "narrative": (
+                f"Largest move: <b>{biggest[key.title()]}</b> "
+                f"({'+' if biggest['Spend Change'] >= 0 else ''}"
+                f"{format_currency(biggest['Spend Change'])}). "
+                f"<b>{new:,}</b> {key}s had spend only in run B, <b>{gone:,}</b> only in run A."
+            ),
+            "figures": [apply_theme(fig)], "tables": [(heading, table.head(top_n))],
+        })
+        sheets.append({"name": sheet_name, "df": table,
+                       "currency_cols": ["Spend (A)", "Spend (B)", "Spend Change"],
+                       "number_cols": ["Transactions (A)", "Transactions (B)"],
+                       "pct_cols": ["Change %"]})
+
+    # --- Account movement between the compared windows ---
+    joined = (
+        acct_a.set_index("primary_account_num")[["recent_spend", "recent_transactions"]]
+        .join(acct_b.set_index("primary_account_num")[["recent_spend", "recent_transactions"]],
+              how="outer", lsuffix="_a", rsuffix="_b")
+        .fillna(0)
+    )
+    in_a, in_b = joined["recent_transactions_a"] > 0, joined["recent_transactions_b"] > 0
+    retained = in_a & in_b
+    change = ((joined["recent_spend_b"] - joined["recent_spend_a"])
+              / joined["recent_spend_a"].where(joined["recent_spend_a"] > 0) * 100).fillna(0)
+    groups = {
+        "Retained - Growing": retained & (change > _MOVE_PCT),
+        "Retained - Stable": retained & (change >= -_MOVE_PCT) & (change <= _MOVE_PCT),
+        "Retained - Declining": retained & (change < -_MOVE_PCT),
+        "New (active in B only)": in_b & ~in_a,
+        "Lost (active in A only)": in_a & ~in_b,
+    }
+    move_df = pd.DataFrame([
+        {"Movement": label, "Accounts": int(mask.sum()),
+         "Spend (A)": round(float(joined.loc[mask, "recent_spend_a"].sum()), 2),
+         "Spend (B)": round(float(joined.loc[mask, "recent_spend_b"].sum()), 2)}
+        for label, mask in groups.items()
+    ])
+    move_df["Spend Change"] = (move_df["Spend (B)"] - move_df["Spend (A)"]).round(2)
+
+    spend_a = float(joined["recent_spend_a"].sum())
+    bridge = [("Run A spend", spend_a)] + [
+        (label, float(row["Spend Change"]))
+        for label, row in zip(move_df["Movement"], move_df.to_dict("records"))
+    ]
+    bridge.append(("Run B spend", float(joined["recent_spend_b"].sum())))
+    bridge_fig = waterfall_chart([k for k, _ in bridge], [v for _, v in bridge],
+                                 "Spend Bridge by Account Movement")
+    by_label = move_df.set_index("Movement")["Accounts"]
+    sections.append({
+        "heading": "Account Movement",
+        "narrative": (
+            f"Of <b>{int(in_a.sum()):,}</b> accounts active in run A's compared months, "
+            f"<b>{int(retained.sum()):,}</b> were still active in run B's and "
+            f"<b>{by_label['Lost (active in A only)']:,}</b> were not; "
+            f"<b>{by_label['New (active in B only)']:,}</b> accounts are new in B."
+        ),
+        "figures": [apply_theme(bridge_fig)], "tables": [("Account Movement", move_df)],
+    })
+    sheets.append({"name": "Compare Accounts", "df": move_df,
+                   "currency_cols": ["Spend (A)", "Spend (B)", "Spend Change"],
+                   "number_cols": ["Accounts"]})
+
+    return {
+        "title": f"Run Comparison: {run_a} vs {run_b}",
+        "description": "What changed between two stored runs: KPIs, monthly trend, "
+                       "merchant and competitor movers, account movement",
+        "sections": sections,
+        "sheets": sheets,
+    }
+
+
+def write_comparison(config: dict, run_a: str | None = None,
+                     run_b: str | None = None) -> tuple[Path, Path]:
+    """Compare two stored runs and write the Excel and HTML delta reports."""
+    from v4_excel_report import generate_excel_report
+    from v4_html_report import generate_html_report
+
+    run_a, run_b = _resolve_runs(config, run_a, run_b)
+    result = compare_runs(config, run_a, run_b)
+    output_dir = Path(config.get("output_dir", "output"))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stem = (f"{config.get('client_id', '')}_{config.get('client_name', 'Client').replace(' ', '_')}"
+            f"_V4_Compare_{run_a}_vs_{run_b}")
+    excel_path, html_path = output_dir / f"{stem}.xlsx", output_dir / f"{stem}.html"
+    generate_excel_report({"comparison": result}, config, str(excel_path))
+    generate_html_report({"comparison": result}, config, str(html_path))
+    return excel_path, html_path
+
+
+if __name__ == "__main__":
+    from v4_data_loader import load_config
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("list", "compare"):
+        print("Usage: python v4_run_store.py list|compare my_client.yaml [RUN_A [RUN_B]]")
+        sys.exit(2)
+    config = load_config(sys.argv[2])
+    if sys.argv[1] == "list":
+        for m in list_runs(config):
+            print(f"{m['run_id']}  {m['first_month']} .. {m['last_month']}  "
+                  f"spend {format_currency(m['kpis']['Total Spend'])}  "
+                  f"accounts {m['kpis']['Transacting Accounts']:,}")
+    else:
+        ids = (sys.argv[3:5] + [None, None])[:2]
+        excel_path, html_path = write_comparison(config, *ids)
+        print(f"Excel: {excel_path}\nHTML:  {html_path}")
@@ -5,24 +5,31 @@ from __future__ import annotations
 import re
 
 import pandas as pd
+from v4_activity import active_in, last_months
 from v4_benchmarks import PULSE_2024, compare_to_pulse, METRIC_LABELS
+from v4_data_loader import source_loaded
 from v4_html_report import build_kpi_html
 from v4_themes import format_currency, format_pct
 
+SOURCES = ("odd",)
+TXN_COLUMNS = ()
+
 
 def run(ctx: dict, storyline_results: dict) -> dict:
     """Generate executive summary from completed storyline results.
 
     Unlike other storylines, this receives the full results dict so it can
-    synthesize cross-storyline insights.
+    synthesize cross-storyline insights. Reads transactions only when the
+    run loaded them (an ODD-only run skips the transaction scorecard).
     """
-    df = ctx["combined_df"]
+    df = ctx["combined_df"] if source_loaded(ctx, "transactions") else None
     odd = ctx["odd_df"]
     config = ctx.get("config", {})
     sections: list[dict] = []
     sheets: list[dict] = []
 
-    _program_health_scorecard(df, odd, config, sections, sheets)
+    if df is not None:
+        _program_health_scorecard(df, ctx["activity"], odd, config, sections, sheets)
     _key_findings(storyline_results, sections, sheets)
     _competitive_position(storyline_results, sections, sheets)
     _revenue_opportunity_matrix(storyline_results, df, config, sections, sheets)
@@ -43,7 +50,7 @@ def run(ctx: dict, storyline_results: dict) -> dict:
 # Section 1: Program Health Scorecard
 # =========================================================================
 
-def _program_health_scorecard(df, odd, config, sections, sheets):
+def _program_health_scorecard(df, act, odd, config, sections, sheets):
     interchange_rate = config.get("interchange_rate", 0.015)
     recent_months = config.get("recent_months", 12)
 
@@ -53,15 +60,12 @@ def _program_health_scorecard(df, odd, config, sections, sheets):
     est_interchange = total_spend * interchange_rate
 
     # Active rate: accounts with >= 1 txn in last month
-    active_accounts = 0
-    if "year_month" in df.columns:
-        latest_month = df["year_month"].max()
-        active_accounts = df[df["year_month"] == latest_month]["primary_account_num"].nunique()
+    active_accounts = int(active_in(act, last_months(act, 1)).sum())
 
     active_rate = (active_accounts / total_accounts * 100) if total_accounts > 0 else 0
 
     # Monthly txns per active card
-    months_in_data = df["year_month"].nunique() if "year_month" in df.columns else 1
+    months_in_data = len(act["months"]) or 1
     monthly_txns = (total_txns / max(active_accounts, 1) / max(months_in_data, 1))
 
     # Average ticket
@@ -269,7 +273,7 @@ def _revenue_opportunity_matrix(storyline_results, df, config, sections, sheets)
     s1 = storyline_results.get("s1_portfolio")
     if s1:
         inactive_count = _extract_number_from_sections(s1, "inactive|dormant")
-        if inactive_count and inactive_count > 0:
+        if inactive_count and inactive_count > 0 and df is not None:
             avg_active_spend = df.groupby("primary_account_num")["amount"].sum().median()
             est_revenue = inactive_count * avg_active_spend * 0.25 * interchange_rate
             opportunities.append({
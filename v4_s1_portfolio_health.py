@@ -5,13 +5,18 @@
 
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
+from v4_activity import monthly_active
+from v4_backend import distinct_count
+from v4_figspec import FigureSpec
 from v4_themes import (
     COLORS, CATEGORY_PALETTE, apply_theme, format_currency,
     horizontal_bar, line_trend, stacked_bar, donut_chart,
 )
 from v4_html_report import build_kpi_html
 
+SOURCES = ("transactions", "odd")
+TXN_COLUMNS = ("transaction_type", "card_present")
+
 
 def run(ctx: dict) -> dict:
     """
@@ -45,7 +50,7 @@ def run(ctx: dict) -> dict:
             return None
 
     # --- KPI Summary ---
-    kpis = _safe("KPI Summary", _build_kpis, df, odd)
+    kpis = _safe("KPI Summary", _build_kpis, df, odd, ctx)
     if kpis is not None:
         sections.append({
             "heading": "Key Performance Indicators",
@@ -55,7 +60,7 @@ def run(ctx: dict) -> dict:
         })
 
     # --- Monthly Summary ---
-    result = _safe("Monthly Transaction Summary", _monthly_summary, df)
+    result = _safe("Monthly Transaction Summary", _monthly_summary, df, ctx["activity"])
     if result is not None:
         monthly_df, monthly_fig = result
         sections.append({
@@ -188,7 +193,7 @@ def run(ctx: dict) -> dict:
             })
 
     # --- Overall Summary Statistics ---
-    result = _safe("Summary Statistics", _summary_statistics, df, odd)
+    result = _safe("Summary Statistics", _summary_statistics, df, odd, ctx)
     if result is not None:
         summary_df = result
         sections.append({
@@ -236,11 +241,12 @@ def run(ctx: dict) -> dict:
 # KPI Builder
 # =============================================================================
 
-def _build_kpis(df, odd):
+def _build_kpis(df, odd, ctx):
     total_spend = df["amount"].sum()
     total_txn = len(df)
-    unique_accounts = df["primary_account_num"].nunique()
-    unique_merchants = df["merchant_consolidated"].nunique() if "merchant_consolidated" in df.columns else df["merchant_name"].nunique()
+    unique_accounts = distinct_count(ctx, df["primary_account_num"])
+    merch_col = "merchant_consolidated" if "merchant_consolidated" in df.columns else "merchant_name"
+    unique_merchants = distinct_count(ctx, df[merch_col])
     months = df["year_month"].nunique() if "year_month" in df.columns else 1
 
     kpis = [
@@ -271,18 +277,19 @@ def _build_kpis(df, odd):
 # Monthly Summary
 # =============================================================================
 
-def _monthly_summary(df):
+def _monthly_summary(df, act):
     monthly = df.groupby("year_month").agg({
-        "primary_account_num": "nunique",
         "transaction_date": "count",
         "amount": ["sum", "mean", "median"],
         "merchant_name": "nunique",
     }).round(2)
 
     monthly.columns = [
-        "Accounts", "Transactions", "Total Spend",
+        "Transactions", "Total Spend",
         "Avg Transaction", "Median Transaction", "Unique Merchants",
     ]
+    # Active accounts per month come from the activity bitmap
+    monthly.insert(0, "Accounts", monthly_active(act).reindex(monthly.index, fill_value=0))
 
     monthly["Spend Growth %"] = monthly["Total Spend"].pct_change() * 100
     monthly["Transaction Growth %"] = monthly["Transactions"].pct_change() * 100
@@ -291,8 +298,8 @@ def _monthly_summary(df):
     monthly = monthly.rename(columns={"year_month": "Month"})
 
     # Chart: dual-axis line (spend + transactions)
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
+    fig = FigureSpec()
+    fig.add_trace(dict(type="bar",
         x=monthly["Month"],
         y=monthly["Total Spend"],
         name="Total Spend",
@@ -300,7 +307,7 @@ def _monthly_summary(df):
         opacity=0.7,
         yaxis="y",
     ))
-    fig.add_trace(go.Scatter(
+    fig.add_trace(dict(type="scatter",
         x=monthly["Month"],
         y=monthly["Transactions"],
         name="Transactions",
@@ -371,8 +378,8 @@ def _transaction_distribution(df):
     dist_df = pd.DataFrame(stats)
 
     # Chart
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
+    fig = FigureSpec()
+    fig.add_trace(dict(type="bar",
         x=dist_df["Amount Range"],
         y=dist_df["Transactions"],
         marker_color=BRACKET_COLORS[:len(dist_df)],
@@ -441,10 +448,10 @@ def _monthly_distribution_variance(df):
     variance_df = variance_df.rename(columns={"year_month": "Month"})
 
     # Stacked bar chart (100% mode) -- data is already in percentages
-    fig = go.Figure()
+    fig = FigureSpec()
     for idx, bracket in enumerate(AMOUNT_LABELS):
         color = BRACKET_COLORS[idx % len(BRACKET_COLORS)]
-        fig.add_trace(go.Bar(
+        fig.add_trace(dict(type="bar",
             x=variance_df["Month"],
             y=variance_df[bracket],
             name=bracket,
@@ -616,12 +623,12 @@ def _pin_sig_mix(df):
     result["PIN %"] = (result["PIN Count"] / result["Total"] * 100).round(1)
     result["Sig %"] = (result["Sig Count"] / result["Total"] * 100).round(1)
 
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
+    fig = FigureSpec()
+    fig.add_trace(dict(type="bar",
         x=result["Month"], y=result["PIN %"],
         name="PIN", marker_color=COLORS["primary"],
     ))
-    fig.add_trace(go.Bar(
+    fig.add_trace(dict(type="bar",
         x=result["Month"], y=result["Sig %"],
         name="Signature", marker_color=COLORS["secondary"],
     ))
@@ -665,8 +672,8 @@ def _balance_distribution(odd):
     colors = [COLORS["negative"], COLORS["neutral"], COLORS["secondary"],
               COLORS["primary"], COLORS["positive"], COLORS["accent"]]
 
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
+    fig = FigureSpec()
+    fig.add_trace(dict(type="bar",
         x=tier_stats["Balance Tier"],
         y=tier_stats["Accounts"],
         marker_color=colors[:len(tier_stats)],
@@ -715,7 +722,7 @@ def _activation_analysis(odd):
     })
 
     colors = [COLORS["positive"], COLORS["negative"], COLORS["neutral"]]
-    fig = go.Figure(data=[go.Pie(
+    fig = FigureSpec(data=[dict(type="pie",
         labels=result["Status"],
         values=result["Accounts"],
         hole=0.45,
@@ -750,12 +757,12 @@ def _activation_narrative(act_df):
 # Summary Statistics Table
 # =============================================================================
 
-def _summary_statistics(df, odd):
+def _summary_statistics(df, odd, ctx):
     total_spend = df["amount"].sum()
     total_txn = len(df)
-    unique_accts = df["primary_account_num"].nunique()
+    unique_accts = distinct_count(ctx, df["primary_account_num"])
     merch_col = "merchant_consolidated" if "merchant_consolidated" in df.columns else "merchant_name"
-    unique_merchants = df[merch_col].nunique()
+    unique_merchants = distinct_count(ctx, df[merch_col])
     avg_ticket = df["amount"].mean()
     median_ticket = df["amount"].median()
     months = df["year_month"].nunique() if "year_month" in df.columns else 1
@@ -5,11 +5,15 @@
 
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
+from v4_figspec import FigureSpec
 from v4_themes import (
     COLORS, CATEGORY_PALETTE, apply_theme, format_currency,
     horizontal_bar, line_trend, stacked_bar,
 )
+from v4_backend import group_agg
+
+SOURCES = ("transactions",)
+TXN_COLUMNS = ("mcc_code",)
 
 
 def run(ctx: dict) -> dict:
@@ -26,8 +30,13 @@ def run(ctx: dict) -> dict:
     sheets = []
     merch_col = "merchant_consolidated" if "merchant_consolidated" in df.columns else "merchant_name"
 
+    # Merchant roll-ups are aggregated once per population and reused below
+    merch_agg = _merchant_rollup(ctx, "combined_df", merch_col)
+    merch_monthly = (_merchant_monthly(ctx, "combined_df", merch_col)
+                     if "year_month" in df.columns else None)
+
     # --- Top Merchants by Spend ---
-    spend_df = _top_merchants(df, merch_col, "amount_sum", top_n)
+    spend_df = _top_merchants(merch_agg, merch_col, "amount_sum", top_n)
     spend_fig = _merchant_bar(spend_df, "Total Spend", f"Top {min(25, top_n)} Merchants by Total Spend")
     sections.append({
         "heading": "Top Merchants by Total Spend",
@@ -43,7 +52,7 @@ def run(ctx: dict) -> dict:
     })
 
     # --- Top Merchants by Transaction Count ---
-    txn_df = _top_merchants(df, merch_col, "txn_count", top_n)
+    txn_df = _top_merchants(merch_agg, merch_col, "txn_count", top_n)
     txn_fig = _merchant_bar(txn_df, "Transactions", f"Top {min(25, top_n)} Merchants by Transaction Count", color=COLORS["secondary"])
     sections.append({
         "heading": "Top Merchants by Transaction Count",
@@ -59,7 +68,7 @@ def run(ctx: dict) -> dict:
     })
 
     # --- Top Merchants by Unique Accounts ---
-    acct_df = _top_merchants(df, merch_col, "unique_accounts", top_n)
+    acct_df = _top_merchants(merch_agg, merch_col, "unique_accounts", top_n)
     acct_fig = _merchant_bar(acct_df, "Unique Accounts", f"Top {min(25, top_n)} Merchants by Account Penetration", color=COLORS["accent"])
     sections.append({
         "heading": "Top Merchants by Unique Accounts",
@@ -76,7 +85,7 @@ def run(ctx: dict) -> dict:
 
     # --- MCC Category Analysis (3-panel: spend, txn count, unique accounts) ---
     if "mcc_code" in df.columns:
-        mcc_df = _mcc_analysis(df, top_n)
+        mcc_df = _mcc_analysis(ctx, top_n)
         mcc_spend_fig = _merchant_bar(mcc_df, "Total Spend", "Top 20 MCC Categories by Spend", y_col="MCC Code", color=COLORS["primary"])
         mcc_txn_df = mcc_df.sort_values("Transactions", ascending=False).head(20)
         mcc_txn_fig = _merchant_bar(mcc_txn_df, "Transactions", "Top 20 MCC Categories by Transaction Count", y_col="MCC Code", color=COLORS["secondary"])
@@ -97,11 +106,12 @@ def run(ctx: dict) -> dict:
 
     # --- Business Top Merchants (spend, txn count, unique accounts) ---
     if len(biz) > 0:
-        biz_df = _top_merchants(biz, merch_col, "amount_sum", top_n)
+        biz_agg = _merchant_rollup(ctx, "business_df", merch_col)
+        biz_df = _top_merchants(biz_agg, merch_col, "amount_sum", top_n)
         biz_fig = _merchant_bar(biz_df, "Total Spend", "Top 25 Business Merchants by Spend", color="#7B2D8E")
-        biz_txn_df = _top_merchants(biz, merch_col, "txn_count", top_n)
+        biz_txn_df = _top_merchants(biz_agg, merch_col, "txn_count", top_n)
         biz_txn_fig = _merchant_bar(biz_txn_df, "Transactions", "Top 25 Business Merchants by Txn Count", color="#7B2D8E")
-        biz_acct_df = _top_merchants(biz, merch_col, "unique_accounts", top_n)
+        biz_acct_df = _top_merchants(biz_agg, merch_col, "unique_accounts", top_n)
         biz_acct_fig = _merchant_bar(biz_acct_df, "Unique Accounts", "Top 25 Business Merchants by Accounts", color="#7B2D8E")
         sections.append({
             "heading": "Business Account - Top Merchants",
@@ -118,11 +128,12 @@ def run(ctx: dict) -> dict:
 
     # --- Personal Top Merchants (spend, txn count, unique accounts) ---
     if len(per) > 0:
-        per_df = _top_merchants(per, merch_col, "amount_sum", top_n)
+        per_agg = _merchant_rollup(ctx, "personal_df", merch_col)
+        per_df = _top_merchants(per_agg, merch_col, "amount_sum", top_n)
         per_fig = _merchant_bar(per_df, "Total Spend", "Top 25 Personal Merchants by Spend", color=COLORS["secondary"])
-        per_txn_df = _top_merchants(per, merch_col, "txn_count", top_n)
+        per_txn_df = _top_merchants(per_agg, merch_col, "txn_count", top_n)
         per_txn_fig = _merchant_bar(per_txn_df, "Transactions", "Top 25 Personal Merchants by Txn Count", color=COLORS["secondary"])
-        per_acct_df = _top_merchants(per, merch_col, "unique_accounts", top_n)
+        per_acct_df = _top_merchants(per_agg, merch_col, "unique_accounts", top_n)
         per_acct_fig = _merchant_bar(per_acct_df, "Unique Accounts", "Top 25 Personal Merchants by Accounts", color=COLORS["secondary"])
         sections.append({
             "heading": "Personal Account - Top Merchants",
@@ -172,7 +183,7 @@ def run(ctx: dict) -> dict:
 
     # --- Spending Consistency / Volatility ---
     if "year_month" in df.columns:
-        result = _spending_consistency(df, merch_col)
+        result = _spending_consistency(merch_monthly, merch_col)
         if result is not None:
             consist_df, consist_fig, volatile_fig = result
             sections.append({
@@ -195,7 +206,7 @@ def run(ctx: dict) -> dict:
 
     # --- Month-over-Month Growth ---
     if "year_month" in df.columns:
-        result = _mom_growth(df, merch_col)
+        result = _mom_growth(merch_monthly, merch_col)
         if result is not None:
             mom_df, mom_growth_fig, mom_decline_fig = result
             sections.append({
@@ -262,7 +273,8 @@ def run(ctx: dict) -> dict:
 
     # --- Business Account Rank Movers ---
     if "year_month" in df.columns and len(biz) > 0:
-        result = _account_rank_movers(biz, merch_col, label="Business")
+        result = _account_rank_movers(
+            _merchant_monthly(ctx, "business_df", merch_col), merch_col, label="Business")
         if result is not None:
             biz_mover_df, biz_climb_fig, biz_fall_fig = result
             sections.append({
@@ -285,7 +297,7 @@ def run(ctx: dict) -> dict:
 
     # --- Personal Account Rank Movers ---
     if "year_month" in df.columns and len(per) > 0:
-        result = _personal_rank_movers(per, merch_col)
+        result = _personal_rank_movers(_merchant_monthly(ctx, "personal_df", merch_col), merch_col)
         if result is not None:
             per_mover_df, per_climb_fig, per_fall_fig, per_spend_fig = result
             sections.append({
@@ -318,20 +330,33 @@ def run(ctx: dict) -> dict:
 # Core Analysis Functions
 # =============================================================================
 
-def _top_merchants(df, merch_col, sort_by, top_n):
-    agg = df.groupby(merch_col).agg({
-        "amount": ["sum", "count", "mean"],
-        "primary_account_num": "nunique",
-    }).round(2)
-    agg.columns = ["Total Spend", "Transactions", "Avg Transaction", "Unique Accounts"]
+def _merchant_rollup(ctx, source, merch_col):
+    """Per-merchant spend, transactions, average ticket and accounts for *source*."""
+    return group_agg(
+        ctx, source, merch_col,
+        **{
+            "Total Spend": ("amount", "sum"),
+            "Transactions": ("amount", "count"),
+            "Avg Transaction": ("amount", "mean"),
+            "Unique Accounts": ("primary_account_num", "nunique"),
+        },
+    ).round(2)
+
+
+def _merchant_monthly(ctx, source, merch_col):
+    """Spend per merchant per month for *source* (columns merch_col, year_month, amount)."""
+    return group_agg(ctx, source, [merch_col, "year_month"], amount=("amount", "sum"))
 
+
+def _top_merchants(agg, merch_col, sort_by, top_n):
+    """Top *top_n* rows of a ``_merchant_rollup`` frame ranked by *sort_by*."""
     sort_map = {
         "amount_sum": "Total Spend",
         "txn_count": "Transactions",
         "unique_accounts": "Unique Accounts",
     }
     agg = agg.sort_values(sort_map.get(sort_by, "Total Spend"), ascending=False).head(top_n)
-    agg = agg.reset_index().rename(columns={merch_col: "Merchant"})
+    agg = agg.reset_index(drop=True).rename(columns={merch_col: "Merchant"})
     return agg
 
 
@@ -339,8 +364,8 @@ def _merchant_bar(df, value_col, title, y_col="Merchant", color=None, top_n=25):
     top = df.head(top_n).iloc[::-1]
     color = color or COLORS["primary"]
 
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
+    fig = FigureSpec()
+    fig.add_trace(dict(type="bar",
         x=top[value_col],
         y=top[y_col].astype(str).str[:40],
         orientation="h",
@@ -366,15 +391,19 @@ def _merchant_bar(df, value_col, title, y_col="Merchant", color=None, top_n=25):
     return fig
 
 
-def _mcc_analysis(df, top_n):
-    agg = df.groupby("mcc_code").agg({
-        "amount": ["sum", "count", "mean"],
-        "primary_account_num": "nunique",
-        "merchant_name": "nunique",
-    }).round(2)
-    agg.columns = ["Total Spend", "Transactions", "Avg Transaction", "Unique Accounts", "Merchants"]
+def _mcc_analysis(ctx, top_n):
+    agg = group_agg(
+        ctx, "combined_df", "mcc_code",
+        **{
+            "Total Spend": ("amount", "sum"),
+            "Transactions": ("amount", "count"),
+            "Avg Transaction": ("amount", "mean"),
+            "Unique Accounts": ("primary_account_num", "nunique"),
+            "Merchants": ("merchant_name", "nunique"),
+        },
+    ).round(2)
     agg = agg.sort_values("Total Spend", ascending=False).head(top_n)
-    agg = agg.reset_index().rename(columns={"mcc_code": "MCC Code"})
+    agg = agg.reset_index(drop=True).rename(columns={"mcc_code": "MCC Code"})
     return agg
 
 
@@ -428,11 +457,11 @@ def _monthly_rank_tracking(df, merch_col):
     rank_df = pd.DataFrame(rows).sort_values("Avg Rank").head(15)
 
     # Chart: line chart of rank trajectory (inverted y-axis)
-    fig = go.Figure()
+    fig = FigureSpec()
     month_strs = [str(m) for m in sorted_months]
     for _, row in rank_df.iterrows():
         ranks = [row.get(m) for m in month_strs]
-        fig.add_trace(go.Scatter(
+        fig.add_trace(dict(type="scatter",
             x=month_strs,
             y=ranks,
             mode="lines+markers",
@@ -487,8 +516,8 @@ def _growth_analysis(df, merch_col, config):
 
     # Growth chart (top 15)
     top_growth = growth.head(15).iloc[::-1]
-    growth_fig = go.Figure()
-    growth_fig.add_trace(go.Bar(
+    growth_fig = FigureSpec()
+    growth_fig.add_trace(dict(type="bar",
         x=top_growth["Change"],
         y=top_growth["Merchant"].astype(str).str[:35],
         orientation="h",
@@ -507,8 +536,8 @@ def _growth_analysis(df, merch_col, config):
 
     # Decline chart (bottom 15)
     top_decline = growth.tail(15)
-    decline_fig = go.Figure()
-    decline_fig.add_trace(go.Bar(
+    decline_fig = FigureSpec()
+    decline_fig.add_trace(dict(type="bar",
         x=top_decline["Change"],
         y=top_decline["Merchant"].astype(str).str[:35],
         orientation="h",
@@ -536,18 +565,13 @@ MIN_ACTIVE_MONTHS = 3
 MIN_TOTAL_SPEND = 10_000
 
 
-def _spending_consistency(df, merch_col):
+def _spending_consistency(monthly_spend, merch_col):
     """Classify merchants by spending volatility using coefficient of variation.
 
     CV = std / mean * 100. Consistency score = 100 - min(CV, 100).
     Filters: 3+ active months and $10K+ total spend.
+    *monthly_spend* is the ``_merchant_monthly`` frame.
     """
-    monthly_spend = (
-        df.groupby([merch_col, "year_month"])["amount"]
-        .sum()
-        .reset_index()
-    )
-
     pivot = monthly_spend.pivot(
         index=merch_col, columns="year_month", values="amount"
     ).fillna(0)
@@ -589,8 +613,8 @@ def _spending_consistency(df, merch_col):
 
     # --- Chart 1: Top 30 Most Consistent (lowest CV) ---
     consistent = stats.sort_values("CV (%)").head(30).iloc[::-1]
-    consist_fig = go.Figure()
-    consist_fig.add_trace(go.Bar(
+    consist_fig = FigureSpec()
+    consist_fig.add_trace(dict(type="bar",
         x=consistent["Consistency Score"],
         y=consistent["Merchant"].astype(str).str[:35],
         orientation="h",
@@ -610,8 +634,8 @@ def _spending_consistency(df, merch_col):
 
     # --- Chart 2: Top 30 Most Volatile (highest CV) ---
     volatile = stats.sort_values("CV (%)", ascending=False).head(30).iloc[::-1]
-    volatile_fig = go.Figure()
-    volatile_fig.add_trace(go.Bar(
+    volatile_fig = FigureSpec()
+    volatile_fig.add_trace(dict(type="bar",
         x=volatile["CV (%)"],
         y=volatile["Merchant"].astype(str).str[:35],
         orientation="h",
@@ -642,23 +666,18 @@ def _spending_consistency(df, merch_col):
 MOM_MIN_SPEND = 1_000
 
 
-def _mom_growth(df, merch_col):
+def _mom_growth(monthly, merch_col):
     """Calculate month-over-month spend changes for each merchant.
 
     Compares every consecutive month pair. Only includes merchants
     with $1K+ spend in either the previous or current month.
     Returns top 50 growth leaders and top 50 decliners across all pairs.
+    *monthly* is the ``_merchant_monthly`` frame.
     """
-    sorted_months = sorted(df["year_month"].unique())
+    sorted_months = sorted(monthly["year_month"].unique())
     if len(sorted_months) < 2:
         return None
 
-    monthly = (
-        df.groupby([merch_col, "year_month"])["amount"]
-        .sum()
-        .reset_index()
-    )
-
     rows = []
     for i in range(len(sorted_months) - 1):
         prev_month = sorted_months[i]
@@ -704,8 +723,8 @@ def _mom_growth(df, merch_col):
     chart_leaders_label = chart_leaders.apply(
         lambda r: f"{r['Merchant'][:25]} ({r['Period']})", axis=1
     )
-    growth_fig = go.Figure()
-    growth_fig.add_trace(go.Bar(
+    growth_fig = FigureSpec()
+    growth_fig.add_trace(dict(type="bar",
         x=chart_leaders["Change ($)"],
         y=chart_leaders_label,
         orientation="h",
@@ -732,8 +751,8 @@ def _mom_growth(df, merch_col):
     chart_decliners_label = chart_decliners.apply(
         lambda r: f"{r['Merchant'][:25]} ({r['Period']})", axis=1
     )
-    decline_fig = go.Figure()
-    decline_fig.add_trace(go.Bar(
+    decline_fig = FigureSpec()
+    decline_fig.add_trace(dict(type="bar",
         x=chart_decliners["Change ($)"],
         y=chart_decliners_label,
         orientation="h",
@@ -895,25 +914,17 @@ def _cohort_top_new(df, merch_col, top_n=5, recent_months=3):
 TOP_RANK_THRESHOLD = 100
 
 
-def _account_rank_movers(subset_df, merch_col, label="Business"):
+def _account_rank_movers(monthly_spend, merch_col, label="Business"):
     """Compare merchant spend ranks between consecutive months.
 
     Only merchants ranked in the top 100 in either month are considered.
+    *monthly_spend* is the ``_merchant_monthly`` frame of the population.
     Returns a DataFrame and two horizontal bar charts (climbers / fallers).
     """
-    if "year_month" not in subset_df.columns:
-        return None
-
-    sorted_months = sorted(subset_df["year_month"].unique())
+    sorted_months = sorted(monthly_spend["year_month"].unique())
     if len(sorted_months) < 2:
         return None
 
-    monthly_spend = (
-        subset_df.groupby([merch_col, "year_month"])["amount"]
-        .sum()
-        .reset_index()
-    )
-
     all_movers = []
 
     for i in range(len(sorted_months) - 1):
@@ -995,8 +1006,8 @@ def _account_rank_movers(subset_df, merch_col, label="Business"):
         lambda r: f"{r['Merchant'][:25]} ({r['Period']})", axis=1
     )
 
-    climb_fig = go.Figure()
-    climb_fig.add_trace(go.Bar(
+    climb_fig = FigureSpec()
+    climb_fig.add_trace(dict(type="bar",
         x=climbers_plot["Rank Change"],
         y=climbers_label,
         orientation="h",
@@ -1021,8 +1032,8 @@ def _account_rank_movers(subset_df, merch_col, label="Business"):
         lambda r: f"{r['Merchant'][:25]} ({r['Period']})", axis=1
     )
 
-    fall_fig = go.Figure()
-    fall_fig.add_trace(go.Bar(
+    fall_fig = FigureSpec()
+    fall_fig.add_trace(dict(type="bar",
         x=fallers_plot["Rank Change"],
         y=fallers_label,
         orientation="h",
@@ -1052,29 +1063,21 @@ def _account_rank_movers(subset_df, merch_col, label="Business"):
 # Personal Account Rank Movers (M5F)
 # =============================================================================
 
-def _personal_rank_movers(subset_df, merch_col):
+def _personal_rank_movers(monthly_spend, merch_col):
     """Personal account rank movers with an additional spend-increase chart.
 
     Returns: (mover_df, climb_fig, fall_fig, spend_increase_fig)
     The spend_increase_fig shows the top 30 merchants by absolute spend
     increase across consecutive months.
     """
-    base = _account_rank_movers(subset_df, merch_col, label="Personal")
+    base = _account_rank_movers(monthly_spend, merch_col, label="Personal")
     if base is None:
         return None
 
     mover_df, climb_fig, fall_fig = base
 
     # Compute absolute spend changes for the spend-increase chart
-    if "year_month" not in subset_df.columns:
-        return None
-
-    sorted_months = sorted(subset_df["year_month"].unique())
-    monthly_spend = (
-        subset_df.groupby([merch_col, "year_month"])["amount"]
-        .sum()
-        .reset_index()
-    )
+    sorted_months = sorted(monthly_spend["year_month"].unique())
 
     spend_rows = []
     for i in range(len(sorted_months) - 1):
@@ -1114,8 +1117,8 @@ def _personal_rank_movers(subset_df, merch_col):
         lambda r: f"{r['Merchant'][:25]} ({r['Period']})", axis=1
     )
 
-    spend_fig = go.Figure()
-    spend_fig.add_trace(go.Bar(
+    spend_fig = FigureSpec()
+    spend_fig.add_trace(dict(type="bar",
         x=spend_plot["Spend Change"],
         y=spend_label,
         orientation="h",
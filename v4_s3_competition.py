@@ -5,12 +5,16 @@
 
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
+from v4_figspec import FigureSpec
 from v4_themes import (
     COLORS, COMPETITOR_COLORS, GENERATION_COLORS,
     apply_theme, format_currency, format_pct,
     horizontal_bar, donut_chart, stacked_bar, line_trend, grouped_bar,
 )
+from v4_backend import distinct_count, group_agg
+
+SOURCES = ("transactions",)
+TXN_COLUMNS = ("mcc_code",)
 
 CATEGORY_LABELS = {
     "big_nationals": "Big Nationals", "regionals": "Regionals",
@@ -32,6 +36,8 @@ def _detect_competitors(df: pd.DataFrame, config: dict) -> pd.DataFrame:
     Matching priority: exact -> starts_with -> contains.
     False positives from config are excluded before categorizing.
     """
+    if "competitor_category" in df.columns:  # tagged upstream (competitor_categories)
+        return df.copy()
     competitors = config.get("competitors", {})
     false_positives = [fp.upper() for fp in config.get("false_positives", [])]
     merch_col = "merchant_consolidated" if "merchant_consolidated" in df.columns else "merchant_name"
@@ -68,6 +74,18 @@ def _detect_competitors(df: pd.DataFrame, config: dict) -> pd.DataFrame:
     return df
 
 
+def competitor_categories(merchants: pd.Series, config: dict) -> pd.Series:
+    """competitor_category per row of *merchants*, matching each distinct name once.
+
+    The rules only look at the merchant name, so a frame tagged this way
+    (e.g. by ``v4_fanout`` before it splits the data) is not re-tagged by
+    ``_detect_competitors``.
+    """
+    names = pd.DataFrame({"merchant_name": merchants.drop_duplicates()})
+    tagged = _detect_competitors(names, config).dropna(subset=["competitor_category"])
+    return merchants.map(dict(zip(tagged["merchant_name"], tagged["competitor_category"])))
+
+
 def run(ctx: dict) -> dict:
     """Run Competitive Landscape analyses."""
     df = ctx["combined_df"]
@@ -97,8 +115,8 @@ def run(ctx: dict) -> dict:
     comp_spend = comp["amount"].sum()
     comp_pct = (comp_spend / total_spend * 100) if total_spend > 0 else 0
     comp_txn = len(comp)
-    comp_accounts = comp["primary_account_num"].nunique()
-    total_accounts = df["primary_account_num"].nunique()
+    comp_accounts = distinct_count(ctx, comp["primary_account_num"])
+    total_accounts = distinct_count(ctx, df["primary_account_num"])
     acct_pct = (comp_accounts / total_accounts * 100) if total_accounts > 0 else 0
 
     cat_spend = comp.groupby("competitor_category")["amount"].sum().sort_values(ascending=False)
@@ -152,11 +170,12 @@ def run(ctx: dict) -> dict:
 
     # --- 3. Competitor Category Breakdown ---
     cat_agg = (
-        comp.groupby("competitor_category").agg(
+        group_agg(
+            ctx, comp, "competitor_category",
             Spend=("amount", "sum"), Transactions=("amount", "count"),
             Unique_Accounts=("primary_account_num", "nunique"),
         )
-        .sort_values("Spend", ascending=False).reset_index()
+        .sort_values("Spend", ascending=False).reset_index(drop=True)
     )
     cat_agg["Category"] = cat_agg["competitor_category"].map(CATEGORY_LABELS).fillna(cat_agg["competitor_category"])
     cat_agg["Spend %"] = (cat_agg["Spend"] / cat_agg["Spend"].sum() * 100).round(1)
@@ -175,8 +194,8 @@ def run(ctx: dict) -> dict:
         )
 
     cat_colors = [COMPETITOR_COLORS.get(c, COLORS["neutral"]) for c in cat_agg["competitor_category"]]
-    cat_fig = go.Figure()
-    cat_fig.add_trace(go.Bar(
+    cat_fig = FigureSpec()
+    cat_fig.add_trace(dict(type="bar",
         x=cat_agg["Category"], y=cat_agg["Spend"], marker_color=cat_colors,
         text=cat_agg["Spend"].apply(format_currency), textposition="outside",
         textfont=dict(size=10), name="Spend",
@@ -9,12 +9,16 @@
 import os
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
+from v4_figspec import FigureSpec
+from v4_incidence import cell_rows, column_accounts, column_mask, row_sums
 from v4_themes import (
     COLORS, COMPETITOR_COLORS, apply_theme, format_currency, format_pct,
     horizontal_bar, stacked_bar, heatmap, scatter_plot, insight_title,
 )
 
+SOURCES = ("transactions",)
+TXN_COLUMNS = ()
+
 CATEGORY_LABELS = {
     "big_nationals": "Big Nationals", "regionals": "Regionals",
     "credit_unions": "Credit Unions", "digital_banks": "Digital Banks",
@@ -39,15 +43,16 @@ def run(ctx: dict) -> dict:
     merch_col = "merchant_consolidated" if "merchant_consolidated" in comp.columns else "merchant_name"
     sections, sheets = [], []
 
-    # Build account-level segmentation foundation
-    acct_totals = df.groupby("primary_account_num")["amount"].sum().rename("total_spend")
-    comp_by_acct = comp.groupby(["primary_account_num", merch_col]).agg(
-        comp_spend=("amount", "sum"),
-    ).reset_index()
-    comp_acct_total = comp.groupby("primary_account_num")["amount"].sum().rename("competitor_spend")
+    # Build account-level segmentation foundation from the account x merchant
+    # incidence matrix: competitor spend is a row sum over competitor columns
+    inc = ctx["incidence"]
+    is_comp = column_mask(inc, comp[merch_col].unique())
+    acct_totals = pd.Series(row_sums(inc), index=inc["accounts"], name="total_spend")
 
-    acct_seg = pd.DataFrame({"total_spend": acct_totals}).join(comp_acct_total, how="left")
-    acct_seg["competitor_spend"] = acct_seg["competitor_spend"].fillna(0)
+    acct_seg = pd.DataFrame({
+        "total_spend": acct_totals,
+        "competitor_spend": row_sums(inc, columns=is_comp),
+    })
     acct_seg["cu_spend"] = acct_seg["total_spend"] - acct_seg["competitor_spend"]
     acct_seg["competitor_pct"] = np.where(
         acct_seg["total_spend"] > 0,
@@ -64,8 +69,9 @@ def run(ctx: dict) -> dict:
     ctx["s3_account_segments"] = acct_seg
 
     _segmentation_overview(acct_seg, sections, sheets)
-    _segmentation_by_competitor(comp, merch_col, acct_totals, sections, sheets)
-    _segmentation_heatmap(comp, merch_col, acct_totals, sections, sheets)
+    seg_counts = _competitor_segments(inc, is_comp, acct_totals)
+    _segmentation_by_competitor(seg_counts, sections, sheets)
+    _segmentation_heatmap(seg_counts, sections, sheets)
     _at_risk_accounts(acct_seg, sections, sheets)
     _spend_scatter(acct_seg, sections, sheets)
     _spend_comparison(acct_seg, sections, sheets)
@@ -98,7 +104,7 @@ def _segmentation_overview(acct_seg, sections, sheets):
     ]
 
     colors = [SEG_COLORS[s] for s in tbl["Segment"]]
-    fig = go.Figure(go.Bar(
+    fig = FigureSpec(dict(type="bar",
         x=tbl["Segment"], y=tbl["Accounts"], marker_color=colors,
         text=[f"{a:,}<br>({p}%)" for a, p in zip(tbl["Accounts"], tbl["% of Total"])],
         textposition="outside",
@@ -132,32 +138,37 @@ def _segmentation_overview(acct_seg, sections, sheets):
     })
 
 
-def _segmentation_by_competitor(comp, merch_col, acct_totals, sections, sheets):
+def _competitor_segments(inc, is_comp, acct_totals):
+    """Accounts per segment for the top 15 competitors by account count.
+
+    An account's segment at a competitor comes from its wallet share there
+    (the competitor's cell over the account's total spend).
+    """
+    cells = np.flatnonzero(is_comp[inc["indices"]])
+    cols = inc["indices"][cells]
+    total = acct_totals.to_numpy()[cell_rows(inc)[cells]]
+    comp_pct = np.divide(inc["spend"][cells], total,
+                         out=np.zeros(len(cells)), where=total > 0) * 100
+    segment = pd.cut(comp_pct, bins=[-0.01, 25, 50, 100.01], labels=False)
+
+    comp_totals = pd.Series(column_accounts(inc)[is_comp], index=inc["merchants"][is_comp])
+    top_15 = comp_totals.sort_values(ascending=False).head(15).index
+    rank = np.full(len(inc["merchants"]), -1)
+    rank[inc["merchants"].get_indexer(top_15)] = np.arange(len(top_15))
+    keep = (rank[cols] >= 0) & ~np.isnan(segment)
+    counts = np.bincount(rank[cols[keep]] * 3 + segment[keep].astype(np.int64),
+                         minlength=len(top_15) * 3).reshape(-1, 3)
+    return pd.DataFrame(counts[:, ::-1], index=top_15,
+                        columns=pd.Index(["Competitor-Heavy", "Balanced", "CU-Focused"],
+                                         name="segment"))
+
+
+def _segmentation_by_competitor(seg_counts, sections, sheets):
     """Stacked bar of CU-Focused/Balanced/Competitor-Heavy per top 15 competitors."""
-    per_comp_acct = comp.groupby([merch_col, "primary_account_num"])["amount"].sum().reset_index()
-    per_comp_acct["total_spend"] = per_comp_acct["primary_account_num"].map(acct_totals)
-    per_comp_acct["comp_pct"] = np.where(
-        per_comp_acct["total_spend"] > 0,
-        per_comp_acct["amount"] / per_comp_acct["total_spend"] * 100, 0,
-    )
-    per_comp_acct["segment"] = pd.cut(
-        per_comp_acct["comp_pct"], bins=[-0.01, 25, 50, 100.01],
-        labels=["CU-Focused", "Balanced", "Competitor-Heavy"],
-    )
-
-    comp_totals = per_comp_acct.groupby(merch_col)["primary_account_num"].nunique()
-    top_15 = comp_totals.sort_values(ascending=False).head(15).index.tolist()
-    filtered = per_comp_acct[per_comp_acct[merch_col].isin(top_15)]
-
-    pivot = (filtered.groupby([merch_col, "segment"]).size()
-             .unstack(fill_value=0).reindex(top_15))
+    pivot = seg_counts
     pivot_pct = pivot.div(pivot.sum(axis=1), axis=0).mul(100).round(1)
-    for s in ["CU-Focused", "Balanced", "Competitor-Heavy"]:
-        if s not in pivot_pct.columns:
-            pivot_pct[s] = 0.0
-    pivot_pct = pivot_pct[["Competitor-Heavy", "Balanced", "CU-Focused"]]
 
-    chart_df = pivot_pct.reset_index().rename(columns={merch_col: "Competitor"})
+    chart_df = pivot_pct.reset_index().rename(columns={pivot.index.name: "Competitor"})
     chart_df["Competitor"] = chart_df["Competitor"].astype(str).str[:35]
 
     fig = stacked_bar(
@@ -180,29 +191,9 @@ def _segmentation_by_competitor(comp, merch_col, acct_totals, sections, sheets):
     })
 
 
-def _segmentation_heatmap(comp, merch_col, acct_totals, sections, sheets):
+def _segmentation_heatmap(seg_counts, sections, sheets):
     """Risk-colored heatmap: competitors x segments with account counts."""
-    per_comp_acct = comp.groupby([merch_col, "primary_account_num"])["amount"].sum().reset_index()
-    per_comp_acct["total_spend"] = per_comp_acct["primary_account_num"].map(acct_totals)
-    per_comp_acct["comp_pct"] = np.where(
-        per_comp_acct["total_spend"] > 0,
-        per_comp_acct["amount"] / per_comp_acct["total_spend"] * 100, 0,
-    )
-    per_comp_acct["segment"] = pd.cut(
-        per_comp_acct["comp_pct"], bins=[-0.01, 25, 50, 100.01],
-        labels=["CU-Focused", "Balanced", "Competitor-Heavy"],
-    )
-
-    comp_totals = per_comp_acct.groupby(merch_col)["primary_account_num"].nunique()
-    top_15 = comp_totals.sort_values(ascending=False).head(15).index.tolist()
-    filtered = per_comp_acct[per_comp_acct[merch_col].isin(top_15)]
-
-    pivot = (filtered.groupby([merch_col, "segment"]).size()
-             .unstack(fill_value=0).reindex(top_15))
-    for s in ["CU-Focused", "Balanced", "Competitor-Heavy"]:
-        if s not in pivot.columns:
-            pivot[s] = 0
-    pivot = pivot[["Competitor-Heavy", "Balanced", "CU-Focused"]]
+    pivot = seg_counts.copy()
     pivot.index = [str(c)[:35] for c in pivot.index]
 
     fig = heatmap(pivot, "Account Segmentation Heatmap", colorscale="RdYlGn_r")
@@ -250,7 +241,7 @@ def _at_risk_accounts(acct_seg, sections, sheets):
     )
     bucket_counts = buckets.value_counts().reindex(["80-85%", "85-90%", "90-95%", "95-100%"]).fillna(0)
 
-    fig = go.Figure(go.Bar(
+    fig = FigureSpec(dict(type="bar",
         x=bucket_counts.index.tolist(), y=bucket_counts.values.tolist(),
         marker_color=[COLORS["accent"], COLORS["accent"], COLORS["negative"], COLORS["negative"]],
         text=[f"{int(v):,}" for v in bucket_counts.values],
@@ -340,12 +331,12 @@ def _spend_comparison(acct_seg, sections, sheets):
     top_20 = top_20.reset_index()
     top_20["label"] = top_20["primary_account_num"].astype(str).str[:12]
 
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
+    fig = FigureSpec()
+    fig.add_trace(dict(type="bar",
         name="Competitor Spend", y=top_20["label"], x=top_20["competitor_spend"],
         orientation="h", marker_color=COLORS["negative"],
     ))
-    fig.add_trace(go.Bar(
+    fig.add_trace(dict(type="bar",
         name="CU Spend", y=top_20["label"], x=top_20["cu_spend"],
         orientation="h", marker_color=COLORS["positive"],
     ))
@@ -7,11 +7,15 @@
 
 import pandas as pd
 import numpy as np
+from v4_backend import distinct_count
 from v4_themes import (
     COLORS, COMPETITOR_COLORS, apply_theme, format_currency,
     horizontal_bar, grouped_bar, insight_title,
 )
 
+SOURCES = ("transactions",)
+TXN_COLUMNS = ()
+
 CATEGORY_LABELS = {
     "big_nationals": "Big Nationals", "regionals": "Regionals",
     "credit_unions": "Credit Unions", "digital_banks": "Digital Banks",
@@ -29,7 +33,7 @@ def run(ctx: dict) -> dict:
         return {"title": "S3B: Threat Intelligence", "description": "No competitor data",
                 "sections": [], "sheets": []}
 
-    total_accounts = df["primary_account_num"].nunique()
+    total_accounts = distinct_count(ctx, df["primary_account_num"])
     merch_col = "merchant_consolidated" if "merchant_consolidated" in comp.columns else "merchant_name"
     sections, sheets = [], []
 
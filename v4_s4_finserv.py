@@ -6,7 +6,9 @@
 
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
+from v4_backend import distinct_count
+from v4_figspec import FigureSpec
+from v4_incidence import collapse_columns, cooccurrence, row_sums
 from v4_themes import (
     CATEGORY_PALETTE,
     COLORS,
@@ -20,6 +22,9 @@ from v4_themes import (
     stacked_bar,
 )
 
+SOURCES = ("transactions",)
+TXN_COLUMNS = ()
+
 # Display-friendly names for config keys
 _CATEGORY_LABELS = {
     "auto_loans": "Auto Loans",
@@ -32,6 +37,11 @@ _CATEGORY_LABELS = {
     "treasury_bonds": "Treasury/Bonds",
 }
 
+
+def _category_label(config_key):
+    """Display label of a ``financial_services`` config key."""
+    return _CATEGORY_LABELS.get(config_key, config_key.replace("_", " ").title())
+
 # Value tier thresholds (dollars)
 _HIGH_VALUE_THRESHOLD = 10_000
 _MEDIUM_VALUE_THRESHOLD = 1_000
@@ -54,7 +64,12 @@ def run(ctx: dict) -> dict:
     )
 
     # --- 1. Detection ---
-    df = _detect_finserv(df, merch_col, finserv_config)
+    # The patterns only look at the merchant name: tag each column of the
+    # account x merchant incidence matrix once and map the tags to the rows
+    inc = ctx["incidence"]
+    merchants = pd.DataFrame({merch_col: inc["merchants"]})
+    merchant_cats = _detect_finserv(merchants, merch_col, finserv_config)["finserv_category"]
+    df["finserv_category"] = merchant_cats.to_numpy()[inc["merchants"].get_indexer(df[merch_col])]
     fs_df = df[df["finserv_category"].notna()].copy()
 
     if fs_df.empty:
@@ -79,7 +94,7 @@ def run(ctx: dict) -> dict:
         }
 
     # --- 2. Summary ---
-    summary_section, summary_sheet = _finserv_summary(df, fs_df, merch_col)
+    summary_section, summary_sheet = _finserv_summary(df, fs_df, merch_col, ctx)
     sections.append(summary_section)
     sheets.append(summary_sheet)
 
@@ -100,7 +115,12 @@ def run(ctx: dict) -> dict:
             sections.append(gen_section)
 
     # --- 6. Cross-Category Analysis ---
-    cross_section, cross_sheet = _cross_category_analysis(fs_df)
+    # Account x category incidence: the merchant columns summed per category
+    categories = sorted(fs_df["finserv_category"].unique())
+    acct_cats = collapse_columns(
+        inc, pd.Index(categories).get_indexer(merchant_cats.fillna("")), categories
+    )
+    cross_section, cross_sheet = _cross_category_analysis(acct_cats)
     sections.append(cross_section)
     if cross_sheet is not None:
         sheets.append(cross_sheet)
@@ -111,7 +131,7 @@ def run(ctx: dict) -> dict:
     sheets.append(opp_sheet)
 
     # --- 8. Category Affinity Matrix ---
-    affinity_result = _category_affinity_matrix(fs_df)
+    affinity_result = _category_affinity_matrix(acct_cats)
     if affinity_result is not None:
         affinity_section, affinity_sheet = affinity_result
         sections.append(affinity_section)
@@ -140,13 +160,13 @@ def _detect_finserv(df, merch_col, finserv_config):
     Uses substring matching against uppercased merchant names.
     First match wins; rows with no match get NaN.
     """
-    df["finserv_category"] = np.nan
+    df["finserv_category"] = pd.Series(np.nan, index=df.index, dtype=object)
     merchant_upper = df[merch_col].str.upper().fillna("")
 
     for config_key, patterns in finserv_config.items():
         if not patterns:
             continue
-        label = _CATEGORY_LABELS.get(config_key, config_key.replace("_", " ").title())
+        label = _category_label(config_key)
         mask = merchant_upper.apply(
             lambda m: any(p in m for p in (pat.upper() for pat in patterns))
         )
@@ -162,14 +182,14 @@ def _detect_finserv(df, merch_col, finserv_config):
 # =============================================================================
 
 
-def _finserv_summary(df, fs_df, merch_col):
+def _finserv_summary(df, fs_df, merch_col, ctx):
     """Overall FinServ summary with donut chart by category."""
     total_spend = df["amount"].sum()
     fs_spend = fs_df["amount"].sum()
     fs_pct = (fs_spend / total_spend * 100) if total_spend > 0 else 0
-    fs_accounts = fs_df["primary_account_num"].nunique()
+    fs_accounts = distinct_count(ctx, fs_df["primary_account_num"])
     fs_txns = len(fs_df)
-    total_accounts = df["primary_account_num"].nunique()
+    total_accounts = distinct_count(ctx, df["primary_account_num"])
     acct_pct = (fs_accounts / total_accounts * 100) if total_accounts > 0 else 0
 
     # Category breakdown
@@ -461,27 +481,34 @@ def _generation_profile(fs_df):
 # =============================================================================
 
 
-def _cross_category_analysis(fs_df):
-    """How many accounts use multiple FinServ categories?"""
-    acct_cats = (
-        fs_df.groupby("primary_account_num")["finserv_category"]
-        .nunique()
-        .reset_index()
-        .rename(columns={"finserv_category": "Categories Used"})
-    )
+def _cross_category_analysis(acct_cats):
+    """How many accounts use multiple FinServ categories?
 
-    dist = acct_cats["Categories Used"].value_counts().sort_index().reset_index()
+    *acct_cats* is the account x category incidence matrix; an account's
+    categories are its non-empty cells.
+    """
+    used = np.flatnonzero(np.diff(acct_cats["indptr"]) > 0)
+    acct_spend = pd.DataFrame({
+        "primary_account_num": acct_cats["accounts"][used],
+        "Categories Used": np.diff(acct_cats["indptr"])[used].astype(np.int64),
+        "Total_FinServ_Spend": row_sums(acct_cats)[used],
+        "FinServ_Txns": row_sums(acct_cats, "count")[used].astype(np.int64),
+        "row": used,
+    })
+    cats_used = acct_spend["Categories Used"]
+
+    dist = cats_used.value_counts().sort_index().reset_index()
     dist.columns = ["Categories Used", "Accounts"]
     dist["% of FinServ Accounts"] = (dist["Accounts"] / dist["Accounts"].sum() * 100).round(1)
 
-    multi_count = int(acct_cats[acct_cats["Categories Used"] >= 2].shape[0])
-    total_fs_accounts = int(acct_cats.shape[0])
+    multi_count = int((cats_used >= 2).sum())
+    total_fs_accounts = len(cats_used)
     multi_pct = (multi_count / total_fs_accounts * 100) if total_fs_accounts > 0 else 0
 
     # Build a bar chart of distribution
-    fig = go.Figure()
+    fig = FigureSpec()
     fig.add_trace(
-        go.Bar(
+        dict(type="bar",
             x=dist["Categories Used"],
             y=dist["Accounts"],
             marker_color=COLORS["accent"],
@@ -511,17 +538,16 @@ def _cross_category_analysis(fs_df):
     multi_detail = None
     sheet = None
     if multi_count > 0:
-        multi_accts = acct_cats[acct_cats["Categories Used"] >= 2].copy()
-        # Get spend and category list per account
-        acct_spend = fs_df.groupby("primary_account_num").agg(
-            Total_FinServ_Spend=("amount", "sum"),
-            FinServ_Txns=("amount", "count"),
-            Categories=("finserv_category", lambda x: ", ".join(sorted(x.unique()))),
-        )
+        multi_accts = acct_spend[acct_spend["Categories Used"] >= 2].reset_index(drop=True)
+        multi_detail = multi_accts.sort_values("Categories Used", ascending=False).head(50).copy()
+        # Category list of the listed accounts only
+        groups, indptr = acct_cats["groups"], acct_cats["indptr"]
+        multi_detail["Categories"] = [
+            ", ".join(groups[acct_cats["indices"][indptr[r]:indptr[r + 1]]])
+            for r in multi_detail.pop("row")
+        ]
         multi_detail = (
-            multi_accts.merge(acct_spend, on="primary_account_num", how="left")
-            .sort_values("Categories Used", ascending=False)
-            .head(50)
+            multi_detail
             .rename(
                 columns={
                     "primary_account_num": "Account",
@@ -710,36 +736,22 @@ def _opportunity_scoring(fs_df):
 # =============================================================================
 
 
-def _category_affinity_matrix(fs_df):
+def _category_affinity_matrix(acct_cats):
     """Co-occurrence matrix for accounts using 2+ FinServ categories.
 
-    For each pair of categories, counts how many accounts use both.
+    For each pair of categories, counts how many accounts use both
+    (``B.T @ B`` of the account x category incidence matrix); the diagonal
+    holds the accounts in each category.
     Returns None if fewer than 2 categories have overlapping accounts.
     """
-    # Build account-to-categories mapping
-    acct_cats = fs_df.groupby("primary_account_num")["finserv_category"].apply(set)
-
-    # Keep only accounts with 2+ categories
-    multi_accts = acct_cats[acct_cats.apply(len) >= 2]
-    if multi_accts.empty:
+    if not (np.diff(acct_cats["indptr"]) >= 2).any():
         return None
 
-    all_categories = sorted(fs_df["finserv_category"].unique())
+    all_categories = list(acct_cats["groups"])
     if len(all_categories) < 2:
         return None
 
-    # Build the co-occurrence matrix
-    matrix = pd.DataFrame(0, index=all_categories, columns=all_categories)
-    for cats in multi_accts:
-        cat_list = sorted(cats)
-        for i, cat_a in enumerate(cat_list):
-            for cat_b in cat_list[i + 1:]:
-                matrix.loc[cat_a, cat_b] += 1
-                matrix.loc[cat_b, cat_a] += 1
-
-    # Set diagonal to per-category account counts (total accounts in each category)
-    for cat in all_categories:
-        matrix.loc[cat, cat] = int(acct_cats.apply(lambda s: cat in s).sum())
+    matrix = cooccurrence(acct_cats)
 
     # Drop categories with zero co-occurrences (all off-diagonal zeros)
     off_diag_sums = matrix.sum(axis=1) - np.diag(matrix.values)
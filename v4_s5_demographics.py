@@ -5,16 +5,18 @@
 
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
+from v4_figspec import FigureSpec
 from v4_themes import (
     COLORS, CATEGORY_PALETTE, GENERATION_COLORS,
     apply_theme, format_currency, format_pct,
     horizontal_bar, donut_chart, grouped_bar, scatter_plot, heatmap,
 )
+from v4_data_loader import get_odd_timeseries, ts_column, ts_latest
 
-# Named constants for tenure bucket boundaries
-TENURE_BINS = [0, 1, 3, 5, 10, float("inf")]
-TENURE_LABELS = ["0-1 yr", "1-3 yrs", "3-5 yrs", "5-10 yrs", "10+ yrs"]
+SOURCES = ("transactions", "odd")
+TXN_COLUMNS = ()
+
+# Tenure and age bands are derived at load time (v4_data_loader.ODD_FEATURE_BINS)
 TOP_BRANCHES = 20
 HEATMAP_BRANCHES = 15
 
@@ -215,9 +217,10 @@ def run(ctx: dict) -> dict:
                 })
 
     # --- 10. Segmentation Ladder ---
-    seg_col = _find_segmentation_col(odd)
-    if seg_col:
-        result = _safe("Segmentation Ladder", _segmentation_ladder, odd, seg_col)
+    seg = _latest_segmentation(get_odd_timeseries(ctx), odd)
+    if seg is not None:
+        seg_col = seg.name
+        result = _safe("Segmentation Ladder", _segmentation_ladder, seg)
         if result is not None:
             seg_df, seg_fig = result
             if seg_df is not None:
@@ -303,7 +306,7 @@ def _generation_distribution(odd, df):
     acct_spend = acct_spend.reset_index().sort_values("Avg Spend/Acct", ascending=False)
 
     bar_colors = [GENERATION_COLORS.get(g, COLORS["neutral"]) for g in acct_spend["generation"]]
-    bar_fig = go.Figure(go.Bar(
+    bar_fig = FigureSpec(dict(type="bar",
         x=acct_spend["generation"],
         y=acct_spend["Avg Spend/Acct"],
         marker_color=bar_colors,
@@ -384,9 +387,7 @@ def _tenure_analysis(odd, df):
     if tenure.empty:
         return pd.DataFrame(), []
 
-    odd["Tenure Bucket"] = pd.cut(
-        odd["tenure_years"], bins=TENURE_BINS, labels=TENURE_LABELS, right=False,
-    )
+    odd["Tenure Bucket"] = odd["tenure_band"]
 
     bucket_stats = odd.groupby("Tenure Bucket", observed=True).agg(
         accounts=("Acct Number", "nunique"),
@@ -401,10 +402,8 @@ def _tenure_analysis(odd, df):
 
     # Avg spend per account by tenure bucket
     df_t = df.copy()
-    if "tenure_years" in df_t.columns:
-        df_t["Tenure Bucket"] = pd.cut(
-            df_t["tenure_years"], bins=TENURE_BINS, labels=TENURE_LABELS, right=False,
-        )
+    if "tenure_band" in df_t.columns:
+        df_t["Tenure Bucket"] = df_t["tenure_band"]
         spend_by_bucket = df_t.groupby("Tenure Bucket", observed=True).agg(
             total=("amount", "sum"),
             accts=("primary_account_num", "nunique"),
@@ -422,7 +421,7 @@ def _tenure_analysis(odd, df):
         bucket_stats["Avg Spend per Account"] = 0
 
     # Distribution bar chart
-    dist_fig = go.Figure(go.Bar(
+    dist_fig = FigureSpec(dict(type="bar",
         x=bucket_stats["Tenure Bucket"].astype(str),
         y=bucket_stats["Accounts"],
         marker_color=COLORS["primary"],
@@ -437,7 +436,7 @@ def _tenure_analysis(odd, df):
     dist_fig = apply_theme(dist_fig)
 
     # Spend by tenure bar
-    spend_fig = go.Figure(go.Bar(
+    spend_fig = FigureSpec(dict(type="bar",
         x=bucket_stats["Tenure Bucket"].astype(str),
         y=bucket_stats["Avg Spend per Account"],
         marker_color=COLORS["secondary"],
@@ -628,7 +627,7 @@ def _product_mix(odd, df):
         )
         prod_spend = prod_spend.sort_values("Avg Spend/Acct", ascending=False)
 
-        bar_fig = go.Figure(go.Bar(
+        bar_fig = FigureSpec(dict(type="bar",
             x=prod_spend["Prod Desc"].astype(str).str[:30],
             y=prod_spend["Avg Spend/Acct"],
             marker_color=COLORS["accent"],
@@ -674,21 +673,16 @@ def _product_narrative(prod_df):
 # 8. Age Distribution Histogram
 # =============================================================================
 
-AGE_BINS = [0, 25, 35, 45, 55, 65, 200]
-AGE_LABELS = ["18-25", "26-35", "36-45", "46-55", "56-65", "65+"]
-
-
 def _age_distribution(odd):
-    ages = odd["Account Holder Age"].dropna()
-    if ages.empty:
+    if odd["Account Holder Age"].dropna().empty or odd["age_band"].isna().all():
         return None, None
-    buckets = pd.cut(ages, bins=AGE_BINS, labels=AGE_LABELS, right=True)
-    counts = buckets.value_counts().reindex(AGE_LABELS, fill_value=0).reset_index()
+    buckets = odd["age_band"]
+    counts = buckets.value_counts().reindex(buckets.cat.categories, fill_value=0).reset_index()
     counts.columns = ["Age Band", "Accounts"]
     total = counts["Accounts"].sum()
     counts["% of Total"] = (counts["Accounts"] / total * 100).round(1) if total else 0
 
-    fig = go.Figure(go.Bar(
+    fig = FigureSpec(dict(type="bar",
         x=counts["Age Band"], y=counts["Accounts"],
         marker_color=CATEGORY_PALETTE[:len(counts)],
         text=[f"{v:,}" for v in counts["Accounts"]],
@@ -725,9 +719,9 @@ def _balance_tier_demographics(odd):
     ct_pct = ct_pct.T.reset_index()
 
     tier_cols = [c for c in ct_pct.columns if c != "generation"]
-    fig = go.Figure()
+    fig = FigureSpec()
     for i, tier in enumerate(tier_cols):
-        fig.add_trace(go.Bar(
+        fig.add_trace(dict(type="bar",
             x=ct_pct["generation"], y=ct_pct[tier],
             name=str(tier),
             marker_color=CATEGORY_PALETTE[i % len(CATEGORY_PALETTE)],
@@ -748,22 +742,17 @@ def _balance_tier_demographics(odd):
 # 10. Segmentation Ladder
 # =============================================================================
 
-import re as _re
-
-_SEG_COLS_RE = _re.compile(r"^[A-Z][a-z]{2}\d{2} Segmentation$")
-
-
-def _find_segmentation_col(odd):
-    """Return the most recent segmentation column, or None."""
-    seg_cols = sorted(
-        [c for c in odd.columns if _SEG_COLS_RE.match(c)],
-        key=lambda c: c[:5],
-    )
-    return seg_cols[-1] if seg_cols else None
+def _latest_segmentation(ts, odd):
+    """Return the most recent month's segmentation (named by its column), or None."""
+    period = ts_latest(ts, "segmentation")
+    if period is None:
+        return None
+    return ts_column(ts, "segmentation", period, index=odd.index)
 
 
-def _segmentation_ladder(odd, seg_col):
-    vals = odd[seg_col].dropna().astype(str).str.strip()
+def _segmentation_ladder(seg):
+    seg_col = seg.name
+    vals = seg.dropna().astype(str).str.strip()
     vals = vals[vals != ""]
     if vals.empty:
         return None, None
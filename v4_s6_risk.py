@@ -3,11 +3,16 @@
 
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
+from v4_figspec import FigureSpec
 from v4_themes import (
     COLORS, CATEGORY_PALETTE, GENERATION_COLORS, apply_theme, format_currency,
     stacked_bar, donut_chart, grouped_bar, scatter_plot,
 )
+from v4_backend import group_agg
+from v4_data_loader import get_odd_timeseries, ts_column, ts_latest
+
+SOURCES = ("transactions", "odd")
+TXN_COLUMNS = ()
 
 TIER_ORDER = ["Low", "Medium", "High", "Very High"]
 
@@ -15,13 +20,15 @@ TIER_ORDER = ["Low", "Medium", "High", "Very High"]
 def run(ctx: dict) -> dict:
     """Run Risk & Balance Correlation analyses."""
     df, odd = ctx["combined_df"], ctx["odd_df"]
+    ts = get_odd_timeseries(ctx)
+    acct = _acct_spend(ctx)
     sections, sheets = [], []
-    _balance_tiers(odd, df, sections, sheets)
-    _balance_vs_spend(df, odd, sections, sheets)
-    _reg_e_status(odd, df, sections, sheets)
-    _od_limit(odd, df, sections, sheets)
+    _balance_tiers(odd, acct, sections, sheets)
+    _balance_vs_spend(acct, odd, sections, sheets)
+    _reg_e_status(odd, ts, acct, sections, sheets)
+    _od_limit(odd, ts, acct, sections, sheets)
     _spend_velocity(df, sections, sheets)
-    _inactive(odd, sections, sheets)
+    _inactive(odd, ts, sections, sheets)
     return {
         "title": "S6: Risk & Balance Correlation",
         "description": "Balance tiers, balance-spend correlation, Reg E, OD limits, spend velocity, inactive accounts",
@@ -30,23 +37,29 @@ def run(ctx: dict) -> dict:
     }
 
 
-def _latest_col(odd: pd.DataFrame, suffix: str) -> str | None:
-    matches = sorted(c for c in odd.columns if suffix in c)
-    return matches[-1] if matches else None
+def _latest(ts: dict, odd: pd.DataFrame, series: str) -> tuple[str | None, pd.Series | None]:
+    """Most recent month of an ODD time series: (source column name, values)."""
+    period = ts_latest(ts, series)
+    if period is None:
+        return None, None
+    vals = ts_column(ts, series, period, index=odd.index)
+    return vals.name, vals
 
 
 def _sdiv(n: float, d: float) -> float:
     return n / d if d else 0.0
 
 
-def _acct_spend(df: pd.DataFrame) -> pd.DataFrame:
-    return df.groupby("primary_account_num").agg(
+def _acct_spend(ctx: dict) -> pd.DataFrame:
+    """Per-account total spend and transaction count, shared by the sections below."""
+    return group_agg(
+        ctx, "combined_df", "primary_account_num",
         total_spend=("amount", "sum"), txn_count=("amount", "count"),
-    ).reset_index()
+    )
 
 
 def _simple_bar(x, y, title, colors=None):
-    fig = go.Figure(go.Bar(
+    fig = FigureSpec(dict(type="bar",
         x=x, y=y, marker_color=colors or CATEGORY_PALETTE[:len(x)],
         text=[format_currency(v) for v in y], textposition="outside",
     ))
@@ -56,7 +69,7 @@ def _simple_bar(x, y, title, colors=None):
 
 # -- 1. Balance Tier Distribution ---------------------------------------------
 
-def _balance_tiers(odd, df, sections, sheets):
+def _balance_tiers(odd, acct, sections, sheets):
     if "balance_tier" not in odd.columns:
         return
     counts = odd["balance_tier"].value_counts().reindex(TIER_ORDER).fillna(0)
@@ -67,7 +80,6 @@ def _balance_tiers(odd, df, sections, sheets):
     fig1 = apply_theme(donut_chart(counts.index.tolist(), counts.values.tolist(),
                                     "Account Distribution by Balance Tier"))
 
-    acct = _acct_spend(df)
     merged = acct.merge(odd[["Acct Number", "balance_tier"]],
                         left_on="primary_account_num", right_on="Acct Number", how="inner")
     avg_spend = merged.groupby("balance_tier")["total_spend"].mean().reindex(TIER_ORDER).fillna(0)
@@ -95,10 +107,9 @@ def _balance_tiers(odd, df, sections, sheets):
 
 # -- 2. Balance vs Spend Correlation ------------------------------------------
 
-def _balance_vs_spend(df, odd, sections, sheets):
+def _balance_vs_spend(acct, odd, sections, sheets):
     if "Avg Bal" not in odd.columns:
         return
-    acct = _acct_spend(df)
     merged = acct.merge(odd[["Acct Number", "Avg Bal", "generation"]].dropna(subset=["Avg Bal"]),
                         left_on="primary_account_num", right_on="Acct Number", how="inner")
     if merged.empty:
@@ -121,17 +132,16 @@ def _balance_vs_spend(df, odd, sections, sheets):
 
 # -- 3. Reg E Status Analysis -------------------------------------------------
 
-def _reg_e_status(odd, df, sections, sheets):
-    col = _latest_col(odd, "Reg E Code")
+def _reg_e_status(odd, ts, acct, sections, sheets):
+    col, raw = _latest(ts, odd, "reg_e_code")
     if col is None:
         return
-    status = odd[col].fillna("Unknown").astype(str).str.strip()
+    status = raw.astype(object).fillna("Unknown").astype(str).str.strip()
     counts = status.value_counts()
 
     fig1 = apply_theme(donut_chart(counts.index.tolist(), counts.values.tolist(),
                                     f"Reg E Opt-In Status ({col})"))
 
-    acct = _acct_spend(df)
     merged = acct.merge(odd[["Acct Number"]].assign(reg_e=status),
                         left_on="primary_account_num", right_on="Acct Number", how="inner")
     by_status = (merged.groupby("reg_e")
@@ -156,19 +166,17 @@ def _reg_e_status(odd, df, sections, sheets):
 
 # -- 4. OD Limit Analysis -----------------------------------------------------
 
-def _od_limit(odd, df, sections, sheets):
-    col = _latest_col(odd, "OD Limit")
-    if col is None:
+def _od_limit(odd, ts, acct, sections, sheets):
+    col, _ = _latest(ts, odd, "od_limit")
+    if col is None or "od_limit_band" not in odd.columns or odd["od_limit_band"].isna().all():
         return
-    vals = pd.to_numeric(odd[col], errors="coerce").fillna(0)
-    labels = ["$0", "$1-250", "$251-500", "$501-1000", "$1000+"]
-    buckets = pd.cut(vals, bins=[-1, 0, 250, 500, 1000, float("inf")], labels=labels)
+    buckets = odd["od_limit_band"]
+    labels = list(buckets.cat.categories)
     counts = buckets.value_counts().reindex(labels).fillna(0)
 
     fig1 = apply_theme(donut_chart(counts.index.tolist(), counts.values.tolist(),
                                     f"OD Limit Distribution ({col})"))
 
-    acct = _acct_spend(df)
     merged = acct.merge(odd[["Acct Number"]].assign(od_bucket=buckets),
                         left_on="primary_account_num", right_on="Acct Number", how="inner")
     by_od = (merged.groupby("od_bucket", observed=True)
@@ -232,15 +240,15 @@ def _spend_velocity(df, sections, sheets):
 
 # -- 6. Inactive Account Analysis ---------------------------------------------
 
-def _inactive(odd, sections, sheets):
-    spend_col = _latest_col(odd, "Spend")
+def _inactive(odd, ts, sections, sheets):
+    spend_col, spend = _latest(ts, odd, "spend")
     if "Debit?" in odd.columns:
         no_debit = odd["Debit?"].astype(str).str.strip().str.upper().isin(["NO", "N"])
     else:
         no_debit = pd.Series(False, index=odd.index)
 
     if spend_col:
-        zero_spend = pd.to_numeric(odd[spend_col], errors="coerce").fillna(0) == 0
+        zero_spend = spend.fillna(0) == 0
         is_inactive = no_debit | zero_spend
     else:
         is_inactive = no_debit
@@ -262,8 +270,8 @@ def _inactive(odd, sections, sheets):
                           colors=[GENERATION_COLORS.get(g, COLORS["neutral"]) for g in gens])
     elif has_tier:
         tc = inactive["balance_tier"].value_counts().reindex(TIER_ORDER).fillna(0)
-        fig = go.Figure(go.Bar(x=tc.index.tolist(), y=tc.values.tolist(),
-                                marker_color=CATEGORY_PALETTE[:len(tc)]))
+        fig = FigureSpec(dict(type="bar", x=tc.index.tolist(), y=tc.values.tolist(),
+                              marker_color=CATEGORY_PALETTE[:len(tc)]))
         fig.update_layout(title="Inactive Accounts by Balance Tier", showlegend=False)
     else:
         fig = None
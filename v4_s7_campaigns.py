@@ -5,23 +5,22 @@
 
 from __future__ import annotations
 
-import re
-
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 
+from v4_figspec import FigureSpec
 from v4_themes import (
     COLORS, CATEGORY_PALETTE, GENERATION_COLORS,
     apply_theme, format_currency, horizontal_bar,
     grouped_bar, donut_chart, insight_title,
 )
+from v4_data_loader import (
+    get_odd_timeseries, ts_column, ts_month_label, ts_months, ts_window,
+)
+
+SOURCES = ("odd",)
+TXN_COLUMNS = ()
 
-_MAIL_RE = re.compile(r"^[A-Z][a-z]{2}\d{2} Mail$")
-_RESP_RE = re.compile(r"^[A-Z][a-z]{2}\d{2} Resp$")
-_SEG_RE = re.compile(r"^[A-Z][a-z]{2}\d{2} Segmentation$")
-_SPEND_RE = re.compile(r"^[A-Z][a-z]{2}\d{2} Spend$")
-_SWIPE_RE = re.compile(r"^[A-Z][a-z]{2}\d{2} Swipes$")
 _MIN_GROUP = 5
 
 _MONTH_MAP = {
@@ -36,43 +35,33 @@ def _parse_month(label: str) -> tuple[int, int]:
     return _MONTH_MAP[label[:3]], 2000 + int(label[3:5])
 
 
-def _month_sort_key(label: str) -> tuple[int, int]:
+def _shift_month(label: str, n: int) -> str:
+    """Return the month label *n* months after *label* (negative = before)."""
     m, y = _parse_month(label)
-    return (y, m)
+    idx = y * 12 + (m - 1) + n
+    return f"{_INV_MONTH[idx % 12 + 1]}{idx // 12 - 2000:02d}"
 
 
 def _next_month(label: str) -> str:
     """Return the month label following *label* (e.g. 'Apr25' -> 'May25')."""
-    m, y = _parse_month(label)
-    m += 1
-    if m > 12:
-        m, y = 1, y + 1
-    return f"{_INV_MONTH[m]}{y - 2000:02d}"
+    return _shift_month(label, 1)
 
 
-def _detect_spend_swipe_cols(odd: pd.DataFrame):
+def _spend_swipe_months(ts: dict) -> list[str]:
     """Return sorted month labels that have both Spend and Swipes columns."""
-    spend_months = {c.replace(" Spend", "") for c in odd.columns if _SPEND_RE.match(c)}
-    swipe_months = {c.replace(" Swipes", "") for c in odd.columns if _SWIPE_RE.match(c)}
-    common = sorted(spend_months & swipe_months, key=_month_sort_key)
-    return common
+    common = set(ts_months(ts, "spend")) & set(ts_months(ts, "swipes"))
+    return [ts_month_label(p) for p in sorted(common)]
 
 
-def _classify_responders(offer_accounts, resp_col, offer_val):
-    """Split *offer_accounts* into (responders, non_responders) DataFrames.
+_NU_NON_RESPONSE = r"NU [1-4]"
+_REL_MONTHS = range(-3, 4)
 
-    For NU offers, NU 1-4 counts as non-response.
-    """
-    if "NU" in str(offer_val):
-        mask = (
-            offer_accounts[resp_col].notna()
-            & ~offer_accounts[resp_col].astype(str).str.contains(
-                r"NU [1-4]", na=False, regex=True
-            )
-        )
-    else:
-        mask = offer_accounts[resp_col].notna()
-    return offer_accounts[mask], offer_accounts[~mask]
+
+def _count_equal(ts: dict, series: str, period, value) -> int:
+    """Accounts whose coded *series* equals *value* in *period*."""
+    hit = np.flatnonzero(ts["categories"][series] == value)
+    codes = ts["codes"][series][:, (period - ts["months"][0]).n]
+    return int(np.isin(codes, hit).sum())
 
 
 def _rate(num: int, den: int) -> float:
@@ -80,17 +69,106 @@ def _rate(num: int, den: int) -> float:
     return round(num / den * 100, 1) if den else 0.0
 
 
-def _has_campaign_data(odd: pd.DataFrame | None) -> bool:
+def _has_campaign_data(odd: pd.DataFrame | None, ts: dict) -> bool:
     if odd is None or odd.empty:
         return False
-    return "# of Offers" in odd.columns or any(_MAIL_RE.match(c) for c in odd.columns)
+    return "# of Offers" in odd.columns or bool(ts_months(ts, "mail"))
+
+
+# -- Preprocessing: long-format campaign fact table ---------------------------
+
+def _build_campaign_facts(ts: dict) -> pd.DataFrame:
+    """Melt the ODD Mail/Resp/Spend/Swipes time series into one long table.
+
+    One row per (account, campaign) for every account mailed in that campaign.
+    Campaigns without a matching ``Resp`` column are skipped.
+
+    Columns
+    -------
+    acct        : positional row index into the ODD
+    campaign    : campaign month label, ordered categorical (chronological)
+    offer       : offer value as mailed (string categorical)
+    responder   : bool -- Resp present; for NU offers, NU 1-4 is non-response
+    spend_{k:+d}, swipes_{k:+d} :
+        ODD spend / swipes *k* months relative to the campaign month
+        (k in -3..+3); NaN when that month's column is absent.
+    """
+    rel_cols = [f"{m}_{k:+d}" for m in ("spend", "swipes") for k in _REL_MONTHS]
+    resp_months = set(ts_months(ts, "resp"))
+    has_spend = {m: m in ts["metrics"] for m in ("spend", "swipes")}
+    labels: list[str] = []
+    frames: list[pd.DataFrame] = []
+    for period in ts_months(ts, "mail"):
+        if period not in resp_months:
+            continue
+        mail = ts_column(ts, "mail", period)
+        mask = mail.notna().to_numpy()
+        if not mask.any():
+            continue
+
+        label = ts_month_label(period)
+        offer = mail[mask].astype(str)
+        resp = ts_column(ts, "resp", period)[mask]
+        nu_miss = offer.str.contains("NU", regex=False) & resp.astype(str).str.contains(
+            _NU_NON_RESPONSE, na=False, regex=True
+        )
+        part = {
+            "acct": np.flatnonzero(mask).astype(np.int32),
+            "campaign": label,
+            "offer": offer.to_numpy(),
+            "responder": (resp.notna() & ~nu_miss).to_numpy(),
+        }
+        for metric in ("spend", "swipes"):
+            if not has_spend[metric]:
+                for k in _REL_MONTHS:
+                    part[f"{metric}_{k:+d}"] = np.nan
+                continue
+            window = ts_window(ts, metric, period, before=-_REL_MONTHS[0],
+                               after=_REL_MONTHS[-1])[mask].astype(float)
+            for j, k in enumerate(_REL_MONTHS):
+                part[f"{metric}_{k:+d}"] = window[:, j]
+        labels.append(label)
+        frames.append(pd.DataFrame(part))
+
+    if not frames:
+        facts = pd.DataFrame(columns=["acct", "campaign", "offer", "responder", *rel_cols])
+    else:
+        facts = pd.concat(frames, ignore_index=True)
+    facts["campaign"] = pd.Categorical(facts["campaign"], categories=labels, ordered=True)
+    facts["offer"] = facts["offer"].astype("category")
+    facts["responder"] = facts["responder"].astype(bool)
+    return facts
+
+
+def _measured(facts: pd.DataFrame, months: list[str]) -> pd.DataFrame:
+    """Rows whose measurement month (campaign + 1) has Spend and Swipes columns."""
+    month_set = set(months)
+    ok = [c for c in facts["campaign"].cat.categories if _next_month(c) in month_set]
+    return facts[facts["campaign"].isin(ok)]
 
 
-def _detect_cols(odd: pd.DataFrame):
-    mail = sorted(c for c in odd.columns if _MAIL_RE.match(c))
-    resp = sorted(c for c in odd.columns if _RESP_RE.match(c))
-    seg = sorted(c for c in odd.columns if _SEG_RE.match(c))
-    return mail, resp, seg
+def _responder_split(facts: pd.DataFrame, keys: list[str], agg: dict) -> pd.DataFrame:
+    """Aggregate *facts* by *keys* x responder and keep groups that have both sides.
+
+    Returns a frame indexed by *keys* with ``(name, True)`` / ``(name, False)``
+    columns for every named aggregation in *agg*.
+    """
+    grp = facts.groupby([*keys, "responder"], observed=True).agg(
+        _n=("acct", "size"), **agg
+    ).unstack("responder")
+    if (True not in grp.columns.get_level_values(1)
+            or False not in grp.columns.get_level_values(1)):
+        return grp.iloc[0:0]
+    both = grp[("_n", True)].fillna(0).gt(0) & grp[("_n", False)].fillna(0).gt(0)
+    return grp[both]
+
+
+def _lift(resp: pd.Series, non_resp: pd.Series) -> pd.Series:
+    """Percentage lift of *resp* over *non_resp*; 0 when the base is not positive."""
+    return pd.Series(
+        np.where(non_resp > 0, (resp - non_resp) / non_resp.where(non_resp > 0) * 100, 0.0),
+        index=resp.index,
+    )
 
 
 # -- Analysis 1: Campaign Overview -------------------------------------------
@@ -131,11 +209,11 @@ def _campaign_overview(odd):
 def _response_by_generation(odd):
     need = {"generation", "# of Offers", "# of Responses"}
     if not need.issubset(odd.columns):
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     offered = odd[odd["# of Offers"] > 0].copy()
     if offered.empty:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     gs = offered.groupby("generation").agg(
         mailed=("# of Offers", "count"),
@@ -147,7 +225,7 @@ def _response_by_generation(odd):
     gs.columns = ["Generation", "Mailed", "Responders", "Response Rate (%)"]
 
     colors = [GENERATION_COLORS.get(g, COLORS["neutral"]) for g in gs["Generation"]]
-    fig = go.Figure(go.Bar(
+    fig = FigureSpec(dict(type="bar",
         x=gs["Generation"], y=gs["Response Rate (%)"],
         marker_color=colors,
         text=[f"{v:.1f}%" for v in gs["Response Rate (%)"]],
@@ -172,7 +250,7 @@ def _response_by_generation(odd):
 
 def _spend_lift(odd):
     if "Total Spend" not in odd.columns or "# of Responses" not in odd.columns:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     odd = odd.copy()
     odd["resp_flag"] = np.where(odd["# of Responses"] > 0, "Responder", "Non-Responder")
@@ -195,7 +273,7 @@ def _spend_lift(odd):
     else:
         combined = base.copy()
 
-    fig = go.Figure(go.Bar(
+    fig = FigureSpec(dict(type="bar",
         x=combined["Group"], y=combined["Avg Spend"],
         marker_color=CATEGORY_PALETTE[:len(combined)],
         text=[format_currency(v) for v in combined["Avg Spend"]],
@@ -225,29 +303,29 @@ def _spend_lift(odd):
 
 # -- Analysis 4: Monthly Mail & Response Tracking -----------------------------
 
-def _monthly_tracking(odd):
-    mail_cols, _, _ = _detect_cols(odd)
-    if not mail_cols:
-        return pd.DataFrame(), go.Figure(), ""
+def _monthly_tracking(ts):
+    mail_months = ts_months(ts, "mail")
+    if not mail_months:
+        return pd.DataFrame(), FigureSpec(), ""
 
+    resp_months = set(ts_months(ts, "resp"))
     rows = []
-    for mc in mail_cols:
-        label = mc.replace(" Mail", "")
-        rc = f"{label} Resp"
-        m = int((odd[mc] == 1).sum()) if mc in odd.columns else 0
-        r = int((odd[rc] == 1).sum()) if rc in odd.columns else 0
+    for period in mail_months:
+        label = ts_month_label(period)
+        m = _count_equal(ts, "mail", period, 1)
+        r = _count_equal(ts, "resp", period, 1) if period in resp_months else 0
         rows.append({"Month": label, "Mailed": m, "Responded": r, "Response Rate (%)": _rate(r, m)})
 
     tdf = pd.DataFrame(rows)
     if tdf.empty:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
+    fig = FigureSpec()
+    fig.add_trace(dict(type="bar",
         x=tdf["Month"], y=tdf["Mailed"], name="Mailed",
         marker_color=COLORS["primary"], opacity=0.7, yaxis="y",
     ))
-    fig.add_trace(go.Scatter(
+    fig.add_trace(dict(type="scatter",
         x=tdf["Month"], y=tdf["Response Rate (%)"], name="Response Rate %",
         mode="lines+markers", line=dict(color=COLORS["accent"], width=3),
         marker=dict(size=8), yaxis="y2",
@@ -272,22 +350,25 @@ def _monthly_tracking(odd):
 
 # -- Analysis 5: Campaign Segmentation Performance ----------------------------
 
-def _segmentation_performance(odd):
-    _, _, seg_cols = _detect_cols(odd)
-    if not seg_cols:
-        return pd.DataFrame(), go.Figure(), ""
+def _segmentation_performance(odd, ts):
+    seg_months = ts_months(ts, "segmentation")
+    if not seg_months:
+        return pd.DataFrame(), FigureSpec(), ""
 
-    latest = seg_cols[-1]
-    label = latest.replace(" Segmentation", "")
-    rc = f"{label} Resp"
+    period = seg_months[-1]
+    seg = ts_column(ts, "segmentation", period, index=odd.index)
+    latest, label = seg.name, ts_month_label(period)
 
-    sd = odd[[latest]].copy()
-    sd["responded"] = (odd[rc] == 1).astype(int) if rc in odd.columns else 0
+    sd = seg.astype(object).to_frame()
+    sd["responded"] = (
+        (ts_column(ts, "resp", period, index=odd.index) == 1).astype(int)
+        if period in ts_months(ts, "resp") else 0
+    )
     sd["spend"] = odd["Total Spend"] if "Total Spend" in odd.columns else 0
     sd = sd.dropna(subset=[latest])
     sd = sd[sd[latest].astype(str).str.strip() != ""]
     if sd.empty:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     st = sd.groupby(latest).agg(
         accounts=(latest, "count"), responders=("responded", "sum"),
@@ -322,11 +403,11 @@ def _segmentation_performance(odd):
 
 def _response_by_balance_tier(odd):
     if "balance_tier" not in odd.columns or "# of Responses" not in odd.columns:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     offered = odd[odd["# of Offers"] > 0].copy() if "# of Offers" in odd.columns else odd.copy()
     if offered.empty:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     offered["resp_flag"] = np.where(offered["# of Responses"] > 0, "Responder", "Non-Responder")
     ct = pd.crosstab(offered["balance_tier"], offered["resp_flag"])
@@ -343,12 +424,12 @@ def _response_by_balance_tier(odd):
     summary = summary.reset_index()
     summary.columns = ["Balance Tier", "Responders", "Non-Responders", "Total", "Response Rate (%)"]
 
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
+    fig = FigureSpec()
+    fig.add_trace(dict(type="bar",
         x=ct_pct["balance_tier"], y=ct_pct["Responder"],
         name="Responder", marker_color=COLORS["positive"],
     ))
-    fig.add_trace(go.Bar(
+    fig.add_trace(dict(type="bar",
         x=ct_pct["balance_tier"], y=ct_pct["Non-Responder"],
         name="Non-Responder", marker_color=COLORS["neutral"],
     ))
@@ -373,42 +454,20 @@ def _response_by_balance_tier(odd):
 
 # -- Analysis 7: Per-Offer Response Rates ------------------------------------
 
-def _per_offer_response(odd):
+def _per_offer_response(facts):
     """Response rate breakdown by offer type across all campaign months."""
-    mail_cols, _, _ = _detect_cols(odd)
-    if not mail_cols:
-        return pd.DataFrame(), go.Figure(), ""
-
-    rows = []
-    for mc in mail_cols:
-        label = mc.replace(" Mail", "")
-        rc = f"{label} Resp"
-        if rc not in odd.columns:
-            continue
-        campaign_accts = odd[odd[mc].notna()].copy()
-        for offer in sorted(campaign_accts[mc].dropna().unique()):
-            offer_accts = campaign_accts[campaign_accts[mc] == offer]
-            resp, _ = _classify_responders(offer_accts, rc, offer)
-            rows.append({
-                "Campaign": label,
-                "Offer": str(offer),
-                "Sent": len(offer_accts),
-                "Responded": len(resp),
-                "Response Rate (%)": _rate(len(resp), len(offer_accts)),
-            })
+    if facts.empty:
+        return pd.DataFrame(), FigureSpec(), ""
 
-    if not rows:
-        return pd.DataFrame(), go.Figure(), ""
-
-    tdf = pd.DataFrame(rows)
-    # Aggregate across campaigns: average rate per offer type
-    agg = tdf.groupby("Offer").agg(
-        total_sent=("Sent", "sum"),
-        total_responded=("Responded", "sum"),
+    n_campaigns = facts["campaign"].nunique()
+    agg = facts.groupby("offer", observed=True).agg(
+        total_sent=("acct", "size"),
+        total_responded=("responder", "sum"),
     ).reset_index()
-    agg["Response Rate (%)"] = agg.apply(
-        lambda r: _rate(int(r["total_responded"]), int(r["total_sent"])), axis=1
-    )
+    agg["offer"] = agg["offer"].astype(str)
+    agg["Response Rate (%)"] = (
+        agg["total_responded"] / agg["total_sent"] * 100
+    ).round(1)
     agg = agg.sort_values("Response Rate (%)", ascending=False)
     agg.columns = ["Offer Type", "Total Sent", "Total Responded", "Response Rate (%)"]
 
@@ -419,72 +478,49 @@ def _per_offer_response(odd):
     ))
     fig.update_layout(title=insight_title(
         "Response rate varies significantly by offer type",
-        f"{len(agg)} offer types across {len(mail_cols)} campaigns",
+        f"{len(agg)} offer types across {n_campaigns} campaigns",
     ))
 
-    if not agg.empty:
-        best = agg.iloc[0]
-        narr = (
-            f"<b>{best['Offer Type']}</b> has the highest response rate at "
-            f"<b>{best['Response Rate (%)']:.1f}%</b> "
-            f"({int(best['Total Responded']):,} of {int(best['Total Sent']):,} sent). "
-            f"Analysis covers {len(mail_cols)} campaign waves."
-        )
-    else:
-        narr = ""
+    best = agg.iloc[0]
+    narr = (
+        f"<b>{best['Offer Type']}</b> has the highest response rate at "
+        f"<b>{best['Response Rate (%)']:.1f}%</b> "
+        f"({int(best['Total Responded']):,} of {int(best['Total Sent']):,} sent). "
+        f"Analysis covers {n_campaigns} campaign waves."
+    )
     return agg, fig, narr
 
 
 # -- Analysis 8: Spend & Swipe Lift by Offer Type ---------------------------
 
-def _offer_lift(odd):
+def _offer_lift(facts, months):
     """Spend lift and swipe lift for responders vs non-responders per offer type."""
-    mail_cols, _, _ = _detect_cols(odd)
-    months = _detect_spend_swipe_cols(odd)
-    if not mail_cols or not months:
-        return pd.DataFrame(), go.Figure(), ""
-
-    rows = []
-    for mc in mail_cols:
-        label = mc.replace(" Mail", "")
-        rc = f"{label} Resp"
-        measure = _next_month(label)
-        spend_col = f"{measure} Spend"
-        swipe_col = f"{measure} Swipes"
-        if rc not in odd.columns or spend_col not in odd.columns:
-            continue
-
-        campaign_accts = odd[odd[mc].notna()].copy()
-        for offer in sorted(campaign_accts[mc].dropna().unique()):
-            offer_accts = campaign_accts[campaign_accts[mc] == offer]
-            resp, non_resp = _classify_responders(offer_accts, rc, offer)
-            if resp.empty or non_resp.empty:
-                continue
-
-            r_spend = resp[spend_col].mean()
-            n_spend = non_resp[spend_col].mean()
-            spend_lift = ((r_spend - n_spend) / n_spend * 100) if n_spend > 0 else 0
-
-            r_swipes = resp[swipe_col].mean() if swipe_col in odd.columns else 0
-            n_swipes = non_resp[swipe_col].mean() if swipe_col in odd.columns else 0
-            swipe_lift = ((r_swipes - n_swipes) / n_swipes * 100) if n_swipes > 0 else 0
+    measured = _measured(facts, months)
+    if measured.empty:
+        return pd.DataFrame(), FigureSpec(), ""
 
-            rows.append({
-                "Campaign": label,
-                "Offer": str(offer),
-                "Resp Avg Spend": round(r_spend, 2),
-                "Non-Resp Avg Spend": round(n_spend, 2),
-                "Spend Lift (%)": round(spend_lift, 1),
-                "Resp Avg Swipes": round(r_swipes, 1),
-                "Non-Resp Avg Swipes": round(n_swipes, 1),
-                "Swipe Lift (%)": round(swipe_lift, 1),
-            })
-
-    if not rows:
-        return pd.DataFrame(), go.Figure(), ""
+    g = _responder_split(
+        measured, ["campaign", "offer"],
+        {"spend": ("spend_+1", "mean"), "swipes": ("swipes_+1", "mean")},
+    )
+    if g.empty:
+        return pd.DataFrame(), FigureSpec(), ""
 
-    tdf = pd.DataFrame(rows)
-    # Aggregate: weighted-average lifts per offer type
+    r_spend, n_spend = g[("spend", True)], g[("spend", False)]
+    r_swipes, n_swipes = g[("swipes", True)], g[("swipes", False)]
+    tdf = pd.DataFrame({
+        "Resp Avg Spend": r_spend.round(2),
+        "Non-Resp Avg Spend": n_spend.round(2),
+        "Spend Lift (%)": _lift(r_spend, n_spend).round(1),
+        "Resp Avg Swipes": r_swipes.round(1),
+        "Non-Resp Avg Swipes": n_swipes.round(1),
+        "Swipe Lift (%)": _lift(r_swipes, n_swipes).round(1),
+    }).reset_index()
+    tdf = tdf.rename(columns={"campaign": "Campaign", "offer": "Offer"})
+    tdf["Campaign"] = tdf["Campaign"].astype(str)
+    tdf["Offer"] = tdf["Offer"].astype(str)
+
+    # Aggregate: average lifts per offer type
     agg = tdf.groupby("Offer").agg(
         spend_lift=("Spend Lift (%)", "mean"),
         swipe_lift=("Swipe Lift (%)", "mean"),
@@ -506,7 +542,7 @@ def _offer_lift(odd):
     )
 
     narr = (
-        f"Across {len(mail_cols)} campaigns, <b>{len(agg)}</b> offer types analyzed. "
+        f"Across {tdf['Campaign'].nunique()} campaigns, <b>{len(agg)}</b> offer types analyzed. "
     )
     pos = agg[agg["Avg Spend Lift (%)"] > 0]
     if not pos.empty:
@@ -520,70 +556,48 @@ def _offer_lift(odd):
 
 # -- Analysis 9: Before/After Campaign Trends -------------------------------
 
-def _before_after_trends(odd):
+def _before_after_trends(facts, months):
     """3-month before + 3-month after spending trends with campaign marker."""
-    mail_cols, _, _ = _detect_cols(odd)
-    months = _detect_spend_swipe_cols(odd)
-    if not mail_cols or len(months) < 4:
-        return pd.DataFrame(), go.Figure(), ""
+    if facts.empty or len(months) < 4:
+        return pd.DataFrame(), FigureSpec(), ""
 
     # Use the latest campaign month
-    latest_mail = mail_cols[-1]
-    label = latest_mail.replace(" Mail", "")
-    rc = f"{label} Resp"
-    if rc not in odd.columns:
-        return pd.DataFrame(), go.Figure(), ""
-
-    campaign_accts = odd[odd[latest_mail].notna()].copy()
-    resp_mask = campaign_accts[rc].notna()
-    if "NU" in str(campaign_accts[latest_mail].iloc[0] if not campaign_accts.empty else ""):
-        resp_mask = resp_mask & ~campaign_accts[rc].astype(str).str.contains(
-            r"NU [1-4]", na=False, regex=True
-        )
-    responders = campaign_accts[resp_mask]
-    non_responders = campaign_accts[~resp_mask]
-
-    # Window: 3 before + campaign + 3 after
-    try:
-        camp_idx = months.index(label)
-    except ValueError:
-        return pd.DataFrame(), go.Figure(), ""
+    label = facts["campaign"].cat.categories[-1]
+    if label not in months:
+        return pd.DataFrame(), FigureSpec(), ""
 
-    start = max(0, camp_idx - 3)
-    end = min(len(months), camp_idx + 4)
-    window = months[start:end]
+    latest = facts[facts["campaign"] == label]
+    n_resp = int(latest["responder"].sum())
+    n_non = len(latest) - n_resp
 
-    rows = []
-    for m in window:
-        sc = f"{m} Spend"
-        if sc not in odd.columns:
-            continue
-        r_avg = responders[sc].mean() if not responders.empty else 0
-        n_avg = non_responders[sc].mean() if not non_responders.empty else 0
-        rows.append({"Month": m, "Responder Avg Spend": round(r_avg, 2),
-                      "Non-Resp Avg Spend": round(n_avg, 2)})
+    # Window: 3 before + campaign + 3 after (months present in the ODD)
+    month_set = set(months)
+    window = [(k, _shift_month(label, k)) for k in _REL_MONTHS]
+    window = [(k, m) for k, m in window if m in month_set]
 
-    if not rows:
-        return pd.DataFrame(), go.Figure(), ""
-
-    tdf = pd.DataFrame(rows)
+    means = latest.groupby("responder")[[f"spend_{k:+d}" for k, _ in window]].mean()
+    means = means.reindex([True, False]).fillna(0)
+    tdf = pd.DataFrame({
+        "Month": [m for _, m in window],
+        "Responder Avg Spend": means.loc[True].round(2).to_numpy(),
+        "Non-Resp Avg Spend": means.loc[False].round(2).to_numpy(),
+    })
 
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
+    fig = FigureSpec()
+    fig.add_trace(dict(type="bar",
         x=tdf["Month"], y=tdf["Responder Avg Spend"],
-        name=f"Responders (n={len(responders):,})",
+        name=f"Responders (n={n_resp:,})",
         marker_color=COLORS["primary"], opacity=0.85,
     ))
-    fig.add_trace(go.Bar(
+    fig.add_trace(dict(type="bar",
         x=tdf["Month"], y=tdf["Non-Resp Avg Spend"],
-        name=f"Non-Responders (n={len(non_responders):,})",
+        name=f"Non-Responders (n={n_non:,})",
         marker_color=COLORS["neutral"], opacity=0.65,
     ))
     # Vertical campaign marker
-    camp_pos = window.index(label) if label in window else None
-    if camp_pos is not None:
-        fig.add_vline(x=camp_pos, line_dash="dash", line_color=COLORS["negative"],
-                      annotation_text="Campaign Month", annotation_position="top")
+    camp_pos = [m for _, m in window].index(label)
+    fig.add_vline(x=camp_pos, line_dash="dash", line_color=COLORS["negative"],
+                  annotation_text="Campaign Month", annotation_position="top")
     fig.update_layout(
         barmode="group",
         title=insight_title(
@@ -615,40 +629,25 @@ def _before_after_trends(odd):
 
 # -- Analysis 10: Transaction Size Distribution (Responders vs Non) ----------
 
-def _txn_size_buckets(odd):
+def _txn_size_buckets(facts, months):
     """Transaction size bucket comparison between responders and non-responders."""
-    mail_cols, _, _ = _detect_cols(odd)
-    months = _detect_spend_swipe_cols(odd)
-    if not mail_cols or not months:
-        return pd.DataFrame(), go.Figure(), ""
-
-    latest_mail = mail_cols[-1]
-    label = latest_mail.replace(" Mail", "")
-    rc = f"{label} Resp"
-    measure = _next_month(label)
-    spend_col = f"{measure} Spend"
-    swipe_col = f"{measure} Swipes"
+    if facts.empty or not months:
+        return pd.DataFrame(), FigureSpec(), ""
 
-    if rc not in odd.columns or spend_col not in odd.columns or swipe_col not in odd.columns:
-        return pd.DataFrame(), go.Figure(), ""
+    label = facts["campaign"].cat.categories[-1]
+    measure = _next_month(label)
+    if measure not in months:
+        return pd.DataFrame(), FigureSpec(), ""
 
-    campaign_accts = odd[odd[latest_mail].notna()].copy()
-    resp, non_resp = _classify_responders(
-        campaign_accts, rc,
-        campaign_accts[latest_mail].iloc[0] if not campaign_accts.empty else ""
-    )
+    latest = facts[facts["campaign"] == label]
 
     # Avg transaction size = spend / swipes
-    def _avg_txn(grp):
-        s = grp[spend_col].fillna(0)
-        w = grp[swipe_col].fillna(0).replace(0, np.nan)
-        return (s / w).dropna()
-
-    resp_sizes = _avg_txn(resp)
-    non_resp_sizes = _avg_txn(non_resp)
+    size = latest["spend_+1"].fillna(0) / latest["swipes_+1"].fillna(0).replace(0, np.nan)
+    resp_sizes = size[latest["responder"]].dropna()
+    non_resp_sizes = size[~latest["responder"]].dropna()
 
     if resp_sizes.empty and non_resp_sizes.empty:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     bins = [0, 5, 10, 25, 50, 100, 500, float("inf")]
     labels = ["< $5", "$5-10", "$10-25", "$25-50", "$50-100", "$100-500", "$500+"]
@@ -690,52 +689,36 @@ def _txn_size_buckets(odd):
 
 # -- Analysis 11: Avg Txn Size & Swipe Counts by Offer Type -----------------
 
-def _offer_txn_detail(odd):
+def _offer_txn_detail(facts, months):
     """Average transaction size and swipe counts per offer type."""
-    mail_cols, _, _ = _detect_cols(odd)
-    months = _detect_spend_swipe_cols(odd)
-    if not mail_cols or not months:
-        return pd.DataFrame(), go.Figure(), ""
-
-    rows = []
-    for mc in mail_cols:
-        label = mc.replace(" Mail", "")
-        rc = f"{label} Resp"
-        measure = _next_month(label)
-        spend_col = f"{measure} Spend"
-        swipe_col = f"{measure} Swipes"
-        if rc not in odd.columns or spend_col not in odd.columns or swipe_col not in odd.columns:
-            continue
-
-        campaign_accts = odd[odd[mc].notna()].copy()
-        for offer in sorted(campaign_accts[mc].dropna().unique()):
-            offer_accts = campaign_accts[campaign_accts[mc] == offer]
-            resp, non_resp = _classify_responders(offer_accts, rc, offer)
-            if resp.empty or non_resp.empty:
-                continue
-
-            r_total_spend = resp[spend_col].sum()
-            r_total_swipes = resp[swipe_col].sum()
-            r_avg_txn = r_total_spend / r_total_swipes if r_total_swipes > 0 else 0
-
-            n_total_spend = non_resp[spend_col].sum()
-            n_total_swipes = non_resp[swipe_col].sum()
-            n_avg_txn = n_total_spend / n_total_swipes if n_total_swipes > 0 else 0
-
-            rows.append({
-                "Campaign": label,
-                "Offer": str(offer),
-                "Resp Avg Txn Size": round(r_avg_txn, 2),
-                "Non-Resp Avg Txn Size": round(n_avg_txn, 2),
-                "Resp Avg Swipes": round(resp[swipe_col].mean(), 1),
-                "Non-Resp Avg Swipes": round(non_resp[swipe_col].mean(), 1),
-            })
+    measured = _measured(facts, months)
+    if measured.empty:
+        return pd.DataFrame(), FigureSpec(), ""
+
+    g = _responder_split(
+        measured, ["campaign", "offer"],
+        {
+            "spend_sum": ("spend_+1", "sum"),
+            "swipes_sum": ("swipes_+1", "sum"),
+            "swipes_avg": ("swipes_+1", "mean"),
+        },
+    )
+    if g.empty:
+        return pd.DataFrame(), FigureSpec(), ""
 
-    if not rows:
-        return pd.DataFrame(), go.Figure(), ""
+    def _avg_txn(side):
+        swipes = g[("swipes_sum", side)]
+        return (g[("spend_sum", side)] / swipes.where(swipes > 0)).fillna(0)
 
-    tdf = pd.DataFrame(rows)
-    agg = tdf.groupby("Offer").agg(
+    tdf = pd.DataFrame({
+        "Resp Avg Txn Size": _avg_txn(True).round(2),
+        "Non-Resp Avg Txn Size": _avg_txn(False).round(2),
+        "Resp Avg Swipes": g[("swipes_avg", True)].round(1),
+        "Non-Resp Avg Swipes": g[("swipes_avg", False)].round(1),
+    }).reset_index()
+    tdf["offer"] = tdf["offer"].astype(str)
+
+    agg = tdf.groupby("offer").agg(
         resp_txn=("Resp Avg Txn Size", "mean"),
         non_resp_txn=("Non-Resp Avg Txn Size", "mean"),
         resp_swipes=("Resp Avg Swipes", "mean"),
@@ -758,7 +741,7 @@ def _offer_txn_detail(odd):
     ))
 
     narr = (
-        f"Across <b>{len(mail_cols)}</b> campaigns, responders average "
+        f"Across <b>{tdf['campaign'].nunique()}</b> campaigns, responders average "
         f"<b>{agg['Resp Avg Swipes'].mean():.1f}</b> swipes vs "
         f"<b>{agg['Non-Resp Avg Swipes'].mean():.1f}</b> for non-responders."
     )
@@ -770,13 +753,13 @@ def _offer_txn_detail(odd):
 def _biz_personal_campaigns(odd):
     """Response rates split by Business vs Personal accounts."""
     if "Business?" not in odd.columns:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
     if "# of Offers" not in odd.columns or "# of Responses" not in odd.columns:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     offered = odd[odd["# of Offers"] > 0].copy()
     if offered.empty:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     grp = offered.groupby("Business?").agg(
         mailed=("# of Offers", "count"),
@@ -815,51 +798,30 @@ def _biz_personal_campaigns(odd):
 def _response_by_age_tenure(odd):
     """Response rates by age buckets and tenure buckets."""
     if "# of Offers" not in odd.columns or "# of Responses" not in odd.columns:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     offered = odd[odd["# of Offers"] > 0].copy()
     if offered.empty:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     rows = []
-    # Age buckets (if available)
-    if "Account Holder Age" in offered.columns:
-        ages = offered["Account Holder Age"].dropna()
-        if not ages.empty:
-            bins = [0, 25, 35, 45, 55, 65, 200]
-            labels = ["18-25", "26-35", "36-45", "46-55", "56-65", "65+"]
-            offered["age_bucket"] = pd.cut(ages, bins=bins, labels=labels, right=True)
-            for bucket in labels:
-                grp = offered[offered["age_bucket"] == bucket]
-                if len(grp) < _MIN_GROUP:
-                    continue
-                resp_count = int((grp["# of Responses"] > 0).sum())
-                rows.append({
-                    "Dimension": "Age", "Bucket": bucket,
-                    "Mailed": len(grp), "Responders": resp_count,
-                    "Response Rate (%)": _rate(resp_count, len(grp)),
-                })
-
-    # Tenure buckets (if available)
-    if "tenure_years" in offered.columns:
-        tenure = offered["tenure_years"].dropna()
-        if not tenure.empty:
-            bins = [0, 1, 3, 5, 10, 100]
-            labels = ["< 1 yr", "1-3 yrs", "3-5 yrs", "5-10 yrs", "10+ yrs"]
-            offered["tenure_bucket"] = pd.cut(tenure, bins=bins, labels=labels, right=True)
-            for bucket in labels:
-                grp = offered[offered["tenure_bucket"] == bucket]
-                if len(grp) < _MIN_GROUP:
-                    continue
-                resp_count = int((grp["# of Responses"] > 0).sum())
-                rows.append({
-                    "Dimension": "Tenure", "Bucket": bucket,
-                    "Mailed": len(grp), "Responders": resp_count,
-                    "Response Rate (%)": _rate(resp_count, len(grp)),
-                })
+    # Age / tenure bands (derived at load, if available)
+    for dim, col in (("Age", "age_band"), ("Tenure", "tenure_band")):
+        if col not in offered.columns or offered[col].isna().all():
+            continue
+        for bucket in offered[col].cat.categories:
+            grp = offered[offered[col] == bucket]
+            if len(grp) < _MIN_GROUP:
+                continue
+            resp_count = int((grp["# of Responses"] > 0).sum())
+            rows.append({
+                "Dimension": dim, "Bucket": bucket,
+                "Mailed": len(grp), "Responders": resp_count,
+                "Response Rate (%)": _rate(resp_count, len(grp)),
+            })
 
     if not rows:
-        return pd.DataFrame(), go.Figure(), ""
+        return pd.DataFrame(), FigureSpec(), ""
 
     tdf = pd.DataFrame(rows)
 
@@ -916,8 +878,9 @@ def _add(sections, sheets, heading, df, fig, narr, sheet_name, **col_spec):
 def run(ctx: dict) -> dict:
     """Run Campaign Effectiveness analyses and return storyline payload."""
     odd = ctx.get("odd_df")
+    ts = get_odd_timeseries(ctx)
 
-    if not _has_campaign_data(odd):
+    if not _has_campaign_data(odd, ts):
         return {
             "title": "S7: Campaign Effectiveness",
             "description": "No campaign data available in the ODD file.",
@@ -935,6 +898,12 @@ def run(ctx: dict) -> dict:
             "sheets": [],
         }
 
+    # Melt the campaign months of the ODD time-series tensor into a long fact
+    # table once; the per-offer analyses below are groupbys on that table.
+    months = _spend_swipe_months(ts)
+    facts = _build_campaign_facts(ts)
+    ctx["s7_campaign_facts"] = facts
+
     sections, sheets = [], []
 
     # 1 - Campaign Overview (always appended when campaign data exists)
@@ -961,13 +930,13 @@ def run(ctx: dict) -> dict:
 
     # 4 - Monthly Tracking
     _add(sections, sheets, "Monthly Mail & Response Tracking",
-         *_monthly_tracking(odd), "S7 Monthly Tracking",
+         *_monthly_tracking(ts), "S7 Monthly Tracking",
          currency_cols=[], pct_cols=["Response Rate (%)"],
          number_cols=["Mailed", "Responded"])
 
     # 5 - Segmentation
     _add(sections, sheets, "Campaign Segmentation Performance",
-         *_segmentation_performance(odd), "S7 Segmentation",
+         *_segmentation_performance(odd, ts), "S7 Segmentation",
          currency_cols=["Avg Spend"], pct_cols=["Response Rate (%)"],
          number_cols=["Accounts", "Responders"])
 
@@ -979,32 +948,32 @@ def run(ctx: dict) -> dict:
 
     # 7 - Per-Offer Response Rates
     _add(sections, sheets, "Response Rate by Offer Type",
-         *_per_offer_response(odd), "S7 Per-Offer Rates",
+         *_per_offer_response(facts), "S7 Per-Offer Rates",
          currency_cols=[], pct_cols=["Response Rate (%)"],
          number_cols=["Total Sent", "Total Responded"])
 
     # 8 - Spend & Swipe Lift by Offer Type
     _add(sections, sheets, "Spend & Swipe Lift by Offer Type",
-         *_offer_lift(odd), "S7 Offer Lift",
+         *_offer_lift(facts, months), "S7 Offer Lift",
          currency_cols=["Resp Avg Spend", "Non-Resp Avg Spend"],
          pct_cols=["Spend Lift (%)", "Swipe Lift (%)"],
          number_cols=[])
 
     # 9 - Before/After Campaign Trends
     _add(sections, sheets, "Before/After Campaign Spending Trends",
-         *_before_after_trends(odd), "S7 Before After",
+         *_before_after_trends(facts, months), "S7 Before After",
          currency_cols=["Responder Avg Spend", "Non-Resp Avg Spend"],
          pct_cols=[], number_cols=[])
 
     # 10 - Transaction Size Distribution
     _add(sections, sheets, "Transaction Size Distribution",
-         *_txn_size_buckets(odd), "S7 Txn Buckets",
+         *_txn_size_buckets(facts, months), "S7 Txn Buckets",
          currency_cols=[], pct_cols=["Responders (%)", "Non-Responders (%)"],
          number_cols=["Difference (pp)"])
 
     # 11 - Avg Transaction Size & Swipes by Offer Type
     _add(sections, sheets, "Transaction Detail by Offer Type",
-         *_offer_txn_detail(odd), "S7 Offer Txn Detail",
+         *_offer_txn_detail(facts, months), "S7 Offer Txn Detail",
          currency_cols=["Resp Avg Txn ($)", "Non-Resp Avg Txn ($)"],
          pct_cols=[], number_cols=["Resp Avg Swipes", "Non-Resp Avg Swipes"])
 
@@ -7,13 +7,18 @@ import re
 
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
+from v4_backend import distinct_count
+from v4_figspec import FigureSpec
+from v4_incidence import column_mask, row_sums
 from v4_themes import (
     COLORS, GENERATION_COLORS, apply_theme, format_currency, format_pct,
     horizontal_bar, line_trend, donut_chart, grouped_bar,
     insight_title, add_source_footer,
 )
 
+SOURCES = ("transactions",)
+TXN_COLUMNS = ()
+
 _KNOWN_PROCESSORS = {
     "ADP", "PAYCHEX", "INTUIT", "BAMBOOHR", "GUSTO", "PAYLOCITY",
     "PAYCOM", "CERIDIAN", "WORKDAY", "RIPPLING", "NAMELY",
@@ -118,7 +123,7 @@ def run(ctx: dict) -> dict:
                          "figures": [], "tables": []})
         return empty_result
 
-    s, sh = _payroll_summary(df, payroll_df)
+    s, sh = _payroll_summary(df, payroll_df, ctx)
     sections.append(s); sheets.append(sh)
     s, sh = _top_employers(payroll_df)
     sections.append(s); sheets.append(sh)
@@ -128,7 +133,7 @@ def run(ctx: dict) -> dict:
     if "year_month" in payroll_df.columns:
         s, sh = _monthly_trends(payroll_df)
         sections.append(s); sheets.append(sh)
-    circ = _circular_economy(df, payroll_df)
+    circ = _circular_economy(df, payroll_df, ctx["incidence"])
     if circ[0] is not None:
         sections.append(circ[0]); sheets.append(circ[1])
 
@@ -139,7 +144,7 @@ def run(ctx: dict) -> dict:
 
     personal_df = ctx.get("personal_df")
     if personal_df is not None and not payroll_df.empty:
-        circ_detail = _circular_economy_detail(payroll_df, personal_df, config)
+        circ_detail = _circular_economy_detail(payroll_df, personal_df, ctx)
         if circ_detail[0] is not None:
             sections.append(circ_detail[0]); sheets.append(circ_detail[1])
 
@@ -151,11 +156,11 @@ def run(ctx: dict) -> dict:
     return empty_result  # sections/sheets already mutated into it
 
 
-def _payroll_summary(df: pd.DataFrame, pay: pd.DataFrame):
+def _payroll_summary(df: pd.DataFrame, pay: pd.DataFrame, ctx: dict):
     total_pay = pay["amount"].sum()
     total_all = df["amount"].sum()
-    n_employers = pay["payroll_employer"].nunique()
-    n_accounts = pay["primary_account_num"].nunique()
+    n_employers = distinct_count(ctx, pay["payroll_employer"])
+    n_accounts = distinct_count(ctx, pay["primary_account_num"])
     pct = (total_pay / total_all * 100) if total_all > 0 else 0
 
     fig = donut_chart(
@@ -223,7 +228,7 @@ def _payroll_by_generation(pay: pd.DataFrame):
     agg.columns = ["Generation", "Total Payroll", "Unique Accounts"]
     colors = [GENERATION_COLORS.get(g, COLORS["neutral"]) for g in agg["Generation"]]
 
-    fig = go.Figure(go.Bar(
+    fig = FigureSpec(dict(type="bar",
         x=agg["Generation"], y=agg["Total Payroll"], marker_color=colors,
         text=agg["Total Payroll"].apply(format_currency), textposition="outside",
         textfont=dict(size=10), hovertemplate="%{x}: %{y:$,.0f}<extra></extra>",
@@ -288,14 +293,18 @@ def _monthly_trends(pay: pd.DataFrame):
     return section, sheet
 
 
-def _circular_economy(df: pd.DataFrame, pay: pd.DataFrame):
-    """Recapture rate: debit spend / payroll received for payroll recipients."""
-    pay_accts = pay["primary_account_num"].unique()
-    pay_by_acct = pay.groupby("primary_account_num")["amount"].sum()
-    non_pay = df[df["primary_account_num"].isin(pay_accts) & ~df.index.isin(pay.index)]
-    deb_by_acct = non_pay.groupby("primary_account_num")["amount"].sum()
+def _circular_economy(df: pd.DataFrame, pay: pd.DataFrame, inc: dict):
+    """Recapture rate: debit spend / payroll received for payroll recipients.
 
-    combo = pd.DataFrame({"payroll_received": pay_by_acct, "debit_spend": deb_by_acct}).fillna(0)
+    Payroll is detected on the merchant name, so payroll received and debit
+    spend per account are row sums of the account x merchant incidence
+    matrix *inc* over the payroll / other merchant columns.
+    """
+    is_pay = column_mask(inc, pay["merchant_consolidated"].unique())
+    combo = pd.DataFrame({
+        "payroll_received": row_sums(inc, columns=is_pay),
+        "debit_spend": row_sums(inc, columns=~is_pay),
+    }, index=inc["accounts"])
     combo = combo[combo["payroll_received"] > 0]
     if combo.empty:
         return (None, None)
@@ -306,7 +315,7 @@ def _circular_economy(df: pd.DataFrame, pay: pd.DataFrame):
     has_gen = "generation" in df.columns
     if has_gen:
         acct_gen = (
-            df.loc[df["primary_account_num"].isin(pay_accts)]
+            df.loc[df["primary_account_num"].isin(combo.index)]
             .drop_duplicates("primary_account_num")[["primary_account_num", "generation"]]
             .set_index("primary_account_num")
         )
@@ -316,7 +325,7 @@ def _circular_economy(df: pd.DataFrame, pay: pd.DataFrame):
         gr.columns = ["Generation", "Avg Recapture %"]
         gr["Avg Recapture %"] = gr["Avg Recapture %"].round(1)
         colors = [GENERATION_COLORS.get(g, COLORS["neutral"]) for g in gr["Generation"]]
-        fig = go.Figure(go.Bar(
+        fig = FigureSpec(dict(type="bar",
             x=gr["Generation"], y=gr["Avg Recapture %"], marker_color=colors,
             text=gr["Avg Recapture %"].apply(lambda v: f"{v:.1f}%"),
             textposition="outside", textfont=dict(size=10),
@@ -452,7 +461,7 @@ def _clean_employer_list(pay: pd.DataFrame):
 def _circular_economy_detail(
     pay: pd.DataFrame,
     personal_df: pd.DataFrame,
-    config: dict,
+    ctx: dict,
 ):
     """Per-employer circular economy analysis.
 
@@ -463,7 +472,7 @@ def _circular_economy_detail(
     if pay.empty or personal_df.empty:
         return (None, None)
 
-    max_match: int = config.get("payroll", {}).get("max_match_count", 1_000)
+    max_match: int = ctx.get("config", {}).get("payroll", {}).get("max_match_count", 1_000)
 
     # Build employer spend ranking with clean names
     employer_spend = (
@@ -506,8 +515,8 @@ def _circular_economy_detail(
             continue
 
         consumer_spend = matches["amount"].sum()
-        consumer_accounts = matches["primary_account_num"].nunique()
-        consumer_merchants = matches[merch_col].nunique()
+        consumer_accounts = distinct_count(ctx, matches["primary_account_num"])
+        consumer_merchants = distinct_count(ctx, matches[merch_col])
         recapture_pct = (
             (consumer_spend / payroll_spend * 100) if payroll_spend > 0 else 0
         )
@@ -542,7 +551,7 @@ def _circular_economy_detail(
         _blend_color(COLORS["accent"], COLORS["positive"], v) for v in normed
     ]
 
-    fig = go.Figure(go.Bar(
+    fig = FigureSpec(dict(type="bar",
         x=chart_df["Consumer Spend"],
         y=chart_df["Business Name"],
         orientation="h",
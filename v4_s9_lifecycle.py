@@ -3,14 +3,20 @@
 # =============================================================================
 # 8 lifecycle stages from acquisition to attrition, one section per stage.
 # Requires ODD columns: Date Opened, Date Closed, Debit?, Avg Bal, generation
-# Uses combined_df for transaction-level metrics.
+# Uses combined_df for transaction-level metrics and ctx["activity"] (the
+# account x month activity bitmap, v4_activity) for dormancy, attrition classes,
+# activity retention, reactivation and streaks.
 
 from __future__ import annotations
 
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 
+from v4_activity import (
+    active_in, last_months, reactivated, retention_curve, streaks, window_total,
+)
+from v4_backend import distinct_count
+from v4_figspec import FigureSpec
 from v4_themes import (
     COLORS, CATEGORY_PALETTE, GENERATION_COLORS,
     apply_theme, format_currency,
@@ -19,11 +25,15 @@ from v4_themes import (
     insight_title,
 )
 
+SOURCES = ("transactions", "odd")
+TXN_COLUMNS = ("mcc_code", "card_present")
+
 
 def run(ctx: dict) -> dict:
     """Run Lifecycle Management analyses."""
     df = ctx["combined_df"]
     odd = ctx["odd_df"]
+    act = ctx["activity"]
 
     sections, sheets = [], []
 
@@ -33,8 +43,9 @@ def run(ctx: dict) -> dict:
     _stage4_early_engagement(odd, df, ctx, sections, sheets)
     _stage5_daily_banking(odd, df, sections, sheets)
     _stage6_expansion(df, ctx, sections, sheets)
-    _stage7_retention(odd, df, sections, sheets)
-    _stage8_attrition(odd, df, ctx, sections, sheets)
+    _stage7_retention(odd, act, sections, sheets)
+    _activity_retention(act, sections, sheets)
+    _stage8_attrition(odd, df, act, ctx, sections, sheets)
 
     return {
         "title": "S9: Lifecycle Management",
@@ -58,7 +69,7 @@ _STAGES = [
     ("4. Early Engagement", "PARTIAL", "90-day spend profile, merchant diversity", "App login data"),
     ("5. Daily Banking", "FULL", "Primary bank score, txn frequency, ticket size", ""),
     ("6. Expansion", "PARTIAL", "MCC expansion, e-commerce growth", "Loan cross-sell data"),
-    ("7. Retention", "STRONG", "Closure rate, survival, dormancy", "NPS / satisfaction"),
+    ("7. Retention", "STRONG", "Closure rate, survival, dormancy, activity retention", "NPS / satisfaction"),
     ("8. Attrition", "FULL", "Lifecycle class, revenue at risk", ""),
 ]
 
@@ -74,7 +85,7 @@ def _data_coverage(odd, df, sections, sheets):
         })
     cov_df = pd.DataFrame(rows)
 
-    fig = go.Figure(go.Bar(
+    fig = FigureSpec(dict(type="bar",
         x=[_COVERAGE_COLORS.get(r["Coverage"], COLORS["neutral"]) for _, r in cov_df.iterrows()],
         y=cov_df["Stage"],
         orientation="h",
@@ -247,7 +258,7 @@ def _stage4_early_engagement(odd, df, ctx, sections, sheets):
         return
 
     # Early engagement metrics
-    early_accts = early["primary_account_num"].nunique()
+    early_accts = distinct_count(ctx, early["primary_account_num"])
     early_txn = len(early)
     early_spend = early["amount"].sum()
     avg_ticket = early["amount"].mean()
@@ -259,7 +270,7 @@ def _stage4_early_engagement(odd, df, ctx, sections, sheets):
     port_merchant_div = df.groupby("primary_account_num")[merch_col].nunique().mean()
 
     metrics = pd.DataFrame([
-        {"Metric": "Accounts with Early Txns", "Early (0-90d)": early_accts, "Portfolio Avg": df["primary_account_num"].nunique()},
+        {"Metric": "Accounts with Early Txns", "Early (0-90d)": early_accts, "Portfolio Avg": distinct_count(ctx, df["primary_account_num"])},
         {"Metric": "Avg Ticket Size ($)", "Early (0-90d)": round(avg_ticket, 2), "Portfolio Avg": round(port_avg_ticket, 2)},
         {"Metric": "Avg Merchant Diversity", "Early (0-90d)": round(merchant_diversity, 1), "Portfolio Avg": round(port_merchant_div, 1)},
         {"Metric": "Total Spend", "Early (0-90d)": round(early_spend, 2), "Portfolio Avg": round(df["amount"].sum(), 2)},
@@ -458,7 +469,7 @@ def _stage6_expansion(df, ctx, sections, sheets):
 # Stage 7: Retention
 # =============================================================================
 
-def _stage7_retention(odd, df, sections, sheets):
+def _stage7_retention(odd, act, sections, sheets):
     figs = []
 
     # Closure rate trending
@@ -476,20 +487,13 @@ def _stage7_retention(odd, df, sections, sheets):
             figs.append(fig)
 
     # Dormancy rate: zero txns in last 90 days
-    if "year_month" in df.columns:
-        sorted_months = sorted(df["year_month"].unique())
-        if len(sorted_months) >= 3:
-            recent_3 = sorted_months[-3:]
-            active_accts = set(df[df["year_month"].isin(recent_3)]["primary_account_num"].unique())
-            all_accts = set(odd["Acct Number"].unique()) if "Acct Number" in odd.columns else set()
-            dormant = all_accts - active_accts
-            dormancy_rate = (len(dormant) / len(all_accts) * 100) if all_accts else 0
-        else:
-            dormant = set()
-            dormancy_rate = 0
-    else:
-        dormant = set()
-        dormancy_rate = 0
+    n_dormant = 0
+    dormancy_rate = 0
+    if len(act["months"]) >= 3 and "Acct Number" in odd.columns:
+        active_accts = act["accounts"][active_in(act, last_months(act, 3))]
+        all_accts = pd.Index(odd["Acct Number"].unique())
+        n_dormant = int((~all_accts.isin(active_accts)).sum())
+        dormancy_rate = (n_dormant / len(all_accts) * 100) if len(all_accts) else 0
 
     # Retention cohort: opened per quarter, % still open
     retention_df = None
@@ -510,7 +514,7 @@ def _stage7_retention(odd, df, sections, sheets):
 
     narr = (
         f"Dormancy rate (no txns in last 90 days): <b>{dormancy_rate:.1f}%</b> "
-        f"({len(dormant):,} accounts)."
+        f"({n_dormant:,} accounts)."
     )
     if closure_df is not None and not closure_df.empty:
         narr += f" Total closures tracked: <b>{closure_df['Closures'].sum():,}</b>."
@@ -534,35 +538,99 @@ def _stage7_retention(odd, df, sections, sheets):
 
 
 # =============================================================================
-# Stage 8: Attrition & Recovery
+# Activity Retention, Reactivation & Streaks
 # =============================================================================
 
-def _stage8_attrition(odd, df, ctx, sections, sheets):
-    if "year_month" not in df.columns:
+def _activity_retention(act, sections, sheets):
+    """Month-k activity retention of first-transaction cohorts, reactivation, streaks."""
+    n_months = len(act["months"])
+    if n_months < 3:
         return
 
+    curve = retention_curve(act).round(1)
+    lag_cols = [c for c in curve.columns if c.startswith("Month ")]
+
+    # Average curve over the new-account cohorts (the first month of data
+    # holds existing accounts), weighted by cohort size
+    new_cohorts = curve.iloc[1:]
+    avg_rows = []
+    for col in lag_cols[1:]:
+        has_lag = new_cohorts[col].notna()
+        sizes = new_cohorts.loc[has_lag, "Accounts"]
+        if sizes.sum() > 0:
+            pct = (new_cohorts.loc[has_lag, col] * sizes).sum() / sizes.sum()
+            avg_rows.append({"Month": col, "Retention %": round(float(pct), 1)})
+    avg_df = pd.DataFrame(avg_rows)
+
+    current, longest = streaks(act)
+    n_reactivated = int(reactivated(act, gap=3).sum())
+    n_active_now = int((current > 0).sum())
+    n_always = int((longest == n_months).sum())
+    n_accts = len(act["accounts"])
+
+    figs = []
+    if not avg_df.empty:
+        fig = line_trend(avg_df, "Month", ["Retention %"], "New-Account Activity Retention")
+        fig.update_layout(title=insight_title(
+            "New-Account Activity Retention",
+            "% of accounts still transacting N months after their first transaction",
+        ))
+        figs.append(apply_theme(fig))
+
+    summary_df = pd.DataFrame([
+        {"Metric": "Active in latest month", "Accounts": n_active_now},
+        {"Metric": f"Active in all {n_months} months", "Accounts": n_always},
+        {"Metric": "Reactivated (back after 3+ idle months)", "Accounts": n_reactivated},
+        {"Metric": "Current streak of 3+ months", "Accounts": int((current >= 3).sum())},
+    ])
+    summary_df["% of Accounts"] = (summary_df["Accounts"] / max(n_accts, 1) * 100).round(1)
+
+    narr = (
+        f"<b>{n_always:,}</b> accounts ({n_always / max(n_accts, 1) * 100:.1f}%) transacted "
+        f"in every one of the {n_months} months; <b>{n_reactivated:,}</b> came back in the "
+        f"latest month after 3+ months without a transaction."
+    )
+    by_month = dict(zip(avg_df.get("Month", []), avg_df.get("Retention %", [])))
+    if "Month 1" in by_month:
+        narr += (f" Of new accounts, <b>{by_month['Month 1']:.1f}%</b> transact again "
+                 f"the month after their first transaction")
+        narr += (f" and <b>{by_month['Month 3']:.1f}%</b> three months after."
+                 if "Month 3" in by_month else ".")
+
+    cohort_df = curve.rename_axis("First Txn Month").reset_index()
+    sections.append({
+        "heading": "Activity Retention & Reactivation",
+        "narrative": narr,
+        "figures": figs,
+        "tables": [("Activity Summary", summary_df), ("Activity Retention by Cohort", cohort_df)],
+    })
+    sheets.append({
+        "name": "S9 Activity Cohorts", "df": cohort_df,
+        "pct_cols": lag_cols, "number_cols": ["Accounts"],
+    })
+
+
+# =============================================================================
+# Stage 8: Attrition & Recovery
+# =============================================================================
+
+def _stage8_attrition(odd, df, act, ctx, sections, sheets):
     config = ctx.get("config", {})
     interchange_rate = config.get("interchange_rate", 0.015)
 
-    sorted_months = sorted(df["year_month"].unique())
-    if len(sorted_months) < 3:
+    n_months = len(act["months"])
+    if n_months < 3:
         return
 
-    recent_3 = sorted_months[-3:]
-    prev_3 = sorted_months[-6:-3] if len(sorted_months) >= 6 else sorted_months[:3]
-
-    acct_recent = (
-        df[df["year_month"].isin(recent_3)]
-        .groupby("primary_account_num")["amount"].sum()
-        .rename("recent_spend")
-    )
-    acct_prev = (
-        df[df["year_month"].isin(prev_3)]
-        .groupby("primary_account_num")["amount"].sum()
-        .rename("prev_spend")
-    )
+    recent_3 = last_months(act, 3)
+    prev_3 = last_months(act, 3, skip=3) if n_months >= 6 else slice(0, 3)
 
-    acct = pd.concat([acct_recent, acct_prev], axis=1).fillna(0)
+    # Accounts with a transaction in either window
+    in_window = active_in(act, recent_3) | active_in(act, prev_3)
+    acct = pd.DataFrame({
+        "recent_spend": window_total(act, recent_3)[in_window],
+        "prev_spend": window_total(act, prev_3)[in_window],
+    }, index=act["accounts"][in_window])
     acct["change_pct"] = np.where(
         acct["prev_spend"] > 0,
         (acct["recent_spend"] - acct["prev_spend"]) / acct["prev_spend"] * 100,
@@ -589,7 +657,7 @@ def _stage8_attrition(odd, df, ctx, sections, sheets):
 
     # Revenue at risk: declining + dormant annual spend projected from prev
     at_risk_accts = acct[acct["lifecycle"].isin(["Declining", "Dormant"])]
-    annual_at_risk = at_risk_accts["prev_spend"].sum() * (12 / max(len(prev_3), 1))
+    annual_at_risk = at_risk_accts["prev_spend"].sum() * (12 / max(prev_3.stop - prev_3.start, 1))
     interchange_risk = annual_at_risk * interchange_rate
 
     # Waterfall chart: lifecycle flow
@@ -641,7 +709,7 @@ def _stage8_attrition(odd, df, ctx, sections, sheets):
     })
 
     # --- Enhanced attrition sub-analyses ---
-    _attrition_risk_scoring(odd, df, acct, sections, sheets)
+    _attrition_risk_scoring(odd, act, acct, sections, sheets)
     _attrition_competitor_xref(acct, ctx, sections, sheets)
     _attrition_revenue_impact(acct, config, sections, sheets)
 
@@ -650,7 +718,7 @@ def _stage8_attrition(odd, df, ctx, sections, sheets):
 # Attrition Enhancement: Risk Scoring
 # =============================================================================
 
-def _attrition_risk_scoring(odd, df, acct, sections, sheets):
+def _attrition_risk_scoring(odd, act, acct, sections, sheets):
     """Score each account 0-100 based on weighted attrition signals."""
     if acct.empty:
         return
@@ -658,8 +726,8 @@ def _attrition_risk_scoring(odd, df, acct, sections, sheets):
     scores = acct[["recent_spend", "prev_spend", "change_pct", "lifecycle"]].copy()
 
     # Signal 1: Months since last transaction (weight 25)
-    last_txn = df.groupby("primary_account_num")["transaction_date"].max()
-    max_date = df["transaction_date"].max()
+    last_txn = pd.Series(act["last_date"], index=act["accounts"])
+    max_date = act["as_of"]
     months_inactive = ((max_date - last_txn).dt.days / 30).clip(upper=12)
     scores["inactivity_score"] = months_inactive.reindex(scores.index).fillna(12)
     scores["inactivity_score"] = (scores["inactivity_score"] / 12 * 25).round(1)
@@ -728,7 +796,7 @@ def _attrition_risk_scoring(odd, df, acct, sections, sheets):
     }
     bar_colors = [colors.get(t, COLORS["neutral"]) for t in tier_dist["Risk Tier"]]
 
-    fig = go.Figure(go.Bar(
+    fig = FigureSpec(dict(type="bar",
         x=tier_dist["Risk Tier"],
         y=tier_dist["Accounts"],
         marker_color=bar_colors,
@@ -0,0 +1,180 @@
+"""Pre-aggregated segment cubes for the dashboard's Segment Explorer.
+
+"The dashboard, just for business accounts / just Branch 12" used to mean
+a full pipeline rerun on a filtered dataset. With ``segment_filters: true``
+the HTML dashboard instead embeds small cubes keyed by the segment
+dimensions (``segment_dims``, default ``SEGMENT_DIMS``), and its Segment
+Explorer re-aggregates KPIs, the monthly trend, top merchants and the
+monthly table in the browser whenever a filter changes.
+
+The dimensions are account attributes from the ODD, so each account sits
+in exactly one segment cell and distinct-account counts add up across
+cells (accounts not in the ODD, or with a blank attribute, fall into
+"Unknown"). Three cubes are embedded as compact JSON:
+
+- segment cell x month: spend, transactions, active accounts;
+- segment cell: accounts active at any time in the data;
+- segment cell x merchant, for the top ``SEGMENT_TOP_MERCHANTS``
+  merchants: spend, transactions.
+
+The payload is capped at ``segment_payload_kb``: past the cap the
+merchant cube is cut to fewer merchants, then the dimension with the most
+values is dropped, until it fits. The cubes are cached with the storyline
+results (``v4_result_cache``), so a rerun whose data did not change does
+not reload transactions to rebuild them.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from v4_backend import group_agg
+from v4_result_cache import data_fingerprint, load_result, save_result
+
+SEGMENT_DIMS = ("Business?", "Branch", "generation", "balance_tier")
+
+# Embedded payload cap (KB of JSON)
+SEGMENT_PAYLOAD_KB = 1500
+
+# Merchants with a per-segment breakdown (by total spend)
+SEGMENT_TOP_MERCHANTS = 25
+
+_CACHE_KEY = "html_segments"
+
+
+def _dims(config: dict) -> list[str]:
+    return list(config.get("segment_dims") or SEGMENT_DIMS)
+
+
+def _fingerprint(config: dict) -> str:
+    h = hashlib.sha1(data_fingerprint(config).encode())
+    h.update(Path(__file__).read_bytes())
+    h.update(json.dumps([_dims(config), config.get("segment_payload_kb", SEGMENT_PAYLOAD_KB),
+                         config.get("approx_distinct")], default=str).encode())
+    return h.hexdigest()
+
+
+def _cell_codes(df: pd.DataFrame, dims: list[str]) -> tuple[np.ndarray, list[list[str]]]:
+    """One int64 segment-cell code per row, and the labels of each dimension."""
+    codes, labels = [], []
+    for dim in dims:
+        dim_codes, uniques = pd.factorize(df[dim], sort=True)
+        # Missing -> "Unknown" (last code), so no row drops out of a group-by
+        codes.append(np.where(dim_codes < 0, len(uniques), dim_codes))
+        labels.append([str(u) for u in uniques] + ["Unknown"])
+    if not dims:
+        return np.zeros(len(df), dtype=np.int64), labels
+    shape = tuple(len(lbl) for lbl in labels)
+    return np.ravel_multi_index(codes, shape).astype(np.int64), labels
+
+
+def build_segment_cubes(ctx: dict, dims: list[str], top_merchants: int) -> dict:
+    """Segment cubes of the loaded transactions, as a JSON-ready dict."""
+    df = ctx["combined_df"]
+    dims = [d for d in dims if d in df.columns]
+    merch_col = "merchant_consolidated" if "merchant_consolidated" in df.columns else "merchant_name"
+    cell, labels = _cell_codes(df, dims)
+    frame = pd.DataFrame({
+        "cell": cell,
+        "year_month": df["year_month"].array,
+        "primary_account_num": df["primary_account_num"].array,
+        "amount": df["amount"].array,
+    })
+
+    monthly = group_agg(ctx, frame, ["cell", "year_month"], spend=("amount", "sum"),
+                        txns=("amount", "size"), accounts=("primary_account_num", "nunique"))
+    per_cell = group_agg(ctx, frame, "cell", accounts=("primary_account_num", "nunique"))
+
+    # Renumber the cells that occur 0..n-1 and keep their per-dimension labels
+    used = np.unique(np.concatenate([monthly["cell"].to_numpy(), per_cell["cell"].to_numpy()]))
+    remap = pd.Series(np.arange(len(used)), index=used)
+    shape = tuple(len(lbl) for lbl in labels)
+    cells = (np.stack(np.unravel_index(used, shape), axis=1).tolist()
+             if dims else [[] for _ in used])
+    months = sorted(monthly["year_month"].astype(str).unique())
+    month_pos = {m: i for i, m in enumerate(months)}
+
+    merchant_totals = group_agg(ctx, "combined_df", merch_col, spend=("amount", "sum"))
+    top = merchant_totals.nlargest(top_merchants, "spend")[merch_col].tolist()
+    is_top = df[merch_col].isin(top).to_numpy()
+    merch_frame = pd.DataFrame({
+        "cell": cell[is_top],
+        "merchant": pd.Categorical(df[merch_col].to_numpy()[is_top], categories=top).codes,
+        "amount": df["amount"].to_numpy()[is_top],
+    })
+    merch = group_agg(ctx, merch_frame, ["cell", "merchant"],
+                      spend=("amount", "sum"), txns=("amount", "size"))
+
+    accounts = np.zeros(len(used), dtype=np.int64)
+    accounts[remap[per_cell["cell"]].to_numpy()] = per_cell["accounts"].to_numpy()
+    return {
+        "dims": dims,
+        "values": labels,
+        "cells": cells,
+        "months": months,
+        # [cell, month index, spend, transactions, accounts]
+        "monthly": [
+            [int(c), month_pos[str(m)], round(float(s), 2), int(t), int(a)]
+            for c, m, s, t, a in zip(remap[monthly["cell"]].to_numpy(), monthly["year_month"],
+                                     monthly["spend"], monthly["txns"], monthly["accounts"])
+        ],
+        "cell_accounts": accounts.tolist(),
+        "merchants": [str(m) for m in top],
+        # [cell, merchant index, spend, transactions]
+        "merchant_rows": [
+            [int(c), int(m), round(float(s), 2), int(t)]
+            for c, m, s, t in zip(remap[merch["cell"]].to_numpy(), merch["merchant"],
+                                  merch["spend"], merch["txns"])
+        ],
+    }
+
+
+def segment_payload(ctx: dict | None, config: dict) -> str | None:
+    """JSON of the segment cubes for the dashboard, within ``segment_payload_kb``.
+
+    None unless ``segment_filters`` is on. *ctx* may be None (every
+    storyline came from the result cache): the transactions are then
+    loaded only if no cached payload matches.
+    """
+    if not config.get("segment_filters"):
+        return None
+    fingerprint = _fingerprint(config)
+    cached = load_result(config, _CACHE_KEY, fingerprint)
+    if cached is not None:
+        return cached["payload"]
+
+    if ctx is None:
+        from v4_data_loader import load_context
+
+        ctx = load_context(config)
+    cap = float(config.get("segment_payload_kb", SEGMENT_PAYLOAD_KB)) * 1024
+    dims = [d for d in _dims(config) if d in ctx["combined_df"].columns]
+    top = SEGMENT_TOP_MERCHANTS
+    while True:
+        try:
+            cubes = build_segment_cubes(ctx, dims, top)
+        except Exception as e:  # e.g. no transactions in the ODD-only context
+            print(f"[segments] WARNING: Segment Explorer skipped ({type(e).__name__}: {e})")
+            return None
+        payload = json.dumps(cubes, separators=(",", ":"))
+        if len(payload) <= cap:
+            break
+        if top > 10:
+            top = 10
+        elif dims:
+            widest = max(range(len(dims)), key=lambda i: len(cubes["values"][i]))
+            print(f"[segments] {len(payload) / 1024:,.0f} KB over segment_payload_kb, "
+                  f"dropping '{dims[widest]}' ({len(cubes['values'][widest]):,} values)")
+            dims.pop(widest)
+        else:
+            print("[segments] WARNING: segment cubes exceed segment_payload_kb even "
+                  "without dimensions, Segment Explorer skipped")
+            return None
+    print(f"[segments] Embedded cubes: {', '.join(dims) or 'no dimensions'}, "
+          f"{len(cubes['cells']):,} cells, {len(payload) / 1024:,.0f} KB")
+    save_result(config, _CACHE_KEY, fingerprint, {"payload": payload})
+    return payload
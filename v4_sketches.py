@@ -0,0 +1,459 @@
+"""Mergeable sketches for distinct counts, heavy hitters and quantiles.
+
+Exact ``nunique`` / top-N / ``median`` need every raw row of the window at
+once. The sketches here are small summaries that can be built per month and
+merged into any window afterwards, with a bounded error:
+
+- ``HyperLogLog`` / ``GroupedHLL`` -- distinct accounts (overall / per
+  merchant or MCC); relative error about ``1.04 / sqrt(2**p)``;
+- ``SpaceSaving`` -- heavy-hitter merchants by spend or transactions; each
+  estimate is an upper bound, ``estimate - error`` a lower bound, and the
+  error is at most ``total / k``;
+- ``KLL`` -- ticket-size quantiles; rank error about ``3.3 / k``.
+
+``sketch_error`` (config, default 0.01) sizes all three. Per-month sketches
+are built once per transaction file and cached in ``sketch_dir`` (default
+``.cache/sketches/<client_id>/``), so an update only reads files that are
+new or changed since the last one:
+
+    python v4_sketches.py my_client.yaml [YYYY-MM YYYY-MM]
+
+prints unique accounts, top merchants and ticket quantiles for the window.
+With ``approx_distinct: true`` the storyline group-bys
+(``v4_backend.group_agg``) and scalar account / merchant counts
+(``v4_backend.distinct_count``) use HyperLogLog as well.
+"""
+from __future__ import annotations
+
+import math
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SKETCH_DIR = ".cache/sketches"
+SKETCH_ERROR = 0.01
+
+# Columns a monthly sketch reads from each transaction file
+_SKETCH_COLUMNS = ["transaction_date", "primary_account_num", "amount",
+                   "mcc_code", "merchant_name"]
+
+
+# =========================================================================
+# Hashing and sizing
+# =========================================================================
+
+def _hash64(values: pd.Series) -> np.ndarray:
+    """64-bit hash per value; integral floats hash like the integers they hold."""
+    if values.dtype.kind == "f":
+        values = values.astype(np.int64)
+    elif values.dtype.kind not in "iu":
+        values = values.astype(str)
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Exact bit length of uint64 values (via two 32-bit halves)."""
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1])
+
+
+def hll_precision(error: float) -> int:
+    """HyperLogLog precision ``p`` whose standard error is at most *error*."""
+    return min(18, max(4, math.ceil(math.log2((1.04 / error) ** 2))))
+
+
+def _registers(hashes: np.ndarray, p: int) -> tuple[np.ndarray, np.ndarray]:
+    """Register index and rank (leading zeros + 1) per hash."""
+    q = 64 - p
+    idx = (hashes >> np.uint64(q)).astype(np.int32)
+    rest = hashes & np.uint64((1 << q) - 1)
+    rank = (q - _bit_length(rest) + 1).astype(np.uint8)
+    return idx, rank
+
+
+def _hll_estimate(m: int, z: np.ndarray, zeros: np.ndarray) -> np.ndarray:
+    """HLL cardinality from ``sum(2**-rank)`` (*z*) and empty registers."""
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / z
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+# =========================================================================
+# Distinct counts
+# =========================================================================
+
+class HyperLogLog:
+    """Distinct count of the values added (dense registers)."""
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, values) -> "HyperLogLog":
+        values = pd.Series(values).dropna()
+        if len(values):
+            idx, rank = _registers(_hash64(values), self.p)
+            np.maximum.at(self.registers, idx, rank)
+        return self
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError(f"Cannot merge HyperLogLog p={self.p} with p={other.p}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> float:
+        m = len(self.registers)
+        z = np.ldexp(1.0, -self.registers.astype(np.int32)).sum()
+        return float(_hll_estimate(m, z, np.count_nonzero(self.registers == 0)))
+
+    @property
+    def error(self) -> float:
+        return 1.04 / math.sqrt(1 << self.p)
+
+
+class GroupedHLL:
+    """HyperLogLog per group (merchant, MCC, ...), stored sparsely.
+
+    Only non-empty registers are kept, as a (group, register, rank) table,
+    so a merchant with a handful of accounts costs a handful of rows.
+    Merging the rows of several groups counts the union (e.g. all the
+    merchants of one competitor).
+    """
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.table = pd.DataFrame({"group": pd.Series(dtype=object),
+                                   "reg": pd.Series(dtype=np.int32),
+                                   "rank": pd.Series(dtype=np.uint8)})
+
+    def add(self, groups, values) -> "GroupedHLL":
+        frame = pd.DataFrame({"group": np.asarray(groups, dtype=object),
+                              "value": pd.Series(values).to_numpy()}).dropna()
+        if len(frame):
+            reg, rank = _registers(_hash64(frame["value"]), self.p)
+            new = pd.DataFrame({"group": frame["group"].to_numpy(), "reg": reg, "rank": rank})
+            self.table = self._reduce(pd.concat([self.table, new], ignore_index=True))
+        return self
+
+    def merge(self, other: "GroupedHLL") -> "GroupedHLL":
+        if other.p != self.p:
+            raise ValueError(f"Cannot merge GroupedHLL p={self.p} with p={other.p}")
+        self.table = self._reduce(pd.concat([self.table, other.table], ignore_index=True))
+        return self
+
+    @staticmethod
+    def _reduce(table: pd.DataFrame) -> pd.DataFrame:
+        return table.groupby(["group", "reg"], sort=False, as_index=False)["rank"].max()
+
+    def counts(self, groups=None) -> pd.Series:
+        """Distinct count per group (or for *groups*, each separately)."""
+        table = self.table if groups is None else self.table[self.table["group"].isin(groups)]
+        m = 1 << self.p
+        agg = (table.assign(w=np.ldexp(1.0, -table["rank"].astype(np.int32)))
+               .groupby("group", sort=False)
+               .agg(z=("w", "sum"), used=("reg", "size")))
+        zeros = m - agg["used"].to_numpy()
+        est = _hll_estimate(m, agg["z"].to_numpy() + zeros, zeros)
+        return pd.Series(est, index=agg.index, name="accounts").sort_values(ascending=False)
+
+    def union_count(self, groups) -> float:
+        """Distinct count over the union of *groups*."""
+        table = self.table[self.table["group"].isin(groups)]
+        regs = table.groupby("reg")["rank"].max()
+        m = 1 << self.p
+        zeros = m - len(regs)
+        z = np.ldexp(1.0, -regs.to_numpy().astype(np.int32)).sum() + zeros
+        return float(_hll_estimate(m, z, zeros))
+
+
+# =========================================================================
+# Heavy hitters
+# =========================================================================
+
+class SpaceSaving:
+    """Top-k items by weight (mergeable Space-Saving summary).
+
+    ``counts`` are upper bounds, ``counts - errors`` lower bounds; an item
+    not kept weighs at most ``floor``. Error per item <= total weight / k.
+    """
+
+    def __init__(self, k: int = 100):
+        self.k = k
+        self.counts = pd.Series(dtype=np.float64)
+        self.errors = pd.Series(dtype=np.float64)
+        self.floor = 0.0
+        self.total = 0.0
+
+    def add(self, items, weights=None) -> "SpaceSaving":
+        items = pd.Series(np.asarray(items, dtype=object))
+        weights = pd.Series(1.0 if weights is None else np.asarray(weights, dtype=np.float64),
+                            index=items.index)
+        batch = SpaceSaving(self.k)
+        batch.counts = weights.groupby(items.to_numpy()).sum()
+        batch.errors = pd.Series(0.0, index=batch.counts.index)
+        batch.total = float(weights.sum())
+        batch._truncate()
+        return self.merge(batch)
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        index = self.counts.index.union(other.counts.index)
+        self.counts = (self.counts.reindex(index).fillna(self.floor)
+                       + other.counts.reindex(index).fillna(other.floor))
+        self.errors = (self.errors.reindex(index).fillna(self.floor)
+                       + other.errors.reindex(index).fillna(other.floor))
+        self.floor += other.floor
+        self.total += other.total
+        self._truncate()
+        return self
+
+    def _truncate(self) -> None:
+        if len(self.counts) > self.k:
+            order = self.counts.sort_values(ascending=False, kind="stable")
+            self.floor = max(self.floor, float(order.iloc[self.k]))
+            keep = order.index[: self.k]
+            self.counts, self.errors = self.counts[keep], self.errors[keep]
+
+    def top(self, n: int = 10) -> pd.DataFrame:
+        """The *n* heaviest items: ``estimate`` and guaranteed ``lower`` bound."""
+        order = self.counts.sort_values(ascending=False, kind="stable").head(n)
+        return pd.DataFrame({"item": order.index, "estimate": order.to_numpy(),
+                             "lower": (order - self.errors[order.index]).to_numpy()})
+
+
+# =========================================================================
+# Quantiles
+# =========================================================================
+
+class KLL:
+    """Quantile sketch (KLL compactors, capacity decaying by 2/3 per level)."""
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = k
+        self.n = 0
+        self.levels: list[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - 1 - level
+        return max(2, math.ceil(self.k * (2 / 3) ** depth))
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(items)
+            keep = items[:1] if len(items) % 2 else items[:0]
+            pairs = items[len(keep):]
+            promoted = pairs[self._rng.integers(2)::2]
+            self.levels[level] = keep
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level = 0  # capacities shrink when a level is added
+
+    def add(self, values) -> "KLL":
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+        return self
+
+    def merge(self, other: "KLL") -> "KLL":
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, qs) -> np.ndarray:
+        items = np.concatenate(self.levels)
+        if not len(items):
+            return np.full(len(qs), np.nan)
+        weights = np.concatenate([np.full(len(x), 2.0 ** h) for h, x in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        cum = np.cumsum(weights[order])
+        pos = np.searchsorted(cum, np.asarray(qs) * cum[-1], side="left")
+        return items[order][np.minimum(pos, len(items) - 1)]
+
+    @property
+    def error(self) -> float:
+        return 3.3 / self.k
+
+
+# =========================================================================
+# Monthly sketches
+# =========================================================================
+
+def new_month_sketch(error: float = SKETCH_ERROR) -> dict:
+    """Empty set of sketches for one month, sized for *error*."""
+    p = hll_precision(error)
+    k = math.ceil(1 / error)
+    return {
+        "rows": 0,
+        "spend": 0.0,
+        "accounts": HyperLogLog(p),
+        "merchant_accounts": GroupedHLL(p),
+        "mcc_accounts": GroupedHLL(p),
+        "merchant_spend": SpaceSaving(k),
+        "merchant_txns": SpaceSaving(k),
+        "ticket": KLL(math.ceil(3.3 / error)),
+    }
+
+
+def add_rows(sketch: dict, df: pd.DataFrame) -> dict:
+    """Fold transaction rows (loader layout) into a month sketch."""
+    merch_col = "merchant_consolidated" if "merchant_consolidated" in df.columns else "merchant_name"
+    accts = df["primary_account_num"]
+    sketch["rows"] += len(df)
+    sketch["spend"] += float(df["amount"].sum())
+    sketch["accounts"].add(accts)
+    sketch["merchant_accounts"].add(df[merch_col], accts)
+    if "mcc_code" in df.columns:
+        sketch["mcc_accounts"].add(df["mcc_code"].astype(str), accts)
+    sketch["merchant_spend"].add(df[merch_col], df["amount"])
+    sketch["merchant_txns"].add(df[merch_col])
+    sketch["ticket"].add(df["amount"])
+    return sketch
+
+
+def merge_sketches(sketches) -> dict:
+    """Merge month sketches (same error) into one window sketch."""
+    sketches = list(sketches)
+    if not sketches:
+        raise ValueError("No month sketches to merge")
+    window = pickle.loads(pickle.dumps(sketches[0]))  # deep copy
+    for other in sketches[1:]:
+        window["rows"] += other["rows"]
+        window["spend"] += other["spend"]
+        for key in ("accounts", "merchant_accounts", "mcc_accounts",
+                    "merchant_spend", "merchant_txns", "ticket"):
+            window[key].merge(other[key])
+    return window
+
+
+def _cache_path(config: dict, filepath: Path) -> Path | None:
+    sketch_dir = config.get("sketch_dir", SKETCH_DIR)
+    if not sketch_dir:
+        return None
+    client = str(config.get("client_id") or "default")
+    return Path(sketch_dir) / client / f"{filepath.stem}.pkl"
+
+
+def update_sketches(config: dict) -> dict[str, dict]:
+    """Month sketches for the selected transaction files -> {"YYYY-MM": sketch}.
+
+    Files whose sketch is cached (same name, size, mtime and error) are not
+    read; new or changed files are read once and their sketch cached. With
+    ``merchant_clusters`` set, merchants are mapped as in the loader and the
+    mapping file's stamp is part of the cache check.
+    """
+    from v4_data_loader import _read_transactions_pandas, select_transaction_files
+
+    error = float(config.get("sketch_error", SKETCH_ERROR))
+    clusters = config.get("merchant_clusters") or ""
+    cluster_stamp = ()
+    if clusters:
+        mapping = Path(clusters)
+        cluster_stamp = ((clusters, mapping.stat().st_mtime_ns if mapping.is_file() else 0),)
+    months: dict[str, dict] = {}
+    built = 0
+    for filepath, file_date in sorted(select_transaction_files(config), key=lambda x: x[1]):
+        st = filepath.stat()
+        stamp = (filepath.name, st.st_size, st.st_mtime_ns, error) + cluster_stamp
+        path = _cache_path(config, filepath)
+        sketch = None
+        if path is not None and path.is_file():
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            if entry.get("stamp") == stamp:
+                sketch = entry["sketch"]
+        if sketch is None:
+            df = _read_transactions_pandas([filepath], _SKETCH_COLUMNS)
+            if clusters:
+                from v4_merchant_clusters import apply_clusters
+
+                df["merchant_consolidated"] = apply_clusters(df["merchant_consolidated"], clusters)
+            sketch = add_rows(new_month_sketch(error), df)
+            built += 1
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+                with open(tmp, "wb") as f:
+                    pickle.dump({"stamp": stamp, "sketch": sketch}, f,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+        month = f"{file_date:%Y-%m}"
+        months[month] = merge_sketches([months[month], sketch]) if month in months else sketch
+    print(f"[sketches] {len(months)} month(s): {built} built, {len(months) - built} cached "
+          f"(error {error:.1%})")
+    return months
+
+
+def window_summary(months: dict[str, dict], start: str | None = None,
+                   end: str | None = None, top_n: int = 10) -> dict:
+    """Merge the months in ``[start, end]`` and summarise the window.
+
+    Returns
+    -------
+    dict with ``months``, ``rows``, ``spend``, ``accounts`` (estimate),
+    ``account_error`` (relative), ``top_merchants`` (DataFrame with spend
+    bounds and distinct accounts) and ``ticket_quantiles`` (Series).
+    """
+    keys = [m for m in sorted(months) if (start is None or m >= start) and (end is None or m <= end)]
+    window = merge_sketches(months[m] for m in keys)
+    top = window["merchant_spend"].top(top_n).rename(
+        columns={"item": "Merchant", "estimate": "Spend (upper)", "lower": "Spend (lower)"})
+    accounts = window["merchant_accounts"].counts(top["Merchant"])
+    top["Unique Accounts (est.)"] = top["Merchant"].map(accounts).round().astype("Int64")
+    qs = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+    return {
+        "months": keys,
+        "rows": window["rows"],
+        "spend": window["spend"],
+        "accounts": window["accounts"].count(),
+        "account_error": window["accounts"].error,
+        "top_merchants": top,
+        "ticket_quantiles": pd.Series(window["ticket"].quantiles(qs), index=qs, name="ticket"),
+    }
+
+
+def group_nunique(df: pd.DataFrame, by: list[str], col: str, error: float = SKETCH_ERROR) -> pd.Series:
+    """Approximate ``df.groupby(by)[col].nunique()`` with one HyperLogLog per group."""
+    # rows with a null key get a NaN (float) or -1 group code: dropped, as in groupby
+    codes = df.groupby(by, observed=True, sort=True).ngroup().to_numpy(dtype=np.float64)
+    valid = ~np.isnan(codes) & (codes >= 0)
+    codes = codes[valid].astype(np.int64)
+    n_groups = int(codes.max()) + 1 if len(codes) else 0
+    hll = GroupedHLL(hll_precision(error)).add(codes, df[col].to_numpy()[valid])
+    counts = hll.counts()
+    return counts.reindex(range(n_groups), fill_value=0.0).round().astype(np.int64)
+
+
+if __name__ == "__main__":
+    from v4_data_loader import load_config
+
+    config = load_config(sys.argv[1] if len(sys.argv) > 1 else "v4_config.yaml")
+    start, end = (sys.argv[2:4] + [None, None])[:2]
+    summary = window_summary(update_sketches(config), start, end,
+                             top_n=int(config.get("top_n", 10)))
+    print(f"\nWindow {summary['months'][0]} .. {summary['months'][-1]}: "
+          f"{summary['rows']:,} transactions, ${summary['spend']:,.2f}")
+    print(f"Unique accounts: ~{summary['accounts']:,.0f} (+/-{summary['account_error']:.1%})")
+    print("\nTop merchants by spend:")
+    print(summary["top_merchants"].to_string(index=False))
+    print("\nTicket size quantiles:")
+    print(summary["ticket_quantiles"].round(2).to_string())
@@ -0,0 +1,149 @@
+"""Spill large storyline tables to Parquet and stream them back in chunks.
+
+A full run keeps every storyline result in memory until the reports are
+written; account-level sheets (marketing lists, segment rosters) can hold
+hundreds of thousands of rows. ``spill_result`` moves each sheet / section
+table with at least ``spill_rows`` rows (default ``SPILL_ROWS``) to a
+Parquet file as soon as the storyline finishes and leaves a
+``SpilledTable`` in its place. The Excel and HTML writers read those back
+``SPILL_CHUNK_ROWS`` rows at a time (``iter_frames``), so peak memory is
+one chunk per table instead of every table of the run.
+
+Spill files live in a temporary directory (under ``spill_dir`` when set)
+that is removed once no ``SpilledTable`` refers to it. A pickled
+``SpilledTable`` (result cache, batch workers) is a plain DataFrame again.
+``spill_rows: 0`` (or no pyarrow) keeps everything in memory.
+"""
+from __future__ import annotations
+
+import importlib.util
+import tempfile
+from pathlib import Path
+from typing import Iterator, Union
+
+import pandas as pd
+
+# Sheets / tables with at least this many rows are spilled
+SPILL_ROWS = 25_000
+
+# Rows per chunk when a spilled table is streamed back
+SPILL_CHUNK_ROWS = 10_000
+
+
+class SpilledTable:
+    """A DataFrame stored as Parquet, read back whole or in chunks.
+
+    Stands in for the frame in a result's ``sheets`` / ``tables``; it
+    exposes the metadata the report writers check (``columns``, ``empty``,
+    ``len``) without loading any rows.
+    """
+
+    def __init__(self, path: Path, columns: pd.Index, n_rows: int,
+                 store: tempfile.TemporaryDirectory):
+        self.path = path
+        self.columns = columns
+        self.n_rows = n_rows
+        self._store = store  # keeps the spill directory alive
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @property
+    def empty(self) -> bool:
+        return self.n_rows == 0 or len(self.columns) == 0
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.n_rows, len(self.columns)
+
+    def iter_chunks(self, rows: int = SPILL_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """Yield the table ``rows`` rows at a time."""
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(self.path)
+        for batch in pf.iter_batches(batch_size=rows):
+            yield batch.to_pandas()
+
+    def to_frame(self) -> pd.DataFrame:
+        """Load the whole table."""
+        return pd.read_parquet(self.path)
+
+    def __reduce__(self):
+        return _as_frame, (self.to_frame(),)
+
+    def __repr__(self) -> str:
+        return f"SpilledTable({self.path.name}, {self.n_rows:,} rows x {len(self.columns)} cols)"
+
+
+def _as_frame(df: pd.DataFrame) -> pd.DataFrame:
+    return df
+
+
+TableLike = Union[pd.DataFrame, SpilledTable]
+
+
+def iter_frames(table: TableLike, rows: int = SPILL_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield an in-memory frame as-is, or a spilled table chunk by chunk."""
+    if isinstance(table, SpilledTable):
+        yield from table.iter_chunks(rows)
+    else:
+        yield table
+
+
+def as_frame(table: TableLike) -> pd.DataFrame:
+    """The table as a DataFrame (loads a spilled table)."""
+    return table.to_frame() if isinstance(table, SpilledTable) else table
+
+
+def new_spill_store(config: dict) -> tempfile.TemporaryDirectory | None:
+    """Temporary spill directory for one run, or None if spilling is off."""
+    if not config.get("spill_rows", SPILL_ROWS):
+        return None
+    if importlib.util.find_spec("pyarrow") is None:
+        print("[spill] WARNING: pyarrow not installed, report tables kept in memory")
+        return None
+    spill_dir = config.get("spill_dir")
+    if spill_dir:
+        Path(spill_dir).mkdir(parents=True, exist_ok=True)
+    return tempfile.TemporaryDirectory(prefix="v4_spill_", dir=spill_dir or None)
+
+
+def _spill_frame(df: pd.DataFrame, store: tempfile.TemporaryDirectory,
+                 name: str) -> TableLike:
+    path = Path(store.name) / f"{name}.parquet"
+    try:
+        df.to_parquet(path, index=False)
+    except (ValueError, TypeError, ImportError) as e:
+        # e.g. mixed-type object columns or non-string column names
+        print(f"[spill] Keeping {name} in memory: {e}")
+        path.unlink(missing_ok=True)
+        return df
+    return SpilledTable(path, df.columns, len(df), store)
+
+
+def spill_result(result: dict, key: str, config: dict,
+                 store: tempfile.TemporaryDirectory | None) -> dict:
+    """Replace the large sheet / section-table frames of *result* in place.
+
+    A frame used both as a sheet and as a section table is written once.
+    """
+    min_rows = config.get("spill_rows", SPILL_ROWS)
+    if store is None or not min_rows:
+        return result
+
+    spilled: dict[int, TableLike] = {}
+
+    def spill(df, name):
+        if not isinstance(df, pd.DataFrame) or len(df) < min_rows:
+            return df
+        if id(df) not in spilled:
+            spilled[id(df)] = _spill_frame(df, store, f"{key}-{len(spilled)}")
+            print(f"[spill] {key} / {name}: {len(df):,} rows")
+        return spilled[id(df)]
+
+    for sheet in result.get("sheets", []):
+        sheet["df"] = spill(sheet.get("df"), sheet.get("name", "sheet"))
+    for section in result.get("sections", []):
+        if section.get("tables"):
+            section["tables"] = [(title, spill(df, title)) for title, df in section["tables"]]
+    return result
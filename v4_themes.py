@@ -1,18 +1,23 @@
 """Chart theme, color palettes, and shared chart builders for V4 analysis.
 
 Single source of truth for all chart styling. Every builder function returns
-a themed go.Figure ready for HTML rendering or PNG export (for Excel embedding).
+a ``FigureSpec`` (see ``v4_figspec``): plain trace / layout data that
+``to_figure`` validates and themes once, at HTML rendering, in the app or
+at PNG export (for Excel embedding).
 
 Registers a 'v4_consultant' Plotly template lazily via ensure_theme().
 """
 
 from __future__ import annotations
 
+from pathlib import Path
 from typing import Sequence
 
 import plotly.graph_objects as go
 import plotly.io as pio
 
+from v4_figspec import FigureLike, FigureSpec
+
 # =============================================================================
 # Color Palettes
 # =============================================================================
@@ -142,11 +147,15 @@ def ensure_theme() -> None:
 # =============================================================================
 
 
-def apply_theme(fig: go.Figure) -> go.Figure:
+def apply_theme(fig: FigureLike) -> FigureLike:
     """Apply the consultant theme to any existing figure.
 
-    Useful when a figure was created outside the builder functions.
+    Useful when a figure was created outside the builder functions. A
+    ``FigureSpec`` is returned unchanged: ``to_figure`` themes it at render
+    time.
     """
+    if isinstance(fig, FigureSpec):
+        return fig
     ensure_theme()
     fig.update_layout(template="v4_consultant")
     return fig
@@ -202,19 +211,17 @@ def _fmt_value(val: float, fmt_spec: str) -> str:
 # =============================================================================
 
 
-def save_chart(fig: go.Figure, path: str, width: int = 900, height: int = 500) -> None:
+def save_chart(fig: FigureLike, path: str, width: int = 900, height: int = 500,
+               scale: float = 1) -> None:
     """Save a figure as PNG for Excel embedding.
 
-    Uses scale=1 for Excel-appropriate resolution. For standalone PNGs
-    intended for presentation decks, use scale=3 via fig.write_image directly.
+    Uses scale=1 for Excel-appropriate resolution; scale=3 for standalone
+    PNGs intended for presentation decks. Goes through the PNG cache in
+    ``v4_chart_export``; to export many charts use ``render_pngs``.
     """
-    fig.write_image(
-        path,
-        width=width,
-        height=height,
-        scale=1,
-        engine="kaleido",
-    )
+    from v4_chart_export import render_png
+
+    Path(path).write_bytes(render_png(fig, width=width, height=height, scale=scale))
 
 
 # =============================================================================
@@ -232,13 +239,12 @@ def horizontal_bar(
     top_n: int = 25,
     show_values: bool = True,
     value_format: str = "${:,.0f}",
-) -> go.Figure:
+) -> FigureSpec:
     """Horizontal bar chart for rankings (merchants, competitors, etc).
 
     Data is sorted descending by x_col and limited to top_n rows.
     Bars render bottom-to-top so rank #1 appears at the top.
     """
-    ensure_theme()
     bar_color = color or COLORS["primary"]
 
     subset = df.nlargest(top_n, x_col)
@@ -250,8 +256,8 @@ def horizontal_bar(
 
     text_vals = [_fmt_value(v, value_format) for v in values] if show_values else None
 
-    fig = go.Figure(
-        go.Bar(
+    fig = FigureSpec(
+        dict(type="bar",
             x=values,
             y=labels,
             orientation="h",
@@ -291,12 +297,11 @@ def lollipop_chart(
     top_n: int = 25,
     accent_n: int = 3,
     value_format: str = "${:,.0f}",
-) -> go.Figure:
+) -> FigureSpec:
     """Lollipop chart (dot + stem line) for cleaner ranking visualization.
 
     Top accent_n items receive the accent color; the rest are neutral gray.
     """
-    ensure_theme()
     dot_color = color or COLORS["secondary"]
 
     subset = df.nlargest(top_n, x_col)
@@ -307,7 +312,7 @@ def lollipop_chart(
     n = len(labels)
 
     if n == 0:
-        fig = go.Figure()
+        fig = FigureSpec()
         fig.add_annotation(
             text="No data available", xref="paper", yref="paper",
             x=0.5, y=0.5, showarrow=False,
@@ -326,11 +331,11 @@ def lollipop_chart(
         stem_x.extend([0, val, None])
         stem_y.extend([label, label, None])
 
-    fig = go.Figure()
+    fig = FigureSpec()
 
     # Stems
     fig.add_trace(
-        go.Scatter(
+        dict(type="scatter",
             x=stem_x,
             y=stem_y,
             mode="lines",
@@ -342,7 +347,7 @@ def lollipop_chart(
 
     # Dots with value labels
     fig.add_trace(
-        go.Scatter(
+        dict(type="scatter",
             x=values,
             y=labels,
             mode="markers+text",
@@ -381,21 +386,20 @@ def line_trend(
     *,
     colors: list[str] | None = None,
     y_format: str | None = None,
-) -> go.Figure:
+) -> FigureSpec:
     """Multi-line trend chart for time series data.
 
     Each column in y_cols becomes a separate line. Provides clean hover
     labels and optional y-axis formatting (e.g. '$,.0f' or ',.0%').
     """
-    ensure_theme()
     line_colors = colors or CATEGORY_PALETTE
 
-    fig = go.Figure()
+    fig = FigureSpec()
 
     for idx, col in enumerate(y_cols):
         c = line_colors[idx % len(line_colors)]
         fig.add_trace(
-            go.Scatter(
+            dict(type="scatter",
                 x=df[x_col],
                 y=df[col],
                 mode="lines+markers",
@@ -431,16 +435,15 @@ def stacked_bar(
     *,
     colors: list[str] | None = None,
     as_percentage: bool = False,
-) -> go.Figure:
+) -> FigureSpec:
     """Stacked bar chart for composition over categories.
 
     When as_percentage=True, values are normalized to 100% within each
     x-category. Otherwise raw values are stacked.
     """
-    ensure_theme()
     bar_colors = colors or CATEGORY_PALETTE
 
-    fig = go.Figure()
+    fig = FigureSpec()
 
     if as_percentage:
         totals = df[y_cols].sum(axis=1).replace(0, 1)
@@ -454,7 +457,7 @@ def stacked_bar(
         hover_fmt = "%{y:.1f}%" if as_percentage else "%{y:,.0f}"
 
         fig.add_trace(
-            go.Bar(
+            dict(type="bar",
                 x=df[x_col],
                 y=y_values,
                 name=col,
@@ -486,12 +489,11 @@ def donut_chart(
     *,
     colors: list[str] | None = None,
     hole: float = 0.4,
-) -> go.Figure:
+) -> FigureSpec:
     """Donut/pie chart for composition breakdowns.
 
     Uses pull on the largest slice for visual emphasis.
     """
-    ensure_theme()
     fill_colors = colors or CATEGORY_PALETTE
 
     # Slight pull on the largest slice
@@ -500,8 +502,8 @@ def donut_chart(
         max_idx = max(range(len(values)), key=lambda i: values[i])
         pull_values[max_idx] = 0.04
 
-    fig = go.Figure(
-        go.Pie(
+    fig = FigureSpec(
+        dict(type="pie",
             labels=list(labels),
             values=list(values),
             hole=hole,
@@ -534,14 +536,12 @@ def heatmap(
     *,
     colorscale: str = "Blues",
     fmt: str = ".0f",
-) -> go.Figure:
+) -> FigureSpec:
     """Heatmap for matrix data (monthly ranks, correlations, etc).
 
     DataFrame index becomes y-axis labels, columns become x-axis labels.
     Cell values are displayed as annotations.
     """
-    ensure_theme()
-
     z_values = df.values.tolist()
     x_labels = [str(c) for c in df.columns]
     y_labels = [str(i) for i in df.index]
@@ -561,8 +561,8 @@ def heatmap(
                 )
             )
 
-    fig = go.Figure(
-        go.Heatmap(
+    fig = FigureSpec(
+        dict(type="heatmap",
             z=z_values,
             x=x_labels,
             y=y_labels,
@@ -591,28 +591,26 @@ def bullet_chart(
     title: str,
     *,
     ranges: list[float] | None = None,
-) -> go.Figure:
+) -> FigureSpec:
     """Bullet chart for KPI scorecards.
 
     Shows a single KPI value against a target, with optional background
     ranges for poor/ok/good bands. Default ranges are [25%, 50%, 100%]
     of target.
     """
-    ensure_theme()
-
     if ranges is None:
         ranges = [target * 0.5, target * 0.75, target * 1.2]
 
     ranges_sorted = sorted(ranges)
 
-    fig = go.Figure()
+    fig = FigureSpec()
 
     # Background range bands (light to dark gray)
     band_colors = ["#EEEEEE", "#DDDDDD", "#CCCCCC"]
     prev = 0.0
     for idx, r in enumerate(ranges_sorted):
         fig.add_trace(
-            go.Bar(
+            dict(type="bar",
                 x=[r - prev],
                 y=[title],
                 orientation="h",
@@ -627,7 +625,7 @@ def bullet_chart(
 
     # Actual value bar
     fig.add_trace(
-        go.Bar(
+        dict(type="bar",
             x=[value],
             y=[title],
             orientation="h",
@@ -640,7 +638,7 @@ def bullet_chart(
 
     # Target marker line
     fig.add_trace(
-        go.Scatter(
+        dict(type="scatter",
             x=[target, target],
             y=[title, title],
             mode="markers",
@@ -680,15 +678,13 @@ def scatter_plot(
     size_col: str | None = None,
     color_col: str | None = None,
     hover_col: str | None = None,
-) -> go.Figure:
+) -> FigureSpec:
     """Scatter plot with optional bubble sizing and color encoding.
 
     When color_col is provided, points are colored by that column's values
     using the category palette. When size_col is provided, marker area
     scales proportionally.
     """
-    ensure_theme()
-
     marker_opts: dict = dict(
         color=COLORS["primary"],
         size=8,
@@ -717,8 +713,8 @@ def scatter_plot(
         else x_col + ": %{x:,.0f}<br>" + y_col + ": %{y:,.0f}<extra></extra>"
     )
 
-    fig = go.Figure(
-        go.Scatter(
+    fig = FigureSpec(
+        dict(type="scatter",
             x=df[x_col],
             y=df[y_col],
             mode="markers",
@@ -745,7 +741,7 @@ def scatter_plot(
         }
         for val, c in color_map.items():
             fig.add_trace(
-                go.Scatter(
+                dict(type="scatter",
                     x=[None],
                     y=[None],
                     mode="markers",
@@ -766,17 +762,16 @@ def grouped_bar(
     title: str,
     *,
     colors: list[str] | None = None,
-) -> go.Figure:
+) -> FigureSpec:
     """Side-by-side grouped bar chart for comparing metrics across categories."""
-    ensure_theme()
     bar_colors = colors or CATEGORY_PALETTE
 
-    fig = go.Figure()
+    fig = FigureSpec()
 
     for idx, col in enumerate(y_cols):
         c = bar_colors[idx % len(bar_colors)]
         fig.add_trace(
-            go.Bar(
+            dict(type="bar",
                 x=df[x_col],
                 y=df[col],
                 name=col,
@@ -800,17 +795,15 @@ def waterfall_chart(
     categories: Sequence[str],
     values: Sequence[float],
     title: str,
-) -> go.Figure:
+) -> FigureSpec:
     """Waterfall chart for showing composition or sequential changes.
 
     The last category is treated as the total. Positive steps render in
     the positive color, negative steps in the negative color.
     """
-    ensure_theme()
-
     n = len(categories)
     if n == 0:
-        fig = go.Figure()
+        fig = FigureSpec()
         fig.add_annotation(
             text="No data available", xref="paper", yref="paper",
             x=0.5, y=0.5, showarrow=False,
@@ -832,8 +825,8 @@ def waterfall_chart(
         else:
             text_values.append(format_currency(val))
 
-    fig = go.Figure(
-        go.Waterfall(
+    fig = FigureSpec(
+        dict(type="waterfall",
             x=list(categories),
             y=list(values),
             measure=measures,
@@ -888,10 +881,10 @@ def insight_title(main: str, subtitle: str = "") -> dict:
 
 
 def add_source_footer(
-    fig: go.Figure,
+    fig: FigureLike,
     client_name: str = "",
     date_range: str = "",
-) -> go.Figure:
+) -> FigureLike:
     """Add a subtle source footer annotation at the bottom-left of a chart."""
     parts = ["Source:"]
     if client_name: